@@ -0,0 +1,6 @@
+# Local Console sees the topics of every device, under their mount point
+listener ${console_port} 127.0.0.1
+connection_messages true
+log_timestamp false
+
+allow_anonymous true
@@ -0,0 +1,3 @@
+
+listener ${mqtt_port}
+mount_point ${mount_point}
@@ -14,57 +14,199 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 import base64
-import json
 import logging
 import random
-import re
+from collections import Counter
 from collections.abc import AsyncIterator
+from collections.abc import Hashable
+from collections.abc import Iterable
 from contextlib import asynccontextmanager
+from functools import partial
 from typing import Any
 from typing import Callable
 from typing import Optional
 
-import paho.mqtt.client as paho
 import trio
 from exceptiongroup import catch
-from local_console.clients.trio_paho_mqtt import AsyncClient
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_outbound import FileOutboundStore
+from local_console.clients.mqtt_outbound import OutboundStore
+from local_console.clients.mqtt_outbound import OutboundStoreError
+from local_console.clients.mqtt_queues import DropPolicy
+from local_console.clients.mqtt_queues import QueueSpec
+from local_console.clients.mqtt_router import TopicRouter
+from local_console.clients.rpc import DEFAULT_RPC_TIMEOUT
+from local_console.clients.rpc import PendingRPC
+from local_console.clients.rpc import PendingRPCs
+from local_console.clients.trio_mqtt import MQTTClient
 from local_console.core.camera.enums import MQTTTopics
+from local_console.core.config import broker_credentials
+from local_console.core.config import outbound_store_path
 from local_console.core.schemas.schemas import DeploymentManifest
 from local_console.core.schemas.schemas import DesiredDeviceConfig
 from local_console.core.schemas.schemas import OnWireProtocol
-from paho.mqtt.client import MQTT_ERR_SUCCESS
+from local_console.utils.json_codec import json_decode
+from local_console.utils.json_codec import json_encode
+from local_console.utils.tls import client_ssl_context
 
 logger = logging.getLogger(__name__)
 
 
+def attribute_keys(message: Message) -> Optional[Hashable]:
+    """
+    Identifies an attributes report by the set of attributes it carries,
+    so that an unread report is superseded by a newer one of the same kind.
+    """
+    try:
+        data = json_decode(message.payload)
+    except ValueError:
+        return None
+    return frozenset(data) if isinstance(data, dict) else None
+
+
+# Requests from the device and the reports awaited by the deployment and
+# RPC flows must not be evicted by a flood of telemetry.
+RECEIVE_QUEUES = [
+    QueueSpec(MQTTTopics.ATTRIBUTES_REQ.value, priority=2, capacity=32),
+    QueueSpec(MQTTTopics.RPC_RESPONSES.value, priority=1, capacity=32),
+    QueueSpec(
+        MQTTTopics.ATTRIBUTES.value,
+        priority=1,
+        policy=DropPolicy.COALESCE,
+        coalesce_key=attribute_keys,
+    ),
+    QueueSpec(MQTTTopics.TELEMETRY.value, priority=0),
+]
+
+# Connected agents, by broker address, that can be lent to
+# one-shot operations. See Agent.lease()
+_sessions: dict[str, "Agent"] = {}
+
+
+def device_outbound_store(host: str, port: int) -> OutboundStore:
+    """
+    Store of the messages published to the device at `host`:`port`, which
+    is persisted if so configured, and otherwise kept in memory. Meant for
+    the agent that owns the device's session, which must close it. While
+    one is open, others are kept in memory.
+    """
+    path = outbound_store_path(host, port)
+    if path is None:
+        return OutboundStore()
+    try:
+        return FileOutboundStore(path)
+    except OutboundStoreError as e:
+        logger.warning(f"Not persisting the outbound messages: {e}")
+        return OutboundStore()
+
+
 class Agent:
-    def __init__(self, host: str, port: int, onwire_schema: OnWireProtocol) -> None:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        onwire_schema: OnWireProtocol,
+        receive_queues: Optional[list[QueueSpec]] = None,
+        outbound: Optional[OutboundStore] = None,
+    ) -> None:
         self._host = host
         self._port = port
         self.onwire_schema = onwire_schema
+        self.receive_queues = (
+            RECEIVE_QUEUES if receive_queues is None else receive_queues
+        )
+        # Shared by the clients of successive sessions, so that messages
+        # left unacknowledged by one are retransmitted by the next. Owners
+        # of the device's session pass the one of device_outbound_store()
+        self.outbound = OutboundStore() if outbound is None else outbound
+        credentials = broker_credentials()
+        self.ssl_context = client_ssl_context(credentials) if credentials else None
 
-        self.client: Optional[AsyncClient] = None
+        self.client: Optional[MQTTClient] = None
         self.nursery: Optional[trio.Nursery] = None
 
-        client_id = f"cli-client-{random.randint(0, 10**7)}"
-        self.mqttc = paho.Client(clean_session=True, client_id=client_id)
-
-    async def initialize_handshake(self, timeout: int = 5) -> None:
-        async with self.mqtt_scope(
-            [
-                MQTTTopics.ATTRIBUTES_REQ.value,
-            ]
-        ):
-            assert self.nursery
-            assert self.client  # appease mypy
-
-            with trio.move_on_after(timeout):
-                async with self.client.messages() as mgen:
-                    async for msg in mgen:
-                        await check_attributes_request(
-                            self, msg.topic, msg.payload.decode()
-                        )
-            logger.debug("Exiting initialized handshake")
+        # A persistent session is resumed by the broker under the same
+        # client identifier, so only one such agent of a device should be
+        # connected at a time
+        if self.outbound.persistent:
+            self.client_id = f"cli-client-{port}"
+        else:
+            self.client_id = f"cli-client-{random.randint(0, 10**7)}"
+        self.rpc_requests = PendingRPCs()
+        self._subscriptions: Counter[str] = Counter()
+        # Mount point of the device's topics on a shared connection
+        self.topic_prefix = ""
+        # Operations that borrowed this agent by lease()
+        self._borrowers = 0
+        self._returned = trio.Event()
+
+    @classmethod
+    @asynccontextmanager
+    async def lease(
+        cls,
+        host: str,
+        port: int,
+        onwire_schema: OnWireProtocol,
+        subs_topics: Iterable[str] = (),
+        handshake: bool = False,
+    ) -> AsyncIterator["Agent"]:
+        """
+        Lends a connected agent to a one-shot operation. This is the agent
+        already connected to the broker at `host`:`port` by an owner that
+        lends it, such as the one of a CameraState, and otherwise a new one,
+        which is disconnected once the operation is done.
+
+        The `subs_topics` subscriptions are shared with the other users of
+        the agent, and undone when the last of them is released. Received
+        messages are not multiplexed: they keep being delivered to the
+        owner, which is why only owners running a reader loop lend their
+        agent (see mqtt_scope()), and borrowers rely on the state the owner
+        keeps. The owner waits for its borrowers before disconnecting.
+
+        The handshake is only performed on new connections, as the owner
+        of a connected agent is already answering the attributes requests.
+        """
+        agent = _sessions.get(f"{host}:{port}")
+        if agent:
+            logger.debug(f"Borrowing MQTT session {agent.client_id}")
+            agent._borrowers += 1
+            try:
+                async with agent.subscriptions(subs_topics):
+                    yield agent
+            finally:
+                agent._borrowers -= 1
+                if not agent._borrowers:
+                    agent._returned.set()
+            return
+
+        agent = cls(host, port, onwire_schema)
+        async with agent.mqtt_scope(list(subs_topics)):
+            if handshake:
+                await agent.initialize_handshake()
+            yield agent
+
+    async def initialize_handshake(self, timeout: float = 5) -> None:
+        """
+        Answers the attributes requests of the device for `timeout` seconds,
+        on the current connection if there is one.
+        """
+        if self.client and self.client.connected:
+            async with self.subscriptions([MQTTTopics.ATTRIBUTES_REQ.value]):
+                await self._answer_attributes_requests(timeout)
+        else:
+            async with self.mqtt_scope([MQTTTopics.ATTRIBUTES_REQ.value]):
+                await self._answer_attributes_requests(timeout)
+        logger.debug("Exiting initialized handshake")
+
+    async def _answer_attributes_requests(self, timeout: float) -> None:
+        router = TopicRouter()
+        router.add_handler(
+            MQTTTopics.ATTRIBUTES_REQ.value,
+            partial(answer_attributes_request, self),
+            decode=False,
+        )
+        with trio.move_on_after(timeout):
+            await self.route_messages(router)
 
     async def set_periodic_reports(self, report_interval: int) -> None:
         await self.device_configure(
@@ -82,10 +224,23 @@ class Agent:
 
         await self.publish(MQTTTopics.ATTRIBUTES.value, payload=deployment)
 
-    async def rpc(self, instance_id: str, method: str, params: str) -> None:
+    async def rpc(
+        self,
+        instance_id: str,
+        method: str,
+        params: str,
+        timeout: float = DEFAULT_RPC_TIMEOUT,
+    ) -> PendingRPC:
+        """
+        Sends an RPC to a module instance, returning its pending result.
+        This resolves with the device's response, when the messages on
+        MQTTTopics.RPC_RESPONSES are routed to `rpc_requests.resolve`.
+        """
         # TODO Schematize this across the on-wire schema versions
 
         reqid = str(random.randint(0, 10**8))
+        while reqid in self.rpc_requests:
+            reqid = str(random.randint(0, 10**8))
         RPC_TOPIC = f"v1/devices/me/rpc/request/{reqid}"
         if self.onwire_schema == OnWireProtocol.EVP2:
             # Following the implementation at:
@@ -100,7 +255,7 @@ class Agent:
                     "params": params,
                 }
             }
-            payload = json.dumps(
+            payload = json_encode(
                 {
                     "method": "ModuleMethodCall",
                     "params": evp2_body,
@@ -114,18 +269,27 @@ class Agent:
             evp1_body = {
                 "moduleMethod": method,
                 "moduleInstance": instance_id,
-                "params": json.loads(params),
+                "params": json_decode(params),
             }
-            payload = json.dumps(
+            payload = json_encode(
                 {
                     "method": "ModuleMethodCall",
                     "params": evp1_body,
                 }
             )
-        logger.debug(f"payload: {payload}")
-        await self.publish(RPC_TOPIC, payload=payload)
+        logger.debug("payload: %s", payload)
+        # Registered beforehand, as the response could arrive before publish returns
+        call = self.rpc_requests.register(reqid, timeout)
+        try:
+            await self.publish(RPC_TOPIC, payload=payload)
+        except BaseException:
+            self.rpc_requests.discard(reqid)
+            raise
+        return call
 
-    async def configure(self, instance_id: str, topic: str, config: str) -> None:
+    async def configure(
+        self, instance_id: str, topic: str, config: str, qos: int = 0
+    ) -> None:
         # TODO Schematize this across the on-wire schema versions
         # FIXME EVP2 does not enforce base64 encoding. Decide how to handle it here
         #       see:
@@ -137,9 +301,28 @@ class Agent:
         config = base64.b64encode(config.encode("utf-8")).decode("utf-8")
 
         message: dict = {f"configuration/{instance_id}/{topic}": config}
-        payload = json.dumps(message)
-        logger.debug(f"payload: {payload}")
-        await self.publish(MQTTTopics.ATTRIBUTES.value, payload=payload)
+        payload = json_encode(message)
+        logger.debug("payload: %s", payload)
+        await self.publish(MQTTTopics.ATTRIBUTES.value, payload=payload, qos=qos)
+
+    async def configure_many(
+        self, configs: Iterable[tuple[str, str, str]], qos: int = 1
+    ) -> None:
+        """
+        Pushes several (instance_id, topic, config) configurations at once.
+        With QoS 1 or 2 they are pipelined, up to the client's in-flight
+        window, and this returns once the broker acknowledged all of them.
+        With QoS 0 they are written one after the other.
+        """
+        if not qos:
+            for instance_id, topic, config in configs:
+                await self.configure(instance_id, topic, config)
+            return
+        async with trio.open_nursery() as nursery:
+            for instance_id, topic, config in configs:
+                nursery.start_soon(
+                    partial(self.configure, instance_id, topic, config, qos=qos)
+                )
 
     async def device_configure(
         self, desired_device_config: DesiredDeviceConfig
@@ -157,7 +340,7 @@ class Agent:
                 }
             }
         }
-        payload = json.dumps(message)
+        payload = json_encode(message)
         await self.publish(MQTTTopics.ATTRIBUTES.value, payload=payload)
 
     async def loop_client(
@@ -170,15 +353,31 @@ class Agent:
             await driver_task(cs, self)
 
     @asynccontextmanager
-    async def mqtt_scope(self, subs_topics: list[str]) -> AsyncIterator[None]:
+    async def mqtt_scope(
+        self, subs_topics: list[str], lend: bool = False
+    ) -> AsyncIterator[None]:
+        """
+        Connects for the duration of the context. With `lend`, the agent
+        is lent by lease() meanwhile, so the caller must keep reading the
+        received messages, as borrowers do not get to see them.
+        """
         is_os_error = False  # Determines if an OSError occurred within the context
         async with guarded_nursery() as nursery:
             self.nursery = nursery
-            self.client = AsyncClient(self.mqttc, self.nursery)
+            self.client = MQTTClient(
+                self.client_id,
+                self.nursery,
+                queues=self.receive_queues,
+                outbound=self.outbound,
+                ssl_context=self.ssl_context,
+            )
+            address = f"{self._host}:{self._port}"
             try:
-                self.client.connect(self._host, self._port)
+                await self.client.connect(self._host, self._port)
+                if lend:
+                    _sessions.setdefault(address, self)
                 for topic in subs_topics:
-                    self.client.subscribe(topic)
+                    await self.subscribe(topic)
                 yield
             except OSError:
                 logger.error(
@@ -186,18 +385,124 @@ class Agent:
                 )
                 is_os_error = True
             finally:
-                self.client.disconnect()
+                if _sessions.get(address) is self:
+                    del _sessions[address]
+                await self._wait_for_borrowers()
+                self._subscriptions.clear()
+                with trio.move_on_after(1) as cleanup_scope:
+                    cleanup_scope.shield = True
+                    await self.client.disconnect()
                 self.nursery.cancel_scope.cancel()
 
         if is_os_error:
             raise SystemExit
 
-    async def publish(self, topic: str, payload: str) -> None:
+    @asynccontextmanager
+    async def shared_scope(
+        self, client: MQTTClient, topic_prefix: str
+    ) -> AsyncIterator[None]:
+        """
+        Uses a connection that is shared with other devices, on which the
+        topics of this device are mounted under `topic_prefix`. The prefix
+        is added to the topics this agent publishes and subscribes to, and
+        the owner of the connection routes the received messages, without
+        their prefix. Meanwhile, this agent is lent by lease().
+        """
+        self.client = client
+        self.topic_prefix = topic_prefix
+        address = f"{self._host}:{self._port}"
+        _sessions.setdefault(address, self)
+        try:
+            yield
+        finally:
+            if _sessions.get(address) is self:
+                del _sessions[address]
+            await self._wait_for_borrowers()
+            with trio.move_on_after(1) as cleanup_scope:
+                cleanup_scope.shield = True
+                for topic in list(self._subscriptions):
+                    if client.connected:
+                        await client.unsubscribe(self.topic_prefix + topic)
+            self._subscriptions.clear()
+            self.client = None
+
+    async def _wait_for_borrowers(self) -> None:
+        """
+        Waits for the operations that borrowed this agent to release it,
+        even if the owner is being cancelled, as they still use the
+        connection. Only then can the owner disconnect.
+        """
+        with trio.CancelScope(shield=True):
+            while self._borrowers:
+                logger.debug(f"Waiting for {self._borrowers} borrowers to finish")
+                self._returned = trio.Event()
+                await self._returned.wait()
+
+    async def subscribe(self, topic: str) -> None:
+        """
+        Subscribes to `topic`, unless already subscribed. Subscriptions
+        are counted, so that each one is undone by an unsubscribe().
+        """
+        assert self.client is not None
+        if not self._subscriptions[topic]:
+            await self.client.subscribe(self.topic_prefix + topic)
+        self._subscriptions[topic] += 1
+
+    async def unsubscribe(self, topic: str) -> None:
+        self._subscriptions[topic] -= 1
+        if self._subscriptions[topic] > 0:
+            return
+        del self._subscriptions[topic]
+        if self.client and self.client.connected:
+            await self.client.unsubscribe(self.topic_prefix + topic)
+
+    async def resubscribe(self) -> None:
+        """
+        Renews the current subscriptions, after the client reconnected
+        with a new session.
+        """
+        assert self.client is not None
+        for topic in self._subscriptions:
+            await self.client.subscribe(self.topic_prefix + topic)
+
+    async def reconnect(self) -> None:
+        """
+        Connects the client again after it lost its connection, such
+        as when the broker restarted, and renews the subscriptions.
+        """
+        assert self.client is not None
+        if not self.client.connected:
+            await self.client.connect(self._host, self._port)
+        await self.resubscribe()
+
+    @asynccontextmanager
+    async def subscriptions(self, topics: Iterable[str]) -> AsyncIterator[None]:
+        subscribed = []
+        try:
+            for topic in topics:
+                await self.subscribe(topic)
+                subscribed.append(topic)
+            yield
+        finally:
+            with trio.move_on_after(1) as cleanup_scope:
+                cleanup_scope.shield = True
+                for topic in subscribed:
+                    await self.unsubscribe(topic)
+
+    async def publish(self, topic: str, payload: str | bytes, qos: int = 0) -> None:
+        """
+        Publishes `payload` on `topic`. With QoS 1 or 2, returns once the
+        broker acknowledged it, and concurrent calls share the client's
+        in-flight window.
+        """
         assert self.client is not None
-        msg_info = await self.client.publish_and_wait(topic, payload=payload)
-        if msg_info[0] != MQTT_ERR_SUCCESS:
+        try:
+            await self.client.publish(
+                self.topic_prefix + topic, payload=payload, qos=qos
+            )
+        except ConnectionError:
             logger.error("Error on MQTT publish agent logs")
-            raise ConnectionError
+            raise
 
     def read_only_loop(self, subs_topics: list[str], message_task: Callable) -> None:
         async def _driver_task(_cs: trio.CancelScope, _agent: "Agent") -> None:
@@ -205,6 +510,18 @@ class Agent:
 
         trio.run(self.loop_client, subs_topics, _driver_task, message_task)
 
+    async def route_messages(self, router: TopicRouter) -> None:
+        """
+        Dispatches the received messages through `router`, until
+        the connection is closed. Not for agents on a shared connection,
+        whose messages are routed by the connection's owner.
+        """
+        assert self.client is not None
+        assert not self.topic_prefix
+        async with self.client.messages() as mgen:
+            async for msg in mgen:
+                await router.dispatch(msg)
+
     async def request_instance_logs(self, instance_id: str) -> None:
         async with self.mqtt_scope([]):
             await self.rpc(instance_id, "$agent/set", '{"log_enable": true}')
@@ -236,24 +553,18 @@ def handle_task_exceptions(excgroup: Any) -> None:
         )
 
 
-async def check_attributes_request(agent: Agent, topic: str, payload: str) -> bool:
+async def answer_attributes_request(agent: Agent, topic: str, payload: bytes) -> None:
     """
-    Checks that a given MQTT message (as provided by its topic and payload)
-    conveys a request from the device's agent for data attributes set in the
-    MQTT broker.
+    Answers a request from the device's agent for data attributes set in
+    the MQTT broker, as routed from the MQTTTopics.ATTRIBUTES_REQ topic.
     """
-    got_request = False
-    result = re.search(r"^v1/devices/me/attributes/request/(\d+)$", topic)
-    if result:
-        got_request = True
-        req_id = result.group(1)
-        logger.debug(
-            "Got attribute request (id=%s) with payload: '%s'",
-            req_id,
-            payload,
-        )
-        await agent.publish(
-            f"v1/devices/me/attributes/response/{req_id}",
-            "{}",
-        )
-    return got_request
+    req_id = topic.rsplit("/", 1)[-1]
+    logger.debug(
+        "Got attribute request (id=%s) with payload: '%s'",
+        req_id,
+        payload.decode(errors="replace"),
+    )
+    await agent.publish(
+        f"v1/devices/me/attributes/response/{req_id}",
+        "{}",
+    )
@@ -0,0 +1,211 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Recording of MQTT traffic into a compact append-only file, and its replay
+with the original timing, scaled, or as fast as possible.
+
+A capture starts with MAGIC and the wall-clock time at which it began, as
+a little-endian double. Each message follows as a RECORD header (seconds
+since that beginning, QoS and retain flags, topic and payload lengths),
+then its UTF-8 topic and its payload.
+"""
+import logging
+import struct
+import time
+from collections.abc import Awaitable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from dataclasses import dataclass
+from dataclasses import field
+from pathlib import Path
+from statistics import quantiles
+from types import TracebackType
+from typing import Any
+from typing import BinaryIO
+from typing import Callable
+from typing import NamedTuple
+from typing import Optional
+
+import trio
+from local_console.clients.mqtt_codec import Message
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LCMQTT\x01\n"
+START = struct.Struct("<d")
+RECORD = struct.Struct("<dBHI")
+RETAIN_FLAG = 0x04
+
+
+class CaptureError(Exception):
+    """
+    Conveys that a file is not an MQTT traffic capture
+    """
+
+
+class CapturedMessage(NamedTuple):
+    # Seconds since the capture began
+    offset: float
+    message: Message
+
+
+def _read_start(capture: BinaryIO, path: Path) -> float:
+    header = capture.read(len(MAGIC) + START.size)
+    if len(header) < len(MAGIC) + START.size or not header.startswith(MAGIC):
+        raise CaptureError(f"{path} is not an MQTT traffic capture")
+    return float(START.unpack_from(header, len(MAGIC))[0])
+
+
+class TrafficRecorder:
+    """
+    Appends messages to a capture file, which is created if missing.
+    Messages recorded into an existing capture keep being timed from
+    its beginning.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.recorded = 0
+        if path.is_file() and path.stat().st_size:
+            with path.open("rb") as capture:
+                started = _read_start(capture, path)
+            self._file: BinaryIO = path.open("ab")
+        else:
+            started = time.time()
+            self._file = path.open("wb")
+            self._file.write(MAGIC + START.pack(started))
+        self._origin = time.monotonic() - (time.time() - started)
+
+    def record(self, message: Message) -> None:
+        topic = message.topic.encode()
+        flags = message.qos | (RETAIN_FLAG if message.retain else 0)
+        self._file.write(
+            RECORD.pack(
+                time.monotonic() - self._origin, flags, len(topic), len(message.payload)
+            )
+        )
+        self._file.write(topic)
+        self._file.write(message.payload)
+        self.recorded += 1
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "TrafficRecorder":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
+def read_capture(path: Path) -> Iterator[CapturedMessage]:
+    """
+    Yields the messages of a capture in recording order. A message cut
+    short, as left by an interrupted recording, ends the capture.
+    """
+    with path.open("rb") as capture:
+        _read_start(capture, path)
+        while header := capture.read(RECORD.size):
+            if len(header) < RECORD.size:
+                logger.warning(f"Ignoring a truncated record at the end of {path}")
+                return
+            offset, flags, topic_len, payload_len = RECORD.unpack(header)
+            body = capture.read(topic_len + payload_len)
+            if len(body) < topic_len + payload_len:
+                logger.warning(f"Ignoring a truncated record at the end of {path}")
+                return
+            message = Message(
+                body[:topic_len].decode(),
+                body[topic_len:],
+                flags & 0x03,
+                bool(flags & RETAIN_FLAG),
+            )
+            yield CapturedMessage(offset, message)
+
+
+@dataclass
+class TrafficReplayStats:
+    messages: int = 0
+    elapsed: float = 0.0
+    max_lag: float = 0.0
+    durations: list[float] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """
+        Achieved rate of messages per second
+        """
+        return self.messages / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile(self, percent: int) -> float:
+        """
+        Time in seconds it took to deliver a message, at the given percentile.
+        """
+        if len(self.durations) < 2:
+            return self.durations[0] if self.durations else 0.0
+        return quantiles(self.durations, n=100, method="inclusive")[percent - 1]
+
+
+class TrafficReplayer:
+    """
+    Delivers captured messages through `deliver`, which may publish them
+    to a broker or hand them directly to a consumer. Messages are replayed
+    following their original timing, scaled by `speed` (i.e. 2.0 doubles
+    the rate), or as fast as `deliver` allows when `speed` is None.
+    """
+
+    def __init__(
+        self,
+        messages: Iterable[CapturedMessage],
+        deliver: Callable[[Message], Awaitable[Any]],
+        speed: Optional[float] = 1.0,
+    ) -> None:
+        if speed is not None and speed <= 0:
+            raise ValueError(f"Invalid replay speed: {speed}")
+        self.messages = messages
+        self.deliver = deliver
+        self.speed = speed
+
+    async def run(self) -> TrafficReplayStats:
+        stats = TrafficReplayStats()
+        origin: Optional[float] = None
+        start = trio.current_time()
+        for offset, message in self.messages:
+            if origin is None:
+                origin = offset
+            if self.speed is not None:
+                due = start + (offset - origin) / self.speed
+                await trio.sleep_until(due)
+                stats.max_lag = max(stats.max_lag, trio.current_time() - due)
+            else:
+                # Let other tasks run, even at full speed
+                await trio.lowlevel.checkpoint()
+
+            began = time.perf_counter()
+            await self.deliver(message)
+            stats.durations.append(time.perf_counter() - began)
+            stats.messages += 1
+
+        stats.elapsed = trio.current_time() - start
+        return stats
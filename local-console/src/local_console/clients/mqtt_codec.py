@@ -0,0 +1,437 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Encoding and decoding of the MQTT 3.1.1 and 5.0 control packets
+required by an MQTT client, and by the embedded broker. MQTT 5 properties
+are not used, so they are encoded as empty and skipped when decoding.
+"""
+import enum
+import struct
+from dataclasses import dataclass
+from typing import Optional
+
+# Default upper bound for incoming packets, as a safeguard against
+# a corrupted stream. Deployment manifests are the largest payloads.
+MAX_PACKET_SIZE = 16 * 1024 * 1024
+
+
+class MQTTProtocolError(Exception):
+    """
+    Conveys a malformed or unexpected packet on the wire
+    """
+
+
+class MQTTVersion(enum.IntEnum):
+    V311 = 4
+    V5 = 5
+
+
+class PacketType(enum.IntEnum):
+    CONNECT = 1
+    CONNACK = 2
+    PUBLISH = 3
+    PUBACK = 4
+    PUBREC = 5
+    PUBREL = 6
+    PUBCOMP = 7
+    SUBSCRIBE = 8
+    SUBACK = 9
+    UNSUBSCRIBE = 10
+    UNSUBACK = 11
+    PINGREQ = 12
+    PINGRESP = 13
+    DISCONNECT = 14
+    AUTH = 15
+
+
+@dataclass
+class Message:
+    topic: str
+    payload: bytes
+    qos: int = 0
+    retain: bool = False
+    dup: bool = False
+    packet_id: int = 0
+
+
+@dataclass
+class Packet:
+    type: PacketType
+    flags: int
+    body: bytes
+
+
+@dataclass
+class Connect:
+    client_id: str
+    version: MQTTVersion
+    keepalive: int
+    clean_start: bool = True
+    username: Optional[str] = None
+    password: Optional[bytes] = None
+    will: Optional[Message] = None
+
+
+PINGREQ = bytes([PacketType.PINGREQ << 4, 0])
+PINGRESP = bytes([PacketType.PINGRESP << 4, 0])
+DISCONNECT = bytes([PacketType.DISCONNECT << 4, 0])
+
+
+def encode_varint(value: int) -> bytes:
+    if not 0 <= value <= 268_435_455:
+        raise MQTTProtocolError(f"Value out of range for variable integer: {value}")
+    encoded = bytearray()
+    while True:
+        byte, value = value % 128, value // 128
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def decode_varint(data: bytes | bytearray, offset: int = 0) -> tuple[int, int]:
+    """
+    Returns the decoded value and the offset past its last byte.
+    Raises IndexError if the data ends before the value does.
+    """
+    value = 0
+    for shift in range(0, 28, 7):
+        byte = data[offset]
+        offset += 1
+        value += (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+    raise MQTTProtocolError("Malformed variable integer")
+
+
+def encode_string(value: str | bytes) -> bytes:
+    raw = value.encode("utf-8") if isinstance(value, str) else value
+    return struct.pack("!H", len(raw)) + raw
+
+
+def decode_string(data: bytes, offset: int) -> tuple[str, int]:
+    (length,) = struct.unpack_from("!H", data, offset)
+    start = offset + 2
+    return data[start : start + length].decode("utf-8"), start + length
+
+
+def _packet(ptype: PacketType, flags: int, *parts: bytes) -> bytes:
+    body = b"".join(parts)
+    return bytes([(ptype << 4) | flags]) + encode_varint(len(body)) + body
+
+
+def _properties(version: MQTTVersion) -> bytes:
+    return b"\x00" if version == MQTTVersion.V5 else b""
+
+
+def _skip_properties(data: bytes, offset: int, version: MQTTVersion) -> int:
+    if version != MQTTVersion.V5 or offset >= len(data):
+        return offset
+    length, offset = decode_varint(data, offset)
+    return offset + length
+
+
+def encode_connect(
+    client_id: str,
+    keepalive: int,
+    version: MQTTVersion = MQTTVersion.V311,
+    clean_start: bool = True,
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+) -> bytes:
+    flags = 0x02 if clean_start else 0
+    payload = encode_string(client_id)
+    if username is not None:
+        flags |= 0x80
+        payload += encode_string(username)
+    if password is not None:
+        flags |= 0x40
+        payload += encode_string(password)
+    header = encode_string("MQTT") + struct.pack("!BBH", version, flags, keepalive)
+    return _packet(PacketType.CONNECT, 0, header, _properties(version), payload)
+
+
+def encode_publish_header(
+    message: Message, version: MQTTVersion = MQTTVersion.V311
+) -> bytes:
+    """
+    Encodes a PUBLISH packet up to its payload, so that
+    large payloads can be written out without copying them.
+    """
+    flags = (message.qos << 1) | int(message.retain) | (int(message.dup) << 3)
+    packet_id = struct.pack("!H", message.packet_id) if message.qos else b""
+    variable_header = encode_string(message.topic) + packet_id + _properties(version)
+    remaining_length = len(variable_header) + len(message.payload)
+    return (
+        bytes([(PacketType.PUBLISH << 4) | flags])
+        + encode_varint(remaining_length)
+        + variable_header
+    )
+
+
+def encode_publish(message: Message, version: MQTTVersion = MQTTVersion.V311) -> bytes:
+    return encode_publish_header(message, version) + message.payload
+
+
+def encode_ack(ptype: PacketType, packet_id: int) -> bytes:
+    """
+    Encodes PUBACK, PUBREC, PUBREL and PUBCOMP packets. Their success
+    form is the same for both protocol versions, as MQTT 5 allows to
+    omit the reason code when it is 0 and there are no properties.
+    """
+    flags = 0x02 if ptype == PacketType.PUBREL else 0
+    return _packet(ptype, flags, struct.pack("!H", packet_id))
+
+
+def encode_subscribe(
+    packet_id: int,
+    topics: list[tuple[str, int]],
+    version: MQTTVersion = MQTTVersion.V311,
+) -> bytes:
+    filters = b"".join(encode_string(topic) + bytes([qos]) for topic, qos in topics)
+    return _packet(
+        PacketType.SUBSCRIBE,
+        0x02,
+        struct.pack("!H", packet_id),
+        _properties(version),
+        filters,
+    )
+
+
+def encode_unsubscribe(
+    packet_id: int, topics: list[str], version: MQTTVersion = MQTTVersion.V311
+) -> bytes:
+    filters = b"".join(encode_string(topic) for topic in topics)
+    return _packet(
+        PacketType.UNSUBSCRIBE,
+        0x02,
+        struct.pack("!H", packet_id),
+        _properties(version),
+        filters,
+    )
+
+
+def encode_connack(
+    session_present: bool, code: int, version: MQTTVersion = MQTTVersion.V311
+) -> bytes:
+    return _packet(
+        PacketType.CONNACK, 0, bytes([int(session_present), code]), _properties(version)
+    )
+
+
+def encode_suback(
+    packet_id: int, codes: list[int], version: MQTTVersion = MQTTVersion.V311
+) -> bytes:
+    return _packet(
+        PacketType.SUBACK,
+        0,
+        struct.pack("!H", packet_id),
+        _properties(version),
+        bytes(codes),
+    )
+
+
+def encode_unsuback(
+    packet_id: int, count: int, version: MQTTVersion = MQTTVersion.V311
+) -> bytes:
+    """
+    MQTT 5 UNSUBACKs carry a reason code per topic filter, which are
+    all reported as successful, as unknown filters are not an error.
+    """
+    codes = bytes(count) if version == MQTTVersion.V5 else b""
+    return _packet(
+        PacketType.UNSUBACK,
+        0,
+        struct.pack("!H", packet_id),
+        _properties(version),
+        codes,
+    )
+
+
+def decode_connect(packet: Packet) -> Connect:
+    """
+    Decodes a CONNECT packet, including the will message if any.
+    Raises MQTTProtocolError for other protocols than MQTT 3.1.1 and 5.
+    """
+    if packet.type != PacketType.CONNECT:
+        raise MQTTProtocolError(f"Expected CONNECT, got {packet.type.name}")
+    data = packet.body
+    try:
+        name, offset = decode_string(data, 0)
+        level, flags, keepalive = struct.unpack_from("!BBH", data, offset)
+        if name != "MQTT" or level not in tuple(MQTTVersion):
+            raise MQTTProtocolError(f"Unsupported protocol: {name} level {level}")
+        version = MQTTVersion(level)
+        offset = _skip_properties(data, offset + 4, version)
+        client_id, offset = decode_string(data, offset)
+
+        will = None
+        if flags & 0x04:
+            offset = _skip_properties(data, offset, version)
+            will_topic, offset = decode_string(data, offset)
+            (length,) = struct.unpack_from("!H", data, offset)
+            will_payload = data[offset + 2 : offset + 2 + length]
+            offset += 2 + length
+            will = Message(
+                will_topic, will_payload, (flags >> 3) & 0x03, bool(flags & 0x20)
+            )
+        username = None
+        if flags & 0x80:
+            username, offset = decode_string(data, offset)
+        password = None
+        if flags & 0x40:
+            (length,) = struct.unpack_from("!H", data, offset)
+            password = data[offset + 2 : offset + 2 + length]
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise MQTTProtocolError(f"Malformed CONNECT: {e}")
+    return Connect(
+        client_id, version, keepalive, bool(flags & 0x02), username, password, will
+    )
+
+
+def decode_subscribe(
+    packet: Packet, version: MQTTVersion
+) -> tuple[int, list[tuple[str, int]]]:
+    """
+    Decodes a SUBSCRIBE packet into its packet identifier and its topic
+    filters, with the maximum QoS requested for each of them. MQTT 5
+    subscription options other than the QoS are ignored.
+    """
+    try:
+        (packet_id,) = struct.unpack_from("!H", packet.body, 0)
+        offset = _skip_properties(packet.body, 2, version)
+        topics = []
+        while offset < len(packet.body):
+            topic, offset = decode_string(packet.body, offset)
+            topics.append((topic, packet.body[offset] & 0x03))
+            offset += 1
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise MQTTProtocolError(f"Malformed SUBSCRIBE: {e}")
+    if not topics:
+        raise MQTTProtocolError("SUBSCRIBE without topic filters")
+    return packet_id, topics
+
+
+def decode_unsubscribe(packet: Packet, version: MQTTVersion) -> tuple[int, list[str]]:
+    try:
+        (packet_id,) = struct.unpack_from("!H", packet.body, 0)
+        offset = _skip_properties(packet.body, 2, version)
+        topics = []
+        while offset < len(packet.body):
+            topic, offset = decode_string(packet.body, offset)
+            topics.append(topic)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise MQTTProtocolError(f"Malformed UNSUBSCRIBE: {e}")
+    return packet_id, topics
+
+
+def decode_connack(packet: Packet, version: MQTTVersion) -> tuple[bool, int]:
+    """
+    Returns whether the broker has a session for the client, and the
+    return code (3.1.1) or reason code (5), which is zero on success.
+    """
+    if len(packet.body) < 2:
+        raise MQTTProtocolError("Truncated CONNACK")
+    return bool(packet.body[0] & 0x01), packet.body[1]
+
+
+def decode_publish(packet: Packet, version: MQTTVersion) -> Message:
+    qos = (packet.flags >> 1) & 0x03
+    if qos == 3:
+        raise MQTTProtocolError("Invalid QoS in PUBLISH")
+    try:
+        topic, offset = decode_string(packet.body, 0)
+        packet_id = 0
+        if qos:
+            (packet_id,) = struct.unpack_from("!H", packet.body, offset)
+            offset += 2
+        offset = _skip_properties(packet.body, offset, version)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise MQTTProtocolError(f"Malformed PUBLISH: {e}")
+    return Message(
+        topic,
+        packet.body[offset:],
+        qos,
+        retain=bool(packet.flags & 0x01),
+        dup=bool(packet.flags & 0x08),
+        packet_id=packet_id,
+    )
+
+
+def decode_ack(packet: Packet) -> tuple[int, int]:
+    """
+    Decodes PUBACK, PUBREC, PUBREL and PUBCOMP packets
+    into their packet identifier and reason code.
+    """
+    if len(packet.body) < 2:
+        raise MQTTProtocolError(f"Truncated {packet.type.name}")
+    (packet_id,) = struct.unpack_from("!H", packet.body, 0)
+    reason = packet.body[2] if len(packet.body) > 2 else 0
+    return packet_id, reason
+
+
+def decode_suback(packet: Packet, version: MQTTVersion) -> tuple[int, list[int]]:
+    """
+    Decodes SUBACK and UNSUBACK packets into their packet identifier
+    and the return or reason code of each topic filter. An UNSUBACK
+    from an MQTT 3.1.1 broker carries no codes.
+    """
+    if len(packet.body) < 2:
+        raise MQTTProtocolError(f"Truncated {packet.type.name}")
+    (packet_id,) = struct.unpack_from("!H", packet.body, 0)
+    offset = _skip_properties(packet.body, 2, version)
+    return packet_id, list(packet.body[offset:])
+
+
+class PacketReader:
+    """
+    Splits a stream of bytes into MQTT control packets. Data is fed as it
+    arrives from the socket, and complete packets are returned as soon as
+    all of their bytes are available.
+    """
+
+    def __init__(self, max_packet_size: int = MAX_PACKET_SIZE) -> None:
+        self.max_packet_size = max_packet_size
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[Packet]:
+        self._buffer += data
+        packets = []
+        offset = 0
+        while len(self._buffer) - offset >= 2:
+            try:
+                length, body_start = decode_varint(self._buffer, offset + 1)
+            except IndexError:
+                break
+            if length > self.max_packet_size:
+                raise MQTTProtocolError(f"Packet too large: {length} bytes")
+            end = body_start + length
+            if end > len(self._buffer):
+                break
+
+            first = self._buffer[offset]
+            try:
+                ptype = PacketType(first >> 4)
+            except ValueError:
+                raise MQTTProtocolError(f"Invalid packet type: {first >> 4}")
+            packets.append(
+                Packet(ptype, first & 0x0F, bytes(self._buffer[body_start:end]))
+            )
+            offset = end
+
+        del self._buffer[:offset]
+        return packets
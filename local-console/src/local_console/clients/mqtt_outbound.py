@@ -0,0 +1,229 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import base64
+import json
+import logging
+import os
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+from typing import IO
+
+from local_console.clients.mqtt_codec import Message
+
+logger = logging.getLogger(__name__)
+
+# Records appended to a persisted store before it is compacted, unless
+# there are that many pending messages
+COMPACT_RECORDS = 1000
+
+
+class OutboundStoreError(Exception):
+    """
+    Raised when a persisted outbound store cannot be used
+    """
+
+
+class OutboundStore:
+    """
+    Keeps the QoS 1 and 2 messages published by a client until the broker
+    acknowledges them, in publication order and keyed by packet identifier,
+    so that they can be retransmitted over a new connection. QoS 2 messages
+    for which the broker sent PUBREC are marked as released, as it is their
+    PUBREL that must be retransmitted instead.
+
+    This store lives in memory. See FileOutboundStore for one that survives
+    restarts of the process.
+    """
+
+    # Whether the messages outlive the process, in which case clients
+    # ask the broker to keep their session as well
+    persistent = False
+
+    def __init__(self) -> None:
+        self._messages: dict[int, Message] = {}
+        self._released: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __contains__(self, packet_id: int) -> bool:
+        return packet_id in self._messages
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(list(self._messages.values()))
+
+    def is_released(self, packet_id: int) -> bool:
+        return packet_id in self._released
+
+    def add(self, message: Message) -> None:
+        assert message.qos and message.packet_id
+        self._messages[message.packet_id] = message
+
+    def mark_sent(self, packet_id: int) -> None:
+        """
+        Flags the message as a duplicate for its retransmissions.
+        """
+        message = self._messages.get(packet_id)
+        if message:
+            message.dup = True
+
+    def release(self, packet_id: int) -> None:
+        if packet_id in self._messages:
+            self._released.add(packet_id)
+
+    def remove(self, packet_id: int) -> None:
+        self._messages.pop(packet_id, None)
+        self._released.discard(packet_id)
+
+    def close(self) -> None:
+        pass
+
+
+class FileOutboundStore(OutboundStore):
+    """
+    Outbound store persisted as an append-only log of JSON lines, one per
+    change, which is compacted to the pending messages when loaded, and
+    once COMPACT_RECORDS more changes were appended to it.
+
+    The store is locked for the process that opened it, until closed, as
+    its log is not to be written concurrently. OutboundStoreError is raised
+    if another process holds it.
+    """
+
+    persistent = True
+
+    def __init__(self, path: Path, compact_records: int = COMPACT_RECORDS) -> None:
+        super().__init__()
+        self.path = path
+        self.compact_records = compact_records
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = lock_file(path.with_name(path.name + ".lock"))
+        self._load()
+        self._log: IO[str] = self.path.open("a")
+        self._appended = 0
+
+    def _load(self) -> None:
+        if self.path.is_file():
+            for line in self.path.read_text().splitlines():
+                try:
+                    self._replay(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    # A torn write at the end of the log
+                    logger.warning(f"Skipping corrupt record in {self.path}: {e}")
+        self._write_pending()
+        if self:
+            logger.info(f"{len(self)} unacknowledged messages loaded from {self.path}")
+
+    def _write_pending(self) -> None:
+        """
+        Replaces the log with the records of the pending messages alone.
+        """
+        records = [self._add_record(message) for message in self]
+        records += [{"op": "rel", "id": pid} for pid in self._released]
+        compacted = self.path.with_name(self.path.name + ".tmp")
+        compacted.write_text("".join(json.dumps(r) + "\n" for r in records))
+        os.replace(compacted, self.path)
+
+    def _compact(self) -> None:
+        self._log.close()
+        self._write_pending()
+        self._log = self.path.open("a")
+        self._appended = 0
+
+    def _replay(self, record: dict) -> None:
+        op = record["op"]
+        if op == "add":
+            super().add(
+                Message(
+                    record["topic"],
+                    base64.b64decode(record["payload"]),
+                    record["qos"],
+                    record["retain"],
+                    record["dup"],
+                    record["id"],
+                )
+            )
+        elif op == "sent":
+            super().mark_sent(record["id"])
+        elif op == "rel":
+            super().release(record["id"])
+        elif op == "del":
+            super().remove(record["id"])
+
+    @staticmethod
+    def _add_record(message: Message) -> dict:
+        return {
+            "op": "add",
+            "id": message.packet_id,
+            "topic": message.topic,
+            "payload": base64.b64encode(message.payload).decode(),
+            "qos": message.qos,
+            "retain": message.retain,
+            "dup": message.dup,
+        }
+
+    def _append(self, record: dict) -> None:
+        self._log.write(json.dumps(record) + "\n")
+        self._log.flush()
+        self._appended += 1
+        if self._appended >= max(self.compact_records, 2 * len(self)):
+            self._compact()
+
+    def add(self, message: Message) -> None:
+        super().add(message)
+        self._append(self._add_record(message))
+
+    def mark_sent(self, packet_id: int) -> None:
+        if packet_id in self and not self._messages[packet_id].dup:
+            self._append({"op": "sent", "id": packet_id})
+        super().mark_sent(packet_id)
+
+    def release(self, packet_id: int) -> None:
+        super().release(packet_id)
+        self._append({"op": "rel", "id": packet_id})
+
+    def remove(self, packet_id: int) -> None:
+        super().remove(packet_id)
+        self._append({"op": "del", "id": packet_id})
+
+    def close(self) -> None:
+        if not self._log.closed:
+            self._log.close()
+            self._lock.close()
+
+
+def lock_file(path: Path) -> IO[bytes]:
+    """
+    Opens `path` holding an exclusive lock on it, which is released when
+    the returned file is closed. Raises OutboundStoreError if the lock is
+    held elsewhere.
+    """
+    file = path.open("a+b")
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError as e:
+        file.close()
+        raise OutboundStoreError(f"{path} is locked by another process: {e}")
+    return file
@@ -0,0 +1,217 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+from collections import Counter
+from collections import deque
+from collections.abc import Hashable
+from dataclasses import dataclass
+from typing import Callable
+from typing import Optional
+
+import trio
+from local_console.clients.mqtt_codec import Message
+from local_console.utils.enums import StrEnum
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 100
+
+
+class DropPolicy(StrEnum):
+    DROP_OLDEST = "drop-oldest"
+    DROP_NEWEST = "drop-newest"
+    # Replaces a queued message with the same key, if any,
+    # and otherwise behaves like DROP_OLDEST.
+    COALESCE = "coalesce"
+
+
+@dataclass(frozen=True)
+class QueueSpec:
+    topic_filter: str
+    priority: int = 0
+    capacity: int = DEFAULT_CAPACITY
+    policy: DropPolicy = DropPolicy.DROP_OLDEST
+    # Key under which messages are coalesced. Defaults to the topic.
+    # Messages for which it returns None are never coalesced.
+    coalesce_key: Optional[Callable[[Message], Optional[Hashable]]] = None
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """
+    Tells whether `topic` matches `topic_filter`, as per the
+    MQTT wildcard rules for '+' (one level) and '#' (any levels).
+    """
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class _Entry:
+    __slots__ = ("seq", "message", "_key", "_keyed")
+
+    def __init__(self, seq: int, message: Message) -> None:
+        self.seq = seq
+        self.message = message
+        self._key: Optional[Hashable] = None
+        self._keyed = False
+
+    def key(self, spec: QueueSpec) -> Optional[Hashable]:
+        # Computed on overflow only, and then cached
+        if not self._keyed:
+            self._key = (
+                spec.coalesce_key(self.message)
+                if spec.coalesce_key
+                else self.message.topic
+            )
+            self._keyed = True
+        return self._key
+
+
+class _Queue:
+    def __init__(self, spec: QueueSpec) -> None:
+        if spec.capacity < 1:
+            raise ValueError(f"Invalid capacity for {spec.topic_filter} queue")
+        self.spec = spec
+        self.entries: deque[_Entry] = deque()
+
+    def put(self, entry: _Entry) -> Optional[Message]:
+        """
+        Enqueues an entry, returning the message dropped
+        to make room for it, if the queue was full.
+        """
+        if len(self.entries) < self.spec.capacity:
+            self.entries.append(entry)
+            return None
+
+        if self.spec.policy == DropPolicy.DROP_NEWEST:
+            return entry.message
+
+        if self.spec.policy == DropPolicy.COALESCE:
+            key = entry.key(self.spec)
+            if key is not None:
+                for i, queued in enumerate(self.entries):
+                    if queued.key(self.spec) == key:
+                        del self.entries[i]
+                        self.entries.append(entry)
+                        return queued.message
+
+        dropped = self.entries.popleft()
+        self.entries.append(entry)
+        return dropped.message
+
+
+class MessageQueues:
+    """
+    Buffers received messages in bounded per-topic queues, so that a flood
+    on one topic cannot evict the messages of another. Each message goes to
+    the first queue whose topic filter matches it, or to a catch-all queue.
+
+    Messages are taken from the non-empty queue with the highest priority,
+    and in arrival order among queues of equal priority. When a queue is
+    full, its drop policy decides which message is discarded, and the
+    discard is counted in `dropped`, keyed by the queue's topic filter.
+    """
+
+    def __init__(
+        self, specs: Optional[list[QueueSpec]] = None, capacity: int = DEFAULT_CAPACITY
+    ) -> None:
+        specs = list(specs or [])
+        if not any(spec.topic_filter == "#" for spec in specs):
+            specs.append(QueueSpec("#", capacity=capacity))
+        self._queues = [_Queue(spec) for spec in specs]
+        self.dropped: Counter[str] = Counter()
+        self._seq = 0
+        self._closed = False
+        self._lot = trio.lowlevel.ParkingLot()
+
+    def __len__(self) -> int:
+        return sum(len(queue.entries) for queue in self._queues)
+
+    def put(self, message: Message) -> None:
+        if self._closed:
+            raise trio.ClosedResourceError
+        queue = next(
+            q for q in self._queues if topic_matches(q.spec.topic_filter, message.topic)
+        )
+        self._seq += 1
+        dropped = queue.put(_Entry(self._seq, message))
+        if dropped is not None:
+            self.dropped[queue.spec.topic_filter] += 1
+            logger.debug(
+                f"Queue {queue.spec.topic_filter} full. Dropped message on {dropped.topic}"
+            )
+        self._lot.unpark()
+
+    def close(self) -> None:
+        """
+        Lets consumers know no more messages will arrive. Those
+        already queued can still be received.
+        """
+        self._closed = True
+        self._lot.unpark_all()
+
+    def reopen(self) -> None:
+        """
+        Accepts messages again after close(), as for a new connection.
+        """
+        self._closed = False
+
+    def receive_nowait(self) -> Message:
+        best: Optional[_Queue] = None
+        for queue in self._queues:
+            if not queue.entries:
+                continue
+            if (
+                best is None
+                or queue.spec.priority > best.spec.priority
+                or (
+                    queue.spec.priority == best.spec.priority
+                    and queue.entries[0].seq < best.entries[0].seq
+                )
+            ):
+                best = queue
+        if best is None:
+            if self._closed:
+                raise trio.EndOfChannel
+            raise trio.WouldBlock
+        return best.entries.popleft().message
+
+    async def receive(self) -> Message:
+        await trio.lowlevel.checkpoint_if_cancelled()
+        while True:
+            try:
+                message = self.receive_nowait()
+            except trio.WouldBlock:
+                await self._lot.park()
+                continue
+            await trio.lowlevel.cancel_shielded_checkpoint()
+            return message
+
+    def __aiter__(self) -> "MessageQueues":
+        return self
+
+    async def __anext__(self) -> Message:
+        try:
+            return await self.receive()
+        except trio.EndOfChannel:
+            raise StopAsyncIteration
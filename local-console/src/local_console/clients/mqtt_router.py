@@ -0,0 +1,156 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+from collections.abc import Awaitable
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+from typing import Optional
+
+from local_console.clients.mqtt_codec import Message
+from local_console.utils.json_codec import json_decode
+
+logger = logging.getLogger(__name__)
+
+# Called with the topic of the message, and either its decoded
+# JSON payload, or its raw payload for routes with decode=False.
+Handler = Callable[[str, Any], Awaitable[None]]
+
+# Topics may carry request identifiers, so the table of routes
+# per topic is reset instead of growing without bounds.
+MAX_CACHED_TOPICS = 1024
+
+
+@dataclass(frozen=True)
+class Route:
+    topic_filter: str
+    handler: Handler
+    key: Optional[str] = None
+    decode: bool = True
+    order: int = 0
+
+
+@dataclass
+class _Node:
+    children: dict[str, "_Node"] = field(default_factory=dict)
+    routes: list[Route] = field(default_factory=list)
+
+
+class TopicRouter:
+    """
+    Dispatches incoming messages to the handlers registered for the topic
+    filters that match their topic. Filters may use the '+' and '#' MQTT
+    wildcards, and are kept in a trie indexed by topic level, so that
+    matching a topic only visits the levels it shares with the filters.
+    The routes that match each topic are computed once and cached.
+
+    A route may also require a top-level key in the JSON payload. Payloads
+    are decoded at most once per message, and only when a matching route
+    needs them, so messages on topics without handlers cost no decoding.
+    """
+
+    def __init__(self) -> None:
+        self._root = _Node()
+        self._count = 0
+        self._table: dict[str, tuple[Route, ...]] = {}
+
+    def add_handler(
+        self,
+        topic_filter: str,
+        handler: Handler,
+        key: Optional[str] = None,
+        decode: bool = True,
+    ) -> None:
+        """
+        Registers `handler` for messages on topics matching `topic_filter`.
+        If `key` is given, the handler is only called for JSON objects that
+        have it. With `decode=False`, it gets the raw payload instead.
+        """
+        if key is not None and not decode:
+            raise ValueError("Routing by payload key requires decoding the payload")
+
+        node = self._root
+        for level in topic_filter.split("/"):
+            node = node.children.setdefault(level, _Node())
+        node.routes.append(Route(topic_filter, handler, key, decode, self._count))
+        self._count += 1
+        self._table.clear()
+
+    def routes_for(self, topic: str) -> tuple[Route, ...]:
+        routes = self._table.get(topic)
+        if routes is None:
+            found: list[Route] = []
+            self._collect(self._root, topic.split("/"), 0, found)
+            # Registration order, regardless of which filter matched
+            routes = tuple(sorted(found, key=lambda route: route.order))
+            if len(self._table) >= MAX_CACHED_TOPICS:
+                self._table.clear()
+            self._table[topic] = routes
+        return routes
+
+    def _collect(
+        self, node: _Node, levels: list[str], depth: int, found: list[Route]
+    ) -> None:
+        # As per the MQTT spec, wildcards at the first level
+        # do not match topics starting with '$'
+        wildcards = depth > 0 or not levels[0].startswith("$")
+        if wildcards and "#" in node.children:
+            found.extend(node.children["#"].routes)
+        if depth == len(levels):
+            found.extend(node.routes)
+            return
+        child = node.children.get(levels[depth])
+        if child:
+            self._collect(child, levels, depth + 1, found)
+        if wildcards and "+" in node.children:
+            self._collect(node.children["+"], levels, depth + 1, found)
+
+    async def dispatch(self, message: Message) -> int:
+        """
+        Calls the handlers of the routes matching the message,
+        returning how many of them were called.
+        """
+        routes = self.routes_for(message.topic)
+        if not routes:
+            return 0
+
+        payload: Any = None
+        decoded = False
+        called = 0
+        for route in routes:
+            if not route.decode:
+                await route.handler(message.topic, message.payload)
+                called += 1
+                continue
+
+            if not decoded:
+                decoded = True
+                try:
+                    payload = json_decode(message.payload)
+                except ValueError:
+                    logger.warning(f"Discarding non-JSON payload on {message.topic}")
+                    payload = None
+            if payload is None:
+                continue
+
+            if route.key is None or (
+                isinstance(payload, dict) and route.key in payload
+            ):
+                await route.handler(message.topic, payload)
+                called += 1
+
+        return called
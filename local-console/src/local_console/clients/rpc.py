@@ -0,0 +1,131 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+from collections.abc import Generator
+from typing import Any
+from typing import Optional
+
+import trio
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RPC_TIMEOUT = 10.0
+
+# Key of the EVP2 response body, which carries the request id
+EVP2_RESPONSE = "direct-command-response"
+
+
+class RPCTimeoutError(TimeoutError):
+    """
+    Conveys that a device did not respond to an RPC in time
+    """
+
+
+class PendingRPC:
+    """
+    Result of an RPC sent to a device. Awaiting it returns the body of
+    the device's response, or raises RPCTimeoutError once its deadline
+    passes. An RPC that is never awaited is dropped from the table of
+    pending requests on its deadline, or when its response arrives.
+    """
+
+    def __init__(
+        self, reqid: str, deadline: float, table: dict[str, "PendingRPC"]
+    ) -> None:
+        self.reqid = reqid
+        self.deadline = deadline
+        self._table = table
+        self._done = trio.Event()
+        self._response: Any = None
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def set_response(self, response: Any) -> None:
+        self._response = response
+        self._done.set()
+
+    async def wait(self) -> Any:
+        try:
+            with trio.move_on_at(self.deadline):
+                await self._done.wait()
+                return self._response
+        finally:
+            if self._table.get(self.reqid) is self:
+                del self._table[self.reqid]
+        raise RPCTimeoutError(f"No response to RPC {self.reqid}")
+
+    def __await__(self) -> Generator[Any, None, Any]:
+        return self.wait().__await__()
+
+
+class PendingRPCs:
+    """
+    Table of the RPCs awaiting a response from a device, keyed by request
+    id. Its `resolve` method handles the messages on the RPC response topic.
+    Requests past their deadline are dropped whenever a request is
+    registered or a response received, whether or not they were awaited.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[str, PendingRPC] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, reqid: str) -> bool:
+        return reqid in self._pending
+
+    def register(self, reqid: str, timeout: float = DEFAULT_RPC_TIMEOUT) -> PendingRPC:
+        self.expire()
+        if reqid in self._pending:
+            raise ValueError(f"RPC {reqid} is already pending")
+        call = PendingRPC(reqid, trio.current_time() + timeout, self._pending)
+        self._pending[reqid] = call
+        return call
+
+    def discard(self, reqid: str) -> None:
+        self._pending.pop(reqid, None)
+
+    def expire(self) -> None:
+        """
+        Drops the requests whose deadline has passed.
+        """
+        now = trio.current_time()
+        expired = [r for r, call in self._pending.items() if call.deadline <= now]
+        for reqid in expired:
+            del self._pending[reqid]
+
+    async def resolve(self, topic: str, payload: Any) -> None:
+        """
+        Completes the RPC that the response on `topic` answers. The request
+        id is the last level of the topic, unless the EVP2 body carries it.
+        Responses arriving after the deadline of their RPC are discarded.
+        """
+        self.expire()
+        reqid = topic.rsplit("/", 1)[-1]
+        response = payload
+        if isinstance(payload, dict) and EVP2_RESPONSE in payload:
+            response = payload[EVP2_RESPONSE]
+            if isinstance(response, dict):
+                reqid = str(response.get("reqid", reqid))
+
+        call: Optional[PendingRPC] = self._pending.pop(reqid, None)
+        if call is None:
+            logger.debug(f"Discarding response to unknown or expired RPC {reqid}")
+            return
+        call.set_response(response)
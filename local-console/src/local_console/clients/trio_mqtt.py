@@ -0,0 +1,536 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+import socket
+import ssl
+from collections import Counter
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import trio
+from local_console.clients.mqtt_codec import decode_ack
+from local_console.clients.mqtt_codec import decode_connack
+from local_console.clients.mqtt_codec import decode_publish
+from local_console.clients.mqtt_codec import decode_suback
+from local_console.clients.mqtt_codec import DISCONNECT
+from local_console.clients.mqtt_codec import encode_ack
+from local_console.clients.mqtt_codec import encode_connect
+from local_console.clients.mqtt_codec import encode_publish
+from local_console.clients.mqtt_codec import encode_publish_header
+from local_console.clients.mqtt_codec import encode_subscribe
+from local_console.clients.mqtt_codec import encode_unsubscribe
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_codec import MQTTProtocolError
+from local_console.clients.mqtt_codec import MQTTVersion
+from local_console.clients.mqtt_codec import Packet
+from local_console.clients.mqtt_codec import PacketReader
+from local_console.clients.mqtt_codec import PacketType
+from local_console.clients.mqtt_codec import PINGREQ
+from local_console.clients.mqtt_outbound import OutboundStore
+from local_console.clients.mqtt_queues import DEFAULT_CAPACITY
+from local_console.clients.mqtt_queues import MessageQueues
+from local_console.clients.mqtt_queues import QueueSpec
+
+logger = logging.getLogger(__name__)
+
+RECEIVE_SIZE = 64 * 1024
+# Payloads from this size on are written to the socket straight from the
+# caller's buffer, instead of being copied along with the packet header.
+LARGE_PAYLOAD = 64 * 1024
+# Default limit of QoS 1 and 2 messages awaiting acknowledgement,
+# the same as mosquitto's max_inflight_messages.
+MAX_INFLIGHT = 20
+
+# Latest TLS session with each broker, by the context that established it,
+# which the next connection resumes to skip the full handshake.
+_tls_sessions: dict[tuple[ssl.SSLContext, str, int], ssl.SSLSession] = {}
+
+
+class MQTTConnectionError(ConnectionError):
+    """
+    Conveys the failure of the connection to the broker, or of an
+    operation that required the connection to be established
+    """
+
+
+class _PendingAck:
+    def __init__(self) -> None:
+        self.event = trio.Event()
+        self.codes: list[int] = []
+        self.error: Optional[Exception] = None
+
+    def resolve(self, codes: list[int]) -> None:
+        self.codes = codes
+        self.event.set()
+
+    def fail(self, error: Exception) -> None:
+        self.error = error
+        self.event.set()
+
+
+class MQTTClient:
+    """
+    MQTT 3.1.1 and 5 client running natively on trio. Reading from the
+    socket happens in a task started in the given nursery, which also
+    answers the acknowledgements owed to the broker, and keepalive is
+    handled by another task that pings the broker whenever nothing has
+    been sent within the keepalive period.
+
+    Received messages are buffered in bounded per-topic queues, which
+    consumers read via `messages()`. See `MessageQueues` for how they are
+    prioritized and what is dropped when one is full.
+
+    QoS 1 and 2 publications are pipelined: up to `max_inflight` of them
+    await their acknowledgement at once, and further ones wait for a slot.
+    Until acknowledged, messages are kept in the `outbound` store. If the
+    connection is lost, they are retransmitted when connect() is called
+    again, and publishing at QoS 1 and 2 keeps queueing messages meanwhile.
+    Only disconnect() ends the session, failing the publications in flight.
+    With a persistent `outbound` store, the broker is asked to keep the
+    session across connections too, under the same `client_id`.
+
+    Given an `ssl_context`, connections are secured with TLS, resuming the
+    session of the previous connection to the same broker when possible.
+    `tls_resumed` tells whether the current connection did.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        nursery: trio.Nursery,
+        protocol: MQTTVersion = MQTTVersion.V311,
+        keepalive: int = 60,
+        max_buffer: int = DEFAULT_CAPACITY,
+        queues: Optional[list[QueueSpec]] = None,
+        send_buffer: Optional[int] = None,
+        max_inflight: int = MAX_INFLIGHT,
+        outbound: Optional[OutboundStore] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ) -> None:
+        self.client_id = client_id
+        self.protocol = protocol
+        self.keepalive = keepalive
+        # Left to the OS, which usually auto-tunes it, unless set
+        self.send_buffer = send_buffer
+        self.ssl_context = ssl_context
+        self.tls_resumed = False
+        self._nursery = nursery
+
+        self._stream: Optional[trio.abc.Stream] = None
+        self._reader = PacketReader()
+        self._send_lock = trio.Lock()
+        self._tasks_scope = trio.CancelScope()
+        self._connected = False
+        # Between the first connection and disconnect()
+        self._session = False
+        self._last_sent = 0.0
+        self._ping_outstanding = False
+
+        self._next_id = 0
+        self._pending: dict[int, _PendingAck] = {}
+        self._incoming_qos2: set[int] = set()
+        self._window = trio.Semaphore(max_inflight)
+        self.outbound = OutboundStore() if outbound is None else outbound
+
+        self._queues = MessageQueues(queues, max_buffer)
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    async def connect(
+        self,
+        host: str,
+        port: int = 1883,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        timeout: float = 10,
+    ) -> None:
+        """
+        Connects to the broker and waits for it to accept the connection,
+        then retransmits the messages left unacknowledged in `outbound`.
+        Raises OSError if the broker cannot be reached.
+        """
+        if self._connected:
+            raise MQTTConnectionError("Already connected")
+        self._reader = PacketReader()
+        self._tasks_scope = trio.CancelScope()
+        self._ping_outstanding = False
+        tcp_stream = await trio.open_tcp_stream(host, port)
+        self._stream = tcp_stream
+        try:
+            await self._handshake(tcp_stream, host, port, username, password, timeout)
+        except BaseException:
+            # Including cancellation, so that the stream is never left open
+            await self._close()
+            raise
+
+        self._connected = True
+        self._session = True
+        self._queues.reopen()
+        self._nursery.start_soon(self._run, self._stream, self._tasks_scope)
+        logger.debug(f"Connected to MQTT broker {host}:{port}")
+        await self._retransmit()
+
+    async def _handshake(
+        self,
+        tcp_stream: trio.SocketStream,
+        host: str,
+        port: int,
+        username: Optional[str],
+        password: Optional[str],
+        timeout: float,
+    ) -> None:
+        """
+        Sends the CONNECT packet over `tcp_stream`, returning once the
+        broker has accepted the connection. The caller closes the stream
+        if this raises.
+        """
+        tcp_stream.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, True)
+        if self.send_buffer:
+            tcp_stream.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        if self.ssl_context:
+            self._stream = await self._start_tls(tcp_stream, host, port)
+
+        clean_start = not self.outbound.persistent
+        await self._send(
+            encode_connect(
+                self.client_id,
+                self.keepalive,
+                self.protocol,
+                clean_start,
+                username,
+                password,
+            )
+        )
+        with trio.move_on_after(timeout):
+            while True:
+                for packet in await self._receive():
+                    if packet.type != PacketType.CONNACK:
+                        raise MQTTProtocolError(
+                            f"Expected CONNACK, got {packet.type.name}"
+                        )
+                    _, code = decode_connack(packet, self.protocol)
+                    if code:
+                        raise MQTTConnectionError(
+                            f"Connection refused by {host}:{port} with code {code}"
+                        )
+                    if self.ssl_context:
+                        # Session tickets are only sent along with the CONNACK
+                        self._keep_tls_session(host, port)
+                    return
+
+        raise MQTTConnectionError(f"Timed out waiting for CONNACK from {host}:{port}")
+
+    async def _start_tls(
+        self, tcp_stream: trio.SocketStream, host: str, port: int
+    ) -> trio.SSLStream:
+        assert self.ssl_context
+        stream = trio.SSLStream(tcp_stream, self.ssl_context, server_hostname=host)
+        session = _tls_sessions.get((self.ssl_context, host, port))
+        if session:
+            # Forwarded to the SSL object, which the stubs do not tell
+            stream.session = session  # type: ignore[misc]
+        try:
+            await stream.do_handshake()
+        except trio.BrokenResourceError as e:
+            raise MQTTConnectionError(
+                f"TLS handshake with {host}:{port} failed: {e.__cause__ or e}"
+            )
+        self.tls_resumed = stream.session_reused
+        return stream
+
+    def _keep_tls_session(self, host: str, port: int) -> None:
+        assert self.ssl_context
+        assert isinstance(self._stream, trio.SSLStream)
+        session = self._stream.session
+        if session:
+            _tls_sessions[(self.ssl_context, host, port)] = session
+
+    async def disconnect(self) -> None:
+        """
+        Ends the session. Publications awaiting acknowledgement fail, and
+        their messages are left in `outbound`.
+        """
+        if self._connected:
+            try:
+                await self._send(DISCONNECT)
+            except MQTTConnectionError:
+                pass
+        error = MQTTConnectionError("Client disconnected")
+        self._connection_lost(error)
+        self._session = False
+        for pending in self._pending.values():
+            pending.fail(error)
+        await self._close()
+
+    async def subscribe(self, topic: str, qos: int = 0) -> int:
+        """
+        Subscribes to a topic filter, returning the QoS granted by the broker.
+        """
+        packet_id, pending = self._register_pending()
+        await self._send(encode_subscribe(packet_id, [(topic, qos)], self.protocol))
+        codes = await self._wait(packet_id, pending)
+        if not codes or codes[0] >= 0x80:
+            raise MQTTConnectionError(f"Subscription to {topic} was refused")
+        return codes[0]
+
+    async def unsubscribe(self, topic: str) -> None:
+        packet_id, pending = self._register_pending()
+        await self._send(encode_unsubscribe(packet_id, [topic], self.protocol))
+        await self._wait(packet_id, pending)
+
+    async def publish(
+        self,
+        topic: str,
+        payload: Optional[str | bytes] = None,
+        qos: int = 0,
+        retain: bool = False,
+    ) -> None:
+        """
+        Publishes a message. Returns once the message has been written to
+        the socket for QoS 0, or acknowledged by the broker for QoS 1 and 2.
+        """
+        if not (self._connected or (qos and self._session)):
+            raise MQTTConnectionError("Not connected")
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        message = Message(topic, payload or b"", qos, retain)
+        if not qos:
+            await self._send(*self._encode_publish(message))
+            return
+
+        async with self._window:
+            message.packet_id, pending = self._register_pending(offline=True)
+            self.outbound.add(message)
+            if self._connected:
+                await self._send_stored(message)
+            codes = await self._wait(message.packet_id, pending)
+        if codes and codes[0] >= 0x80:
+            raise MQTTConnectionError(
+                f"Publication to {topic} was refused with code {codes[0]}"
+            )
+
+    @property
+    def dropped(self) -> Counter[str]:
+        """
+        Number of received messages dropped by each receive queue
+        """
+        return self._queues.dropped
+
+    @asynccontextmanager
+    async def messages(self) -> AsyncIterator[MessageQueues]:
+        """
+        Provides the received messages, as an async iterable that ends
+        when the connection is lost.
+        """
+        yield self._queues
+
+    async def _send_stored(self, message: Message) -> None:
+        try:
+            if self.outbound.is_released(message.packet_id):
+                await self._send(encode_ack(PacketType.PUBREL, message.packet_id))
+            else:
+                await self._send(*self._encode_publish(message))
+                self.outbound.mark_sent(message.packet_id)
+        except MQTTConnectionError:
+            # Left for retransmission on the next connection
+            pass
+
+    async def _retransmit(self) -> None:
+        if self.outbound:
+            logger.debug(f"Retransmitting {len(self.outbound)} messages")
+        for message in self.outbound:
+            if message.packet_id not in self._pending:
+                # Published in a former process, or by a former client
+                self._pending[message.packet_id] = _PendingAck()
+            await self._send_stored(message)
+
+    def _encode_publish(self, message: Message) -> tuple[bytes, ...]:
+        if len(message.payload) < LARGE_PAYLOAD:
+            return (encode_publish(message, self.protocol),)
+        return encode_publish_header(message, self.protocol), message.payload
+
+    async def _send(self, *parts: bytes) -> None:
+        """
+        Writes out the given parts, one after the other
+        and without interleaving with other packets.
+        """
+        if self._stream is None:
+            raise MQTTConnectionError("Not connected")
+        async with self._send_lock:
+            try:
+                for data in parts:
+                    await self._stream.send_all(data)
+            except (trio.BrokenResourceError, trio.ClosedResourceError) as e:
+                error = MQTTConnectionError(f"Connection lost: {e}")
+                self._connection_lost(error)
+                raise error
+        self._last_sent = trio.current_time()
+
+    async def _receive(self) -> list[Packet]:
+        if self._stream is None:
+            raise MQTTConnectionError("Not connected")
+        data = await self._stream.receive_some(RECEIVE_SIZE)
+        if not data:
+            raise MQTTConnectionError("Connection closed by the broker")
+        return self._reader.feed(data)
+
+    async def _close(self) -> None:
+        self._tasks_scope.cancel()
+        if self._stream is not None:
+            stream, self._stream = self._stream, None
+            with trio.CancelScope(shield=True):
+                await stream.aclose()
+
+    def _register_pending(self, offline: bool = False) -> tuple[int, _PendingAck]:
+        if not (self._connected or offline):
+            raise MQTTConnectionError("Not connected")
+        if len(self._pending) + len(self.outbound) >= 0xFFFF:
+            raise MQTTConnectionError("No packet identifiers available")
+        while True:
+            self._next_id = self._next_id % 0xFFFF + 1
+            if (
+                self._next_id not in self._pending
+                and self._next_id not in self.outbound
+            ):
+                break
+        pending = _PendingAck()
+        self._pending[self._next_id] = pending
+        return self._next_id, pending
+
+    async def _wait(self, packet_id: int, pending: _PendingAck) -> list[int]:
+        try:
+            await pending.event.wait()
+        finally:
+            self._pending.pop(packet_id, None)
+        if pending.error:
+            raise pending.error
+        return pending.codes
+
+    def _connection_lost(self, error: Exception) -> None:
+        if not self._connected:
+            return
+        self._connected = False
+        logger.debug(f"MQTT connection closed: {error}")
+        for packet_id, pending in self._pending.items():
+            # Publications are retransmitted on the next connection
+            if packet_id not in self.outbound:
+                pending.fail(error)
+        self._tasks_scope.cancel()
+        # Lets consumers of `messages()` know there is nothing more to come
+        self._queues.close()
+
+    async def _run(
+        self, stream: trio.abc.Stream, tasks_scope: trio.CancelScope
+    ) -> None:
+        with tasks_scope:
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(self._read_loop)
+                nursery.start_soon(self._keepalive_loop)
+        # Unless already replaced by a new connection
+        if self._stream is stream:
+            await self._close()
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                for packet in await self._receive():
+                    await self._dispatch(packet)
+        except (
+            MQTTConnectionError,
+            MQTTProtocolError,
+            trio.BrokenResourceError,
+            trio.ClosedResourceError,
+        ) as e:
+            if self._connected:
+                logger.error(f"MQTT connection lost: {e}")
+            self._connection_lost(e)
+
+    async def _keepalive_loop(self) -> None:
+        if not self.keepalive:
+            return
+        try:
+            while True:
+                await trio.sleep_until(self._last_sent + self.keepalive)
+                if trio.current_time() - self._last_sent < self.keepalive:
+                    continue
+                if self._ping_outstanding:
+                    logger.error("MQTT broker did not answer to keepalive ping")
+                    self._connection_lost(MQTTConnectionError("Keepalive timeout"))
+                    return
+                self._ping_outstanding = True
+                await self._send(PINGREQ)
+        except MQTTConnectionError:
+            # Already notified by _send
+            pass
+
+    async def _dispatch(self, packet: Packet) -> None:
+        ptype = packet.type
+        if ptype == PacketType.PUBLISH:
+            await self._on_publish(decode_publish(packet, self.protocol))
+        elif ptype in (PacketType.PUBACK, PacketType.PUBCOMP):
+            packet_id, reason = decode_ack(packet)
+            self.outbound.remove(packet_id)
+            self._resolve(packet_id, [reason])
+        elif ptype == PacketType.PUBREC:
+            packet_id, reason = decode_ack(packet)
+            if reason >= 0x80:
+                self.outbound.remove(packet_id)
+                self._resolve(packet_id, [reason])
+            else:
+                self.outbound.release(packet_id)
+                await self._send(encode_ack(PacketType.PUBREL, packet_id))
+        elif ptype == PacketType.PUBREL:
+            packet_id, _ = decode_ack(packet)
+            self._incoming_qos2.discard(packet_id)
+            await self._send(encode_ack(PacketType.PUBCOMP, packet_id))
+        elif ptype in (PacketType.SUBACK, PacketType.UNSUBACK):
+            packet_id, codes = decode_suback(packet, self.protocol)
+            self._resolve(packet_id, codes)
+        elif ptype == PacketType.PINGRESP:
+            self._ping_outstanding = False
+        elif ptype == PacketType.DISCONNECT:
+            raise MQTTConnectionError("Disconnected by the broker")
+        else:
+            raise MQTTProtocolError(f"Unexpected {ptype.name} packet")
+
+    async def _on_publish(self, message: Message) -> None:
+        if message.qos == 2:
+            await self._send(encode_ack(PacketType.PUBREC, message.packet_id))
+            if message.packet_id in self._incoming_qos2:
+                # Redelivery of a message not yet released
+                return
+            self._incoming_qos2.add(message.packet_id)
+        elif message.qos == 1:
+            await self._send(encode_ack(PacketType.PUBACK, message.packet_id))
+
+        self._queues.put(message)
+
+    def _resolve(self, packet_id: int, codes: list[int]) -> None:
+        pending = self._pending.get(packet_id)
+        if pending:
+            if not pending.event.statistics().tasks_waiting:
+                # Nobody to collect it, as retransmitted from a former client
+                self._pending.pop(packet_id)
+            pending.resolve(codes)
+        else:
+            logger.debug(f"Acknowledgement for unknown packet {packet_id}")
+
+    def __repr__(self) -> str:
+        state = "connected" if self._connected else "disconnected"
+        return f"<MQTTClient {self.client_id} {state}>"
@@ -14,12 +14,16 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 import logging
+from pathlib import Path
 from typing import Annotated
+from typing import Optional
 
 import trio
 import typer
 from exceptiongroup import ExceptionGroup
+from local_console.core.config import broker_credentials
 from local_console.core.config import config_obj
+from local_console.core.config import optional_path
 from local_console.core.schemas.schemas import DeviceConnection
 from local_console.plugin import PluginBase
 from local_console.servers.broker import BrokerException
@@ -40,18 +44,40 @@ def broker(
         bool,
         typer.Option("--verbose", "-v", help="Starts the broker in verbose mode"),
     ] = False,
+    embedded: Annotated[
+        bool,
+        typer.Option(
+            "--embedded",
+            help="Runs the built-in broker instead of mosquitto. Also set by the broker.embedded setting",
+        ),
+    ] = False,
 ) -> None:
     logger.setLevel(logging.DEBUG if verbose else logging.INFO)
     device_config = config_obj.get_active_device_config()
-    trio.run(broker_task, device_config, verbose)
+    broker_params = config_obj.get_config().broker
+    embedded = embedded or broker_params.embedded
+    log_dir = optional_path(broker_params.log_dir)
+    trio.run(broker_task, device_config, verbose, embedded, log_dir)
 
 
-async def broker_task(config: DeviceConnection, verbose: bool) -> None:
+async def broker_task(
+    config: DeviceConnection,
+    verbose: bool,
+    embedded: bool = False,
+    log_dir: Optional[Path] = None,
+) -> None:
     logger.setLevel(logging.INFO)
     try:
         async with (
             open_nursery() as nursery,
-            spawn_broker(config.mqtt.port, nursery, verbose),
+            spawn_broker(
+                config.mqtt.port,
+                nursery,
+                verbose,
+                embedded,
+                log_dir,
+                broker_credentials(),
+            ),
         ):
             try:
                 logger.info(f"MQTT broker listening on port {config.mqtt.port}")
@@ -15,6 +15,7 @@
 # SPDX-License-Identifier: Apache-2.0
 import json
 import logging
+from pathlib import Path
 from typing import Annotated
 from typing import Any
 from typing import Optional
@@ -78,15 +79,19 @@ def config_get(
         raise typer.Exit(1)
 
 
+# Sections of the configuration that apply to all devices
+GLOBAL_SECTIONS = ("evp.", "broker.")
+
+
 def _set(section: str, new: str | None, device: str | None) -> None:
-    if section.startswith("evp."):
-        __set_evp(section, new, device)
+    if section.startswith(GLOBAL_SECTIONS):
+        __set_global_scope(section, new, device)
     else:
         __set_device_scope(section, new, device)
 
 
 def __set_device_scope(section: str, new: str | None, device: str | None) -> None:
-    assert not section.startswith("evp.")
+    assert not section.startswith(GLOBAL_SECTIONS)
 
     device_config = (
         config_obj.get_active_device_config()
@@ -117,8 +122,8 @@ def __set_device_scope(section: str, new: str | None, device: str | None) -> Non
         raise SystemExit(f"Error setting '{section}'. {e.errors()[0]['msg']}.")
 
 
-def __set_evp(section: str, new: str | None, device: str | None) -> None:
-    assert section.startswith("evp.")
+def __set_global_scope(section: str, new: str | None, device: str | None) -> None:
+    assert section.startswith(GLOBAL_SECTIONS)
 
     sections_split = section.split(".")
     selected_config = config_obj.config
@@ -203,14 +208,61 @@ def config_instance(
         )
 
 
+@app.command("instances", help="Configure several application module instances at once")
+def config_instances(
+    configs_file: Annotated[
+        Path,
+        typer.Argument(
+            help="JSON file mapping each instance to its configurations by topic, "
+            'e.g. {"node": {"threshold": "0.5"}}. Non-string configurations are '
+            "sent JSON-encoded",
+            exists=True,
+            dir_okay=False,
+        ),
+    ],
+) -> None:
+    try:
+        configs = read_instance_configs(configs_file)
+    except ValueError as e:
+        raise SystemExit(f"Invalid configurations file {configs_file}: {e}")
+    try:
+        trio.run(configure_instances_task, configs)
+    except ConnectionError:
+        raise SystemExit("Connection error while attempting to set configurations")
+
+
+def read_instance_configs(configs_file: Path) -> list[tuple[str, str, str]]:
+    """
+    Reads the (instance_id, topic, config) configurations of `configs_file`
+    """
+    by_instance = json.loads(configs_file.read_text())
+    if not isinstance(by_instance, dict) or not all(
+        isinstance(by_topic, dict) for by_topic in by_instance.values()
+    ):
+        raise ValueError("expected an object of objects")
+    return [
+        (instance_id, topic, cfg if isinstance(cfg, str) else json.dumps(cfg))
+        for instance_id, by_topic in by_instance.items()
+        for topic, cfg in by_topic.items()
+    ]
+
+
 async def configure_task(instance_id: str, topic: str, cfg: str) -> None:
+    await configure_instances_task([(instance_id, topic, cfg)])
+
+
+async def configure_instances_task(configs: list[tuple[str, str, str]]) -> None:
+    """
+    Sends the configurations over a single connection, pipelined, and
+    returns once the broker acknowledged them all.
+    """
     config = config_obj.get_config()
     config_device = config_obj.get_active_device_config()
     schema = OnWireProtocol.from_iot_spec(config.evp.iot_platform)
     agent = Agent(config_device.mqtt.host, config_device.mqtt.port, schema)
-    await agent.initialize_handshake()
     async with agent.mqtt_scope([]):
-        await agent.configure(instance_id, topic, cfg)
+        await agent.initialize_handshake()
+        await agent.configure_many(configs)
 
 
 @app.command("device", help="Configure the device")
@@ -0,0 +1,128 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Annotated
+from typing import Optional
+
+import typer
+from local_console.core.camera.batch_decode import BatchDecoder
+from local_console.core.camera.batch_decode import DecodeFormat
+from local_console.core.camera.flatbuffers import conform_flatbuffer_schema
+from local_console.core.camera.flatbuffers import FlatbufferError
+from local_console.core.camera.flatbuffers import map_class_id_to_name
+from local_console.core.camera.recording import columnar_available
+from local_console.plugin import PluginBase
+
+logger = logging.getLogger(__name__)
+
+app = typer.Typer()
+
+
+@app.command(help="Decode a directory of captured inference files")
+def decode(
+    input_dir: Annotated[
+        Path,
+        typer.Argument(help="Directory holding the captured inference files"),
+    ],
+    schema: Annotated[
+        Path,
+        typer.Option("--schema", "-s", help="FlatBuffers schema of the outputs"),
+    ],
+    output_dir: Annotated[
+        Path,
+        typer.Option("--output", "-o", help="Directory to write the decoded outputs"),
+    ],
+    labels: Annotated[
+        Optional[Path],
+        typer.Option("--labels", "-l", help="Labels file, one class name per line"),
+    ] = None,
+    output_format: Annotated[
+        DecodeFormat,
+        typer.Option(
+            "--format",
+            "-f",
+            help="Write one JSON file per input, or results files as produced by the recorder",
+        ),
+    ] = DecodeFormat.JSON,
+    workers: Annotated[
+        Optional[int],
+        typer.Option(
+            "--workers", "-j", help="Number of worker processes. Defaults to all cores"
+        ),
+    ] = None,
+    chunk_size: Annotated[
+        int,
+        typer.Option(min=1, help="Number of files handed to a worker at a time"),
+    ] = 256,
+    resume: Annotated[
+        bool,
+        typer.Option(help="Skip the files decoded by a previous, interrupted run"),
+    ] = True,
+) -> None:
+    if not input_dir.is_dir():
+        logger.error(f"{input_dir} is not a directory")
+        raise typer.Exit(1)
+    if output_format in (DecodeFormat.ARROW, DecodeFormat.PARQUET):
+        if not columnar_available():
+            logger.error(
+                f"Format '{output_format}' requires pyarrow. Please install it or use '{DecodeFormat.NDJSON}'"
+            )
+            raise typer.Exit(1)
+
+    try:
+        conform_flatbuffer_schema(schema)
+        labels_map = map_class_id_to_name(labels)
+    except FlatbufferError as e:
+        logger.error(f"Invalid schema or labels: {e}")
+        raise typer.Exit(1)
+
+    decoder = BatchDecoder(
+        input_dir,
+        output_dir,
+        schema,
+        output_format,
+        labels_map=labels_map,
+        chunk_size=chunk_size,
+    )
+    if not resume:
+        decoder.reset()
+
+    workers = workers if workers else os.cpu_count()
+    start = time.perf_counter()
+    pending = decoder.pending()
+    with (
+        ProcessPoolExecutor(max_workers=workers) as executor,
+        typer.progressbar(length=len(pending[0]), label="Decoding") as progress,
+    ):
+        summary = decoder.run(executor, progress.update, pending)
+    elapsed = time.perf_counter() - start
+
+    processed = summary.decoded + summary.failed
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(
+        f"Decoded {summary.decoded} files ({summary.failed} failed, {summary.skipped} already done) "
+        f"in {elapsed:.1f}s ({rate:.1f} files/s) into {output_dir}"
+    )
+    if summary.failed:
+        raise typer.Exit(1)
+
+
+class DecodeCommand(PluginBase):
+    implementer = app
@@ -26,12 +26,22 @@ from typing import Optional
 import trio
 import typer
 from local_console.clients.agent import Agent
+from local_console.clients.mqtt_router import TopicRouter
 from local_console.core.camera.enums import DeployStage
 from local_console.core.camera.enums import MQTTTopics
 from local_console.core.commands.deploy import DeployFSM
+from local_console.core.commands.deploy import diff_manifests
 from local_console.core.commands.deploy import get_empty_deployment
 from local_console.core.commands.deploy import manifest_setup_epilog
+from local_console.core.commands.deploy import manifest_template
+from local_console.core.commands.deploy import ManifestDelta
+from local_console.core.commands.fleet_deploy import DEFAULT_PARALLELISM
+from local_console.core.commands.fleet_deploy import DeviceOutcome
+from local_console.core.commands.fleet_deploy import FleetDeployment
+from local_console.core.commands.fleet_deploy import FleetProgress
+from local_console.core.commands.fleet_deploy import select_devices
 from local_console.core.config import config_obj
+from local_console.core.config import ConfigError
 from local_console.core.enums import config_paths
 from local_console.core.enums import ModuleExtension
 from local_console.core.enums import Target
@@ -39,6 +49,7 @@ from local_console.core.schemas.schemas import DeploymentManifest
 from local_console.core.schemas.schemas import OnWireProtocol
 from local_console.plugin import PluginBase
 from local_console.servers.webserver import SyncWebserver
+from local_console.utils.json_codec import json_decode
 from local_console.utils.local_network import get_my_ip_by_routing
 from local_console.utils.local_network import is_localhost
 
@@ -90,8 +101,31 @@ def deploy(
             ),
         ),
     ] = False,
+    devices: Annotated[
+        Optional[str],
+        typer.Option(
+            "-d",
+            "--devices",
+            help=(
+                "Deploy to several devices at once: either 'all' or a comma-separated "
+                "list of device names, which may contain wildcards (e.g. 'lab-*')"
+            ),
+        ),
+    ] = None,
+    parallel: Annotated[
+        int,
+        typer.Option(
+            "--parallel",
+            min=1,
+            help="Maximum number of devices deployed to at the same time",
+        ),
+    ] = DEFAULT_PARALLELISM,
 ) -> None:
     config = config_obj.get_config()
+    if devices is not None:
+        fleet_deploy(devices, parallel, empty, signed, timeout, target)
+        return
+
     config_device = config_obj.get_active_device_config()
     schema = OnWireProtocol.from_iot_spec(config.evp.iot_platform)
     agent = Agent(config_device.mqtt.host, config_device.mqtt.port, schema)
@@ -125,6 +159,7 @@ def deploy(
         if not bin_fp.is_dir():
             raise Exception(f"'bin' folder does not exist at {bin_fp.parent}")
 
+        previous = last_deployment()
         deployment_manifest = multiple_module_manifest_setup(
             bin_fp,
             deploy_fsm.webserver,
@@ -133,6 +168,7 @@ def deploy(
             port,
             host_override,
         )
+        report_delta(deployment_manifest, previous)
         Path(config_paths.deployment_json).write_text(
             json.dumps(deployment_manifest.model_dump(), indent=2)
         )
@@ -155,6 +191,77 @@ def deploy(
         sys.exit(0 if success else 1)
 
 
+def fleet_deploy(
+    selector: str,
+    parallelism: int,
+    empty: bool,
+    signed: bool,
+    timeout: int,
+    target: Optional[Target],
+) -> None:
+    """
+    Deploys the project to the devices picked by `selector`, whose
+    modules are served by a single local webserver.
+    """
+    schema = OnWireProtocol.from_iot_spec(config_obj.get_config().evp.iot_platform)
+    try:
+        fleet = select_devices(config_obj.get_device_configs(), selector)
+    except ConfigError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    progress = FleetProgress(fleet, on_change=log_fleet_progress)
+    webserver = SyncWebserver(Path())
+    success = False
+    try:
+        with webserver:
+            if empty:
+                deployment_manifest = get_empty_deployment()
+            else:
+                bin_fp = Path.cwd() / config_paths.bin
+                if not bin_fp.is_dir():
+                    raise Exception(f"'bin' folder does not exist at {bin_fp.parent}")
+
+                previous = last_deployment()
+                deployment_manifest = multiple_module_manifest_setup(
+                    bin_fp, webserver, target, signed
+                )
+                report_delta(deployment_manifest, previous)
+                Path(config_paths.deployment_json).write_text(
+                    json.dumps(deployment_manifest.model_dump(), indent=2)
+                )
+
+            deployment = FleetDeployment(
+                fleet,
+                schema,
+                deployment_manifest,
+                webserver,
+                exec_deployment,
+                parallelism,
+                timeout,
+                progress,
+            )
+            trio.run(deployment.run)
+
+        for outcome in progress.outcomes.values():
+            if outcome.success:
+                logger.info(f"{outcome.name}: deployed in {outcome.elapsed:.1f}s")
+            else:
+                logger.error(f"{outcome.name}: failed ({outcome.error})")
+        success = progress.complete and not progress.failed
+
+    except Exception as e:
+        logger.exception("Deployment error", exc_info=e)
+    except KeyboardInterrupt:
+        logger.info("Cancelled by the user")
+    finally:
+        sys.exit(0 if success else 1)
+
+
+def log_fleet_progress(progress: FleetProgress, outcome: DeviceOutcome) -> None:
+    logger.info(f"{outcome.name}: {outcome.stage} ({progress.summary()})")
+
+
 class DeployCommand(PluginBase):
     implementer = app
 
@@ -176,7 +283,8 @@ def multiple_module_manifest_setup(
     """
     assert files_dir.is_dir()
     webserver.set_directory(files_dir)
-    manifest = config_obj.get_deployment()
+    # The stored manifest is the one last built in the project, if any
+    manifest = manifest_template(config_obj.get_deployment())
     mod_identifiers = list(manifest.deployment.modules.keys())
     for ident in mod_identifiers:
         manifest.deployment.modules[ident].downloadUrl = str(
@@ -188,6 +296,38 @@ def multiple_module_manifest_setup(
     )
 
 
+def last_deployment() -> Optional[DeploymentManifest]:
+    try:
+        return config_obj.get_deployment()
+    except ConfigError:
+        return None
+
+
+def report_delta(
+    manifest: DeploymentManifest, previous: Optional[DeploymentManifest]
+) -> ManifestDelta:
+    """
+    Logs which modules of `manifest` changed from `previous`, the manifest
+    last built in the project directory. That manifest is not specific to
+    any device, so a device may still lack modules reported as unchanged.
+    """
+    delta = diff_manifests(manifest, previous)
+    if delta.identical:
+        logger.info("No changes since the last local build")
+        return delta
+
+    if delta.unchanged:
+        logger.info(
+            "Modules unchanged since the last local build: "
+            f"{', '.join(delta.unchanged)}"
+        )
+    if delta.changed:
+        logger.info(
+            f"Modules changed since the last local build: {', '.join(delta.changed)}"
+        )
+    return delta
+
+
 def project_binary_lookup(
     files_dir: Path,
     module_base_name: str,
@@ -225,17 +365,17 @@ async def exec_deployment(
     agent: Agent,
     deploy_fsm: DeployFSM,
     stage_callback: Optional[Callable[[DeployStage], None]] = None,
+    handshake_timeout: float = 5,
 ) -> bool:
     assert agent.onwire_schema
     success = False
 
-    # Ensure device readiness to receive a deployment manifest
-    await agent.initialize_handshake()
-
     async with (
         trio.open_nursery() as nursery,
         agent.mqtt_scope([MQTTTopics.ATTRIBUTES.value]),
     ):
+        # Ensure device readiness to receive a deployment manifest
+        await agent.initialize_handshake(handshake_timeout)
 
         # assert agent.nursery
         deploy_loop = partial(stimuli_loop, agent, deploy_fsm)
@@ -256,10 +396,15 @@ async def stimuli_loop(agent: Agent, fsm: DeployFSM) -> None:
     """
     assert agent.client is not None
 
+    router = TopicRouter()
+    router.add_handler(
+        MQTTTopics.ATTRIBUTES.value,
+        partial(stimulus_proc, onwire_schema=agent.onwire_schema, fsm=fsm),
+        key="deploymentStatus",
+    )
     async with agent.client.messages() as mgen:
         async for msg in mgen:
-            payload = json.loads(msg.payload)
-            await stimulus_proc(msg.topic, payload, agent.onwire_schema, fsm)
+            await router.dispatch(msg)
 
 
 async def stimulus_proc(
@@ -268,16 +413,14 @@ async def stimulus_proc(
     onwire_schema: Optional[OnWireProtocol],
     fsm: DeployFSM,
 ) -> None:
-    if (
-        payload
-        and topic == MQTTTopics.ATTRIBUTES.value
-        and "deploymentStatus" in payload
-    ):
-        deploy_status_repr = payload.get("deploymentStatus", {})
-        if onwire_schema == OnWireProtocol.EVP1 or onwire_schema is None:
-            deploy_status = json.loads(deploy_status_repr)
-        else:
-            deploy_status = deploy_status_repr
-
-        logger.debug("Deploy: %s", deploy_status)
-        await fsm.update(deploy_status)  # type: ignore  # mypy is not seeing the argument???
+    """
+    Handles the deployment status reports routed to it by stimuli_loop().
+    """
+    deploy_status_repr = payload["deploymentStatus"]
+    if onwire_schema == OnWireProtocol.EVP1 or onwire_schema is None:
+        deploy_status = json_decode(deploy_status_repr)
+    else:
+        deploy_status = deploy_status_repr
+
+    logger.debug("Deploy: %s", deploy_status)
+    await fsm.update(deploy_status)  # type: ignore  # mypy is not seeing the argument???
@@ -13,7 +13,6 @@
 # limitations under the License.
 #
 # SPDX-License-Identifier: Apache-2.0
-import json
 import logging
 from typing import Annotated
 from typing import Callable
@@ -25,6 +24,7 @@ from local_console.core.camera.enums import MQTTTopics
 from local_console.core.config import config_obj
 from local_console.core.schemas.schemas import OnWireProtocol
 from local_console.plugin import PluginBase
+from local_console.utils.json_codec import json_decode
 
 logger = logging.getLogger(__name__)
 
@@ -49,7 +49,7 @@ async def on_message_print_payload(cs: trio.CancelScope, agent: Agent) -> None:
     assert agent.client is not None
     async with agent.client.messages() as mgen:
         async for msg in mgen:
-            payload = json.loads(msg.payload.decode())
+            payload = json_decode(msg.payload)
             if payload:
                 print(payload, flush=True)
             else:
@@ -72,7 +72,7 @@ async def on_message_telemetry(cs: trio.CancelScope, agent: Agent) -> None:
     assert agent.client is not None
     async with agent.client.messages() as mgen:
         async for msg in mgen:
-            payload = json.loads(msg.payload.decode())
+            payload = json_decode(msg.payload)
             if payload:
                 to_print = {
                     key: val for key, val in payload.items() if "device/log" not in key
@@ -102,7 +102,7 @@ def on_message_instance(instance_id: str) -> Callable:
         assert agent.client is not None
         async with agent.client.messages() as mgen:
             async for msg in mgen:
-                payload = json.loads(msg.payload.decode())
+                payload = json_decode(msg.payload)
                 if (
                     "deploymentStatus" not in payload
                     or "instances" not in payload["deploymentStatus"]
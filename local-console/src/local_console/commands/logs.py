@@ -13,15 +13,16 @@
 # limitations under the License.
 #
 # SPDX-License-Identifier: Apache-2.0
-import json
 import logging
 from collections import defaultdict
 from typing import Annotated
+from typing import Any
 from typing import Callable
 
 import trio
 import typer
 from local_console.clients.agent import Agent
+from local_console.clients.mqtt_router import TopicRouter
 from local_console.core.camera.enums import MQTTTopics
 from local_console.core.config import config_obj
 from local_console.core.schemas.schemas import OnWireProtocol
@@ -67,21 +68,25 @@ def on_message_logs(instance_id: str, timeout: int) -> Callable:
     async def __task(cs: trio.CancelScope, agent: Agent) -> None:
         assert agent.client is not None
         with trio.move_on_after(timeout) as time_cs:
+
+            async def print_logs(topic: str, payload: dict[str, Any]) -> None:
+                payload = payload.get("values", payload)
+                if not isinstance(payload, dict) or "device/log" not in payload:
+                    return
+
+                logs = defaultdict(list)
+                for log in payload["device/log"]:
+                    logs[log["app"]].append(log)
+                if instance_id in logs.keys():
+                    time_cs.deadline += timeout
+                    for instance_log in logs[instance_id]:
+                        print(instance_log)
+
+            router = TopicRouter()
+            router.add_handler(MQTTTopics.TELEMETRY.value, print_logs)
             async with agent.client.messages() as mgen:
                 async for msg in mgen:
-                    payload = json.loads(msg.payload.decode())
-                    logs = defaultdict(list)
-                    if "values" in payload:
-                        payload = payload["values"]
-                    if "device/log" not in payload.keys():
-                        continue
-
-                    for log in payload["device/log"]:
-                        logs[log["app"]].append(log)
-                    if instance_id in logs.keys():
-                        time_cs.deadline += timeout
-                        for instance_log in logs[instance_id]:
-                            print(instance_log)
+                    await router.dispatch(msg)
 
         if time_cs.cancelled_caught:
             logger.error(
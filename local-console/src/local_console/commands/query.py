@@ -0,0 +1,124 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+import logging
+from collections import Counter
+from datetime import datetime
+from datetime import timezone
+from itertools import islice
+from pathlib import Path
+from typing import Annotated
+from typing import Optional
+
+import typer
+from local_console.core.camera.recording import ResultsFilter
+from local_console.core.camera.recording import scan_results
+from local_console.core.config import config_obj
+from local_console.plugin import PluginBase
+
+logger = logging.getLogger(__name__)
+
+app = typer.Typer()
+
+
+@app.command(help="Query the inference results recorded while streaming")
+def query(
+    directory: Annotated[
+        Optional[Path],
+        typer.Argument(
+            help="Directory holding the results files. Defaults to the one configured for the active device"
+        ),
+    ] = None,
+    device_id: Annotated[
+        Optional[str],
+        typer.Option("--device-id", help="Only show results from this device"),
+    ] = None,
+    model_id: Annotated[
+        Optional[str],
+        typer.Option("--model-id", help="Only show results from this model"),
+    ] = None,
+    class_id: Annotated[
+        Optional[int],
+        typer.Option("--class-id", "-c", help="Only show results of this class"),
+    ] = None,
+    min_score: Annotated[
+        Optional[float],
+        typer.Option("--min-score", help="Only show results scored at least this"),
+    ] = None,
+    since: Annotated[
+        Optional[datetime],
+        typer.Option(help="Only show results from this moment on (UTC)"),
+    ] = None,
+    until: Annotated[
+        Optional[datetime],
+        typer.Option(help="Only show results before this moment (UTC)"),
+    ] = None,
+    limit: Annotated[
+        Optional[int],
+        typer.Option("--limit", "-n", help="Maximum number of results to print"),
+    ] = None,
+    count: Annotated[
+        bool,
+        typer.Option(
+            "--count", help="Print the number of matching results per class instead"
+        ),
+    ] = False,
+) -> None:
+    if directory is None:
+        configured = config_obj.get_active_device_config().persist.results_dir_path
+        if not configured:
+            logger.error(
+                "No results directory given nor configured at `persist.results_dir_path`"
+            )
+            raise typer.Exit(1)
+        directory = Path(configured)
+
+    if not directory.is_dir():
+        logger.error(f"{directory} is not a directory")
+        raise typer.Exit(1)
+
+    results_filter = ResultsFilter(
+        device_id=device_id,
+        model_id=model_id,
+        class_id=class_id,
+        min_score=min_score,
+        since=to_epoch_ms(since),
+        until=to_epoch_ms(until),
+    )
+    rows = scan_results(directory, results_filter)
+
+    if count:
+        counter = Counter(
+            (row["class_id"], row["class_name"]) for row in rows
+        ).most_common()
+        for (cls_id, cls_name), amount in counter:
+            label = f"{cls_id} ({cls_name})" if cls_name else str(cls_id)
+            print(f"{label}: {amount}")
+    else:
+        for row in islice(rows, limit):
+            print(json.dumps(row), flush=True)
+
+
+def to_epoch_ms(moment: Optional[datetime]) -> Optional[int]:
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+class QueryCommand(PluginBase):
+    implementer = app
@@ -0,0 +1,181 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+from functools import partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Annotated
+from typing import Optional
+
+import trio
+import typer
+from local_console.core.camera._shared import MessageType
+from local_console.core.camera.flatbuffers import FlatbufferError
+from local_console.core.camera.flatbuffers import map_class_id_to_name
+from local_console.core.camera.replay import ReplayError
+from local_console.core.camera.replay import ReplayStats
+from local_console.core.camera.state import CameraState
+from local_console.gui.enums import ApplicationType
+from local_console.plugin import PluginBase
+
+logger = logging.getLogger(__name__)
+
+app = typer.Typer()
+
+
+@app.command(
+    help="Replay captured image/inference pairs through the streaming pipeline"
+)
+def replay(
+    capture_dir: Annotated[
+        Path,
+        typer.Argument(
+            help="Directory holding the captured images. If it has 'images' and 'inferences' subdirectories, they are used instead"
+        ),
+    ],
+    inferences_dir: Annotated[
+        Optional[Path],
+        typer.Option("--inferences", help="Directory holding the captured inferences"),
+    ] = None,
+    speed: Annotated[
+        float,
+        typer.Option(help="Replay rate relative to the original capture timing"),
+    ] = 1.0,
+    max_speed: Annotated[
+        bool,
+        typer.Option(
+            "--max-speed", help="Replay as fast as possible, e.g. for benchmarking"
+        ),
+    ] = False,
+    app_type: Annotated[
+        ApplicationType,
+        typer.Option("--type", "-t", help="Type of application to draw results for"),
+    ] = ApplicationType.CUSTOM,
+    schema: Annotated[
+        Optional[Path],
+        typer.Option("--schema", "-s", help="FlatBuffers schema of the outputs"),
+    ] = None,
+    labels: Annotated[
+        Optional[Path],
+        typer.Option("--labels", "-l", help="Labels file, one class name per line"),
+    ] = None,
+    output_dir: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--output",
+            "-o",
+            help="Directory to store the processed files. Defaults to a temporary one",
+        ),
+    ] = None,
+    results_dir: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--results", help="Record the decoded results into this directory"
+        ),
+    ] = None,
+    max_size: Annotated[
+        Optional[int],
+        typer.Option(help="Storage limit in MB for the processed files"),
+    ] = None,
+) -> None:
+    if speed <= 0:
+        logger.error("Speed must be greater than zero")
+        raise typer.Exit(1)
+
+    images_dir = capture_dir
+    if inferences_dir is None:
+        if (capture_dir / "images").is_dir() and (capture_dir / "inferences").is_dir():
+            images_dir = capture_dir / "images"
+            inferences_dir = capture_dir / "inferences"
+        else:
+            inferences_dir = capture_dir
+
+    for directory in (images_dir, inferences_dir):
+        if not directory.is_dir():
+            logger.error(f"{directory} is not a directory")
+            raise typer.Exit(1)
+
+    try:
+        labels_map = map_class_id_to_name(labels)
+    except FlatbufferError as e:
+        logger.error(f"Invalid labels: {e}")
+        raise typer.Exit(1)
+
+    with TemporaryDirectory(prefix="LocalConsole_") as tempdir:
+        target = output_dir if output_dir else Path(tempdir)
+        try:
+            replay_fn = partial(
+                replay_main,
+                images_dir,
+                inferences_dir,
+                None if max_speed else speed,
+                target,
+                app_type,
+                schema,
+                labels_map,
+                results_dir,
+                max_size,
+            )
+            stats = trio.run(replay_fn)
+        except ReplayError as e:
+            logger.error(str(e))
+            raise typer.Exit(1)
+
+    print(f"Replayed {stats.pairs} pairs in {stats.elapsed:.2f}s")
+    print(f"Throughput: {stats.throughput:.1f} pairs/s")
+    print(
+        f"Processing time per pair: p50 {stats.percentile(50) * 1000:.1f} ms, "
+        f"p95 {stats.percentile(95) * 1000:.1f} ms"
+    )
+    if not max_speed:
+        print(f"Maximum lag behind schedule: {stats.max_lag * 1000:.1f} ms")
+
+
+async def replay_main(
+    images_dir: Path,
+    inferences_dir: Path,
+    speed: Optional[float],
+    output_dir: Path,
+    app_type: ApplicationType,
+    schema: Optional[Path],
+    labels_map: Optional[dict[int, str]],
+    results_dir: Optional[Path],
+    max_size: Optional[int],
+) -> ReplayStats:
+    send_channel: trio.MemorySendChannel[MessageType]
+    send_channel, _ = trio.open_memory_channel(0)
+    camera_state = CameraState(send_channel, trio.lowlevel.current_trio_token())
+    camera_state.vapp_type.value = app_type
+    if schema:
+        camera_state.vapp_schema_file.value = str(schema)
+    camera_state.vapp_labels_map.value = labels_map
+    camera_state.image_dir_path.value = output_dir / "images"
+    camera_state.inference_dir_path.value = output_dir / "inferences"
+    if max_size is not None:
+        camera_state.total_dir_watcher.set_storage_limit(max_size * 1024 * 1024)
+    if results_dir:
+        camera_state.results_dir_path.value = results_dir
+
+    try:
+        return await camera_state.replay_capture(images_dir, inferences_dir, speed)
+    finally:
+        camera_state.unwatch_input_directories()
+        if camera_state.results_recorder:
+            camera_state.results_recorder.close()
+
+
+class ReplayCommand(PluginBase):
+    implementer = app
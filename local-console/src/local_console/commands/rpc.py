@@ -13,12 +13,17 @@
 # limitations under the License.
 #
 # SPDX-License-Identifier: Apache-2.0
+import json
 import logging
 from typing import Annotated
 
 import trio
 import typer
 from local_console.clients.agent import Agent
+from local_console.clients.mqtt_router import TopicRouter
+from local_console.clients.rpc import DEFAULT_RPC_TIMEOUT
+from local_console.clients.rpc import RPCTimeoutError
+from local_console.core.camera.enums import MQTTTopics
 from local_console.core.config import config_obj
 from local_console.core.schemas.schemas import OnWireProtocol
 from local_console.plugin import PluginBase
@@ -42,21 +47,47 @@ def rpc(
         str,
         typer.Argument(help="JSON representing the parameters"),
     ],
+    timeout: Annotated[
+        float,
+        typer.Option(
+            "-t",
+            "--timeout",
+            help="Max seconds to wait for the response of the module instance",
+        ),
+    ] = DEFAULT_RPC_TIMEOUT,
 ) -> None:
     try:
-        trio.run(rpc_task, instance_id, method, params)
+        retcode = trio.run(rpc_task, instance_id, method, params, timeout)
     except ConnectionError:
         raise SystemExit(f"Could not send command {method} to device {instance_id}")
+    raise typer.Exit(code=retcode)
 
 
-async def rpc_task(instance_id: str, method: str, params: str) -> None:
+async def rpc_task(
+    instance_id: str, method: str, params: str, timeout: float = DEFAULT_RPC_TIMEOUT
+) -> int:
+    """
+    Sends the RPC and prints the response, returning the exit code
+    of the command, which is non-zero if no response came in time.
+    """
     config = config_obj.get_config()
     config_device = config_obj.get_active_device_config()
     schema = OnWireProtocol.from_iot_spec(config.evp.iot_platform)
     agent = Agent(config_device.mqtt.host, config_device.mqtt.port, schema)
-    await agent.initialize_handshake()
-    async with agent.mqtt_scope([]):
-        await agent.rpc(instance_id, method, params)
+    async with agent.mqtt_scope([MQTTTopics.RPC_RESPONSES.value]):
+        assert agent.nursery
+        await agent.initialize_handshake()
+        router = TopicRouter()
+        router.add_handler(MQTTTopics.RPC_RESPONSES.value, agent.rpc_requests.resolve)
+        agent.nursery.start_soon(agent.route_messages, router)
+
+        call = await agent.rpc(instance_id, method, params, timeout)
+        try:
+            print(json.dumps(await call))
+        except RPCTimeoutError:
+            logger.error(f"No response to {method} from {instance_id}")
+            return 1
+    return 0
 
 
 class RPCCommand(PluginBase):
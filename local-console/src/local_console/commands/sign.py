@@ -0,0 +1,90 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+from functools import partial
+from pathlib import Path
+from typing import Annotated
+from typing import Optional
+
+import trio
+import typer
+from local_console.core.commands.sign import sign_modules
+from local_console.core.commands.sign import signing_jobs
+from local_console.core.enums import config_paths
+from local_console.core.enums import Target
+from local_console.plugin import PluginBase
+
+logger = logging.getLogger(__name__)
+
+app = typer.Typer()
+
+
+@app.command(
+    help="Command for signing the AoT-compiled modules in the 'bin' folder, for deploying them with 'deploy --signed'"
+)
+def sign(
+    secret: Annotated[
+        Path,
+        typer.Option(
+            "-s",
+            "--secret",
+            help="ECDSA P-256 private key, in PEM format, to sign the modules with",
+            exists=True,
+            dir_okay=False,
+        ),
+    ],
+    targets: Annotated[
+        Optional[list[Target]],
+        typer.Argument(
+            help="AoT compilation targets whose modules are signed. All of them if not defined"
+        ),
+    ] = None,
+    force: Annotated[
+        bool,
+        typer.Option(
+            "-f",
+            "--force",
+            help="Sign the modules again, even if their signed files are up to date",
+        ),
+    ] = False,
+) -> None:
+    bin_fp = Path.cwd() / config_paths.bin
+    if not bin_fp.is_dir():
+        logger.error(f"'bin' folder does not exist at {bin_fp.parent}")
+        raise typer.Exit(1)
+
+    jobs = signing_jobs(bin_fp, targets or list(Target))
+    if not jobs:
+        logger.warning(f"No AoT-compiled modules found at {bin_fp}")
+        return
+
+    try:
+        result = trio.run(partial(sign_modules, jobs, secret, force))
+    except ValueError as e:
+        logger.error(str(e))
+        raise typer.Exit(1)
+
+    for job in result.skipped:
+        logger.info(f"{job.signed.name} is up to date")
+    logger.info(
+        f"Signed {len(result.signed)} modules, {len(result.skipped)} were up to date"
+    )
+    if result.failed:
+        raise typer.Exit(1)
+
+
+class SignCommand(PluginBase):
+    implementer = app
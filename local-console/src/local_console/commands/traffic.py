@@ -0,0 +1,217 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+import ssl
+from pathlib import Path
+from typing import Annotated
+from typing import Optional
+
+import trio
+import typer
+from exceptiongroup import ExceptionGroup
+from local_console.clients.mqtt_capture import CaptureError
+from local_console.clients.mqtt_capture import read_capture
+from local_console.clients.mqtt_capture import TrafficRecorder
+from local_console.clients.mqtt_capture import TrafficReplayer
+from local_console.clients.mqtt_capture import TrafficReplayStats
+from local_console.clients.trio_mqtt import MQTTClient
+from local_console.core.camera._shared import MessageType
+from local_console.core.camera.state import CameraState
+from local_console.core.config import broker_credentials
+from local_console.core.config import config_obj
+from local_console.core.schemas.schemas import DeviceConnection
+from local_console.plugin import PluginBase
+from local_console.utils.tls import client_ssl_context
+
+logger = logging.getLogger(__name__)
+
+app = typer.Typer(help="Record and replay the MQTT traffic of a device")
+
+# Large enough not to drop messages while writing them out
+RECORD_BUFFER = 10_000
+
+
+@app.command("record", help="Record the MQTT traffic seen by the broker into a file")
+def record(
+    capture: Annotated[
+        Path,
+        typer.Argument(help="File to record into. An existing capture is appended to"),
+    ],
+    topics: Annotated[
+        Optional[list[str]],
+        typer.Option("--topic", "-t", help="Topic filter to record. Defaults to all"),
+    ] = None,
+    duration: Annotated[
+        Optional[float],
+        typer.Option(help="Seconds to record for. Defaults to until interrupted"),
+    ] = None,
+) -> None:
+    device_config = config_obj.get_active_device_config()
+    try:
+        with TrafficRecorder(capture) as recorder:
+            trio.run(record_task, device_config, topics or ["#"], duration, recorder)
+    except CaptureError as e:
+        logger.error(str(e))
+        raise typer.Exit(1)
+    except ExceptionGroup as exc_grp:
+        exit_on_connection_error(exc_grp, device_config)
+        raise
+    except KeyboardInterrupt:
+        logger.info("Recording stopped by the user")
+    print(f"Recorded {recorder.recorded} messages into {capture}")
+
+
+def exit_on_connection_error(exc_grp: ExceptionGroup, config: DeviceConnection) -> None:
+    for e in exc_grp.exceptions:
+        if isinstance(e, OSError):
+            logger.error(
+                f"Error while connecting to MQTT broker {config.mqtt.host}:{config.mqtt.port}: {e}"
+            )
+            raise typer.Exit(1)
+
+
+def broker_ssl_context() -> Optional[ssl.SSLContext]:
+    """
+    Context for connecting to the brokers, which require it in TLS mode
+    """
+    credentials = broker_credentials()
+    return client_ssl_context(credentials) if credentials else None
+
+
+async def record_task(
+    config: DeviceConnection,
+    topics: list[str],
+    duration: Optional[float],
+    recorder: TrafficRecorder,
+) -> None:
+    async with trio.open_nursery() as nursery:
+        client = MQTTClient(
+            "local-console-recorder",
+            nursery,
+            max_buffer=RECORD_BUFFER,
+            ssl_context=broker_ssl_context(),
+        )
+        await client.connect(config.mqtt.host, config.mqtt.port)
+        try:
+            for topic in topics:
+                await client.subscribe(topic)
+            with trio.move_on_after(duration if duration else float("inf")):
+                async with client.messages() as mgen:
+                    async for msg in mgen:
+                        recorder.record(msg)
+        finally:
+            recorder.flush()
+            with trio.move_on_after(1) as cleanup_scope:
+                cleanup_scope.shield = True
+                await client.disconnect()
+            nursery.cancel_scope.cancel()
+
+
+@app.command("replay", help="Replay a recorded MQTT traffic capture")
+def replay(
+    capture: Annotated[
+        Path,
+        typer.Argument(help="Capture file made with the 'record' command"),
+    ],
+    speed: Annotated[
+        float,
+        typer.Option(help="Replay rate relative to the original timing"),
+    ] = 1.0,
+    max_speed: Annotated[
+        bool,
+        typer.Option(
+            "--max-speed", help="Replay as fast as possible, e.g. for benchmarking"
+        ),
+    ] = False,
+    to_broker: Annotated[
+        bool,
+        typer.Option(
+            "--to-broker",
+            help="Publish the messages to the configured broker, instead of feeding them to the camera state",
+        ),
+    ] = False,
+) -> None:
+    if speed <= 0:
+        logger.error("Speed must be greater than zero")
+        raise typer.Exit(1)
+    if not capture.is_file():
+        logger.error(f"{capture} is not a file")
+        raise typer.Exit(1)
+
+    config = config_obj.get_config()
+    device_config = config_obj.get_active_device_config()
+    rate = None if max_speed else speed
+    try:
+        if to_broker:
+            stats = trio.run(replay_to_broker, capture, rate, device_config)
+        else:
+            stats = trio.run(
+                replay_to_state, capture, rate, config.evp.iot_platform, device_config
+            )
+    except CaptureError as e:
+        logger.error(str(e))
+        raise typer.Exit(1)
+    except ExceptionGroup as exc_grp:
+        exit_on_connection_error(exc_grp, device_config)
+        raise
+
+    print(f"Replayed {stats.messages} messages in {stats.elapsed:.2f}s")
+    print(f"Throughput: {stats.throughput:.1f} messages/s")
+    print(
+        f"Processing time per message: p50 {stats.percentile(50) * 1e6:.1f} us, "
+        f"p95 {stats.percentile(95) * 1e6:.1f} us"
+    )
+    if not max_speed:
+        print(f"Maximum lag behind schedule: {stats.max_lag * 1000:.1f} ms")
+
+
+async def replay_to_state(
+    capture: Path,
+    speed: Optional[float],
+    iot_platform: str,
+    device_config: DeviceConnection,
+) -> TrafficReplayStats:
+    send_channel: trio.MemorySendChannel[MessageType]
+    send_channel, _ = trio.open_memory_channel(0)
+    camera_state = CameraState(send_channel, trio.lowlevel.current_trio_token())
+    camera_state.initialize_connection_variables(iot_platform, device_config)
+    return await camera_state.replay_traffic(capture, speed)
+
+
+async def replay_to_broker(
+    capture: Path, speed: Optional[float], config: DeviceConnection
+) -> TrafficReplayStats:
+    async with trio.open_nursery() as nursery:
+        client = MQTTClient(
+            "local-console-replayer", nursery, ssl_context=broker_ssl_context()
+        )
+        await client.connect(config.mqtt.host, config.mqtt.port)
+        try:
+            replayer = TrafficReplayer(
+                read_capture(capture),
+                lambda msg: client.publish(msg.topic, msg.payload, msg.qos, msg.retain),
+                speed,
+            )
+            return await replayer.run()
+        finally:
+            with trio.move_on_after(1) as cleanup_scope:
+                cleanup_scope.shield = True
+                await client.disconnect()
+            nursery.cancel_scope.cancel()
+
+
+class TrafficCommand(PluginBase):
+    implementer = app
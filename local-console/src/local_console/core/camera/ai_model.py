@@ -53,13 +53,14 @@ async def undeploy_step(
     config = config_obj.get_config()
     config_device = config_obj.get_active_device_config()
     schema = OnWireProtocol.from_iot_spec(config.evp.iot_platform)
-    ephemeral_agent = Agent(config_device.mqtt.host, config_device.mqtt.port, schema)
 
     timeout_secs = 30
     model_is_deployed = True
     with trio.move_on_after(timeout_secs) as timeout_scope:
-        async with ephemeral_agent.mqtt_scope([]):
-            await ephemeral_agent.configure(
+        async with Agent.lease(
+            config_device.mqtt.host, config_device.mqtt.port, schema
+        ) as agent:
+            await agent.configure(
                 "backdoor-EA_Main",
                 "placeholder",
                 DnnDelete(
@@ -104,7 +105,6 @@ async def deploy_step(
     config = config_obj.get_config()
     config_device = config_obj.get_active_device_config()
     schema = OnWireProtocol.from_iot_spec(config.evp.iot_platform)
-    ephemeral_agent = Agent(config_device.mqtt.host, config_device.mqtt.port, schema)
     webserver_port = config_device.webserver.port if use_configured_port else 0
 
     with TemporaryDirectory(prefix="lc_deploy_") as temporary_dir:
@@ -118,19 +118,21 @@ async def deploy_step(
         model_is_deployed = False
         with trio.move_on_after(timeout_secs) as timeout_scope:
             async with (
-                ephemeral_agent.mqtt_scope(
-                    [MQTTTopics.ATTRIBUTES_REQ.value, MQTTTopics.ATTRIBUTES.value]
-                ),
+                Agent.lease(
+                    config_device.mqtt.host,
+                    config_device.mqtt.port,
+                    schema,
+                    [MQTTTopics.ATTRIBUTES_REQ.value, MQTTTopics.ATTRIBUTES.value],
+                ) as agent,
                 AsyncWebserver(tmp_dir, webserver_port, None, True) as server,
             ):
-                assert ephemeral_agent.nursery  # make mypy happy
                 # Fill config spec
                 spec = configuration_spec(
                     OTAUpdateModule.DNNMODEL, tmp_module, tmp_dir, server.port, ip_addr
                 ).model_dump_json()
                 logger.debug(f"Update spec is: {spec}")
 
-                await ephemeral_agent.configure("backdoor-EA_Main", "placeholder", spec)
+                await agent.configure("backdoor-EA_Main", "placeholder", spec)
                 while True:
                     if state.device_config.value:
                         model_is_deployed = network_id in get_network_ids(
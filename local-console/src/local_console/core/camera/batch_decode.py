@@ -0,0 +1,311 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+import logging
+import os
+from concurrent.futures import as_completed
+from concurrent.futures import Executor
+from concurrent.futures import Future
+from dataclasses import dataclass
+from dataclasses import field
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Optional
+
+from local_console.core.camera.flatbuffers import add_class_names
+from local_console.core.camera.flatbuffers import flatbuffer_binaries_to_json
+from local_console.core.camera.flatbuffers import flatbuffer_binary_to_json
+from local_console.core.camera.flatbuffers import FlatbufferError
+from local_console.core.camera.flatbuffers import get_output_from_inference
+from local_console.core.camera.recording import get_inference_metadata
+from local_console.core.camera.recording import open_results_writer
+from local_console.core.camera.recording import RecordingError
+from local_console.core.camera.recording import records_from_decoded
+from local_console.core.camera.recording import ResultRecord
+from local_console.core.camera.recording import ResultsFormat
+from local_console.utils.enums import StrEnum
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_NAME = ".decode-journal"
+PART_PREFIX = "results-decode-"
+
+
+class DecodeFormat(StrEnum):
+    JSON = "json"
+    NDJSON = "ndjson"
+    ARROW = "arrow"
+    PARQUET = "parquet"
+
+    @property
+    def results_format(self) -> Optional[ResultsFormat]:
+        """
+        Format of the results files written for this output format,
+        or None when each input is decoded into its own JSON file.
+        """
+        if self == DecodeFormat.JSON:
+            return None
+        return ResultsFormat(self.value)
+
+
+@dataclass
+class DecodedFile:
+    name: str
+    # Only set when not flattened into records, so that
+    # workers do not send back what the output does not need
+    decoded: Optional[dict[str, Any]] = None
+    records: list[ResultRecord] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+@dataclass
+class DecodeSummary:
+    total: int = 0
+    skipped: int = 0
+    decoded: int = 0
+    failed: int = 0
+    records: int = 0
+
+
+def decode_chunk(
+    files: list[Path],
+    schema: Path,
+    labels_map: Optional[dict[int, str]],
+    flatten: bool,
+) -> list[DecodedFile]:
+    """
+    Decodes a chunk of inference files. Meant to run in a worker process,
+    so that it only takes picklable arguments and never raises for a
+    single bad file: its error is reported in the returned entry instead.
+    """
+    results = [DecodedFile(f.name) for f in files]
+    payloads: dict[int, dict[str, Any]] = {}
+    tensors: dict[int, bytes] = {}
+    for index, path in enumerate(files):
+        try:
+            payloads[index] = json.loads(path.read_bytes())
+            tensors[index] = get_output_from_inference(payloads[index])
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            results[index].error = f"Invalid inference file: {e}"
+
+    indices = list(tensors)
+    try:
+        decoded = flatbuffer_binaries_to_json(schema, [tensors[i] for i in indices])
+    except FlatbufferError:
+        # A single undecodable payload fails the whole flatc run,
+        # so fall back to decoding one by one to isolate it.
+        decoded = []
+        for index in list(indices):
+            try:
+                decoded.append(flatbuffer_binary_to_json(schema, tensors[index]))
+            except FlatbufferError as e:
+                results[index].error = str(e)
+                indices.remove(index)
+
+    for index, output in zip(indices, decoded):
+        if labels_map:
+            add_class_names(output, labels_map)
+        if not flatten:
+            results[index].decoded = output
+            continue
+        try:
+            device_id, model_id, timestamp = get_inference_metadata(payloads[index])
+            results[index].records = records_from_decoded(
+                output, device_id, model_id, timestamp
+            )
+        except (RecordingError, KeyError, ValueError) as e:
+            results[index].error = f"Could not extract results: {e}"
+
+    return results
+
+
+class BatchDecoder:
+    """
+    Decodes all inference files within a directory, distributing chunks
+    of files over the workers of an executor. Every finished chunk is
+    written out and then appended to a journal in the output directory,
+    so that an interrupted run can be resumed from the last chunk that
+    was completely written. Files that failed to decode are journaled
+    as such, and retried by the next run.
+    """
+
+    def __init__(
+        self,
+        input_dir: Path,
+        output_dir: Path,
+        schema: Path,
+        output_format: DecodeFormat,
+        labels_map: Optional[dict[int, str]] = None,
+        chunk_size: int = 256,
+        extension: str = "txt",
+    ) -> None:
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.schema = schema
+        self.output_format = output_format
+        self.labels_map = labels_map
+        self.chunk_size = chunk_size
+        self.extension = extension
+        self.journal = output_dir / JOURNAL_NAME
+
+    def reset(self) -> None:
+        """
+        Discards the progress of previous runs.
+        """
+        self.journal.unlink(missing_ok=True)
+        for part in self._part_files():
+            part.unlink()
+
+    def pending(self) -> tuple[list[Path], int]:
+        """
+        Lists the input files not yet processed by a previous run, along
+        with the amount of files that were.
+        """
+        done, parts = self._read_journal()
+        for orphan in set(self._part_files()) - parts:
+            logger.info(f"Removing partially written {orphan}")
+            orphan.unlink()
+
+        inputs = sorted(self.input_dir.glob(f"*.{self.extension}"))
+        pending = [f for f in inputs if f.name not in done]
+        return pending, len(inputs) - len(pending)
+
+    def run(
+        self,
+        executor: Executor,
+        on_progress: Optional[Callable[[int], None]] = None,
+        pending: Optional[tuple[list[Path], int]] = None,
+    ) -> DecodeSummary:
+        """
+        Decodes the files listed by pending(), which can be passed as
+        `pending` by callers that already listed them.
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        files, skipped = self.pending() if pending is None else pending
+        summary = DecodeSummary(total=len(files) + skipped, skipped=skipped)
+
+        flatten = self.output_format.results_format is not None
+        futures: dict[Future, list[Path]] = {}
+        for start in range(0, len(files), self.chunk_size):
+            chunk = files[start : start + self.chunk_size]
+            future = executor.submit(
+                decode_chunk, chunk, self.schema, self.labels_map, flatten
+            )
+            futures[future] = chunk
+
+        part_index = self._next_part_index()
+        try:
+            for future in as_completed(futures):
+                results = future.result()
+                part = self._write_chunk(results, part_index)
+                part_index += 1
+                self._append_journal(results, part)
+
+                for result in results:
+                    if result.error:
+                        summary.failed += 1
+                        logger.warning(f"{result.name}: {result.error}")
+                    else:
+                        summary.decoded += 1
+                        summary.records += len(result.records)
+                if on_progress:
+                    on_progress(len(results))
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return summary
+
+    def _write_chunk(
+        self, results: list[DecodedFile], part_index: int
+    ) -> Optional[Path]:
+        results_format = self.output_format.results_format
+        if results_format is None:
+            for result in results:
+                if result.decoded is not None:
+                    target = self.output_dir / f"{Path(result.name).stem}.json"
+                    _write_atomically(target, json.dumps(result.decoded, indent=2))
+            return None
+
+        part = (
+            self.output_dir
+            / f"{PART_PREFIX}{part_index:06d}.{results_format.extension}"
+        )
+        staging = part.with_name(f".{part.name}.tmp")
+        writer = open_results_writer(
+            staging, results_format, row_group_size=max(self.chunk_size, 1024)
+        )
+        try:
+            for result in results:
+                writer.append(result.records)
+        finally:
+            writer.close()
+        os.replace(staging, part)
+        return part
+
+    def _append_journal(self, results: list[DecodedFile], part: Optional[Path]) -> None:
+        entry = {
+            "part": part.name if part else None,
+            "files": [r.name for r in results if not r.error],
+            "failed": [r.name for r in results if r.error],
+        }
+        with self.journal.open("a") as journal:
+            journal.write(json.dumps(entry) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _read_journal(self) -> tuple[set[str], set[Path]]:
+        done: set[str] = set()
+        parts: set[Path] = set()
+        if not self.journal.is_file():
+            return done, parts
+
+        valid = []
+        lines = self.journal.read_text().splitlines()
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line may be cut short if the previous run was killed
+                logger.debug(f"Ignoring incomplete journal entry: {line}")
+                continue
+            valid.append(line)
+            done.update(entry["files"])
+            if entry["part"]:
+                parts.add(self.output_dir / entry["part"])
+
+        if len(valid) != len(lines):
+            _write_atomically(self.journal, "".join(f"{line}\n" for line in valid))
+        return done, parts
+
+    def _part_files(self) -> list[Path]:
+        return sorted(self.output_dir.glob(f"{PART_PREFIX}*")) + sorted(
+            self.output_dir.glob(f".{PART_PREFIX}*.tmp")
+        )
+
+    def _next_part_index(self) -> int:
+        indices = [
+            int(p.name[len(PART_PREFIX) :].split(".")[0])
+            for p in self.output_dir.glob(f"{PART_PREFIX}*")
+        ]
+        return max(indices, default=-1) + 1
+
+
+def _write_atomically(target: Path, content: str) -> None:
+    staging = target.with_name(f".{target.name}.tmp")
+    staging.write_text(content)
+    os.replace(staging, target)
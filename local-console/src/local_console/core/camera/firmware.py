@@ -149,7 +149,6 @@ async def update_firmware_task(
     config = config_obj.get_config()
     config_device = config_obj.get_active_device_config()
     schema = OnWireProtocol.from_iot_spec(config.evp.iot_platform)
-    ephemeral_agent = Agent(config_device.mqtt.host, config_device.mqtt.port, schema)
     webserver_port = config_device.webserver.port if use_configured_port else 0
     ip_addr = get_webserver_ip()
 
@@ -162,9 +161,12 @@ async def update_firmware_task(
         timeout_secs = 60 * 4
         with trio.move_on_after(timeout_secs) as timeout_scope:
             async with (
-                ephemeral_agent.mqtt_scope(
-                    [MQTTTopics.ATTRIBUTES_REQ.value, MQTTTopics.ATTRIBUTES.value]
-                ),
+                Agent.lease(
+                    config_device.mqtt.host,
+                    config_device.mqtt.port,
+                    schema,
+                    [MQTTTopics.ATTRIBUTES_REQ.value, MQTTTopics.ATTRIBUTES.value],
+                ) as agent,
                 AsyncWebserver(tmp_dir, webserver_port, None, True) as serve,
             ):
                 # Fill config spec
@@ -181,9 +183,7 @@ async def update_firmware_task(
                 payload = update_spec.model_dump_json()
                 logger.debug(f"Update spec is: {payload}")
 
-                await ephemeral_agent.configure(
-                    "backdoor-EA_Main", "placeholder", payload
-                )
+                await agent.configure("backdoor-EA_Main", "placeholder", payload)
                 while True:
                     """
                     This loop assumes that `state` is updated by a main
@@ -19,6 +19,7 @@ import os
 import subprocess
 import sys
 from base64 import b64decode
+from collections.abc import Sequence
 from pathlib import Path
 from shutil import which
 from tempfile import TemporaryDirectory
@@ -85,8 +86,14 @@ def get_output_from_inference_results(raw_data: bytes) -> bytes:
     :param raw_data: binary buffer containing the input data to decode
     :return: base64 decoded value of `Inferences[0]["O"]`.
     """
-    data: dict[str, list[dict[str, str]]] = json.loads(raw_data)
+    return get_output_from_inference(json.loads(raw_data))
 
+
+def get_output_from_inference(data: dict[str, Any]) -> bytes:
+    """
+    As `get_output_from_inference_results`, for a payload already
+    parsed from JSON.
+    """
     inferences = data["Inferences"]
     if len(inferences) > 1:
         logger.warn("More than 1 inference at a time. Using index 0.")
@@ -150,6 +157,61 @@ def flatbuffer_binary_to_json(
         raise FlatbufferError(f"Unexpected error decoding flatbuffers: {e}")
 
 
+def flatbuffer_binaries_to_json(
+    fbs: Path,
+    inference_data: Sequence[bytes],
+) -> list[dict[str, Any]]:
+    """
+    Batch variant of `flatbuffer_binary_to_json`, that amortizes the
+    cost of spawning `flatc` by converting all payloads in a single run.
+
+    :param fbs: FlatBuffer schema file.
+    :inference_data: base64-decoded, flatbuffer-serialized payloads to deserialize
+    :return: the decoded objects, in the same order as `inference_data`.
+    """
+    if not inference_data:
+        return []
+
+    flatc_path = get_flatc()
+    try:
+        with TemporaryDirectory() as tempdir:
+            area = Path(tempdir)
+            input_area = area / "in"
+            input_area.mkdir()
+            output_area = area / "out"
+            output_area.mkdir()
+
+            input_files = []
+            for index, payload in enumerate(inference_data):
+                input_file = input_area / f"{index:08d}.bin"
+                input_file.write_bytes(payload)
+                input_files.append(str(input_file))
+
+            subprocess.run(
+                [
+                    flatc_path,
+                    "--json",
+                    "--defaults-json",
+                    "--strict-json",
+                    "-o",
+                    str(output_area),
+                    "--raw-binary",
+                    str(fbs),
+                    "--",
+                    *input_files,
+                ],
+                check=True,
+                text=True,
+            )
+            return [
+                json.loads((output_area / f"{index:08d}.json").read_text())
+                for index in range(len(inference_data))
+            ]
+
+    except Exception as e:
+        raise FlatbufferError(f"Unexpected error decoding flatbuffers: {e}")
+
+
 def conform_flatbuffer_schema(fbs: Path) -> bool:
     """
     Verifies if JSON is valid.
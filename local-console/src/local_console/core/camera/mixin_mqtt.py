@@ -13,11 +13,16 @@
 # limitations under the License.
 #
 # SPDX-License-Identifier: Apache-2.0
-import json
+import hashlib
 import logging
 from base64 import b64decode
+from collections.abc import AsyncIterable
+from collections.abc import AsyncIterator
+from collections.abc import Iterable
+from contextlib import asynccontextmanager
 from datetime import datetime
 from datetime import timedelta
+from pathlib import Path
 from typing import Any
 from typing import Optional
 from typing import Protocol
@@ -25,17 +30,31 @@ from typing import Protocol
 import trio
 from exceptiongroup import ExceptionGroup
 from local_console.clients.agent import Agent
-from local_console.clients.agent import check_attributes_request
+from local_console.clients.agent import answer_attributes_request
+from local_console.clients.agent import device_outbound_store
+from local_console.clients.mqtt_capture import CapturedMessage
+from local_console.clients.mqtt_capture import read_capture
+from local_console.clients.mqtt_capture import TrafficReplayer
+from local_console.clients.mqtt_capture import TrafficReplayStats
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_queues import topic_matches
+from local_console.clients.mqtt_router import TopicRouter
 from local_console.core.camera._shared import IsAsyncReady
 from local_console.core.camera.enums import MQTTTopics
 from local_console.core.camera.enums import StreamStatus
+from local_console.core.config import broker_credentials
+from local_console.core.config import config_obj
+from local_console.core.config import optional_path
 from local_console.core.schemas.edge_cloud_if_v1 import DeviceConfiguration
 from local_console.core.schemas.edge_cloud_if_v1 import Permission
 from local_console.core.schemas.edge_cloud_if_v1 import SetFactoryReset
 from local_console.core.schemas.schemas import DeviceConnection
 from local_console.core.schemas.schemas import OnWireProtocol
 from local_console.servers.broker import BrokerException
+from local_console.servers.broker import BrokerSupervisor
 from local_console.servers.broker import spawn_broker
+from local_console.servers.shared_broker import SharedBroker
+from local_console.utils.json_codec import json_decode
 from local_console.utils.timing import TimeoutBehavior
 from local_console.utils.tracking import TrackingVariable
 from pydantic import ValidationError
@@ -49,6 +68,9 @@ EA_STATE_TOPIC = "state/backdoor-EA_Main/placeholder"
 SYSINFO_TOPIC = "systemInfo"
 DEPLOY_STATUS_TOPIC = "deploymentStatus"
 CONNECTION_STATUS_TIMEOUT = timedelta(seconds=180)
+# Time given to the broker supervisor to restart the broker and
+# reconnect the agent, once its connection is lost
+RECONNECT_TIMEOUT = 60
 
 
 class HoldsDeployStatus(Protocol):
@@ -88,6 +110,10 @@ class MQTTMixin(HoldsDeployStatus, CanStopStreaming, IsAsyncReady):
         self.timeouts: dict[str, TimeoutBehavior] = {}
         self._last_reception: Optional[datetime] = None
         self._ota_event = trio.Event()
+        self._streaming_stop_required = True
+        self._state_report_digest: Optional[bytes] = None
+        self.shared_broker: Optional[SharedBroker] = None
+        self._init_mqtt_routes()
 
         # State variables
         self.device_config: TrackingVariable[DeviceConfiguration] = TrackingVariable()
@@ -128,6 +154,44 @@ class MQTTMixin(HoldsDeployStatus, CanStopStreaming, IsAsyncReady):
         )
         self.timeouts["connection-alive"].spawn_in(nursery)
 
+    def _init_mqtt_routes(self) -> None:
+        """
+        Routes the incoming messages to their processing methods. These
+        are looked up on each message, so that they can be patched.
+        """
+        self.mqtt_router = TopicRouter()
+        route = self.mqtt_router.add_handler
+        route(
+            MQTTTopics.ATTRIBUTES_REQ.value,
+            lambda topic, payload: self._process_attributes_request(topic, payload),
+            decode=False,
+        )
+        route(
+            MQTTTopics.ATTRIBUTES.value,
+            lambda topic, payload: self._process_state_topic(payload),
+            key=EA_STATE_TOPIC,
+        )
+        route(
+            MQTTTopics.ATTRIBUTES.value,
+            lambda topic, payload: self._process_sysinfo_topic(payload),
+            key=SYSINFO_TOPIC,
+        )
+        route(
+            MQTTTopics.ATTRIBUTES.value,
+            lambda topic, payload: self._process_deploy_status_topic(payload),
+            key=DEPLOY_STATUS_TOPIC,
+        )
+        route(
+            MQTTTopics.RPC_RESPONSES.value,
+            lambda topic, payload: self._process_rpc_response(topic, payload),
+        )
+        # Telemetry is left undecoded, as here it only tells the camera is alive
+        route(
+            MQTTTopics.TELEMETRY.value,
+            lambda topic, payload: trio.lowlevel.checkpoint(),
+            decode=False,
+        )
+
     def _init_bindings_mqtt(self) -> None:
         """
         These bindings among variables implement business logic that requires
@@ -181,45 +245,22 @@ class MQTTMixin(HoldsDeployStatus, CanStopStreaming, IsAsyncReady):
         assert self.mqtt_port.value
         assert self._onwire_schema
 
-        port = self.mqtt_port.value
-
-        self.mqtt_client = Agent(self.mqtt_host.value, port, self._onwire_schema)
         try:
             async with (
                 trio.open_nursery() as nursery,
-                spawn_broker(port, nursery, False),
-                self.mqtt_client.mqtt_scope(
-                    [
-                        MQTTTopics.ATTRIBUTES_REQ.value,
-                        MQTTTopics.TELEMETRY.value,
-                        MQTTTopics.RPC_RESPONSES.value,
-                        MQTTTopics.ATTRIBUTES.value,
-                    ]
-                ),
+                self._mqtt_session(nursery) as messages,
             ):
-                assert self.mqtt_client.client
                 self._setup_timeouts(nursery)
 
                 task_status.started(True)
-                streaming_stop_required = True
-                async with self.mqtt_client.client.messages() as mgen:
-                    async for msg in mgen:
-                        if await check_attributes_request(
-                            self.mqtt_client, msg.topic, msg.payload.decode()
-                        ):
-                            self.attributes_available.value = True
-                            # attributes request handshake is performed at (re)connect
-                            # when reconnecting, multiple requests might be made
-                            if streaming_stop_required:
-                                await self.streaming_rpc_stop()
-                                streaming_stop_required = False
-
-                        payload = json.loads(msg.payload)
-                        await self.process_incoming(msg.topic, payload)
-
-                        self.update_connection_status()
-                        if self._onwire_schema == OnWireProtocol.EVP2 and self.is_ready:
-                            self.timeouts["periodic-reports"].tap()
+                self._streaming_stop_required = True
+                self._state_report_digest = None
+                async for msg in messages:
+                    await self.process_incoming(msg)
+
+                    self.update_connection_status()
+                    if self._onwire_schema == OnWireProtocol.EVP2 and self.is_ready:
+                        self.timeouts["periodic-reports"].tap()
 
         except ExceptionGroup as exc_grp:
             task_status.started(False)
@@ -227,6 +268,80 @@ class MQTTMixin(HoldsDeployStatus, CanStopStreaming, IsAsyncReady):
                 if isinstance(e, BrokerException):
                     await self.message_send_channel.send(("error", str(e)))
 
+    @asynccontextmanager
+    async def _mqtt_session(
+        self, nursery: trio.Nursery
+    ) -> AsyncIterator[AsyncIterable[Message]]:
+        """
+        Connects the camera's agent, to the shared broker if there is one,
+        and otherwise to a broker spawned for this camera alone. Provides
+        the messages received from the camera.
+        """
+        assert self._onwire_schema
+        assert self.mqtt_host.value
+        assert self.mqtt_port.value
+        host = self.mqtt_host.value
+        port = self.mqtt_port.value
+        topics = [
+            MQTTTopics.ATTRIBUTES_REQ.value,
+            MQTTTopics.TELEMETRY.value,
+            MQTTTopics.RPC_RESPONSES.value,
+            MQTTTopics.ATTRIBUTES.value,
+        ]
+
+        if self.shared_broker:
+            async with self.shared_broker.attach(host, port, self._onwire_schema) as (
+                agent,
+                messages,
+            ):
+                self.mqtt_client = agent
+                for topic in topics:
+                    await agent.subscribe(topic)
+                yield messages
+            return
+
+        # As the owner of the device's session, the agent keeps its
+        # unacknowledged messages across restarts, if so configured
+        outbound = device_outbound_store(host, port)
+        self.mqtt_client = Agent(host, port, self._onwire_schema, outbound=outbound)
+        broker_params = config_obj.get_config().broker
+        try:
+            async with (
+                spawn_broker(
+                    port,
+                    nursery,
+                    False,
+                    broker_params.embedded,
+                    optional_path(broker_params.log_dir),
+                    broker_credentials(),
+                ) as supervisor,
+                self.mqtt_client.mqtt_scope(topics, lend=True),
+            ):
+                supervisor.on_ready(self.mqtt_client.reconnect)
+                yield self._supervised_messages(self.mqtt_client, supervisor)
+        finally:
+            outbound.close()
+
+    @staticmethod
+    async def _supervised_messages(
+        agent: Agent, supervisor: BrokerSupervisor
+    ) -> AsyncIterator[Message]:
+        """
+        Provides the messages received by the agent, across the restarts
+        of the broker, after which the supervisor reconnects the agent.
+        """
+        while True:
+            assert agent.client
+            restarts = supervisor.restarts
+            async with agent.client.messages() as mgen:
+                async for msg in mgen:
+                    yield msg
+            logger.warning("Lost connection to the MQTT broker")
+            with trio.move_on_after(RECONNECT_TIMEOUT):
+                await supervisor.wait_restart(restarts)
+            if not (agent.client and agent.client.connected):
+                return
+
     async def set_periodic_reports(self) -> None:
         # Configure the device to emit status reports twice
         # as often as the timeout expiration, to avoid that
@@ -255,36 +370,77 @@ class MQTTMixin(HoldsDeployStatus, CanStopStreaming, IsAsyncReady):
         self.stream_status.value = StreamStatus.Inactive
         self.update_connection_status()
 
-    async def process_incoming(self, topic: str, payload: dict[str, Any]) -> None:
-        sent_from_camera = False
-        if topic == MQTTTopics.ATTRIBUTES.value:
-            if EA_STATE_TOPIC in payload:
-                sent_from_camera = True
-                await self._process_state_topic(payload)
+    async def process_incoming(self, message: Message) -> None:
+        if await self.mqtt_router.dispatch(message):
+            # Handled messages are all sent from the camera
+            self._last_reception = datetime.now()
+            logger.debug("Incoming on %s: %s", message.topic, message.payload)
 
-            if SYSINFO_TOPIC in payload:
-                sent_from_camera = True
-                await self._process_sysinfo_topic(payload)
+    async def replay_traffic(
+        self, capture: Path, speed: Optional[float] = 1.0
+    ) -> TrafficReplayStats:
+        """
+        Feeds the messages of an MQTT traffic capture to process_incoming(),
+        as if they were being received from the camera. Without an MQTT
+        client, the requests that would need an answer are left out, and
+        so is the configuration the state reports would trigger.
+        """
+        messages: Iterable[CapturedMessage] = read_capture(capture)
+        if self.mqtt_client is None:
+            unanswerable = (
+                MQTTTopics.ATTRIBUTES_REQ.value,
+                MQTTTopics.RPC_RESPONSES.value,
+            )
+            messages = (
+                captured
+                for captured in messages
+                if not any(
+                    topic_matches(f, captured.message.topic) for f in unanswerable
+                )
+            )
 
-            if DEPLOY_STATUS_TOPIC in payload:
-                sent_from_camera = True
-                await self._process_deploy_status_topic(payload)
+        stats = await TrafficReplayer(messages, self.process_incoming, speed).run()
+        logger.info(
+            f"Replayed {stats.messages} messages in {stats.elapsed:.2f}s ({stats.throughput:.1f} messages/s)"
+        )
+        return stats
 
-        if topic == MQTTTopics.TELEMETRY.value:
-            sent_from_camera = True
+    async def _process_attributes_request(self, topic: str, payload: bytes) -> None:
+        assert self.mqtt_client
+        await answer_attributes_request(self.mqtt_client, topic, payload)
+        self.attributes_available.value = True
+        # attributes request handshake is performed at (re)connect
+        # when reconnecting, multiple requests might be made
+        if self._streaming_stop_required:
+            await self.streaming_rpc_stop()
+            self._streaming_stop_required = False
 
-        if sent_from_camera:
-            self._last_reception = datetime.now()
-            logger.debug("Incoming on %s: %s", topic, str(payload))
+    async def _process_rpc_response(self, topic: str, payload: Any) -> None:
+        assert self.mqtt_client
+        logger.debug("RPC response on %s: %s", topic, payload)
+        await self.mqtt_client.rpc_requests.resolve(topic, payload)
 
     async def _process_state_topic(self, payload: dict[str, Any]) -> None:
+        # The camera resends its state on every report interval. Unless
+        # it changed, it has already been processed, yet the stream status
+        # may have been set locally since, so it is restored from it.
+        report = payload[EA_STATE_TOPIC]
+        digest = hashlib.blake2b(report.encode(), digest_size=16).digest()
+        if digest == self._state_report_digest:
+            if self.device_config.value:
+                self.stream_status.value = StreamStatus.from_string(
+                    self.device_config.value.Status.Sensor
+                )
+            return
+        self._state_report_digest = digest
+
         firmware_is_supported = False
         try:
-            decoded = json.loads(b64decode(payload[EA_STATE_TOPIC]))
+            decoded = json_decode(b64decode(report))
             firmware_is_supported = True
             self.attributes_available.value = True
-        except UnicodeDecodeError:
-            decoded = json.loads(payload[EA_STATE_TOPIC])
+        except ValueError:
+            decoded = json_decode(report)
 
         if firmware_is_supported:
             try:
@@ -306,7 +462,7 @@ class MQTTMixin(HoldsDeployStatus, CanStopStreaming, IsAsyncReady):
 
     async def _process_deploy_status_topic(self, payload: dict[str, Any]) -> None:
         if self._onwire_schema == OnWireProtocol.EVP1 or self._onwire_schema is None:
-            update = json.loads(payload[DEPLOY_STATUS_TOPIC])
+            update = json_decode(payload[DEPLOY_STATUS_TOPIC])
         else:
             update = payload[DEPLOY_STATUS_TOPIC]
 
@@ -319,7 +475,10 @@ class MQTTMixin(HoldsDeployStatus, CanStopStreaming, IsAsyncReady):
         previous: Optional[DeviceConfiguration],
     ) -> None:
         assert current
-        assert self.mqtt_client
+        if self.mqtt_client is None:
+            # Replaying a capture, with no camera to configure
+            logger.debug("No MQTT client to allow the factory reset with")
+            return
 
         factory_reset = current.Permission.FactoryReset
         logger.debug(f"Factory Reset is {factory_reset}")
@@ -16,22 +16,35 @@
 import json
 import logging
 import shutil
+import time
 from datetime import timedelta
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from typing import Any
 from typing import Optional
 from typing import Protocol
 
 import trio
 from local_console.clients.agent import Agent
+from local_console.clients.rpc import RPCTimeoutError
 from local_console.core.camera._shared import IsAsyncReady
 from local_console.core.camera.axis_mapping import pixel_roi_from_normals
 from local_console.core.camera.axis_mapping import UnitROI
+from local_console.core.camera.enums import StreamStatus
 from local_console.core.camera.flatbuffers import add_class_names
 from local_console.core.camera.flatbuffers import flatbuffer_binary_to_json
 from local_console.core.camera.flatbuffers import FlatbufferError
 from local_console.core.camera.flatbuffers import get_output_from_inference_results
+from local_console.core.camera.recording import get_inference_metadata
+from local_console.core.camera.recording import InferenceRecorder
+from local_console.core.camera.recording import RecordingError
+from local_console.core.camera.replay import captured_pairs
+from local_console.core.camera.replay import ReplayError
+from local_console.core.camera.replay import ReplaySource
+from local_console.core.camera.replay import ReplayStats
 from local_console.core.camera.streaming import FileGrouping
+from local_console.core.camera.video import SegmentRecorder
+from local_console.core.camera.video import VideoRecordingError
 from local_console.core.schemas.edge_cloud_if_v1 import StartUploadInferenceData
 from local_console.gui.drawer.classification import ClassificationDrawer
 from local_console.gui.drawer.objectdetection import DetectionDrawer
@@ -58,12 +71,22 @@ CONNECTION_STATUS_TIMEOUT = timedelta(seconds=180)
 class HasMQTTset(Protocol):
     """
     This Protocol states that classes onto which this applies,
-    will have a `mqtt_client` member. For StreamingMixin below,
-    this means that `mqtt_client` originates elsewhere within
-    CameraState, but StreamingMixin expects to find it.
+    will have `mqtt_client` and `stream_status` members. For StreamingMixin
+    below, this means that these originate elsewhere within CameraState,
+    but StreamingMixin expects to find them.
     """
 
     mqtt_client: Optional[Agent]
+    stream_status: TrackingVariable[StreamStatus]
+
+
+def rpc_failed(response: Any) -> bool:
+    """
+    Tells whether the response to an RPC reports that it failed
+    """
+    if not isinstance(response, dict):
+        return False
+    return response.get("status", "ok") not in ("ok", 0)
 
 
 class StreamingMixin(HasMQTTset, IsAsyncReady):
@@ -74,7 +97,7 @@ class StreamingMixin(HasMQTTset, IsAsyncReady):
     the associated data traffic.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, dir_monitor: Optional[DirectoryMonitor] = None) -> None:
 
         # Ancillary variables
         self.upload_port: int | None = None
@@ -82,7 +105,8 @@ class StreamingMixin(HasMQTTset, IsAsyncReady):
         self._extension_infers = "txt"
         self._grouper = FileGrouping({self._extension_images, self._extension_infers})
         self.total_dir_watcher = StorageSizeWatcher()
-        self.dir_monitor = DirectoryMonitor()
+        # Usually shared among all devices, see DeviceManager
+        self.dir_monitor = dir_monitor if dir_monitor else DirectoryMonitor()
 
         # State variables
         self.stream_image: TrackingVariable[str] = TrackingVariable("")
@@ -92,6 +116,17 @@ class StreamingMixin(HasMQTTset, IsAsyncReady):
         self.inference_field: TrackingVariable[str] = TrackingVariable("")
         self.inference_dir_path: TrackingVariable[Path] = TrackingVariable()
 
+        # Columnar recording of decoded inference results, enabled
+        # by setting the directory where to store the results files.
+        self.results_dir_path: TrackingVariable[Path] = TrackingVariable()
+        self.results_recorder: Optional[InferenceRecorder] = None
+
+        # Muxing of incoming frames into video segments of the given
+        # duration in seconds, within the image directory. Disabled if empty.
+        self.video_segment_seconds: TrackingVariable[str] = TrackingVariable("")
+        self.video_recorder: Optional[SegmentRecorder] = None
+        self._last_muxed_frame: Optional[Path] = None
+
         self.size: TrackingVariable[str] = TrackingVariable("10")
         self.unit: TrackingVariable[str] = TrackingVariable("MB")
 
@@ -110,6 +145,9 @@ class StreamingMixin(HasMQTTset, IsAsyncReady):
         """
         self.image_dir_path.subscribe(self.input_directory_setup)
         self.inference_dir_path.subscribe(self.input_directory_setup)
+        self.results_dir_path.subscribe(self.results_recorder_setup)
+        self.image_dir_path.subscribe(self.video_recorder_setup)
+        self.video_segment_seconds.subscribe(self.video_recorder_setup)
 
     async def streaming_rpc_stop(self) -> None:
         assert self.mqtt_client
@@ -128,7 +166,7 @@ class StreamingMixin(HasMQTTset, IsAsyncReady):
 
         (h_offset, v_offset), (h_size, v_size) = pixel_roi_from_normals(roi)
 
-        await self.mqtt_client.rpc(
+        call = await self.mqtt_client.rpc(
             instance_id,
             method,
             StartUploadInferenceData(
@@ -142,6 +180,19 @@ class StreamingMixin(HasMQTTset, IsAsyncReady):
                 CropVSize=v_size,
             ).model_dump_json(),
         )
+        # Unlike the stop, this is not sent from the message loop, which
+        # delivers the response meanwhile
+        try:
+            response = await call
+        except RPCTimeoutError:
+            logger.error(f"No response to {method} from the camera")
+            self.stream_status.value = StreamStatus.Inactive
+            return
+        if rpc_failed(response):
+            logger.error(f"{method} failed: {response}")
+            self.stream_status.value = StreamStatus.Inactive
+        else:
+            self.stream_status.value = StreamStatus.Active
 
     async def blobs_webserver_task(self) -> None:
         """
@@ -176,6 +227,9 @@ class StreamingMixin(HasMQTTset, IsAsyncReady):
 
     @run_on_ui_thread
     def _process_camera_upload(self, incoming_file: Path) -> None:
+        self.process_camera_upload(incoming_file)
+
+    def process_camera_upload(self, incoming_file: Path) -> None:
         if incoming_file.suffix.lstrip(".") == self._extension_infers:
             assert self.inference_dir_path.value
             target_dir = Path(self.inference_dir_path.value)
@@ -199,7 +253,8 @@ class StreamingMixin(HasMQTTset, IsAsyncReady):
             inference_file = pair[self._extension_infers]
             image_file = pair[self._extension_images]
 
-            payload_render = inference_file.read_text()
+            raw_payload = inference_file.read_text()
+            payload_render = raw_payload
             output_data = get_output_from_inference_results(inference_file.read_bytes())
             if self.vapp_schema_file.value:
                 try:
@@ -210,18 +265,79 @@ class StreamingMixin(HasMQTTset, IsAsyncReady):
                 except FlatbufferError as e:
                     logger.error("Error decoding inference data:", exc_info=e)
 
+            # Parsed once for the metadata needed by the recorders
+            payload: Any = None
+            if self.results_recorder or self.video_recorder:
+                try:
+                    payload = json.loads(raw_payload)
+                except ValueError as e:
+                    logger.warning(f"Could not parse inference payload: {e}")
+
+            if self.results_recorder and isinstance(output_data, dict):
+                try:
+                    self.results_recorder.record(payload, output_data)
+                except (RecordingError, KeyError, ValueError, TypeError) as e:
+                    logger.warning(f"Could not record inference results: {e}")
+
             self.inference_field.value = payload_render
-            try:
-                {
-                    ApplicationType.CLASSIFICATION.value: ClassificationDrawer,
-                    ApplicationType.DETECTION.value: DetectionDrawer,
-                }[str(self.vapp_type.value)].process_frame(image_file, output_data)
-                # Adding drawings modifies file size. Update storage watcher
-                self.total_dir_watcher.update_file_size(image_file)
-            except Exception as e:
-                logger.error(f"Error while performing the drawing: {e}")
+            # There is nothing to draw for custom applications
+            drawer = {
+                ApplicationType.CLASSIFICATION.value: ClassificationDrawer,
+                ApplicationType.DETECTION.value: DetectionDrawer,
+            }.get(str(self.vapp_type.value))
+            if drawer:
+                try:
+                    drawer.process_frame(image_file, output_data)
+                    # Adding drawings modifies file size. Update storage watcher
+                    self.total_dir_watcher.update_file_size(image_file)
+                except Exception as e:
+                    logger.error(f"Error while performing the drawing: {e}")
+
+            if self.video_recorder:
+                self._mux_frame(image_file, payload)
             self.stream_image.value = str(image_file)
 
+    def _mux_frame(self, image_file: Path, payload: Any) -> None:
+        assert self.video_recorder
+        try:
+            timestamp = get_inference_metadata(payload)[2]
+        except RecordingError:
+            timestamp = int(time.time() * 1000)
+
+        try:
+            self.video_recorder.add_frame(image_file, timestamp)
+        except VideoRecordingError as e:
+            logger.warning(f"Could not record frame into video: {e}")
+            return
+
+        # Muxed frames need not be kept as separate files,
+        # except for the latest one, which is on display.
+        if self._last_muxed_frame and self._last_muxed_frame != image_file:
+            self.total_dir_watcher.remove_file(self._last_muxed_frame)
+        self._last_muxed_frame = image_file
+
+    async def replay_capture(
+        self,
+        images_dir: Path,
+        inferences_dir: Path,
+        speed: Optional[float] = 1.0,
+    ) -> ReplayStats:
+        """
+        Feeds the image/inference pairs of a captured directory through
+        the streaming pipeline, as if they were being uploaded by the camera.
+        """
+        pairs = captured_pairs(
+            images_dir, inferences_dir, self._extension_images, self._extension_infers
+        )
+        if not pairs:
+            raise ReplayError(f"No image/inference pairs found in {images_dir}")
+
+        stats = await ReplaySource(pairs, self.process_camera_upload, speed).run()
+        logger.info(
+            f"Replayed {stats.pairs} pairs in {stats.elapsed:.2f}s ({stats.throughput:.1f} pairs/s)"
+        )
+        return stats
+
     def input_directory_setup(
         self, current: Optional[str], previous: Optional[str]
     ) -> None:
@@ -236,7 +352,45 @@ class StreamingMixin(HasMQTTset, IsAsyncReady):
             self.dir_monitor.watch(cur_path, self.notify_directory_deleted)
 
         if pre_path:
-            self.dir_monitor.unwatch(pre_path)
+            self.dir_monitor.unwatch(pre_path, self.notify_directory_deleted)
+
+    def unwatch_input_directories(self) -> None:
+        for path in (self.image_dir_path.value, self.inference_dir_path.value):
+            if path:
+                self.dir_monitor.unwatch(Path(path), self.notify_directory_deleted)
+
+    def results_recorder_setup(
+        self, current: Optional[Path], previous: Optional[Path]
+    ) -> None:
+        if self.results_recorder:
+            self.results_recorder.close()
+            self.results_recorder = None
+
+        if current:
+            try:
+                self.results_recorder = InferenceRecorder(Path(current))
+            except (OSError, RecordingError) as e:
+                logger.error(f"Could not set up results recording: {e}")
+                return
+            logger.info(
+                f"Recording inference results into {self.results_recorder.path}"
+            )
+
+    def video_recorder_setup(self, current: Any, previous: Any) -> None:
+        if self.video_recorder:
+            self.video_recorder.close()
+            self.video_recorder = None
+            self._last_muxed_frame = None
+
+        if self.video_segment_seconds.value and self.image_dir_path.value:
+            try:
+                self.video_recorder = SegmentRecorder(
+                    Path(self.image_dir_path.value),
+                    float(self.video_segment_seconds.value),
+                    storage=self.total_dir_watcher,
+                )
+            except (ValueError, VideoRecordingError) as e:
+                logger.error(f"Could not set up video recording: {e}")
 
     def notify_directory_deleted(self, dir_path: Path) -> None:
         self.send_message_sync("error", f"Directory {dir_path} does no longer exist.")
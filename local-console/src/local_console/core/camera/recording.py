@@ -0,0 +1,453 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+import logging
+import time
+from abc import ABC
+from abc import abstractmethod
+from collections.abc import Iterable
+from collections.abc import Iterator
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import fields
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+from typing import Any
+from typing import Optional
+
+from local_console.core.schemas.tasks.classification import Classification
+from local_console.core.schemas.tasks.objectdetection import ObjectDetection
+from local_console.utils.enums import StrEnum
+from pydantic import ValidationError
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+    import pyarrow.dataset as ds  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+
+class RecordingError(Exception):
+    """
+    Conveys an error when recording or scanning inference results
+    """
+
+
+class ResultsFormat(StrEnum):
+    ARROW = "arrow"
+    PARQUET = "parquet"
+    NDJSON = "ndjson"
+
+    @property
+    def extension(self) -> str:
+        # Arrow data is written in the IPC *stream* format, so that
+        # files remain readable even if the process dies before closing them.
+        return {
+            ResultsFormat.ARROW: "arrows",
+            ResultsFormat.PARQUET: "parquet",
+            ResultsFormat.NDJSON: "ndjson",
+        }[self]
+
+    @classmethod
+    def default(cls) -> "ResultsFormat":
+        return cls.ARROW if columnar_available() else cls.NDJSON
+
+
+def columnar_available() -> bool:
+    return pa is not None
+
+
+@dataclass
+class ResultRecord:
+    """
+    One row of the results table: a single detection or classification
+    """
+
+    timestamp: int  # milliseconds since the epoch, as reported by the camera
+    device_id: str
+    model_id: str
+    task: str
+    class_id: int
+    score: float
+    class_name: Optional[str] = None
+    left: Optional[int] = None
+    top: Optional[int] = None
+    right: Optional[int] = None
+    bottom: Optional[int] = None
+
+
+RECORD_COLUMNS = [f.name for f in fields(ResultRecord)]
+
+
+def _arrow_schema() -> Any:
+    return pa.schema(
+        [
+            ("timestamp", pa.timestamp("ms", tz="UTC")),
+            ("device_id", pa.string()),
+            ("model_id", pa.string()),
+            ("task", pa.string()),
+            ("class_id", pa.int64()),
+            ("score", pa.float32()),
+            ("class_name", pa.string()),
+            ("left", pa.int32()),
+            ("top", pa.int32()),
+            ("right", pa.int32()),
+            ("bottom", pa.int32()),
+        ]
+    )
+
+
+def parse_camera_timestamp(stamp: str) -> int:
+    """
+    Converts the "T" field of an inference payload, such as
+    "20240326110151928", into milliseconds since the epoch.
+    """
+    moment = datetime.strptime(stamp, "%Y%m%d%H%M%S%f").replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def get_inference_metadata(data: dict[str, Any]) -> tuple[str, str, int]:
+    """
+    Extracts the device identifier, the model identifier and the timestamp
+    of the first inference of a device-specific payload, as described in
+    `get_output_from_inference_results`, once parsed from JSON. Raises
+    RecordingError if the payload is malformed.
+    """
+    try:
+        return (
+            data.get("DeviceID", ""),
+            data.get("ModelID", ""),
+            parse_camera_timestamp(data["Inferences"][0]["T"]),
+        )
+    except (AttributeError, KeyError, IndexError, ValueError, TypeError) as e:
+        raise RecordingError(f"Invalid inference metadata: {e}") from e
+
+
+def records_from_decoded(
+    decoded: dict[str, Any], device_id: str, model_id: str, timestamp: int
+) -> list[ResultRecord]:
+    """
+    Flattens the output of `flatbuffer_binary_to_json` into result records,
+    by validating it against the bundled task schemas.
+    """
+    perception = decoded.get("perception", {})
+    try:
+        if "object_detection_list" in perception:
+            detections = ObjectDetection(**decoded).perception.object_detection_list
+            return [
+                ResultRecord(
+                    timestamp,
+                    device_id,
+                    model_id,
+                    task="detection",
+                    class_id=d.class_id,
+                    score=d.score,
+                    class_name=d.class_name,
+                    left=d.bounding_box.left,
+                    top=d.bounding_box.top,
+                    right=d.bounding_box.right,
+                    bottom=d.bounding_box.bottom,
+                )
+                for d in detections
+            ]
+        elif "classification_list" in perception:
+            classes = Classification(**decoded).perception.classification_list
+            return [
+                ResultRecord(
+                    timestamp,
+                    device_id,
+                    model_id,
+                    task="classification",
+                    class_id=c.class_id,
+                    score=c.score,
+                    class_name=c.class_name,
+                )
+                for c in classes
+            ]
+    except ValidationError as e:
+        raise RecordingError(f"Decoded inference does not match task schema: {e}")
+
+    raise RecordingError(
+        "Decoded inference is neither a detection nor a classification"
+    )
+
+
+class ResultsWriter(ABC):
+    """
+    Appends result records to a file, buffering them into
+    row groups of a given size before writing them out. Records
+    are also written out once they have been buffered for
+    `flush_interval` seconds, so that they show up in the file
+    even while inferences arrive slowly.
+    """
+
+    def __init__(
+        self, path: Path, row_group_size: int, flush_interval: Optional[float] = None
+    ) -> None:
+        assert row_group_size > 0
+        self.path = path
+        self.row_group_size = row_group_size
+        self.flush_interval = flush_interval
+        self._pending: list[ResultRecord] = []
+        self._last_flush = time.monotonic()
+
+    def append(self, records: Iterable[ResultRecord]) -> None:
+        self._pending.extend(records)
+        if len(self._pending) >= self.row_group_size or self._flush_due():
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending:
+            self._write_group(self._pending)
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def _flush_due(self) -> bool:
+        return (
+            self.flush_interval is not None
+            and time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def close(self) -> None:
+        self.flush()
+        self._close()
+
+    @abstractmethod
+    def _write_group(self, records: list[ResultRecord]) -> None:
+        """
+        Writes out the given records as a single row group
+        """
+
+    @abstractmethod
+    def _close(self) -> None:
+        """
+        Releases the underlying file
+        """
+
+
+class NDJSONResultsWriter(ResultsWriter):
+    def __init__(
+        self, path: Path, row_group_size: int, flush_interval: Optional[float] = None
+    ) -> None:
+        super().__init__(path, row_group_size, flush_interval)
+        self._file = path.open("a")
+
+    def _write_group(self, records: list[ResultRecord]) -> None:
+        self._file.write("".join(json.dumps(asdict(r)) + "\n" for r in records))
+        self._file.flush()
+
+    def _close(self) -> None:
+        self._file.close()
+
+
+def _to_record_batch(records: list[ResultRecord]) -> Any:
+    columns = {col: [getattr(r, col) for r in records] for col in RECORD_COLUMNS}
+    return pa.RecordBatch.from_pydict(columns, schema=_arrow_schema())
+
+
+class ArrowResultsWriter(ResultsWriter):
+    def __init__(
+        self, path: Path, row_group_size: int, flush_interval: Optional[float] = None
+    ) -> None:
+        super().__init__(path, row_group_size, flush_interval)
+        self._sink = pa.OSFile(str(path), "wb")
+        self._writer = pa.ipc.new_stream(self._sink, _arrow_schema())
+
+    def _write_group(self, records: list[ResultRecord]) -> None:
+        self._writer.write_batch(_to_record_batch(records))
+
+    def _close(self) -> None:
+        self._writer.close()
+        self._sink.close()
+
+
+class ParquetResultsWriter(ResultsWriter):
+    def __init__(
+        self, path: Path, row_group_size: int, flush_interval: Optional[float] = None
+    ) -> None:
+        super().__init__(path, row_group_size, flush_interval)
+        self._writer = pq.ParquetWriter(str(path), _arrow_schema())
+
+    def _write_group(self, records: list[ResultRecord]) -> None:
+        self._writer.write_batch(_to_record_batch(records))
+
+    def _close(self) -> None:
+        self._writer.close()
+
+
+def open_results_writer(
+    path: Path,
+    results_format: ResultsFormat,
+    row_group_size: int,
+    flush_interval: Optional[float] = None,
+) -> ResultsWriter:
+    if results_format == ResultsFormat.NDJSON:
+        return NDJSONResultsWriter(path, row_group_size, flush_interval)
+
+    if not columnar_available():
+        raise RecordingError(
+            f"Format '{results_format}' requires pyarrow. Please install it or use '{ResultsFormat.NDJSON}'"
+        )
+    if results_format == ResultsFormat.ARROW:
+        return ArrowResultsWriter(path, row_group_size, flush_interval)
+    else:
+        return ParquetResultsWriter(path, row_group_size, flush_interval)
+
+
+class InferenceRecorder:
+    """
+    Pipeline stage that appends the decoded results of every incoming
+    inference into a results file within a given directory. A new file
+    is started for each recorder instance, so that previously written
+    files are never reopened. Buffered rows are written out at least
+    every `flush_interval` seconds, and when the recorder is closed.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        results_format: Optional[ResultsFormat] = None,
+        row_group_size: int = 1024,
+        flush_interval: float = 5.0,
+    ) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        self.results_format = (
+            results_format if results_format else ResultsFormat.default()
+        )
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        self.path = directory / f"results-{stamp}.{self.results_format.extension}"
+        self._writer = open_results_writer(
+            self.path, self.results_format, row_group_size, flush_interval
+        )
+
+    def record(self, payload: dict[str, Any], decoded: dict[str, Any]) -> int:
+        """
+        Records the decoded results of an inference payload, as parsed
+        from JSON, returning the number of rows appended.
+        """
+        device_id, model_id, timestamp = get_inference_metadata(payload)
+        records = records_from_decoded(decoded, device_id, model_id, timestamp)
+        self._writer.append(records)
+        return len(records)
+
+    def append(self, records: Iterable[ResultRecord]) -> None:
+        self._writer.append(records)
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+@dataclass
+class ResultsFilter:
+    device_id: Optional[str] = None
+    model_id: Optional[str] = None
+    class_id: Optional[int] = None
+    min_score: Optional[float] = None
+    since: Optional[int] = None  # milliseconds since the epoch
+    until: Optional[int] = None  # milliseconds since the epoch
+
+    def matches(self, row: dict[str, Any]) -> bool:
+        return (
+            (self.device_id is None or row["device_id"] == self.device_id)
+            and (self.model_id is None or row["model_id"] == self.model_id)
+            and (self.class_id is None or row["class_id"] == self.class_id)
+            and (self.min_score is None or row["score"] >= self.min_score)
+            and (self.since is None or row["timestamp"] >= self.since)
+            and (self.until is None or row["timestamp"] < self.until)
+        )
+
+    def expression(self) -> Any:
+        expr = pc.scalar(True)
+        for column in ("device_id", "model_id", "class_id"):
+            value = getattr(self, column)
+            if value is not None:
+                expr = expr & (pc.field(column) == value)
+        if self.min_score is not None:
+            expr = expr & (pc.field("score") >= self.min_score)
+        if self.since is not None:
+            expr = expr & (pc.field("timestamp") >= _ms_scalar(self.since))
+        if self.until is not None:
+            expr = expr & (pc.field("timestamp") < _ms_scalar(self.until))
+        return expr
+
+
+def _ms_scalar(value: int) -> Any:
+    return pa.scalar(value, type=pa.timestamp("ms", tz="UTC"))
+
+
+def _arrow_rows(batches: Iterable[Any]) -> Iterator[dict[str, Any]]:
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        # Timestamps are exposed as integers, as in the NDJSON format
+        table = pa.Table.from_batches([batch])
+        stamps = table.column("timestamp").cast(pa.int64())
+        table = table.set_column(
+            table.schema.get_field_index("timestamp"), "timestamp", stamps
+        )
+        yield from table.to_pylist()
+
+
+def scan_results(
+    directory: Path, results_filter: Optional[ResultsFilter] = None
+) -> Iterator[dict[str, Any]]:
+    """
+    Iterates over the rows stored in all results files in `directory`,
+    in file name (i.e. recording start) order, applying the given filter.
+    For Parquet files, the filter is pushed down so that row groups whose
+    statistics cannot match are skipped.
+    """
+    results_filter = results_filter if results_filter else ResultsFilter()
+    for path in sorted(directory.glob("results-*")):
+        suffix = path.suffix.lstrip(".")
+        if suffix == ResultsFormat.NDJSON.extension:
+            with path.open() as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    if results_filter.matches(row):
+                        yield row
+
+        elif suffix in (ResultsFormat.ARROW.extension, ResultsFormat.PARQUET.extension):
+            if not columnar_available():
+                logger.warning(f"Skipping {path}, as reading it requires pyarrow")
+                continue
+
+            expr = results_filter.expression()
+            if suffix == ResultsFormat.PARQUET.extension:
+                batches = ds.dataset(str(path), format="parquet").to_batches(
+                    filter=expr
+                )
+            else:
+                batches = _filtered_stream(path, expr)
+            yield from _arrow_rows(batches)
+
+
+def _filtered_stream(path: Path, expr: Any) -> Iterator[Any]:
+    with pa.OSFile(str(path), "rb") as source:
+        try:
+            reader = pa.ipc.open_stream(source)
+            for batch in reader:
+                yield from pa.Table.from_batches([batch]).filter(expr).to_batches()
+        except pa.ArrowInvalid as e:
+            # A file being written to by a live recorder may end mid-batch
+            logger.warning(f"Stopped reading truncated results file {path}: {e}")
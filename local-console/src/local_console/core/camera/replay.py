@@ -0,0 +1,164 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+import logging
+import shutil
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from pathlib import Path
+from statistics import quantiles
+from tempfile import TemporaryDirectory
+from typing import Callable
+from typing import Optional
+
+import trio
+from local_console.core.camera.recording import get_inference_metadata
+from local_console.core.camera.recording import RecordingError
+from local_console.core.camera.recording import parse_camera_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayError(Exception):
+    """
+    Conveys an error when a captured directory cannot be replayed
+    """
+
+
+@dataclass(frozen=True)
+class CapturedPair:
+    timestamp: int
+    image: Path
+    inference: Path
+
+
+@dataclass
+class ReplayStats:
+    pairs: int = 0
+    elapsed: float = 0.0
+    max_lag: float = 0.0
+    durations: list[float] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """
+        Achieved rate of pairs per second
+        """
+        return self.pairs / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile(self, percent: int) -> float:
+        """
+        Time in seconds it took to process a pair, at the given percentile.
+        """
+        if len(self.durations) < 2:
+            return self.durations[0] if self.durations else 0.0
+        return quantiles(self.durations, n=100, method="inclusive")[percent - 1]
+
+
+def _pair_timestamp(inference: Path) -> int:
+    try:
+        return get_inference_metadata(json.loads(inference.read_bytes()))[2]
+    except (RecordingError, ValueError):
+        pass
+    try:
+        # Uploaded files are named after their capture time
+        return parse_camera_timestamp(inference.stem)
+    except ValueError:
+        return 0
+
+
+def captured_pairs(
+    images_dir: Path,
+    inferences_dir: Path,
+    image_extension: str = "jpg",
+    inference_extension: str = "txt",
+) -> list[CapturedPair]:
+    """
+    Collects the image and inference files that share a name stem,
+    sorted by the capture time reported within the inference data.
+    Files without a counterpart are left out.
+    """
+    images = {p.stem: p for p in images_dir.glob(f"*.{image_extension}")}
+    inferences = {p.stem: p for p in inferences_dir.glob(f"*.{inference_extension}")}
+    pairs = [
+        CapturedPair(_pair_timestamp(inferences[stem]), images[stem], inferences[stem])
+        for stem in images.keys() & inferences.keys()
+    ]
+    unpaired = len(images) + len(inferences) - 2 * len(pairs)
+    if unpaired:
+        logger.warning(f"Ignoring {unpaired} files with no counterpart to pair with")
+    return sorted(pairs, key=lambda p: (p.timestamp, p.image.stem))
+
+
+class ReplaySource:
+    """
+    Stands in for a camera's uploads, by feeding captured image/inference
+    pairs into the same handler the upload webserver calls for every
+    incoming file. Files are copied into a staging area first, since the
+    handler moves incoming files into the configured input directories.
+
+    Pairs are replayed following their original capture times, scaled by
+    `speed` (i.e. 2.0 doubles the rate), or as fast as the handler allows
+    when `speed` is None.
+    """
+
+    def __init__(
+        self,
+        pairs: list[CapturedPair],
+        on_incoming: Callable[[Path], None],
+        speed: Optional[float] = 1.0,
+    ) -> None:
+        if speed is not None and speed <= 0:
+            raise ReplayError(f"Invalid replay speed: {speed}")
+        self.pairs = pairs
+        self.on_incoming = on_incoming
+        self.speed = speed
+
+    async def run(self) -> ReplayStats:
+        stats = ReplayStats()
+        if not self.pairs:
+            return stats
+
+        with TemporaryDirectory(prefix="LocalConsole_replay_") as tempdir:
+            staging_images = Path(tempdir) / "images"
+            staging_inferences = Path(tempdir) / "inferences"
+            staging_images.mkdir()
+            staging_inferences.mkdir()
+
+            origin = self.pairs[0].timestamp
+            start = trio.current_time()
+            for pair in self.pairs:
+                if self.speed is not None:
+                    due = start + (pair.timestamp - origin) / 1000 / self.speed
+                    await trio.sleep_until(due)
+                    stats.max_lag = max(stats.max_lag, trio.current_time() - due)
+                else:
+                    # Let other tasks run, even at full speed
+                    await trio.lowlevel.checkpoint()
+
+                image = Path(shutil.copy(pair.image, staging_images))
+                inference = Path(shutil.copy(pair.inference, staging_inferences))
+
+                began = time.perf_counter()
+                self.on_incoming(image)
+                self.on_incoming(inference)
+                stats.durations.append(time.perf_counter() - began)
+                stats.pairs += 1
+
+            stats.elapsed = trio.current_time() - start
+
+        return stats
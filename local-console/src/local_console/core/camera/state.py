@@ -32,6 +32,7 @@ from local_console.core.commands.deploy import single_module_manifest_setup
 from local_console.core.commands.deploy import verify_report
 from local_console.core.commands.ota_deploy import get_package_hash
 from local_console.gui.enums import ApplicationConfiguration
+from local_console.utils.fstools import DirectoryMonitor
 from local_console.utils.tracking import TrackingVariable
 from local_console.utils.validation import validate_imx500_model_file
 from trio import CancelScope
@@ -62,9 +63,10 @@ class CameraState(MQTTMixin, StreamingMixin):
         self,
         message_send_channel: MemorySendChannel[MessageType],
         trio_token: TrioToken,
+        dir_monitor: Optional[DirectoryMonitor] = None,
     ) -> None:
         MQTTMixin.__init__(self)
-        StreamingMixin.__init__(self)
+        StreamingMixin.__init__(self, dir_monitor)
 
         self.message_send_channel = message_send_channel
         self.trio_token: TrioToken = trio_token
@@ -205,7 +207,12 @@ class CameraState(MQTTMixin, StreamingMixin):
     def shutdown(self) -> None:
         if self._started.is_set():
             assert self._cancel_scope
+            self.unwatch_input_directories()
             self.dir_monitor.stop()
+            if self.results_recorder:
+                self.results_recorder.close()
+            if self.video_recorder:
+                self.video_recorder.close()
             self._cancel_scope.cancel()
 
     async def send_app_config(self, config: str) -> None:
@@ -0,0 +1,248 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import bisect
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from typing import Optional
+from typing import TextIO
+
+import cv2  # type: ignore
+import numpy as np
+from local_console.utils.enums import StrEnum
+from local_console.utils.fstools import StorageSizeWatcher
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "segment-"
+INDEX_SUFFIX = ".idx"
+
+
+class VideoRecordingError(Exception):
+    """
+    Conveys an error while muxing frames into video segments
+    """
+
+
+class VideoContainer(StrEnum):
+    AVI = "avi"
+    MP4 = "mp4"
+
+    @property
+    def fourcc(self) -> int:
+        # MJPEG is the natural codec for the camera's JPEG frames,
+        # but it is not supported by the MP4 container.
+        code = "MJPG" if self == VideoContainer.AVI else "mp4v"
+        fourcc: int = cv2.VideoWriter.fourcc(*code)
+        return fourcc
+
+
+@dataclass(frozen=True)
+class FrameLocation:
+    timestamp: int
+    segment: Path
+    offset: int
+
+
+def index_path(segment: Path) -> Path:
+    return segment.with_name(segment.name + INDEX_SUFFIX)
+
+
+def segment_path(index: Path) -> Path:
+    return index.with_name(index.name.removesuffix(INDEX_SUFFIX))
+
+
+def is_segment_file(path: Path) -> bool:
+    return path.name.startswith(SEGMENT_PREFIX)
+
+
+class SegmentRecorder:
+    """
+    Muxes incoming frames into fixed-duration video segments within a
+    directory. Next to each segment, a sidecar index file lists the
+    timestamp of every frame in the segment, in order, so that the n-th
+    line is the timestamp of the frame at offset n.
+
+    When given the storage watcher of the directory, segments are
+    accounted for in its quota, and a segment and its index are always
+    pruned together, so that no frame is left without index or vice versa.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        segment_duration: float = 60.0,
+        container: VideoContainer = VideoContainer.AVI,
+        fps: float = 10.0,
+        storage: Optional[StorageSizeWatcher] = None,
+    ) -> None:
+        if segment_duration <= 0:
+            raise VideoRecordingError(
+                f"Invalid segment duration: {segment_duration} seconds"
+            )
+        directory.mkdir(parents=True, exist_ok=True)
+        self.directory = directory
+        self.segment_duration_ms = int(segment_duration * 1000)
+        self.container = container
+        # Nominal rate for playback. Actual capture times are in the index.
+        self.fps = fps
+        self.storage = storage
+
+        self.segment: Optional[Path] = None
+        self._writer: Optional[Any] = None
+        self._index: Optional[TextIO] = None
+        self._frame_size: tuple[int, int] = (0, 0)
+        self._segment_start = 0
+        self._frames = 0
+
+        if self.storage:
+            self.storage.add_prune_listener(self._on_pruned)
+
+    def add_frame(self, image_file: Path, timestamp: int) -> FrameLocation:
+        """
+        Appends the frame stored in `image_file`, captured at `timestamp`
+        (milliseconds since the epoch), to the current segment. A new
+        segment is started when the current one has reached its duration,
+        or when the frame size changes.
+        """
+        frame = cv2.imread(str(image_file))
+        if frame is None:
+            raise VideoRecordingError(f"Could not read frame from {image_file}")
+        height, width = frame.shape[:2]
+
+        if (
+            self._writer is None
+            or timestamp - self._segment_start >= self.segment_duration_ms
+            or timestamp < self._segment_start
+            or (width, height) != self._frame_size
+        ):
+            self._open_segment(timestamp, (width, height))
+
+        assert self._writer and self._index and self.segment
+        self._writer.write(frame)
+        self._index.write(f"{timestamp}\n")
+        self._index.flush()
+        location = FrameLocation(timestamp, self.segment, self._frames)
+        self._frames += 1
+
+        if self.storage:
+            segment = self.segment
+            for path in (segment, index_path(segment)):
+                if self.segment != segment:
+                    # Pruned as soon as accounted for
+                    break
+                if self._frames == 1:
+                    self.storage.incoming(path)
+                else:
+                    self.storage.update_file_size(path)
+
+        return location
+
+    def close(self) -> None:
+        self._close_segment()
+        if self.storage:
+            self.storage.remove_prune_listener(self._on_pruned)
+
+    def _open_segment(self, timestamp: int, frame_size: tuple[int, int]) -> None:
+        self._close_segment()
+
+        segment = self.directory / f"{SEGMENT_PREFIX}{timestamp}.{self.container}"
+        suffix = 1
+        while segment.exists():
+            segment = (
+                self.directory
+                / f"{SEGMENT_PREFIX}{timestamp}_{suffix}.{self.container}"
+            )
+            suffix += 1
+
+        writer = cv2.VideoWriter(
+            str(segment), self.container.fourcc, self.fps, frame_size
+        )
+        if not writer.isOpened():
+            raise VideoRecordingError(f"Could not open video writer for {segment}")
+
+        self.segment = segment
+        self._writer = writer
+        self._index = index_path(segment).open("w")
+        self._frame_size = frame_size
+        self._segment_start = timestamp
+        self._frames = 0
+        logger.debug(f"Started video segment {segment}")
+
+    def _close_segment(self) -> None:
+        if self._writer is None:
+            return
+
+        assert self._index and self.segment
+        self._writer.release()
+        self._index.close()
+        if self.storage and self.segment.exists():
+            # Releasing the writer finalizes the container's headers
+            self.storage.update_file_size(self.segment)
+        self._writer = None
+        self._index = None
+        self.segment = None
+
+    def _on_pruned(self, path: Path) -> None:
+        if path.parent != self.directory or not is_segment_file(path):
+            return
+
+        if path.name.endswith(INDEX_SUFFIX):
+            segment = segment_path(path)
+            sibling = segment
+        else:
+            segment = path
+            sibling = index_path(path)
+
+        if segment == self.segment:
+            logger.warning(f"Pruned video segment {segment} while being recorded")
+            self._close_segment()
+        if self.storage:
+            self.storage.remove_file(sibling)
+
+
+def read_index(segment: Path) -> list[int]:
+    return [int(line) for line in index_path(segment).read_text().splitlines()]
+
+
+def find_frame(directory: Path, timestamp: int) -> Optional[FrameLocation]:
+    """
+    Locates the last frame captured at or before `timestamp`
+    among the segments recorded in `directory`.
+    """
+    for index in sorted(
+        directory.glob(f"{SEGMENT_PREFIX}*{INDEX_SUFFIX}"), reverse=True
+    ):
+        stamps = read_index(segment_path(index))
+        offset = bisect.bisect_right(stamps, timestamp) - 1
+        if offset >= 0:
+            return FrameLocation(stamps[offset], segment_path(index), offset)
+    return None
+
+
+def read_frame(location: FrameLocation) -> np.ndarray:
+    capture = cv2.VideoCapture(str(location.segment))
+    try:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, location.offset)
+        ok, frame = capture.read()
+        if not ok:
+            raise VideoRecordingError(
+                f"Could not read frame {location.offset} of {location.segment}"
+            )
+        return frame
+    finally:
+        capture.release()
@@ -20,6 +20,7 @@ import uuid
 from abc import ABC
 from abc import abstractmethod
 from collections.abc import Awaitable
+from dataclasses import dataclass
 from pathlib import Path
 from pathlib import PurePosixPath
 from typing import Any
@@ -30,8 +31,10 @@ import trio
 from local_console.core.camera.enums import DeployStage
 from local_console.core.schemas.schemas import Deployment
 from local_console.core.schemas.schemas import DeploymentManifest
+from local_console.core.schemas.schemas import Module
 from local_console.core.schemas.schemas import OnWireProtocol
 from local_console.servers.webserver import SyncWebserver
+from local_console.utils.hashing import sha256_hex
 from local_console.utils.local_network import get_webserver_ip
 from local_console.utils.timing import TimeoutBehavior
 
@@ -46,13 +49,19 @@ class DeployFSM(ABC):
         deploy_webserver: bool = True,
         webserver_port: int = 0,
         timeout_secs: int = 30,
+        webserver: Optional[SyncWebserver] = None,
     ) -> None:
         self.deploy_fn = deploy_fn
         self.stage_callback = stage_callback
-        self.webserver = SyncWebserver(
-            Path(), port=webserver_port, deploy=deploy_webserver
-        )
-        self.webserver.start()  # This secures a listening port for the webserver
+        # A given webserver is shared with other deployments,
+        # so it is left to its owner to start and stop it.
+        self._owns_webserver = webserver is None
+        if webserver is None:
+            webserver = SyncWebserver(
+                Path(), port=webserver_port, deploy=deploy_webserver
+            )
+            webserver.start()  # This secures a listening port for the webserver
+        self.webserver = webserver
 
         self.done = trio.Event()
         self._timeout_handler = TimeoutBehavior(timeout_secs, self._on_timeout)
@@ -86,9 +95,21 @@ class DeployFSM(ABC):
     def set_manifest(self, to_deploy: DeploymentManifest) -> None:
         self._to_deploy = to_deploy
 
+    def _renew_deployment_id(self) -> None:
+        """
+        Gives the manifest to deploy an identifier never used before, as
+        the agent would otherwise take it as a deployment it has already
+        applied, even if applying it failed. The manifest is copied, as
+        it may be shared with the deployments to other devices.
+        """
+        assert self._to_deploy
+        self._to_deploy = self._to_deploy.model_copy(deep=True)
+        self._to_deploy.deployment.deploymentId = str(uuid.uuid4())
+
     def stop(self) -> None:
         self._timeout_handler.stop()
-        self.webserver.stop()
+        if self._owns_webserver:
+            self.webserver.stop()
         self.done.set()
 
     async def check_termination(
@@ -131,6 +152,7 @@ class DeployFSM(ABC):
         deploy_webserver: bool = True,
         webserver_port_override: int = 0,
         timeout_secs: int = 30,
+        webserver: Optional[SyncWebserver] = None,
     ) -> "DeployFSM":
         # This is a factory builder, so only run this from this parent class
         assert cls is DeployFSM
@@ -142,6 +164,7 @@ class DeployFSM(ABC):
                 deploy_webserver,
                 webserver_port_override,
                 timeout_secs,
+                webserver,
             )
         elif onwire_schema == OnWireProtocol.EVP2:
             return EVP2DeployFSM(
@@ -150,6 +173,7 @@ class DeployFSM(ABC):
                 deploy_webserver,
                 webserver_port_override,
                 timeout_secs,
+                webserver,
             )
 
 
@@ -171,6 +195,11 @@ class EVP2DeployFSM(DeployFSM):
         is_finished, matches, is_errored = verify_report(
             self._to_deploy.deployment.deploymentId, deploy_status
         )
+        if self.stage == DeployStage.WaitFirstStatus and matches and is_errored:
+            logger.info("A former attempt at this deployment failed. Retrying.")
+            self._renew_deployment_id()
+            matches = is_errored = False
+
         if await self.check_termination(is_finished, matches, is_errored):
             return
 
@@ -201,6 +230,9 @@ class EVP1DeployFSM(DeployFSM):
     async def start(self, nursery: trio.Nursery) -> None:
         assert self._to_deploy
         # Deploy immediately, without comparing with current status, to speed-up the process.
+        # As the status is not known, the manifest cannot be told apart from a former,
+        # failed attempt at the same deployment, so it is always given a new identifier.
+        self._renew_deployment_id()
         logger.debug("Pushing manifest now.")
         self._timeout_handler.spawn_in(nursery)
         await self._set_new_stage(DeployStage.WaitAppliedConfirmation)
@@ -320,6 +352,65 @@ def make_unique_module_ids(deploy_man: DeploymentManifest) -> None:
         instance.moduleId = old_to_new[instance.moduleId]
 
 
+def base_module_id(module_id: str, module: Module) -> str:
+    """
+    Undoes make_unique_module_ids() for a module of a manifest which has
+    already been set up, whose download URL has thus been filled in.
+    """
+    suffix = f"-{module.hash[:5]}"
+    if module.hash and module.downloadUrl and module_id.endswith(suffix):
+        return module_id[: -len(suffix)]
+    return module_id
+
+
+def manifest_template(manifest: DeploymentManifest) -> DeploymentManifest:
+    """
+    Returns a copy of `manifest` with the module identifiers that
+    make_unique_module_ids() would have been given, so that the
+    manifest of the last deployment can be set up again.
+    """
+    template = manifest.model_copy(deep=True)
+    modules = template.deployment.modules
+    old_to_new = {name: base_module_id(name, m) for name, m in modules.items()}
+    template.deployment.modules = {
+        old_to_new[name]: module for name, module in modules.items()
+    }
+    for instance in template.deployment.instanceSpecs.values():
+        instance.moduleId = old_to_new.get(instance.moduleId, instance.moduleId)
+    return template
+
+
+@dataclass
+class ManifestDelta:
+    """
+    Modules of a deployment manifest, split into those which are the
+    same as in a previous manifest, and those which are not. Devices
+    only download again the modules which their cache does not hold.
+    """
+
+    unchanged: list[str]
+    changed: list[str]
+    # Whether the whole deployment is the same as the previous one
+    identical: bool
+
+
+def diff_manifests(
+    manifest: DeploymentManifest, previous: Optional[DeploymentManifest]
+) -> ManifestDelta:
+    previous_modules = previous.deployment.modules if previous else {}
+    unchanged = [
+        name
+        for name, module in manifest.deployment.modules.items()
+        if name in previous_modules and previous_modules[name].hash == module.hash
+    ]
+    changed = [name for name in manifest.deployment.modules if name not in unchanged]
+    identical = (
+        previous is not None
+        and previous.deployment.deploymentId == manifest.deployment.deploymentId
+    )
+    return ManifestDelta(unchanged, changed, identical)
+
+
 def get_empty_deployment() -> DeploymentManifest:
     deployment = {
         "deployment": {
@@ -334,9 +425,7 @@ def get_empty_deployment() -> DeploymentManifest:
 
 
 def calculate_sha256(path: Path) -> str:
-    sha256_hash = hashlib.sha256()
-    sha256_hash.update(path.read_bytes())
-    return sha256_hash.hexdigest()
+    return sha256_hex(path)
 
 
 def populate_urls_and_hashes(
@@ -351,10 +440,18 @@ def populate_urls_and_hashes(
         url = f"http://{host}:{port}/{PurePosixPath(file.relative_to(root_path))}"
         deployment_manifest.deployment.modules[module].downloadUrl = url
 
-    # DeploymentId based on deployment manifest content
-    deployment_manifest_hash = hashlib.sha256(
-        str(deployment_manifest.model_dump()).encode("utf-8")
+    # DeploymentId based on deployment manifest content. The URLs are left
+    # out, as they change with the webserver port, so that deploying the
+    # same modules again results in the same deployment.
+    content = deployment_manifest.model_dump(
+        exclude={
+            "deployment": {
+                "deploymentId": True,
+                "modules": {"__all__": {"downloadUrl"}},
+            }
+        }
     )
+    deployment_manifest_hash = hashlib.sha256(str(content).encode("utf-8"))
     deployment_manifest.deployment.deploymentId = deployment_manifest_hash.hexdigest()
 
 
@@ -0,0 +1,202 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Deployment of a manifest to several devices at once. Each device is driven
+by its own DeployFSM, up to a number of them concurrently, and all of them
+download the modules from the same webserver.
+"""
+import logging
+from collections.abc import Awaitable
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Callable
+from typing import Optional
+
+import trio
+from local_console.clients.agent import Agent
+from local_console.core.camera.enums import DeployStage
+from local_console.core.commands.deploy import DeployFSM
+from local_console.core.config import ConfigError
+from local_console.core.schemas.schemas import DeploymentManifest
+from local_console.core.schemas.schemas import DeviceConnection
+from local_console.core.schemas.schemas import OnWireProtocol
+from local_console.servers.webserver import SyncWebserver
+
+logger = logging.getLogger(__name__)
+
+ALL_DEVICES = "all"
+DEFAULT_PARALLELISM = 8
+
+
+def select_devices(
+    devices: list[DeviceConnection], selector: str
+) -> list[DeviceConnection]:
+    """
+    Picks the devices named by `selector`, which is either "all" or a
+    comma-separated list of names and shell-style patterns, such as
+    "cam-1,lab-*". Raises ConfigError if any of them matches no device.
+    """
+    if selector.strip() == ALL_DEVICES:
+        return list(devices)
+
+    patterns = [pattern.strip() for pattern in selector.split(",") if pattern.strip()]
+    unmatched = [
+        pattern
+        for pattern in patterns
+        if not any(fnmatchcase(device.name, pattern) for device in devices)
+    ]
+    if not patterns or unmatched:
+        raise ConfigError(f"No device matches '{','.join(unmatched) or selector}'")
+    return [
+        device
+        for device in devices
+        if any(fnmatchcase(device.name, pattern) for pattern in patterns)
+    ]
+
+
+@dataclass
+class DeviceOutcome:
+    name: str
+    port: int
+    stage: Optional[DeployStage] = None
+    # Unset until the deployment to the device ended
+    success: Optional[bool] = None
+    error: Optional[str] = None
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class FleetProgress:
+    """
+    Outcome of the deployment to each device, by name. `on_change` is
+    called whenever a device moves to another stage or is done.
+    """
+
+    def __init__(
+        self,
+        devices: list[DeviceConnection],
+        on_change: Optional[Callable[["FleetProgress", DeviceOutcome], None]] = None,
+    ) -> None:
+        self.outcomes = {
+            device.name: DeviceOutcome(device.name, device.mqtt.port)
+            for device in devices
+        }
+        self.on_change = on_change
+
+    @property
+    def succeeded(self) -> list[DeviceOutcome]:
+        return [o for o in self.outcomes.values() if o.success]
+
+    @property
+    def failed(self) -> list[DeviceOutcome]:
+        return [o for o in self.outcomes.values() if o.success is False]
+
+    @property
+    def running(self) -> list[DeviceOutcome]:
+        return [
+            o
+            for o in self.outcomes.values()
+            if o.started is not None and o.success is None
+        ]
+
+    @property
+    def complete(self) -> bool:
+        return all(o.success is not None for o in self.outcomes.values())
+
+    def summary(self) -> str:
+        done = len(self.succeeded) + len(self.failed)
+        return (
+            f"{done}/{len(self.outcomes)} devices done: "
+            f"{len(self.succeeded)} succeeded, {len(self.failed)} failed, "
+            f"{len(self.running)} in progress"
+        )
+
+    def update(self, outcome: DeviceOutcome) -> None:
+        if self.on_change:
+            self.on_change(self, outcome)
+
+
+class FleetDeployment:
+    """
+    Deploys `manifest` to `devices`, at most `parallelism` at a time.
+    The modules it refers to must be served by `webserver`, which the
+    caller starts and stops. `execute` drives a device's DeployFSM with
+    its agent, returning whether the deployment succeeded.
+    """
+
+    def __init__(
+        self,
+        devices: list[DeviceConnection],
+        onwire_schema: OnWireProtocol,
+        manifest: DeploymentManifest,
+        webserver: SyncWebserver,
+        execute: Callable[[Agent, DeployFSM], Awaitable[bool]],
+        parallelism: int = DEFAULT_PARALLELISM,
+        timeout_secs: int = 30,
+        progress: Optional[FleetProgress] = None,
+    ) -> None:
+        if parallelism < 1:
+            raise ValueError(f"Invalid parallelism: {parallelism}")
+        self.devices = devices
+        self.onwire_schema = onwire_schema
+        self.manifest = manifest
+        self.webserver = webserver
+        self.execute = execute
+        self.timeout_secs = timeout_secs
+        self.progress = FleetProgress(devices) if progress is None else progress
+        self._limiter = trio.CapacityLimiter(parallelism)
+
+    async def run(self) -> FleetProgress:
+        async with trio.open_nursery() as nursery:
+            for device in self.devices:
+                nursery.start_soon(self._deploy, device)
+        return self.progress
+
+    async def _deploy(self, device: DeviceConnection) -> None:
+        outcome = self.progress.outcomes[device.name]
+        async with self._limiter:
+            outcome.started = trio.current_time()
+
+            async def on_stage(stage: DeployStage) -> None:
+                outcome.stage = stage
+                self.progress.update(outcome)
+
+            try:
+                agent = Agent(device.mqtt.host, device.mqtt.port, self.onwire_schema)
+                fsm = DeployFSM.instantiate(
+                    self.onwire_schema,
+                    agent.deploy,
+                    on_stage,
+                    timeout_secs=self.timeout_secs,
+                    webserver=self.webserver,
+                )
+                fsm.set_manifest(self.manifest)
+                outcome.success = await self.execute(agent, fsm)
+            # The agent exits if it cannot reach the device's broker
+            except (Exception, SystemExit) as e:
+                logger.error(f"Deployment to {device.name} failed: {e!r}")
+                outcome.success = False
+                outcome.error = str(e) or type(e).__name__
+            outcome.finished = trio.current_time()
+            if not outcome.success and outcome.error is None:
+                outcome.error = f"Stopped at stage {outcome.stage}"
+            self.progress.update(outcome)
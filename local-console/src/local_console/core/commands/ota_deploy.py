@@ -13,25 +13,24 @@
 # limitations under the License.
 #
 # SPDX-License-Identifier: Apache-2.0
-from base64 import b64encode
 from pathlib import Path
 from pathlib import PurePosixPath
 
-from cryptography.hazmat.primitives import hashes
 from local_console.core.camera.enums import OTAUpdateModule
 from local_console.core.schemas.edge_cloud_if_v1 import DnnModelVersion
 from local_console.core.schemas.edge_cloud_if_v1 import DnnOta
 from local_console.core.schemas.edge_cloud_if_v1 import DnnOtaBody
+from local_console.utils.hashing import sha256_b64
 
 
 def get_package_hash(package_file: Path) -> str:
-    digest = hashes.Hash(hashes.SHA256())
-    digest.update(package_file.read_bytes())
-    return b64encode(digest.finalize()).decode()
+    return sha256_b64(package_file)
 
 
 def get_package_version(package_file: Path) -> str:
-    ver_bytes = package_file.read_bytes()[0x30:0x40]
+    with package_file.open("rb") as package:
+        package.seek(0x30)
+        ver_bytes = package.read(0x10)
     return ver_bytes.decode()
 
 
@@ -0,0 +1,119 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+from collections.abc import Iterable
+from dataclasses import dataclass
+from dataclasses import field
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+import trio
+from Crypto.PublicKey import ECC  # type: ignore
+from local_console.core.enums import ModuleExtension
+from local_console.core.enums import Target
+from local_console.utils.signature import sign_file
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SigningJob:
+    source: Path
+    signed: Path
+
+    def is_up_to_date(self, key_file: Path) -> bool:
+        """
+        Whether the signed file was written after the last modification
+        of both the AoT file and the key it is signed with.
+        """
+        if not self.signed.is_file():
+            return False
+        signed_mtime = self.signed.stat().st_mtime_ns
+        return (
+            signed_mtime >= self.source.stat().st_mtime_ns
+            and signed_mtime >= key_file.stat().st_mtime_ns
+        )
+
+
+def signing_jobs(files_dir: Path, targets: Iterable[Target]) -> list[SigningJob]:
+    """
+    Lists the AoT files in `files_dir` compiled for `targets`, named as
+    project_binary_lookup() expects them, along with their signed file.
+    """
+    jobs = []
+    for target in targets:
+        pattern = f"*.{target.value}.{ModuleExtension.AOT.value}"
+        for source in sorted(files_dir.glob(pattern)):
+            signed = source.with_name(f"{source.name}.{ModuleExtension.SIGNED.value}")
+            jobs.append(SigningJob(source, signed))
+    return jobs
+
+
+def load_signing_key(key_file: Path) -> bytes:
+    key = key_file.read_bytes()
+    try:
+        ECC.import_key(key)
+    except ValueError:
+        raise ValueError(f"{key_file} is not an ECDSA private key")
+    return key
+
+
+@dataclass
+class SigningResult:
+    signed: list[SigningJob] = field(default_factory=list)
+    # Those whose signed file was up to date
+    skipped: list[SigningJob] = field(default_factory=list)
+    failed: list[SigningJob] = field(default_factory=list)
+
+
+async def sign_modules(
+    jobs: list[SigningJob],
+    key_file: Path,
+    force: bool = False,
+    parallelism: Optional[int] = None,
+) -> SigningResult:
+    """
+    Signs the AoT files of `jobs` concurrently, in worker threads, unless
+    their signed file is up to date and `force` is not set. Raises
+    ValueError if `key_file` does not hold a valid key.
+    """
+    key = load_signing_key(key_file)
+    result = SigningResult()
+    to_sign = []
+    for job in jobs:
+        if not force and job.is_up_to_date(key_file):
+            result.skipped.append(job)
+        else:
+            to_sign.append(job)
+    limiter = trio.CapacityLimiter(parallelism or max(len(to_sign), 1))
+
+    async def sign_one(job: SigningJob) -> None:
+        try:
+            await trio.to_thread.run_sync(
+                partial(sign_file, job.source, job.signed, key), limiter=limiter
+            )
+        except (ValueError, OSError) as e:
+            logger.error(f"Could not sign {job.source.name}: {e}")
+            result.failed.append(job)
+        else:
+            logger.info(f"Signed {job.source.name}")
+            result.signed.append(job)
+
+    async with trio.open_nursery() as nursery:
+        for job in to_sign:
+            nursery.start_soon(sign_one, job)
+    return result
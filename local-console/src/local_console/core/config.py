@@ -27,6 +27,8 @@ from local_console.core.schemas.schemas import GlobalConfiguration
 from local_console.core.schemas.schemas import MQTTParams
 from local_console.core.schemas.schemas import Persist
 from local_console.core.schemas.schemas import WebserverParams
+from local_console.utils.tls import BrokerCredentials
+from local_console.utils.tls import ensure_broker_credentials
 from pydantic import ValidationError
 
 logger = logging.getLogger(__name__)
@@ -197,3 +199,25 @@ config_obj = Config()
 
 def get_config() -> GlobalConfiguration:
     return config_obj.get_config()
+
+
+def broker_credentials() -> Optional[BrokerCredentials]:
+    """
+    Certificates for the brokers and their clients, if TLS is enabled.
+    They are kept per key type, under the configuration directory.
+    """
+    broker = config_obj.get_config().broker
+    if not broker.tls:
+        return None
+    key_type = broker.tls_key_type
+    return ensure_broker_credentials(config_paths.home / "tls" / key_type, key_type)
+
+
+def outbound_store_path(host: str, port: int) -> Optional[Path]:
+    """
+    File of the messages pending acknowledgement from the broker at
+    `host`:`port`, if they are to be persisted.
+    """
+    if not config_obj.get_config().broker.persist_outbound:
+        return None
+    return config_paths.home / "outbound" / f"{host}_{port}.jsonl"
@@ -13,14 +13,17 @@
 # limitations under the License.
 #
 # SPDX-License-Identifier: Apache-2.0
-import json
 import logging
+from pathlib import Path
 from typing import Annotated
 from typing import Optional
 
 from local_console.utils.enums import StrEnum
+from local_console.utils.json_codec import json_encode
+from local_console.utils.json_codec import json_encode_str
 from pydantic import BaseModel
 from pydantic import Field
+from pydantic import model_validator
 
 logger = logging.getLogger(__name__)
 
@@ -63,7 +66,7 @@ class Deployment(BaseModel):
 class DeploymentManifest(BaseModel):
     deployment: Deployment
 
-    def render_for_evp1(self) -> str:
+    def render_for_evp1(self) -> bytes:
         # The actual manifest, which is the value of the "deployment" key, is stringified. See:
         # https://github.com/midokura/wedge-agent/blob/fa3d4840c37978938084cbc70612fdb8ea8dbf9f/src/libwedge-agent/manifest.c#L1151
         # Also, the fields differ and EVP1 has two mandatory fields in the instanceSpecs:
@@ -72,13 +75,13 @@ class DeploymentManifest(BaseModel):
         difference_hack = body.model_dump()
         for instance in difference_hack["instanceSpecs"].values():
             instance.update({"version": 1, "entryPoint": "main"})
-        as_json = json.dumps(difference_hack)
-        return json.dumps({"deployment": as_json})
+        as_json = json_encode_str(difference_hack)
+        return json_encode({"deployment": as_json})
 
-    def render_for_evp2(self) -> str:
+    def render_for_evp2(self) -> bytes:
         # A direct JSON serialization, see:
         # https://github.com/midokura/wedge-agent/blob/fa3d4840c37978938084cbc70612fdb8ea8dbf9f/src/libwedge-agent/manifest.c#L1168
-        return json.dumps(self.model_dump())
+        return json_encode(self.model_dump())
 
 
 class DesiredDeviceConfig(BaseModel):
@@ -133,6 +136,8 @@ class Persist(BaseModel):
     ai_model_file: str | None = None
     image_dir_path: str | None = None
     inference_dir_path: str | None = None
+    results_dir_path: str | None = None
+    video_segment_seconds: str | None = None
     size: str | None = None
     unit: str | None = None
     vapp_type: str | None = None
@@ -152,7 +157,45 @@ class EVPParams(BaseModel):
     iot_platform: str = Field(pattern=r"^[a-zA-Z][\w]*$")
 
 
+class TLSKeyType(StrEnum):
+    RSA_2048 = "rsa-2048"
+    # Faster to generate, and to handshake with
+    ECDSA_P256 = "ecdsa-p256"
+
+
+class TLSConfiguration(BaseModel):
+    ca_certificate: Optional[Path] = None
+    ca_key: Optional[Path] = None
+
+
+class BrokerParams(BaseModel, validate_assignment=True):
+    # Whether a single broker serves all devices, instead of one per device
+    shared: bool = False
+    # Port on which Local Console connects to the shared broker
+    console_port: int = Field(default=1882, ge=0, le=65535)
+    # Whether per-device brokers run in-process instead of as mosquitto
+    embedded: bool = False
+    # Directory into which the output of mosquitto is written, if set
+    log_dir: Optional[str] = None
+    # Whether brokers require TLS, with certificates that are generated
+    # once and kept under the configuration directory
+    tls: bool = False
+    tls_key_type: TLSKeyType = TLSKeyType.ECDSA_P256
+    # Whether messages published at QoS 1 and 2 are kept on disk until
+    # the broker acknowledges them, so that they are sent again by the
+    # next process connecting to the same device
+    persist_outbound: bool = False
+
+    @model_validator(mode="after")
+    def check_tls_per_device(self) -> "BrokerParams":
+        # Devices connect to the shared broker without TLS
+        if self.shared and self.tls:
+            raise ValueError("TLS is not supported with a shared broker")
+        return self
+
+
 class GlobalConfiguration(BaseModel):
     evp: EVPParams
     devices: list[DeviceConnection]
     active_device: int = IPPortNumber
+    broker: BrokerParams = BrokerParams()
@@ -14,6 +14,7 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 from local_console.core.camera.qr import get_qr_object
+from local_console.core.config import config_obj
 from local_console.gui.controller.base_controller import BaseController
 from local_console.gui.driver import Driver
 from local_console.gui.model.connection_screen import ConnectionScreenModel
@@ -220,7 +221,7 @@ class ConnectionScreenController(BaseController):
             if self.driver.camera_state.mqtt_port.value != ""
             else None
         )
-        tls_enabled = False
+        tls_enabled = config_obj.get_config().broker.tls
         qr = get_qr_object(
             replace_local_address(self.driver.camera_state.mqtt_host.value),
             mqtt_port,
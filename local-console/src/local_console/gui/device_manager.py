@@ -20,12 +20,17 @@ from typing import Callable
 from typing import Optional
 
 import trio
+from exceptiongroup import ExceptionGroup
 from local_console.core.camera.state import CameraState
 from local_console.core.camera.state import MessageType
 from local_console.core.config import config_obj
+from local_console.core.config import optional_path
 from local_console.core.schemas.schemas import DeviceConnection
 from local_console.core.schemas.schemas import DeviceListItem
 from local_console.gui.model.camera_proxy import CameraStateProxy
+from local_console.servers.broker import BrokerException
+from local_console.servers.shared_broker import SharedBroker
+from local_console.utils.fstools import DirectoryMonitor
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +58,8 @@ class DeviceManager:
     _STATE_TO_PROXY_PROPS = [
         "image_dir_path",
         "inference_dir_path",
+        "results_dir_path",
+        "video_segment_seconds",
     ]
 
     def __init__(
@@ -65,9 +72,13 @@ class DeviceManager:
         self.nursery = nursery
         self.trio_token = trio_token
 
+        # Process-wide filesystem observer, shared by all devices
+        self.dir_monitor = DirectoryMonitor()
+
         self.active_device: DeviceListItem | None = None
         self.proxies_factory: dict[int, CameraStateProxy] = {}
         self.state_factory: dict[int, CameraState] = {}
+        self.shared_broker: Optional[SharedBroker] = None
 
     async def init_devices(self, device_configs: list[DeviceConnection]) -> None:
         """
@@ -76,7 +87,14 @@ class DeviceManager:
         using the predefined default name and port. The default device is then
         added to the device manager, set as the active device, and the GUI proxy
         is switched to reflect this change.
+
+        In shared broker mode, the broker is started beforehand, listening
+        for all the configured devices at once.
         """
+        if config_obj.get_config().broker.shared:
+            ports = [device_conn.mqtt.port for device_conn in device_configs]
+            await self.start_shared_broker(ports or [self.DEFAULT_DEVICE_PORT])
+
         if len(device_configs) == 0:
             # There should be at least one device
             default_device = DeviceListItem(
@@ -92,6 +110,21 @@ class DeviceManager:
 
         self.set_active_device(config_obj.get_active_device_config().mqtt.port)
 
+    async def start_shared_broker(self, ports: list[int]) -> None:
+        broker_params = config_obj.get_config().broker
+        shared_broker = SharedBroker(
+            broker_params.console_port,
+            ports,
+            log_dir=optional_path(broker_params.log_dir),
+        )
+        try:
+            await self.nursery.start(shared_broker.run)
+            self.shared_broker = shared_broker
+        except ExceptionGroup as exc_grp:
+            for e in exc_grp.exceptions:
+                if isinstance(e, BrokerException):
+                    await self.send_channel.send(("error", str(e)))
+
     @property
     def num_devices(self) -> int:
         n = len(self.state_factory)
@@ -116,7 +149,10 @@ class DeviceManager:
         """
         key = device_item.port
 
-        state = CameraState(self.send_channel.clone(), self.trio_token)
+        state = CameraState(
+            self.send_channel.clone(), self.trio_token, self.dir_monitor
+        )
+        state.shared_broker = self.shared_broker
         proxy = CameraStateProxy()
 
         config = config_obj.get_config()
@@ -143,6 +179,8 @@ class DeviceManager:
             return
 
         self.state_factory[key].shutdown()
+        if self.shared_broker:
+            self.shared_broker.remove_device(key)
         config_obj.remove_device(key)
         config_obj.save_config()
         del self.proxies_factory[key]
@@ -40,6 +40,8 @@ class CameraStateProxy(CameraStateProxyBase):
 
     image_dir_path = StringProperty("")
     inference_dir_path = StringProperty("")
+    results_dir_path = StringProperty("")
+    video_segment_seconds = StringProperty("")
 
     device_config = ObjectProperty(DeviceConfiguration, allownone=True)
 
@@ -133,6 +135,8 @@ class CameraStateProxy(CameraStateProxyBase):
     def bind_input_directories(self, camera_state: CameraState) -> None:
         self.bind_state_to_proxy("image_dir_path", camera_state, str)
         self.bind_state_to_proxy("inference_dir_path", camera_state, str)
+        self.bind_state_to_proxy("results_dir_path", camera_state, str)
+        self.bind_state_to_proxy("video_segment_seconds", camera_state, str)
 
     def bind_vapp_file_functions(self, camera_state: CameraState) -> None:
         self.bind_proxy_to_state("vapp_schema_file", camera_state)
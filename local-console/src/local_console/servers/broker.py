@@ -14,24 +14,59 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 import logging
+import random
 import re
+import ssl
 import subprocess
 from collections.abc import AsyncIterator
+from collections.abc import Awaitable
 from contextlib import asynccontextmanager
 from functools import partial
 from pathlib import Path
 from shutil import which
 from string import Template
 from tempfile import TemporaryDirectory
+from typing import Any
+from typing import Callable
+from typing import Optional
 
 import trio
+from local_console.clients.mqtt_codec import decode_connack
+from local_console.clients.mqtt_codec import DISCONNECT
+from local_console.clients.mqtt_codec import encode_connect
+from local_console.clients.mqtt_codec import MQTTProtocolError
+from local_console.clients.mqtt_codec import MQTTVersion
+from local_console.clients.mqtt_codec import PacketReader
+from local_console.clients.mqtt_codec import PacketType
+from local_console.clients.trio_mqtt import MQTTConnectionError
+from local_console.servers.broker_logs import BrokerLogIngester
+from local_console.servers.broker_logs import RotatingLogFile
+from local_console.servers.embedded_broker import EmbeddedBroker
+from local_console.utils.tls import BrokerCredentials
+from local_console.utils.tls import client_ssl_context
+from local_console.utils.tls import server_ssl_context
 from trio import run_process
+from trio import TASK_STATUS_IGNORED
 
 logger = logging.getLogger(__name__)
 
 broker_assets = Path(__file__).parents[1] / "assets" / "broker"
 
 
+# Interval between attempts to connect to a starting broker
+PROBE_INTERVAL = 0.01
+# Time given to a broker to accept connections once started
+READY_TIMEOUT = 10.0
+# Waits between restarts of a broker that exited, doubling from the
+# initial one on each restart, up to the maximum. Brokers that stayed
+# up for STABLE_UPTIME are restarted after the initial one again.
+INITIAL_BACKOFF = 0.05
+MAX_BACKOFF = 10.0
+STABLE_UPTIME = 30.0
+# Printed by mosquitto once all of its listeners are open
+RUNNING_BANNER = re.compile(r"mosquitto version (\d+\.\d+\.\d+) running")
+
+
 class BrokerException(Exception):
     """
     Class for broker management exceptions
@@ -40,64 +75,365 @@ class BrokerException(Exception):
 
 @asynccontextmanager
 async def spawn_broker(
-    port: int, nursery: trio.Nursery, verbose: bool
-) -> AsyncIterator[trio.Process]:
+    port: int,
+    nursery: trio.Nursery,
+    verbose: bool,
+    embedded: bool = False,
+    log_dir: Optional[Path] = None,
+    tls: Optional[BrokerCredentials] = None,
+) -> AsyncIterator["BrokerSupervisor"]:
+    """
+    Runs a broker on `port` for the duration of the context, which is
+    mosquitto unless `embedded` is set, to run it in-process instead.
+    The broker is restarted if it exits meanwhile. The output of
+    mosquitto is written into `log_dir`, if given. Given `tls`
+    credentials, the broker only accepts TLS connections.
+    """
+    supervisor = BrokerSupervisor(port, nursery, embedded, log_dir=log_dir, tls=tls)
+    await nursery.start(supervisor.run)
+    yield supervisor
+    supervisor.stop()
+
+
+async def probe_broker(
+    port: int, host: str = "127.0.0.1", ssl_context: Optional[ssl.SSLContext] = None
+) -> bool:
+    """
+    Tells whether the broker at `host`:`port` accepts an MQTT connection,
+    over TLS if `ssl_context` is given.
+    """
+    stream: trio.abc.Stream
+    try:
+        stream = await trio.open_tcp_stream(host, port)
+    except OSError:
+        return False
+    if ssl_context:
+        stream = trio.SSLStream(stream, ssl_context, server_hostname=host)
+    try:
+        client_id = f"local-console-probe-{random.randint(0, 10**7)}"
+        await stream.send_all(encode_connect(client_id, 0))
+        reader = PacketReader()
+        while True:
+            data = await stream.receive_some()
+            if not data:
+                return False
+            for packet in reader.feed(data):
+                if packet.type != PacketType.CONNACK:
+                    return False
+                await stream.send_all(DISCONNECT)
+                return decode_connack(packet, MQTTVersion.V311)[1] == 0
+    except (MQTTProtocolError, trio.BrokenResourceError):
+        return False
+    finally:
+        await stream.aclose()
+
+
+async def wait_until_ready(
+    port: int, host: str = "127.0.0.1", ssl_context: Optional[ssl.SSLContext] = None
+) -> None:
+    while not await probe_broker(port, host, ssl_context):
+        await trio.sleep(PROBE_INTERVAL)
+
+
+class BrokerSupervisor:
+    """
+    Runs a broker in `nursery`, which is considered ready once it accepts
+    an MQTT connection, and restarts it whenever it exits, waiting in
+    between as per an exponential backoff. After each restart, the callbacks added
+    with on_ready() are called, for clients to connect again.
+
+    `restarts`, `uptime` and `last_recovery`, the time it took from the
+    broker exiting to it being ready again, tell how the broker fares.
+
+    Given `tls` credentials, the broker requires TLS and client
+    certificates. The embedded broker then keeps honoring the session
+    tickets it issued before restarting.
+    """
+
+    def __init__(
+        self,
+        port: int,
+        nursery: trio.Nursery,
+        embedded: bool = False,
+        initial_backoff: float = INITIAL_BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+        log_dir: Optional[Path] = None,
+        tls: Optional[BrokerCredentials] = None,
+    ) -> None:
+        self.port = port
+        self.log_file = broker_log_file(log_dir, str(port)) if log_dir else None
+        self.tls = tls
+        self.ssl_context = client_ssl_context(tls) if tls else None
+        self.embedded = embedded
+        self._nursery = nursery
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.restarts = 0
+        self.last_recovery: Optional[float] = None
+        self._ready_since: Optional[float] = None
+        self._ready = trio.Event()
+        self._restarted = trio.Event()
+        self._callbacks: list[Callable[[], Awaitable[None]]] = []
+        self._scope = trio.CancelScope()
+        self.process: Optional[trio.Process] = None
+        self.embedded_broker: Optional[EmbeddedBroker] = None
+
+    @property
+    def running(self) -> bool:
+        return self._ready_since is not None
+
+    @property
+    def uptime(self) -> float:
+        """
+        Seconds since the broker last became ready, or 0 while it is down
+        """
+        if self._ready_since is None:
+            return 0.0
+        return trio.current_time() - self._ready_since
+
+    def on_ready(self, callback: Callable[[], Awaitable[None]]) -> None:
+        self._callbacks.append(callback)
+
+    async def wait_ready(self) -> None:
+        """
+        Returns once the broker is ready and the callbacks were called.
+        """
+        await self._ready.wait()
+
+    async def wait_restart(self, restarts: int) -> None:
+        """
+        Returns once the broker was restarted more than `restarts` times,
+        and the callbacks were called.
+        """
+        while self.restarts <= restarts:
+            await self._restarted.wait()
+
+    def stop(self) -> None:
+        self._ready_since = None
+        self._scope.cancel()
+
+    async def run(self, *, task_status: Any = TASK_STATUS_IGNORED) -> None:
+        """
+        Supervises the broker until stop() is called. Raises BrokerException
+        if it does not start the first time, and otherwise keeps trying.
+        """
+        with self._scope, TemporaryDirectory() as tmp_dir:
+            config_file = Path(tmp_dir) / "broker.toml"
+            populate_broker_conf(self.port, config_file, self.tls)
+            backoff = self.initial_backoff
+            exited_at: Optional[float] = None
+            try:
+                while True:
+                    try:
+                        exited = await self._start(config_file)
+                    except BrokerException as e:
+                        if exited_at is None:
+                            raise
+                        logger.error(f"Failed to restart MQTT broker: {e}")
+                        exited = trio.Event()
+                        exited.set()
+                    else:
+                        await self._set_ready(exited_at)
+                        task_status.started(self)
+                        task_status = TASK_STATUS_IGNORED
+                        await exited.wait()
+
+                    if self.uptime >= STABLE_UPTIME:
+                        backoff = self.initial_backoff
+                    self._ready_since = None
+                    self._ready = trio.Event()
+                    exited_at = trio.current_time()
+                    logger.warning(
+                        f"MQTT broker on port {self.port} exited. "
+                        f"Restarting it in {backoff:.2f} s"
+                    )
+                    await trio.sleep(backoff)
+                    backoff = min(2 * backoff, self.max_backoff)
+            finally:
+                self._ready_since = None
+                if self.process:
+                    self.process.kill()
+                if self.embedded_broker:
+                    self.embedded_broker.close()
 
+    async def _start(self, config_file: Path) -> trio.Event:
+        """
+        Starts the broker and waits for it to be ready,
+        returning an event that is set once it exits.
+        """
+        exited = trio.Event()
+        location = f"On port {self.port}"
+        if self.embedded:
+            try:
+                await self._nursery.start(self._run_embedded, exited)
+            except OSError as e:
+                raise BrokerException(
+                    f"Error: {e.strerror} ({location}).\n"
+                    "Please check and restart Local Console."
+                )
+        else:
+            proc = await start_mosquitto(
+                config_file,
+                self._nursery,
+                location,
+                self.port,
+                self.log_file,
+                self.ssl_context,
+            )
+            self.process = proc
+
+            async def watch() -> None:
+                await proc.wait()
+                exited.set()
+
+            self._nursery.start_soon(watch)
+        return exited
+
+    async def _run_embedded(
+        self, exited: trio.Event, *, task_status: Any = TASK_STATUS_IGNORED
+    ) -> None:
+        ssl_context = server_ssl_context(self.tls) if self.tls else None
+        self.embedded_broker = EmbeddedBroker(self.port, ssl_context=ssl_context)
+        try:
+            await self.embedded_broker.run(task_status=task_status)
+        finally:
+            exited.set()
+
+    async def _set_ready(self, exited_at: Optional[float]) -> None:
+        self._ready_since = trio.current_time()
+        if exited_at is not None:
+            self.last_recovery = self._ready_since - exited_at
+            logger.info(
+                f"MQTT broker on port {self.port} restarted "
+                f"in {self.last_recovery * 1000:.0f} ms"
+            )
+            for callback in self._callbacks:
+                try:
+                    await callback()
+                except (OSError, MQTTConnectionError) as e:
+                    logger.error(f"Failed to reconnect to MQTT broker: {e}")
+            self.restarts += 1
+            self._restarted.set()
+            self._restarted = trio.Event()
+        self._ready.set()
+
+
+async def start_mosquitto(
+    config_file: Path,
+    nursery: trio.Nursery,
+    location: str,
+    port: int,
+    log_file: Optional[Path] = None,
+    ssl_context: Optional[ssl.SSLContext] = None,
+) -> trio.Process:
+    """
+    Starts mosquitto with the given configuration file, returning once
+    it reports to be running and accepts MQTT connections on `port`, over
+    TLS if `ssl_context` is given. Another broker already holding the port
+    does not count. Its output is logged by a task in `nursery`, and
+    written to `log_file` if given. `location` tells which broker failed,
+    in the raised BrokerException, which reports the first error that it
+    printed, or that it exited.
+    """
     broker_bin = which("mosquitto")
     if not broker_bin:
         raise ValueError(
             "Could not find mosquitto in the PATH. Please add it and try again"
         )
 
-    with TemporaryDirectory() as tmp_dir:
-        config_file = Path(tmp_dir) / "broker.toml"
-        populate_broker_conf(port, config_file)
-
-        cmd = [broker_bin, "-v", "-c", str(config_file)]
-        invocation = partial(
-            run_process,
-            command=cmd,
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        )
-        broker_proc = await nursery.start(invocation)
-        # This is to check the broker start up.
-        # A (minor) enhancement would be to poll the broker.
-        pattern = re.compile(r"mosquitto version (\d+\.\d+\.\d+) running")
-        while True:
-            data = await broker_proc.stdout.receive_some()
-            if data:
-                data = data.decode("utf-8")
-                for line in data.splitlines():
-                    logger.debug(line)
-
-                if "error" in data.lower():
-                    line = next(
-                        line for line in data.splitlines() if "error" in line.lower()
-                    )
-                    raise BrokerException(
-                        f"{line} (On port {port}).\nPlease check and restart Local Console."
-                    )
-                elif pattern.search(data):
-                    break
+    cmd = [broker_bin, "-v", "-c", str(config_file)]
+    invocation = partial(
+        run_process,
+        command=cmd,
+        check=False,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    broker_proc: trio.Process = await nursery.start(invocation)
+    stdout = broker_proc.stdout
+    assert stdout is not None
+    ingester = BrokerLogIngester(
+        location, RotatingLogFile(log_file) if log_file else None
+    )
+    error: Optional[str] = None
+    running = trio.Event()
+
+    async def scan_output(cancel_scope: trio.CancelScope) -> None:
+        nonlocal error
+        while chunk := await stdout.receive_some():
+            ingester.feed(chunk)
+            for line in chunk.decode("utf-8").splitlines():
+                if "error" in line.lower():
+                    error = line
+                    cancel_scope.cancel()
+                    return
+                if RUNNING_BANNER.search(line):
+                    running.set()
+        error = "Error: mosquitto exited"
+        cancel_scope.cancel()
 
-        nursery.start_soon(get_broker_logs, broker_proc.stdout)
-        yield broker_proc
+    with trio.move_on_after(READY_TIMEOUT) as timeout_scope:
+        async with trio.open_nursery() as startup:
+            startup.start_soon(scan_output, startup.cancel_scope)
+            # Until mosquitto is running, whatever answers is not it
+            await running.wait()
+            await wait_until_ready(port, ssl_context=ssl_context)
+            startup.cancel_scope.cancel()
+    if timeout_scope.cancelled_caught:
+        error = f"Error: not accepting connections after {READY_TIMEOUT:.0f} s"
+    if not error and broker_proc.returncode is not None:
+        error = "Error: mosquitto exited"
+    if error:
         broker_proc.kill()
+        if ingester.raw_log:
+            ingester.raw_log.close()
+        raise BrokerException(
+            f"{error} ({location}).\nPlease check and restart Local Console."
+        )
+
+    nursery.start_soon(ingester.run, stdout)
+    return broker_proc
+
+
+def broker_log_file(log_dir: Path, name: str) -> Path:
+    return log_dir / f"mosquitto-{name}.log"
 
 
-def populate_broker_conf(port: int, config_file: Path) -> None:
+def populate_shared_broker_conf(
+    console_port: int, mounts: dict[int, str], config_file: Path
+) -> None:
+    """
+    Configures a broker serving several devices: each one connects to its
+    own listener, where its topics are mounted under a distinct prefix,
+    and Local Console connects to a local listener where all are visible.
+    """
+    logger.info(f"Shared MQTT broker for {len(mounts)} devices")
+    template = Template((broker_assets / "config.shared.toml.tpl").read_text())
+    listener = Template((broker_assets / "listener.mounted.toml.tpl").read_text())
+    rendered = template.substitute({"console_port": str(console_port)})
+    for port, mount_point in sorted(mounts.items()):
+        rendered += listener.substitute(
+            {"mqtt_port": str(port), "mount_point": mount_point}
+        )
+    config_file.write_text(rendered)
+
+
+def populate_broker_conf(
+    port: int, config_file: Path, tls: Optional[BrokerCredentials] = None
+) -> None:
     data = {"mqtt_port": str(port)}
     variant = "no-tls"
+    if tls:
+        variant = "tls"
+        data.update(
+            {
+                "ca_crt": str(tls.ca_certificate),
+                "server_crt": str(tls.server_certificate),
+                "server_key": str(tls.server_key),
+            }
+        )
     logger.info(f"MQTT broker in {variant} mode")
     template_file = broker_assets / f"config.{variant}.toml.tpl"
     template = Template(template_file.read_text())
     rendered = template.substitute(data)
     config_file.write_text(rendered)
-
-
-async def get_broker_logs(proc_stdout: trio.abc.ReceiveStream) -> None:
-    async for chunk in proc_stdout:
-        for line in chunk.decode().splitlines():
-            logger.debug(line)
@@ -0,0 +1,227 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Ingestion of the output of a `mosquitto -v` broker.
+
+Lines are only decoded while DEBUG messages are logged. They are then
+parsed into events for client connections, disconnections and
+subscriptions, while the lines about each published message, which
+dominate the output, are rate-limited. The raw output can also be
+written to a file, which is rotated once it reaches a given size.
+"""
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+from typing import Optional
+
+import trio
+from local_console.utils.enums import StrEnum
+
+logger = logging.getLogger(__name__)
+
+# Lines about published messages and keepalives logged per second,
+# beyond which only one out of PUBLISH_LOG_SAMPLE is.
+PUBLISH_LOG_RATE = 20
+PUBLISH_LOG_SAMPLE = 100
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+CONNECT_LINE = re.compile(r"New client connected from (\S+) as (\S+) ")
+DISCONNECT_LINE = re.compile(
+    r"(?:Client (\S+) (?:disconnected|closed its connection|has exceeded timeout)"
+    r"|Socket error on client (\S+), disconnecting)"
+)
+SUBSCRIBE_LINE = re.compile(r"Received SUBSCRIBE from (\S+)$")
+SUBSCRIPTION_LINE = re.compile(r"\t(.+) \(QoS (\d)\)$")
+REPETITIVE_LINES = (
+    "Received PUB",
+    "Sending PUB",
+    "Received PING",
+    "Sending PING",
+)
+
+
+class BrokerEventKind(StrEnum):
+    CONNECT = "connect"
+    DISCONNECT = "disconnect"
+    SUBSCRIBE = "subscribe"
+
+
+@dataclass(frozen=True)
+class BrokerEvent:
+    kind: BrokerEventKind
+    client_id: str
+    # Peer address of a connection, or topic filter of a subscription
+    detail: str = ""
+
+
+class RotatingLogFile:
+    """
+    Appends data to `path`, which is moved to `path`.1 once it would
+    exceed `max_bytes`, shifting the previous backups up to `backups`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int = LOG_FILE_MAX_BYTES,
+        backups: int = LOG_FILE_BACKUPS,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file: BinaryIO = path.open("ab")
+        self._size = self._file.tell()
+
+    def write(self, data: bytes) -> None:
+        if self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            backup = self.path.with_name(f"{self.path.name}.{index}")
+            if backup.exists():
+                backup.replace(self.path.with_name(f"{self.path.name}.{index + 1}"))
+        if self.backups:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._file = self.path.open("ab")
+        self._size = 0
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class BrokerLogIngester:
+    """
+    Handles the output of the broker at `location`, as it is fed with
+    feed(). `events` counts the events parsed so far, and `clients`
+    holds the identifiers of the clients connected meanwhile, both only
+    being tracked while DEBUG messages are logged.
+    """
+
+    def __init__(
+        self,
+        location: str,
+        raw_log: Optional[RotatingLogFile] = None,
+        publish_rate: int = PUBLISH_LOG_RATE,
+        publish_sample: int = PUBLISH_LOG_SAMPLE,
+    ) -> None:
+        self.location = location
+        self.raw_log = raw_log
+        self.publish_rate = publish_rate
+        self.publish_sample = publish_sample
+        self.events: Counter[BrokerEventKind] = Counter()
+        self.clients: set[str] = set()
+        self.suppressed = 0
+        self._partial = b""
+        self._subscriber: Optional[str] = None
+        self._window_start = 0.0
+        self._window_lines = 0
+        self._window_suppressed = 0
+
+    async def run(self, stdout: trio.abc.ReceiveStream) -> None:
+        try:
+            async for chunk in stdout:
+                self.feed(chunk)
+        finally:
+            self._flush_window()
+            if self.raw_log:
+                self.raw_log.close()
+
+    def feed(self, chunk: bytes) -> None:
+        if self.raw_log:
+            self.raw_log.write(chunk)
+        if not logger.isEnabledFor(logging.DEBUG):
+            self._partial = b""
+            return
+
+        *lines, self._partial = (self._partial + chunk).split(b"\n")
+        for line in lines:
+            self.handle_line(line.decode("utf-8", errors="replace").rstrip("\r"))
+
+    def handle_line(self, line: str) -> None:
+        if line.startswith(REPETITIVE_LINES):
+            self._log_repetitive(line)
+            return
+
+        event = self.parse(line)
+        if event is None:
+            logger.debug(line)
+            return
+
+        self.events[event.kind] += 1
+        if event.kind == BrokerEventKind.CONNECT:
+            self.clients.add(event.client_id)
+            message = f"Client {event.client_id} connected from {event.detail}"
+        elif event.kind == BrokerEventKind.DISCONNECT:
+            self.clients.discard(event.client_id)
+            message = f"Client {event.client_id} disconnected"
+        else:
+            message = f"Client {event.client_id} subscribed to {event.detail}"
+        logger.debug(f"{message} ({self.location})", extra={"broker_event": event})
+
+    def parse(self, line: str) -> Optional[BrokerEvent]:
+        if match := SUBSCRIPTION_LINE.match(line):
+            if self._subscriber:
+                return BrokerEvent(
+                    BrokerEventKind.SUBSCRIBE, self._subscriber, match[1]
+                )
+            return None
+
+        self._subscriber = None
+        if match := CONNECT_LINE.match(line):
+            return BrokerEvent(BrokerEventKind.CONNECT, match[2], match[1])
+        if match := DISCONNECT_LINE.match(line):
+            return BrokerEvent(BrokerEventKind.DISCONNECT, match[1] or match[2])
+        if match := SUBSCRIBE_LINE.match(line):
+            self._subscriber = match[1]
+        return None
+
+    def _log_repetitive(self, line: str) -> None:
+        now = trio.current_time()
+        if now - self._window_start >= 1.0:
+            self._flush_window()
+            self._window_start = now
+        self._window_lines += 1
+        if self._window_lines <= self.publish_rate:
+            logger.debug(line)
+            return
+
+        self.suppressed += 1
+        self._window_suppressed += 1
+        if self._window_suppressed % self.publish_sample == 0:
+            logger.debug(f"{line} (sampled)")
+
+    def _flush_window(self) -> None:
+        if self._window_suppressed:
+            logger.debug(
+                f"Skipped {self._window_suppressed} lines about published "
+                f"messages ({self.location})"
+            )
+        self._window_lines = 0
+        self._window_suppressed = 0
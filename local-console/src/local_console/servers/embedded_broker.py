@@ -0,0 +1,370 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+import ssl
+from dataclasses import replace
+from typing import Any
+from typing import Optional
+
+import trio
+from local_console.clients.mqtt_codec import Connect
+from local_console.clients.mqtt_codec import decode_ack
+from local_console.clients.mqtt_codec import decode_connect
+from local_console.clients.mqtt_codec import decode_publish
+from local_console.clients.mqtt_codec import decode_subscribe
+from local_console.clients.mqtt_codec import decode_unsubscribe
+from local_console.clients.mqtt_codec import encode_ack
+from local_console.clients.mqtt_codec import encode_connack
+from local_console.clients.mqtt_codec import encode_publish
+from local_console.clients.mqtt_codec import encode_suback
+from local_console.clients.mqtt_codec import encode_unsuback
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_codec import MQTTProtocolError
+from local_console.clients.mqtt_codec import Packet
+from local_console.clients.mqtt_codec import PacketReader
+from local_console.clients.mqtt_codec import PacketType
+from local_console.clients.mqtt_codec import PINGRESP
+from local_console.clients.mqtt_queues import topic_matches
+from trio import TASK_STATUS_IGNORED
+
+logger = logging.getLogger(__name__)
+
+RECEIVE_SIZE = 64 * 1024
+# Highest QoS at which messages are delivered
+MAX_QOS = 1
+# Time given to clients to send their CONNECT after opening the connection
+CONNECT_TIMEOUT = 10.0
+# Deliveries queued per client. Publishers to a client lagging further
+# behind wait for it, which bounds memory like the socket buffers would.
+MAX_QUEUED = 1000
+# Return code of SUBACK for refused subscriptions
+SUBSCRIPTION_FAILURE = 0x80
+
+_CONNECTION_ERRORS = (
+    MQTTProtocolError,
+    trio.BrokenResourceError,
+    trio.ClosedResourceError,
+    trio.TooSlowError,
+)
+
+
+def valid_topic_filter(topic_filter: str) -> bool:
+    """
+    Tells whether wildcards in `topic_filter` take whole levels,
+    and '#' is only used as the last one.
+    """
+    if not topic_filter:
+        return False
+    levels = topic_filter.split("/")
+    for i, level in enumerate(levels):
+        if level == "#" and i == len(levels) - 1 or level == "+":
+            continue
+        if "+" in level or "#" in level:
+            return False
+    return True
+
+
+def valid_topic(topic: str) -> bool:
+    return bool(topic) and "+" not in topic and "#" not in topic
+
+
+def filter_matches(topic_filter: str, topic: str) -> bool:
+    # As per the MQTT spec, wildcards at the first level
+    # do not match topics starting with '$'
+    if topic.startswith("$") and topic_filter[0] in "+#":
+        return False
+    return topic_matches(topic_filter, topic)
+
+
+class _Session:
+    """
+    A client connected to the broker. Deliveries are queued by the tasks
+    reading from the publishers' connections, and written out by a task
+    of its own, so that publishers do not wait on each subscriber's socket.
+    """
+
+    def __init__(self, connect: Connect, stream: trio.abc.Stream) -> None:
+        self.client_id = connect.client_id
+        self.version = connect.version
+        self.keepalive = connect.keepalive
+        self.will = connect.will
+        self.stream = stream
+        self.scope = trio.CancelScope()
+        self.subscriptions: dict[str, int] = {}
+        self._send_lock = trio.Lock()
+        self._next_id = 0
+        self.incoming_qos2: set[int] = set()
+        self._deliveries, self._queued = trio.open_memory_channel[Message](MAX_QUEUED)
+
+    async def send(self, data: bytes) -> None:
+        async with self._send_lock:
+            await self.stream.send_all(data)
+
+    async def deliver(self, message: Message) -> None:
+        try:
+            try:
+                self._deliveries.send_nowait(message)
+            except trio.WouldBlock:
+                logger.debug(f"Client {self.client_id} is lagging behind")
+                await self._deliveries.send(message)
+        except trio.ClosedResourceError:
+            # The client is gone
+            pass
+
+    def close(self) -> None:
+        self.scope.cancel()
+        self._deliveries.close()
+
+    async def write_loop(self) -> None:
+        try:
+            async for message in self._queued:
+                if message.qos:
+                    self._next_id = self._next_id % 0xFFFF + 1
+                    message.packet_id = self._next_id
+                await self.send(encode_publish(message, self.version))
+        except (trio.BrokenResourceError, trio.ClosedResourceError) as e:
+            logger.debug(f"Client {self.client_id} connection lost: {e}")
+            self.scope.cancel()
+
+    def __repr__(self) -> str:
+        return f"<Session {self.client_id}>"
+
+
+class EmbeddedBroker:
+    """
+    MQTT 3.1.1 and 5 broker running in-process on trio, implementing the
+    subset of MQTT that Local Console and its devices use, to stand in for
+    mosquitto in tests, benchmarks and single-device setups:
+
+    - Publications at QoS 0 and 1. Those at QoS 2 are accepted, and
+      delivered at QoS 1 at most, like subscriptions are granted.
+    - Retained messages, sent to new subscriptions to matching filters.
+    - The '+' and '#' wildcards in subscriptions.
+    - Will messages, and keepalive timeouts.
+
+    Sessions are always clean: subscriptions and pending deliveries end with
+    the connection, and a new connection with the same client id takes
+    over the existing one. As with the mosquitto configuration used by
+    Local Console, connections are anonymous, unless an `ssl_context` is
+    given, with which clients connect over TLS.
+    """
+
+    def __init__(
+        self,
+        port: int = 1883,
+        host: Optional[str] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ) -> None:
+        self.port = port
+        self.host = host
+        self.ssl_context = ssl_context
+        self.retained: dict[str, Message] = {}
+        self._sessions: dict[str, _Session] = {}
+        # Subscribed sessions and their granted QoS, by topic filter
+        self._subscriptions: dict[str, dict[_Session, int]] = {}
+        self._scope = trio.CancelScope()
+
+    @property
+    def clients(self) -> list[str]:
+        return list(self._sessions)
+
+    async def run(self, *, task_status: Any = TASK_STATUS_IGNORED) -> None:
+        """
+        Serves clients until close() is called. Once listening, the actual
+        port, which the system picks if `port` is 0, is passed to the caller
+        of nursery.start(). Raises OSError if the port is not free.
+        """
+        with self._scope:
+            tcp_listeners = await trio.open_tcp_listeners(self.port, host=self.host)
+            self.port = tcp_listeners[0].socket.getsockname()[1]
+            listeners: list[trio.abc.Listener[trio.abc.Stream]] = list(tcp_listeners)
+            if self.ssl_context:
+                listeners = [
+                    trio.SSLListener(listener, self.ssl_context)
+                    for listener in tcp_listeners
+                ]
+            mode = "TLS" if self.ssl_context else "no-tls"
+            logger.info(
+                f"Embedded MQTT broker listening on port {self.port}, in {mode} mode"
+            )
+            async with trio.open_nursery() as nursery:
+                task_status.started(self.port)
+                await trio.serve_listeners(
+                    self._serve, listeners, handler_nursery=nursery
+                )
+
+    def close(self) -> None:
+        self._scope.cancel()
+
+    async def _serve(self, stream: trio.abc.Stream) -> None:
+        reader = PacketReader()
+        packets: list[Packet] = []
+        try:
+            with trio.fail_after(CONNECT_TIMEOUT):
+                while not packets:
+                    packets = await self._receive(stream, reader)
+            connect = decode_connect(packets.pop(0))
+        except _CONNECTION_ERRORS as e:
+            logger.debug(f"Rejected MQTT connection: {e}")
+            await stream.aclose()
+            return
+
+        session = _Session(connect, stream)
+        former = self._sessions.get(session.client_id)
+        if former:
+            logger.debug(f"Client {session.client_id} took over its former session")
+            self._end(former)
+        self._sessions[session.client_id] = session
+        graceful = False
+        try:
+            with session.scope:
+                async with trio.open_nursery() as nursery:
+                    nursery.start_soon(session.write_loop)
+                    graceful = await self._read_loop(session, reader, packets)
+                    nursery.cancel_scope.cancel()
+        finally:
+            self._end(session)
+            with trio.CancelScope(shield=True):
+                await stream.aclose()
+        if not graceful and session.will:
+            await self._publish(session.will)
+
+    def _end(self, session: _Session) -> None:
+        session.close()
+        if self._sessions.get(session.client_id) is session:
+            del self._sessions[session.client_id]
+        for topic_filter in session.subscriptions:
+            self._unsubscribe(session, topic_filter)
+        session.subscriptions.clear()
+
+    @staticmethod
+    async def _receive(stream: trio.abc.Stream, reader: PacketReader) -> list[Packet]:
+        data = await stream.receive_some(RECEIVE_SIZE)
+        if not data:
+            raise trio.BrokenResourceError("Connection closed by the client")
+        return reader.feed(data)
+
+    async def _read_loop(
+        self, session: _Session, reader: PacketReader, packets: list[Packet]
+    ) -> bool:
+        """
+        Accepts the connection and handles the packets of the client until
+        it disconnects, which returns True, or its connection fails.
+        """
+        # Clients must send something within one and a half keepalive periods
+        timeout = 1.5 * session.keepalive if session.keepalive else float("inf")
+        try:
+            await session.send(encode_connack(False, 0, session.version))
+            logger.debug(f"Client {session.client_id} connected")
+            while True:
+                for packet in packets:
+                    if packet.type == PacketType.DISCONNECT:
+                        logger.debug(f"Client {session.client_id} disconnected")
+                        return True
+                    await self._handle(session, packet)
+                with trio.fail_after(timeout):
+                    packets = await self._receive(session.stream, reader)
+        except _CONNECTION_ERRORS as e:
+            logger.debug(f"Client {session.client_id} connection lost: {e}")
+            return False
+
+    async def _handle(self, session: _Session, packet: Packet) -> None:
+        ptype = packet.type
+        if ptype == PacketType.PUBLISH:
+            message = decode_publish(packet, session.version)
+            if not valid_topic(message.topic):
+                raise MQTTProtocolError(f"Invalid topic: {message.topic}")
+            if message.qos == 2:
+                # Delivered on reception, and not again if redelivered
+                if message.packet_id not in session.incoming_qos2:
+                    session.incoming_qos2.add(message.packet_id)
+                    await self._publish(message)
+                await session.send(encode_ack(PacketType.PUBREC, message.packet_id))
+            else:
+                await self._publish(message)
+                if message.qos == 1:
+                    await session.send(encode_ack(PacketType.PUBACK, message.packet_id))
+        elif ptype == PacketType.PUBREL:
+            packet_id, _ = decode_ack(packet)
+            session.incoming_qos2.discard(packet_id)
+            await session.send(encode_ack(PacketType.PUBCOMP, packet_id))
+        elif ptype == PacketType.PUBACK:
+            # Deliveries are not retransmitted, as sessions end with connections
+            pass
+        elif ptype == PacketType.SUBSCRIBE:
+            packet_id, topics = decode_subscribe(packet, session.version)
+            codes = [self._subscribe(session, f, qos) for f, qos in topics]
+            await session.send(encode_suback(packet_id, codes, session.version))
+            for (topic_filter, _), code in zip(topics, codes):
+                if code != SUBSCRIPTION_FAILURE:
+                    await self._send_retained(session, topic_filter, code)
+        elif ptype == PacketType.UNSUBSCRIBE:
+            packet_id, topic_filters = decode_unsubscribe(packet, session.version)
+            for topic_filter in topic_filters:
+                if session.subscriptions.pop(topic_filter, None) is not None:
+                    self._unsubscribe(session, topic_filter)
+            await session.send(
+                encode_unsuback(packet_id, len(topic_filters), session.version)
+            )
+        elif ptype == PacketType.PINGREQ:
+            await session.send(PINGRESP)
+        else:
+            raise MQTTProtocolError(f"Unexpected {ptype.name} packet")
+
+    def _subscribe(self, session: _Session, topic_filter: str, qos: int) -> int:
+        if not valid_topic_filter(topic_filter):
+            logger.warning(f"Refused subscription to invalid filter {topic_filter}")
+            return SUBSCRIPTION_FAILURE
+        granted = min(qos, MAX_QOS)
+        session.subscriptions[topic_filter] = granted
+        self._subscriptions.setdefault(topic_filter, {})[session] = granted
+        return granted
+
+    def _unsubscribe(self, session: _Session, topic_filter: str) -> None:
+        subscribers = self._subscriptions.get(topic_filter, {})
+        subscribers.pop(session, None)
+        if not subscribers:
+            self._subscriptions.pop(topic_filter, None)
+
+    async def _send_retained(
+        self, session: _Session, topic_filter: str, qos: int
+    ) -> None:
+        for topic, message in list(self.retained.items()):
+            if filter_matches(topic_filter, topic):
+                await session.deliver(replace(message, qos=min(message.qos, qos)))
+
+    async def _publish(self, message: Message) -> None:
+        """
+        Delivers the message once to every client with a matching
+        subscription, at the highest QoS that they were granted.
+        """
+        if message.retain:
+            if message.payload:
+                self.retained[message.topic] = replace(
+                    message, qos=min(message.qos, MAX_QOS), dup=False, packet_id=0
+                )
+            else:
+                self.retained.pop(message.topic, None)
+
+        recipients: dict[_Session, int] = {}
+        for topic_filter, subscribers in self._subscriptions.items():
+            if filter_matches(topic_filter, message.topic):
+                for session, qos in subscribers.items():
+                    recipients[session] = max(qos, recipients.get(session, 0))
+        for session, qos in recipients.items():
+            await session.deliver(
+                Message(message.topic, message.payload, min(message.qos, qos))
+            )
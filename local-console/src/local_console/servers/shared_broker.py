@@ -0,0 +1,279 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+from collections.abc import AsyncIterator
+from collections.abc import Iterable
+from contextlib import asynccontextmanager
+from dataclasses import replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+from typing import Optional
+
+import trio
+from local_console.clients.agent import Agent
+from local_console.clients.agent import RECEIVE_QUEUES
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_queues import MessageQueues
+from local_console.clients.mqtt_queues import QueueSpec
+from local_console.clients.trio_mqtt import MQTTClient
+from local_console.core.schemas.schemas import OnWireProtocol
+from local_console.servers.broker import broker_log_file
+from local_console.servers.broker import BrokerException
+from local_console.servers.broker import INITIAL_BACKOFF
+from local_console.servers.broker import MAX_BACKOFF
+from local_console.servers.broker import populate_shared_broker_conf
+from local_console.servers.broker import STABLE_UPTIME
+from local_console.servers.broker import start_mosquitto
+from trio import TASK_STATUS_IGNORED
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONSOLE_PORT = 1882
+MOUNT_ROOT = "devices"
+# Pending messages for all devices, and for each of them
+ROUTING_BUFFER = 1000
+DEVICE_BUFFER = 100
+# Time to gather further device changes before restarting the broker
+RECONFIGURE_DELAY = 0.5
+
+
+def mount_point(port: int) -> str:
+    """
+    Prefix of the topics of the device connecting on `port`
+    """
+    return f"{MOUNT_ROOT}/{port}/"
+
+
+def mounted_queues(specs: list[QueueSpec], capacity: int) -> list[QueueSpec]:
+    """
+    Queues of the given specs, for the topics of any device mounted
+    on the shared connection, each holding up to `capacity` messages.
+    """
+    return [
+        replace(
+            spec, topic_filter=f"{MOUNT_ROOT}/+/{spec.topic_filter}", capacity=capacity
+        )
+        for spec in specs
+    ]
+
+
+class SharedBroker:
+    """
+    A single mosquitto process serving several devices, instead of one
+    per device. Each device keeps connecting to its own port, where a
+    listener mounts its topics under mount_point(port), so that devices
+    cannot see each other's messages. Local Console connects once, to a
+    local listener on `console_port`, and routes the received messages
+    to the attached devices by their mount point, into the priority
+    queues of each device's agent.
+
+    mosquitto does not add listeners on reload, so adding or removing a
+    device restarts the broker, after RECONFIGURE_DELAY to batch changes.
+    So does the broker exiting, backing off as the BrokerSupervisor does.
+    Devices and attached agents then reconnect and resubscribe.
+
+    Client identifiers are global to the broker: devices sharing it must
+    not use the same one.
+    """
+
+    def __init__(
+        self,
+        console_port: int = DEFAULT_CONSOLE_PORT,
+        ports: Iterable[int] = (),
+        verbose: bool = False,
+        log_dir: Optional[Path] = None,
+    ) -> None:
+        self.console_port = console_port
+        self.verbose = verbose
+        self.log_file = broker_log_file(log_dir, "shared") if log_dir else None
+        self._ports = set(ports)
+        # Ports with a listener in the running broker
+        self._serving: set[int] = set()
+        self._changed = trio.Event()
+        self._serving_changed = trio.Event()
+        self._agents: dict[int, Agent] = {}
+        self._queues: dict[int, MessageQueues] = {}
+        self._client: Optional[MQTTClient] = None
+
+    @property
+    def ports(self) -> set[int]:
+        return set(self._ports)
+
+    def add_device(self, port: int) -> None:
+        if port == self.console_port:
+            raise BrokerException(
+                f"Port {port} is used by Local Console on the shared broker"
+            )
+        if port not in self._ports:
+            self._ports.add(port)
+            self._changed.set()
+
+    def remove_device(self, port: int) -> None:
+        if port in self._ports:
+            self._ports.discard(port)
+            self._changed.set()
+
+    async def run(self, *, task_status: Any = TASK_STATUS_IGNORED) -> None:
+        """
+        Runs the broker and Local Console's connection to it, restarting
+        them when devices are added or removed, or when the broker exits.
+        Reports it started once the broker first accepted the connection,
+        raising if it did not. Later, if the broker fails to start with
+        the changed devices, it keeps serving the previous ones.
+        """
+        async with trio.open_nursery() as nursery:
+            client = MQTTClient(
+                "local-console-shared",
+                nursery,
+                queues=mounted_queues(RECEIVE_QUEUES, ROUTING_BUFFER),
+                max_buffer=ROUTING_BUFFER,
+            )
+            self._client = client
+            # Last ports the broker started with, to fall back to
+            served: Optional[list[int]] = None
+            fall_back = False
+            backoff = INITIAL_BACKOFF
+            while True:
+                changed = self._changed = trio.Event()
+                ports = served if fall_back and served else sorted(self._ports)
+                failed = False
+                exited = trio.Event()
+                with TemporaryDirectory() as tmp_dir:
+                    config_file = Path(tmp_dir) / "broker.toml"
+                    mounts = {port: mount_point(port) for port in ports}
+                    populate_shared_broker_conf(self.console_port, mounts, config_file)
+                    try:
+                        proc = await start_mosquitto(
+                            config_file,
+                            nursery,
+                            f"Shared, on ports {ports}",
+                            self.console_port,
+                            self.log_file,
+                        )
+                    except BrokerException as e:
+                        if served is None:
+                            raise
+                        logger.error(f"Failed to restart the shared MQTT broker: {e}")
+                        failed = True
+                    else:
+                        nursery.start_soon(self._watch, proc, exited, changed)
+                        try:
+                            await client.connect("localhost", self.console_port)
+                            for agent in self._agents.values():
+                                await agent.resubscribe()
+                            nursery.start_soon(self._route, client)
+                            self._set_serving(ports)
+                            served = ports
+                            started_at = trio.current_time()
+                            task_status.started()
+                            task_status = TASK_STATUS_IGNORED
+
+                            await changed.wait()
+                            if exited.is_set():
+                                if trio.current_time() - started_at >= STABLE_UPTIME:
+                                    backoff = INITIAL_BACKOFF
+                                logger.warning("The shared MQTT broker exited")
+                                failed = True
+                            else:
+                                await trio.sleep(RECONFIGURE_DELAY)
+                        except OSError as e:
+                            if served is None:
+                                raise
+                            logger.error(
+                                f"Failed to connect to the shared MQTT broker: {e}"
+                            )
+                            failed = True
+                        finally:
+                            with trio.move_on_after(1) as cleanup_scope:
+                                cleanup_scope.shield = True
+                                if client.connected:
+                                    await client.disconnect()
+                            proc.kill()
+
+                # Devices that the broker failed to start with are left out,
+                # until they change again. Restarts of the same devices back off.
+                fall_back = failed and ports != served
+                if fall_back:
+                    logger.info(f"Restarting the shared MQTT broker on ports {served}")
+                elif failed:
+                    logger.info(f"Restarting the shared MQTT broker in {backoff:.2f} s")
+                    await trio.sleep(backoff)
+                    backoff = min(2 * backoff, MAX_BACKOFF)
+                else:
+                    logger.info("Restarting the shared MQTT broker, as devices changed")
+
+    @staticmethod
+    async def _watch(
+        proc: trio.Process, exited: trio.Event, changed: trio.Event
+    ) -> None:
+        await proc.wait()
+        exited.set()
+        changed.set()
+
+    def _set_serving(self, ports: list[int]) -> None:
+        self._serving = set(ports)
+        self._serving_changed.set()
+        self._serving_changed = trio.Event()
+        logger.info(f"Shared MQTT broker serving ports {ports}")
+
+    async def _route(self, client: MQTTClient) -> None:
+        async with client.messages() as mgen:
+            async for message in mgen:
+                self.route(message)
+
+    def route(self, message: Message) -> None:
+        """
+        Hands a message to the device under whose mount point it was
+        published, without the mount point, so that it lands in the
+        queue the device's agent has for its topic.
+        """
+        root, _, rest = message.topic.partition("/")
+        port, _, topic = rest.partition("/")
+        queues = self._queues.get(int(port)) if port.isdigit() else None
+        if root != MOUNT_ROOT or queues is None:
+            logger.debug(f"Discarding message on {message.topic}, for no device")
+            return
+        queues.put(Message(topic, message.payload, message.qos, message.retain))
+
+    @asynccontextmanager
+    async def attach(
+        self, host: str, port: int, onwire_schema: OnWireProtocol
+    ) -> AsyncIterator[tuple[Agent, MessageQueues]]:
+        """
+        Provides the agent of the device that connects to the broker
+        on `port`, and the queues where its messages are routed, once
+        the broker listens on that port. As with a connection of its
+        own, the queues are those of the agent's `receive_queues`.
+        """
+        if port in self._agents:
+            raise BrokerException(f"Device on port {port} is already attached")
+        self.add_device(port)
+        while port not in self._serving:
+            await self._serving_changed.wait()
+        assert self._client
+
+        agent = Agent(host, port, onwire_schema)
+        queues = MessageQueues(agent.receive_queues, DEVICE_BUFFER)
+        self._agents[port] = agent
+        self._queues[port] = queues
+        try:
+            async with agent.shared_scope(self._client, mount_point(port)):
+                yield agent, queues
+        finally:
+            del self._agents[port]
+            del self._queues[port]
+            queues.close()
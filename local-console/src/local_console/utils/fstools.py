@@ -17,6 +17,7 @@ import contextlib
 import enum
 import logging
 import os
+import threading
 from collections.abc import Iterator
 from dataclasses import dataclass
 from pathlib import Path
@@ -69,6 +70,7 @@ class StorageSizeWatcher:
         self.content: list[FileInfo] = []
         self.storage_usage = 0
         self._remaining_before_check = self.check_frequency
+        self._prune_listeners: list[Callable[[Path], None]] = []
 
     def set_path(self, path: Path) -> None:
         assert path.is_dir()
@@ -118,6 +120,24 @@ class StorageSizeWatcher:
                 f"Deferring update of size statistic for incoming file {path} during state {self.state}"
             )
 
+    def add_prune_listener(self, listener: Callable[[Path], None]) -> None:
+        """
+        Registers a callback to be called with the path of every file
+        removed for keeping the storage usage under the limit.
+        """
+        self._prune_listeners.append(listener)
+
+    def remove_prune_listener(self, listener: Callable[[Path], None]) -> None:
+        if listener in self._prune_listeners:
+            self._prune_listeners.remove(listener)
+
+    def remove_file(self, path: Path) -> None:
+        """
+        Removes a file from storage and from the bookkeeping.
+        """
+        self._unregister_file(path)
+        path.unlink(missing_ok=True)
+
     def update_file_size(self, path: Path) -> None:
         # TODO: Optimize. Assumption: updates on files are for the newest ones.
         curr = len(self.content)
@@ -190,6 +210,8 @@ class StorageSizeWatcher:
                 logger.warning(f"File {entry.path} was already removed")
             except KeyError:
                 break
+            for listener in list(self._prune_listeners):
+                listener(entry.path)
 
         # In order to make this class thread-safe,
         # the following would be required:
@@ -251,53 +273,109 @@ OnDeleteCallable = Callable[[Path], None]
 
 
 class DirectoryMonitor:
+    """
+    Watches directories for their deletion, notifying subscribers when
+    that happens. A single instance is meant to be shared among all
+    devices (see DeviceManager), so that there is a single observer
+    thread in the process regardless of the number of cameras. Watches
+    on the same resolved path are deduplicated into a single OS-level
+    watch, and deletion events are fanned out to every subscriber.
+
+    start() and stop() are reference counted, so that each user of a
+    shared instance can pair them without affecting the others.
+    """
 
     class EventHandler(FileSystemEventHandler):
-        def __init__(self, on_delete_cb: OnDeleteCallable) -> None:
+        def __init__(self, root: Path, on_delete_cb: OnDeleteCallable) -> None:
+            self._root = root
             self._on_delete_cb = on_delete_cb
 
         def on_deleted(self, event: DirDeletedEvent) -> None:
-            if event.is_directory:
-                self._on_delete_cb(event)
+            # Non-recursive watches still get events for direct children
+            if event.is_directory and Path(event.src_path) == self._root:
+                self._on_delete_cb(self._root)
 
     def __init__(self) -> None:
         self._obs = Observer()
+        self._lock = threading.Lock()
+        self._users = 0
         self._watches: dict[Path, ObservedWatch] = dict()
+        self._subscribers: dict[Path, list[OnDeleteCallable]] = dict()
+
+    @property
+    def num_watches(self) -> int:
+        return len(self._watches)
 
     def start(self) -> None:
-        self._obs.start()
+        with self._lock:
+            self._users += 1
+            if self._users > 1:
+                return
+            if self._obs.ident is not None:
+                # A stopped thread cannot be restarted
+                self._obs = Observer()
+                for path in self._watches:
+                    self._watches[path] = self._schedule(path)
+            self._obs.start()
 
     def watch(self, directory: Path, on_delete_cb: OnDeleteCallable) -> None:
         assert directory.is_dir()
         resolved = directory.resolve()
-        handler = self.EventHandler(self._watch_decorator(on_delete_cb))
-        watch = self._obs.schedule(
-            handler,
-            str(resolved),
-        )
-        self._watches[resolved] = watch
-
-    def _on_delete_action(self, path: Path) -> None:
-        resolved = path.resolve()
-        watch = self._watches.pop(resolved)
-        self._obs.unschedule(watch)
-
-    def _watch_decorator(self, on_delete_cb: OnDeleteCallable) -> Callable:
-
-        def complete_callback(event: DirDeletedEvent) -> None:
-            path = Path(event.src_path)
-            self._on_delete_action(path)
-            on_delete_cb(path)
-
-        return complete_callback
+        with self._lock:
+            self._subscribers.setdefault(resolved, []).append(on_delete_cb)
+            if resolved not in self._watches:
+                self._watches[resolved] = self._schedule(resolved)
+
+    def unwatch(
+        self, directory: Path, on_delete_cb: Optional[OnDeleteCallable] = None
+    ) -> None:
+        """
+        Removes the subscription of `on_delete_cb` to `directory`, or all
+        of its subscriptions if no callback is given. The OS-level watch
+        is only released once no subscribers are left.
+        """
+        resolved = directory.resolve()
+        with self._lock:
+            subscribers = self._subscribers.get(resolved, [])
+            if on_delete_cb is None:
+                subscribers.clear()
+            else:
+                with contextlib.suppress(ValueError):
+                    subscribers.remove(on_delete_cb)
 
-    def unwatch(self, directory: Path) -> None:
-        try:
-            self._on_delete_action(directory)
-        except KeyError:
-            pass
+            if not subscribers:
+                self._release(resolved)
 
     def stop(self) -> None:
-        self._obs.stop()
+        with self._lock:
+            if self._users == 0:
+                return
+            self._users -= 1
+            if self._users > 0:
+                return
+            # start() may replace the observer as soon as the lock is released
+            observer = self._obs
+        observer.stop()
         with contextlib.suppress(RuntimeError):
-            self._obs.join()
+            observer.join()
+
+    def _schedule(self, resolved: Path) -> ObservedWatch:
+        handler = self.EventHandler(resolved, self._on_deleted)
+        watch: ObservedWatch = self._obs.schedule(handler, str(resolved))
+        return watch
+
+    def _release(self, resolved: Path) -> None:
+        self._subscribers.pop(resolved, None)
+        watch = self._watches.pop(resolved, None)
+        if watch is not None:
+            with contextlib.suppress(KeyError):
+                self._obs.unschedule(watch)
+
+    def _on_deleted(self, path: Path) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(path, []).copy()
+            # A deleted location cannot be recycled by its watch
+            self._release(path)
+
+        for on_delete_cb in subscribers:
+            on_delete_cb(path)
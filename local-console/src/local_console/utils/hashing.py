@@ -0,0 +1,104 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+SHA-256 digests of the files to be deployed, such as modules, models
+and firmware packages. Files are read in chunks, and their digests
+are kept for as long as their size, modification time and inode stay
+the same, so that deploying an unchanged file again does not read it.
+"""
+import hashlib
+import threading
+from base64 import b64encode
+from collections import OrderedDict
+from io import BufferedReader
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+MAX_CACHED_DIGESTS = 256
+
+FileKey = tuple[str, int, int, int]
+
+
+def _sha256_of(file: BufferedReader) -> bytes:
+    # hashlib.file_digest is only available from Python 3.11
+    if hasattr(hashlib, "file_digest"):
+        file_digest: bytes = hashlib.file_digest(file, "sha256").digest()
+        return file_digest
+
+    digest = hashlib.sha256()
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    while size := file.readinto(buffer):
+        digest.update(view[:size])
+    return digest.digest()
+
+
+class FileHasher:
+    """
+    Computes the SHA-256 digest of files, memoizing the digests of the
+    last `max_entries` of them. `hits` and `misses` count the lookups
+    answered from memory and those that required reading the file.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_DIGESTS) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._digests: OrderedDict[FileKey, bytes] = OrderedDict()
+        # Digests are requested both from the GUI and from trio threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path: Path) -> FileKey:
+        stat = path.stat()
+        return (str(path.resolve()), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    def digest(self, path: Path) -> bytes:
+        key = self.key(path)
+        with self._lock:
+            if key in self._digests:
+                self.hits += 1
+                self._digests.move_to_end(key)
+                return self._digests[key]
+
+        with path.open("rb") as file:
+            digest = _sha256_of(file)
+
+        with self._lock:
+            self.misses += 1
+            # The file may have changed while being read
+            if self.key(path) == key:
+                self._digests[key] = digest
+                while len(self._digests) > self.max_entries:
+                    self._digests.popitem(last=False)
+        return digest
+
+    def clear(self) -> None:
+        with self._lock:
+            self._digests.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+file_hasher = FileHasher()
+
+
+def sha256_hex(path: Path) -> str:
+    return file_hasher.digest(path).hex()
+
+
+def sha256_b64(path: Path) -> str:
+    return b64encode(file_hasher.digest(path)).decode()
@@ -0,0 +1,159 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+JSON codec for the MQTT payloads and deployment manifests. It encodes to
+and decodes from bytes, which is what goes over the wire, using orjson or
+msgspec when either is installed, and the standard library otherwise.
+"""
+import json
+import logging
+import os
+from typing import Any
+from typing import Callable
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Forces a backend, e.g. for comparing them. Unset picks the fastest one.
+BACKEND_ENV_VAR = "LOCAL_CONSOLE_JSON_BACKEND"
+
+JSONInput = bytes | bytearray | memoryview | str
+
+
+class JSONBackend(NamedTuple):
+    name: str
+    decode: Callable[[JSONInput], Any]
+    encode: Callable[[Any], bytes]
+
+
+def _stdlib_decode(data: JSONInput) -> Any:
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return json.loads(data)
+
+
+def _stdlib_encode(obj: Any) -> bytes:
+    # Same output as that of the other backends
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _orjson_backend() -> JSONBackend:
+    import orjson
+
+    def encode(obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which the standard library supports
+            return _stdlib_encode(obj)
+
+    return JSONBackend("orjson", orjson.loads, encode)
+
+
+def _msgspec_backend() -> JSONBackend:
+    import msgspec  # type: ignore
+
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder()
+
+    def decode(data: JSONInput) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+
+    def encode(obj: Any) -> bytes:
+        try:
+            encoded: bytes = encoder.encode(obj)
+            return encoded
+        except (msgspec.EncodeError, TypeError):
+            return _stdlib_encode(obj)
+
+    return JSONBackend("msgspec", decode, encode)
+
+
+_BACKENDS: dict[str, Callable[[], JSONBackend]] = {
+    "orjson": _orjson_backend,
+    "msgspec": _msgspec_backend,
+    "json": lambda: JSONBackend("json", _stdlib_decode, _stdlib_encode),
+}
+
+
+def available_backends() -> list[str]:
+    names = []
+    for name, factory in _BACKENDS.items():
+        try:
+            factory()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def use_backend(name: str) -> None:
+    """
+    Selects the backend used by json_decode() and json_encode().
+    Raises ImportError if its library is not installed.
+    """
+    global _backend
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown JSON backend {name!r}")
+    _backend = _BACKENDS[name]()
+
+
+def backend_name() -> str:
+    return _backend.name
+
+
+def json_decode(data: JSONInput) -> Any:
+    """
+    Decodes a JSON document, preferably given as bytes. Any invalid
+    document, including one that is not UTF-8, raises ValueError.
+    """
+    return _backend.decode(data)
+
+
+def json_encode(obj: Any) -> bytes:
+    """
+    Encodes `obj` as compact UTF-8 JSON.
+    """
+    return _backend.encode(obj)
+
+
+def json_encode_str(obj: Any) -> str:
+    """
+    Encodes `obj` as JSON, for when it must be embedded as a string
+    in another document.
+    """
+    return _backend.encode(obj).decode()
+
+
+def _default_backend() -> JSONBackend:
+    forced = os.environ.get(BACKEND_ENV_VAR)
+    if forced:
+        try:
+            return _BACKENDS[forced]()
+        except (KeyError, ImportError):
+            logger.warning(f"JSON backend {forced!r} is not available")
+    for factory in _BACKENDS.values():
+        try:
+            return factory()
+        except ImportError:
+            continue
+    raise AssertionError("The standard library backend is always available")
+
+
+_backend = _default_backend()
@@ -13,7 +13,9 @@
 # limitations under the License.
 #
 # SPDX-License-Identifier: Apache-2.0
+import os
 from collections.abc import Iterable
+from pathlib import Path
 
 from Crypto.Hash import SHA256  # type: ignore
 from Crypto.PublicKey import ECC  # type: ignore
@@ -24,15 +26,27 @@ _SWAF_FOOTER_META_SIZE = 16
 _SWAF_FOOTER_META_VERSION = (0x00, 0x00)
 _SWAF_FOOTER_META_IDENTIFIER = (0x3A, 0x53, 0xF0, 0x07)
 
+_CHUNK_SIZE = 1024 * 1024
+
 
 def make_swaf_bytes(input_aot_bin: bytes, priv_key_bin: bytes) -> Iterable[bytes]:
+    return (
+        input_aot_bin,
+        *make_swaf_trailer(SHA256.new(input_aot_bin), len(input_aot_bin), priv_key_bin),
+    )
+
+
+def make_swaf_trailer(
+    aot_hash: SHA256.SHA256Hash, input_aot_len: int, priv_key_bin: bytes
+) -> tuple[bytes, ...]:
+    """
+    Makes the parts of a SWAF file that follow the WASM AoT file, given
+    the SHA-256 hash object fed with the whole AoT file, and its length.
+    """
     #
     # Check WASM AoT file bytes
     #
 
-    input_aot_len = len(input_aot_bin)
-    aot_hash = SHA256.new(input_aot_bin)
-
     if input_aot_len <= 0:
         raise ValueError("Input file size is 0 bytes")
 
@@ -45,6 +59,8 @@ def make_swaf_bytes(input_aot_bin: bytes, priv_key_bin: bytes) -> Iterable[bytes
     # Calculate signature (deterministic ECDSA P-256 and SHA-256)
     #
     signer = DSS.new(priv_key, "deterministic-rfc6979", encoding="der")
+    # Resumed below for hashing the signature after the AoT file
+    aot_and_sig_hash = aot_hash.copy()
     signature = signer.sign(aot_hash)
 
     sig_len = len(signature)
@@ -55,7 +71,8 @@ def make_swaf_bytes(input_aot_bin: bytes, priv_key_bin: bytes) -> Iterable[bytes
     #
     # Calculate SHA-256 of AoT file and signature (+padding)
     #
-    aot_and_sig_hash = SHA256.new(input_aot_bin + signature + padding)
+    aot_and_sig_hash.update(signature)
+    aot_and_sig_hash.update(padding)
 
     #
     # Calculate SHA-256 of public key
@@ -87,7 +104,6 @@ def make_swaf_bytes(input_aot_bin: bytes, priv_key_bin: bytes) -> Iterable[bytes
     # Make SWAF bytes
     #
     return (
-        input_aot_bin,
         signature,
         padding,
         aot_and_sig_hash.digest(),
@@ -98,3 +114,26 @@ def make_swaf_bytes(input_aot_bin: bytes, priv_key_bin: bytes) -> Iterable[bytes
 
 def sign(content: bytes, ecdsa_private_key: bytes) -> bytes:
     return b"".join(make_swaf_bytes(content, ecdsa_private_key))
+
+
+def sign_file(input_path: Path, output_path: Path, ecdsa_private_key: bytes) -> None:
+    """
+    Writes the SWAF file of the WASM AoT file at `input_path` into
+    `output_path`. The AoT file is read only once and in chunks, being
+    hashed as it is copied, and the output only replaces `output_path`
+    once complete.
+    """
+    partial_path = output_path.with_name(f".{output_path.name}.partial")
+    aot_hash = SHA256.new()
+    input_aot_len = 0
+    try:
+        with input_path.open("rb") as source, partial_path.open("wb") as dest:
+            while chunk := source.read(_CHUNK_SIZE):
+                aot_hash.update(chunk)
+                dest.write(chunk)
+                input_aot_len += len(chunk)
+            for part in make_swaf_trailer(aot_hash, input_aot_len, ecdsa_private_key):
+                dest.write(part)
+        os.replace(partial_path, output_path)
+    finally:
+        partial_path.unlink(missing_ok=True)
@@ -13,17 +13,24 @@
 # limitations under the License.
 #
 # SPDX-License-Identifier: Apache-2.0
+import ipaddress
 import logging
 import socket
 import ssl
+from collections.abc import Sequence
+from dataclasses import dataclass
 from datetime import datetime
 from datetime import timedelta
+from datetime import timezone
 from pathlib import Path
 from typing import Optional
+from typing import Union
 
 from cryptography import x509
+from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives.serialization import load_pem_private_key
@@ -31,22 +38,52 @@ from cryptography.x509 import Name
 from cryptography.x509.oid import NameOID
 from local_console.core.schemas.schemas import IPAddress
 from local_console.core.schemas.schemas import TLSConfiguration
+from local_console.core.schemas.schemas import TLSKeyType
 from retry import retry
 
 logger = logging.getLogger(__name__)
 
+PrivateKey = Union[rsa.RSAPrivateKey, ec.EllipticCurvePrivateKey]
+
+# Cached certificates are renewed once they expire within this margin
+RENEWAL_MARGIN = timedelta(days=7)
+# The brokers' CA outlives the certificates it signs, which are renewed
+# under it, until it is about to expire as well
+BROKER_CA_VALIDITY_DAYS = 3650
+BROKER_HOSTNAMES = ("localhost", "127.0.0.1", "::1")
+BROKER_IDENTIFIER = "localhost"
+CLIENT_IDENTIFIER = "local-console"
+
+# SSL contexts, by purpose and credentials. Reusing them keeps the TLS
+# session tickets valid across connections, which enables resumption.
+_contexts: dict[tuple[ssl.Purpose, "BrokerCredentials"], ssl.SSLContext] = {}
+
+
+def generate_private_key(
+    key_type: TLSKeyType = TLSKeyType.RSA_2048, key_size: int = 2048
+) -> PrivateKey:
+    if key_type == TLSKeyType.ECDSA_P256:
+        return ec.generate_private_key(ec.SECP256R1())
+    return rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+
+
+def _alternative_name(hostname: str) -> x509.GeneralName:
+    try:
+        return x509.IPAddress(ipaddress.ip_address(hostname))
+    except ValueError:
+        return x509.DNSName(hostname)
+
 
 def generate_signed_certificate_pair(
     identifier: str,
     ca_certificate: x509.Certificate,
-    ca_private_key: rsa.RSAPrivateKey,
+    ca_private_key: PrivateKey,
     key_size: int = 2048,
     is_server: bool = False,
-) -> tuple[x509.Certificate, rsa.RSAPrivateKey]:
-    client_private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=key_size,
-    )
+    key_type: TLSKeyType = TLSKeyType.RSA_2048,
+    hostnames: Sequence[str] = (),
+) -> tuple[x509.Certificate, PrivateKey]:
+    client_private_key = generate_private_key(key_type, key_size)
     client_public_key = client_private_key.public_key()
 
     # Builder for client certificate
@@ -79,10 +116,13 @@ def generate_signed_certificate_pair(
         critical=True,
     )
 
-    # If used as a server certificate, add the identifier as its SAN.
+    # If used as a server certificate, add the identifier as its SAN,
+    # along with the other `hostnames` it is reached at.
     if is_server:
+        names = dict.fromkeys([identifier, *hostnames])
         client_cert_builder = client_cert_builder.add_extension(
-            x509.SubjectAlternativeName([x509.DNSName(identifier)]), critical=False
+            x509.SubjectAlternativeName([_alternative_name(name) for name in names]),
+            critical=False,
         )
 
     # Sign the client certificate with the CA's private key
@@ -100,34 +140,80 @@ def ensure_certificate_pair_exists(
     key_path: Path,
     tls_configuration: TLSConfiguration,
     is_server: bool = False,
-) -> None:
-    if not (certificate_path.is_file() and key_path.is_file()):
-        assert tls_configuration.ca_certificate
-        assert tls_configuration.ca_key
-        ca_cert, ca_key = load_certificate_pair(
-            tls_configuration.ca_certificate, tls_configuration.ca_key
-        )
-        certificate, key = generate_signed_certificate_pair(
-            identifier, ca_cert, ca_key, is_server=is_server
+    key_type: TLSKeyType = TLSKeyType.RSA_2048,
+    hostnames: Sequence[str] = (),
+) -> bool:
+    """
+    Generates a certificate pair signed by the configured CA, unless the
+    one already at `certificate_path` and `key_path` was issued by it and
+    is not about to expire. Tells whether it was generated.
+    """
+    assert tls_configuration.ca_certificate
+    assert tls_configuration.ca_key
+    if certificate_path.is_file() and key_path.is_file():
+        ca_cert = x509.load_pem_x509_certificate(
+            tls_configuration.ca_certificate.read_bytes()
         )
-        if not certificate_path.parent.is_dir():
-            certificate_path.parent.mkdir()
-        if not key_path.parent.is_dir():
-            key_path.parent.mkdir()
-        export_cert_pair_as_pem(certificate, key, certificate_path, key_path)
+        cached = x509.load_pem_x509_certificate(certificate_path.read_bytes())
+        if is_certificate_current(cached, ca_cert):
+            return False
+        logger.info(f"Renewing certificate {certificate_path}")
+
+    ca_cert, ca_key = load_certificate_pair(
+        tls_configuration.ca_certificate, tls_configuration.ca_key
+    )
+    certificate, key = generate_signed_certificate_pair(
+        identifier,
+        ca_cert,
+        ca_key,
+        is_server=is_server,
+        key_type=key_type,
+        hostnames=hostnames,
+    )
+    certificate_path.parent.mkdir(parents=True, exist_ok=True)
+    key_path.parent.mkdir(parents=True, exist_ok=True)
+    export_cert_pair_as_pem(certificate, key, certificate_path, key_path)
+    return True
+
+
+def is_expiring(certificate: x509.Certificate) -> bool:
+    """
+    Tells whether `certificate` expires within RENEWAL_MARGIN
+    """
+    expiry = certificate.not_valid_after_utc
+    return expiry - RENEWAL_MARGIN < datetime.now(timezone.utc)
+
+
+def is_certificate_current(
+    certificate: x509.Certificate, ca_certificate: x509.Certificate
+) -> bool:
+    """
+    Tells whether `certificate` was signed by `ca_certificate`,
+    and remains valid for at least RENEWAL_MARGIN.
+    """
+    if is_expiring(certificate):
+        return False
+    if certificate.issuer != ca_certificate.subject:
+        return False
+    try:
+        verify_certificate_against_ca(certificate, ca_certificate)
+    except InvalidSignature:
+        return False
+    return True
 
 
 def load_certificate_pair(
     ca_certificate_path: Path, ca_key_path: Path
-) -> tuple[x509.Certificate, rsa.RSAPrivateKey]:
+) -> tuple[x509.Certificate, PrivateKey]:
     ca_cert = x509.load_pem_x509_certificate(ca_certificate_path.read_bytes())
     ca_key = load_pem_private_key(ca_key_path.read_bytes(), password=None)
+    assert isinstance(ca_key, (rsa.RSAPrivateKey, ec.EllipticCurvePrivateKey))
     return ca_cert, ca_key
 
 
 def export_cert_pair_as_pem(
     certificate: x509.Certificate,
-    client_private_key: rsa.RSAPrivateKey,
+    client_private_key: PrivateKey,
     certificate_file: Path,
     key_file: Path,
 ) -> None:
@@ -184,12 +270,8 @@ def generate_self_signed_ca(
     ca_name: str = "Your Own CA",
     validity_days: int = 365,
     key_size: int = 2048,
-) -> tuple[Path, Path, x509.Certificate, rsa.RSAPrivateKey]:
-    ca_private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=key_size,
-    )
-
+    key_type: TLSKeyType = TLSKeyType.RSA_2048,
+) -> tuple[Path, Path, x509.Certificate, PrivateKey]:
     ca_cert_path = ca_directory / "ca.crt"
     ca_key_path = ca_directory / "ca.key"
 
@@ -198,6 +280,7 @@ def generate_self_signed_ca(
             ca_cert_path, ca_key_path
         )
     else:
+        ca_private_key = generate_private_key(key_type, key_size)
         # CA details are for a simple self-signed certificate, valid only in a local setting.
         ca_subject = x509.Name(
             [
@@ -230,6 +313,7 @@ def generate_self_signed_ca(
             algorithm=hashes.SHA256(),
         )
 
+        ca_directory.mkdir(parents=True, exist_ok=True)
         export_cert_pair_as_pem(
             ca_certificate, ca_private_key, ca_cert_path, ca_key_path
         )
@@ -245,9 +329,118 @@ def verify_certificate_against_ca(
     ca_public_key = ca_certificate.public_key()
 
     # Verify the signature on the certificate to be verified
-    ca_public_key.verify(
-        certificate.signature,
-        certificate.tbs_certificate_bytes,
-        padding.PKCS1v15(),
-        certificate.signature_hash_algorithm,
+    assert certificate.signature_hash_algorithm
+    if isinstance(ca_public_key, ec.EllipticCurvePublicKey):
+        ca_public_key.verify(
+            certificate.signature,
+            certificate.tbs_certificate_bytes,
+            ec.ECDSA(certificate.signature_hash_algorithm),
+        )
+    else:
+        assert isinstance(ca_public_key, rsa.RSAPublicKey)
+        ca_public_key.verify(
+            certificate.signature,
+            certificate.tbs_certificate_bytes,
+            padding.PKCS1v15(),
+            certificate.signature_hash_algorithm,
+        )
+
+
+@dataclass(frozen=True)
+class BrokerCredentials:
+    ca_certificate: Path
+    server_certificate: Path
+    server_key: Path
+    client_certificate: Path
+    client_key: Path
+
+
+def ensure_broker_credentials(
+    tls_directory: Path, key_type: TLSKeyType = TLSKeyType.ECDSA_P256
+) -> BrokerCredentials:
+    """
+    Provides a CA, and the certificates it signed for the brokers and
+    for Local Console as their client. They are generated on the first
+    call, and then kept in `tls_directory` until they are about to expire.
+    A renewed CA has the certificates it signed renewed too, and SSL
+    contexts made with renewed files are discarded.
+    """
+    ca_cert_path = tls_directory / "ca.crt"
+    ca_key_path = tls_directory / "ca.key"
+    if ca_cert_path.is_file() and ca_key_path.is_file():
+        if is_expiring(x509.load_pem_x509_certificate(ca_cert_path.read_bytes())):
+            logger.info(f"Renewing CA {ca_cert_path}")
+            ca_cert_path.unlink()
+            ca_key_path.unlink()
+    if not (ca_cert_path.is_file() and ca_key_path.is_file()):
+        generate_self_signed_ca(
+            tls_directory,
+            "Local Console CA",
+            validity_days=BROKER_CA_VALIDITY_DAYS,
+            key_type=key_type,
+        )
+    ca = TLSConfiguration(ca_certificate=ca_cert_path, ca_key=ca_key_path)
+    credentials = BrokerCredentials(
+        ca_certificate=ca_cert_path,
+        server_certificate=tls_directory / "broker.crt",
+        server_key=tls_directory / "broker.key",
+        client_certificate=tls_directory / "client.crt",
+        client_key=tls_directory / "client.key",
+    )
+    server_renewed = ensure_certificate_pair_exists(
+        BROKER_IDENTIFIER,
+        credentials.server_certificate,
+        credentials.server_key,
+        ca,
+        is_server=True,
+        key_type=key_type,
+        hostnames=BROKER_HOSTNAMES,
     )
+    client_renewed = ensure_certificate_pair_exists(
+        CLIENT_IDENTIFIER,
+        credentials.client_certificate,
+        credentials.client_key,
+        ca,
+        key_type=key_type,
+    )
+    if server_renewed or client_renewed:
+        for purpose in (ssl.Purpose.CLIENT_AUTH, ssl.Purpose.SERVER_AUTH):
+            _contexts.pop((purpose, credentials), None)
+    return credentials
+
+
+def server_ssl_context(credentials: BrokerCredentials) -> ssl.SSLContext:
+    """
+    Context of brokers, which require clients to present a certificate
+    signed by the CA. As it holds the keys of the session tickets it
+    issues, it is created once, for tickets to be honored across brokers.
+    """
+    key = (ssl.Purpose.CLIENT_AUTH, credentials)
+    if key not in _contexts:
+        context = ssl.create_default_context(
+            ssl.Purpose.CLIENT_AUTH, cafile=credentials.ca_certificate
+        )
+        context.load_cert_chain(credentials.server_certificate, credentials.server_key)
+        context.verify_mode = ssl.CERT_REQUIRED
+        _contexts[key] = context
+    return _contexts[key]
+
+
+def client_ssl_context(credentials: BrokerCredentials) -> ssl.SSLContext:
+    """
+    Context of Local Console's connections to brokers. Sessions can
+    only be resumed with the context that established them, so it is
+    created once.
+
+    Brokers are reached at any of the addresses of the host, so they are
+    identified by the CA, which only Local Console uses, not by hostname.
+    """
+    key = (ssl.Purpose.SERVER_AUTH, credentials)
+    if key not in _contexts:
+        context = ssl.create_default_context(
+            ssl.Purpose.SERVER_AUTH, cafile=credentials.ca_certificate
+        )
+        context.check_hostname = False
+        context.load_cert_chain(credentials.client_certificate, credentials.client_key)
+        _contexts[key] = context
+    return _contexts[key]
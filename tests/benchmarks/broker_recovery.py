@@ -0,0 +1,70 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Measures how long the broker supervisor takes to bring a broker back after
+it exits, and to reconnect and resubscribe a client, with the embedded
+broker unless --mosquitto is given. Run it from the repository root with:
+
+    python -m tests.benchmarks.broker_recovery [--restarts N] [--mosquitto]
+"""
+import argparse
+import time
+from statistics import median
+
+import trio
+from local_console.clients.agent import Agent
+from local_console.core.schemas.schemas import OnWireProtocol
+from local_console.servers.broker import BrokerSupervisor
+from local_console.servers.broker import INITIAL_BACKOFF
+
+BROKER_PORT = 18831
+TOPIC = "benchmark/recovery"
+
+
+async def main(restarts: int, embedded: bool) -> None:
+    recoveries: list[float] = []
+    async with trio.open_nursery() as nursery:
+        # Backing off for the initial delay only, as after a stable uptime
+        supervisor = BrokerSupervisor(
+            BROKER_PORT, nursery, embedded, max_backoff=INITIAL_BACKOFF
+        )
+        await nursery.start(supervisor.run)
+        agent = Agent("127.0.0.1", BROKER_PORT, OnWireProtocol.EVP2)
+        async with agent.mqtt_scope([TOPIC]):
+            supervisor.on_ready(agent.reconnect)
+            for i in range(restarts):
+                exited_at = time.perf_counter()
+                if supervisor.embedded_broker:
+                    supervisor.embedded_broker.close()
+                elif supervisor.process:
+                    supervisor.process.kill()
+                await supervisor.wait_restart(i)
+                recoveries.append(time.perf_counter() - exited_at)
+        supervisor.stop()
+
+    print(
+        f"Recovered from {restarts} exits, with a backoff of "
+        f"{INITIAL_BACKOFF * 1e3:.0f} ms: median "
+        f"{median(recoveries) * 1e3:.1f} ms, max {max(recoveries) * 1e3:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--restarts", type=int, default=5)
+    parser.add_argument("--mosquitto", action="store_true")
+    args = parser.parse_args()
+    trio.run(main, args.restarts, not args.mosquitto)
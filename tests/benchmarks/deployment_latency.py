@@ -0,0 +1,137 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Measures the latency of deploying a module to simulated devices, each on
+its own embedded broker, for both on-wire schemas, and how a fleet of them
+is deployed to with increasing parallelism. Run it from the repository
+root with:
+
+    python -m tests.benchmarks.deployment_latency [--devices N] [--size-mb N]
+"""
+import argparse
+import os
+import time
+from functools import partial
+from pathlib import Path
+from statistics import median
+from tempfile import TemporaryDirectory
+
+import trio
+from local_console.commands.deploy import exec_deployment
+from local_console.core.commands.deploy import single_module_manifest_setup
+from local_console.core.commands.fleet_deploy import FleetDeployment
+from local_console.core.schemas.schemas import DeploymentManifest
+from local_console.core.schemas.schemas import DeviceConnection
+from local_console.core.schemas.schemas import MQTTParams
+from local_console.core.schemas.schemas import OnWireProtocol
+from local_console.core.schemas.schemas import WebserverParams
+from local_console.servers.embedded_broker import EmbeddedBroker
+from local_console.servers.webserver import SyncWebserver
+
+from tests.mocks.simulated_device import DeviceBehavior
+from tests.mocks.simulated_device import SimulatedDevice
+
+
+async def deploy_fleet(
+    devices: int,
+    parallelism: int,
+    onwire_schema: OnWireProtocol,
+    manifest: DeploymentManifest,
+    webserver: SyncWebserver,
+    args: argparse.Namespace,
+) -> tuple[float, list[float]]:
+    behavior = DeviceBehavior(
+        report_interval=args.report_interval,
+        download_delay=args.download_delay,
+        start_delay=args.start_delay,
+    )
+    async with trio.open_nursery() as nursery:
+        brokers = []
+        connections = []
+        for index in range(devices):
+            broker = EmbeddedBroker(0, "127.0.0.1")
+            await nursery.start(broker.run)
+            device = SimulatedDevice(
+                "127.0.0.1", broker.port, onwire_schema, behavior, f"device-{index}"
+            )
+            await nursery.start(device.run)
+            brokers.append(broker)
+            connections.append(
+                DeviceConnection(
+                    mqtt=MQTTParams(host="127.0.0.1", port=broker.port, device_id=None),
+                    webserver=WebserverParams(host="127.0.0.1", port=0),
+                    name=f"device-{index}",
+                )
+            )
+
+        deployment = FleetDeployment(
+            connections,
+            onwire_schema,
+            manifest,
+            webserver,
+            partial(exec_deployment, handshake_timeout=args.handshake),
+            parallelism,
+        )
+        start = time.perf_counter()
+        progress = await deployment.run()
+        total = time.perf_counter() - start
+        nursery.cancel_scope.cancel()
+
+    assert not progress.failed, progress.summary()
+    return total, [o.elapsed or 0 for o in progress.outcomes.values()]
+
+
+async def main(args: argparse.Namespace) -> None:
+    with TemporaryDirectory() as tmp_dir:
+        module = Path(tmp_dir) / "node.wasm"
+        module.write_bytes(os.urandom(args.size_mb * 2**20))
+        with SyncWebserver(Path(tmp_dir)) as webserver:
+            manifest = single_module_manifest_setup(
+                "node", module, webserver, host_override="127.0.0.1"
+            )
+            print(
+                f"Deploying a {args.size_mb} MiB module, "
+                f"with a {args.handshake} s attributes handshake"
+            )
+            for schema in OnWireProtocol:
+                total, _ = await deploy_fleet(1, 1, schema, manifest, webserver, args)
+                print(f"{schema:>8}, single device: {total:6.2f} s")
+
+            for parallelism in sorted({1, args.devices // 4 or 1, args.devices}):
+                total, elapsed = await deploy_fleet(
+                    args.devices,
+                    parallelism,
+                    OnWireProtocol.EVP2,
+                    manifest,
+                    webserver,
+                    args,
+                )
+                print(
+                    f"{args.devices} devices, parallelism {parallelism:>3}: "
+                    f"{total:6.2f} s, median per device {median(elapsed):5.2f} s"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=4)
+    parser.add_argument("--handshake", type=float, default=0.5)
+    parser.add_argument("--report-interval", type=float, default=0.1)
+    parser.add_argument("--download-delay", type=float, default=0.0)
+    parser.add_argument("--start-delay", type=float, default=0.2)
+    args = parser.parse_args()
+    trio.run(main, args)
@@ -0,0 +1,62 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Measures hashing a deployment artifact the way it was done before, by
+reading it whole, against the chunked hasher, on the first deployment
+and on a repeated one of the unchanged file. Run it from the repository
+root with:
+
+    python -m tests.benchmarks.file_hashing [--size-mb N]
+"""
+import argparse
+import hashlib
+import os
+import time
+import tracemalloc
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable
+
+from local_console.utils.hashing import FileHasher
+
+
+def measure(label: str, fn: Callable[[], object]) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>20}: {elapsed * 1e3:8.2f} ms, peak {peak / 2**20:7.2f} MiB")
+
+
+def main(size_mb: int) -> None:
+    with TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "firmware.bin"
+        path.write_bytes(os.urandom(size_mb * 2**20))
+        print(f"Hashing a {size_mb} MiB file")
+
+        measure("whole file", lambda: hashlib.sha256(path.read_bytes()).digest())
+        hasher = FileHasher()
+        measure("chunked", lambda: hasher.digest(path))
+        measure("chunked, unchanged", lambda: hasher.digest(path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=256)
+    args = parser.parse_args()
+    main(args.size_mb)
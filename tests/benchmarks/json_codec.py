@@ -0,0 +1,119 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Measures the cost of decoding the incoming MQTT payloads and encoding the
+outgoing ones with each available JSON backend. The payloads are either
+read from a capture, with one payload per line as printed by
+`mosquitto_sub -t '#'`, or synthesized after the device's state, deployment
+status and telemetry reports. Run it from the repository root with:
+
+    python -m tests.benchmarks.json_codec [--capture FILE] [--repeat N]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Optional
+
+from local_console.core.schemas.schemas import DeploymentManifest
+from local_console.utils import json_codec
+
+from tests.benchmarks.manifest_publish import multi_module_manifest
+
+
+def synthetic_payloads() -> list[bytes]:
+    state = {
+        "Hardware": {"Sensor": "IMX500", "SensorId": "100A5", "Version": "1.0"},
+        "Version": {"ApFwVersion": "X700F6", "SensorFwVersion": "010707"},
+        "Status": {"Sensor": "Standby", "ApplicationProcessor": "Idle"},
+        "OTA": {"UpdateProgress": 100, "UpdateStatus": "Done"},
+        "Image": {"FrameRate": 2997, "DriveMode": 1},
+        "Network": {"NTP": "pool.ntp.org", "IPAddress": "192.168.1.20"},
+    }
+    state_report = {
+        "state/backdoor-EA_Main/placeholder": base64.b64encode(
+            json.dumps(state).encode()
+        ).decode()
+    }
+    deploy_status = {
+        "deploymentStatus": {
+            "deploymentId": hashlib.sha256(b"benchmark").hexdigest(),
+            "reconcileStatus": "ok",
+            "instances": {
+                f"node-{i:02d}": {"status": "ok", "moduleId": f"node-{i:02d}"}
+                for i in range(4)
+            },
+            "modules": {f"node-{i:02d}": {"status": "ok"} for i in range(4)},
+        }
+    }
+    telemetry = {
+        "values": {
+            "device/log": [
+                {"app": "node", "level": 3, "log": "x" * 120, "timestamp": i}
+                for i in range(8)
+            ]
+        }
+    }
+    return [json.dumps(p).encode() for p in (state_report, deploy_status, telemetry)]
+
+
+def captured_payloads(capture: Path) -> list[bytes]:
+    payloads = []
+    for line in capture.read_bytes().splitlines():
+        try:
+            json.loads(line)
+        except ValueError:
+            continue
+        payloads.append(line)
+    return payloads
+
+
+def time_per_call(func: Callable[[Any], Any], args: list, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for arg in args:
+            func(arg)
+    return (time.perf_counter() - start) / (repeat * len(args))
+
+
+def main(capture: Optional[Path], repeat: int) -> None:
+    payloads = captured_payloads(capture) if capture else synthetic_payloads()
+    documents = [json.loads(p) for p in payloads]
+    manifest: DeploymentManifest = multi_module_manifest(8)
+    print(f"{len(payloads)} payloads, {sum(map(len, payloads))} bytes")
+    for name in json_codec.available_backends():
+        json_codec.use_backend(name)
+        decode = time_per_call(json_codec.json_decode, payloads, repeat)
+        encode = time_per_call(json_codec.json_encode, documents, repeat)
+        render = time_per_call(
+            DeploymentManifest.render_for_evp1, [manifest], repeat // 10 or 1
+        )
+        print(
+            f"{name:>8}: decode {decode * 1e6:6.2f} us, encode {encode * 1e6:6.2f} us"
+            f" per payload, EVP1 manifest {render * 1e6:7.2f} us"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--capture", type=Path, default=None)
+    parser.add_argument("--repeat", type=int, default=20_000)
+    args = parser.parse_args()
+    main(args.capture, args.repeat)
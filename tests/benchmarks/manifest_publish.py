@@ -0,0 +1,129 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Measures the latency of publishing a multi-module deployment manifest and
+a large configuration blob, from the call to the broker's acknowledgement,
+with the 2 KiB socket send buffer formerly forced by the paho adapter and
+with the OS default. Run it from the repository root with:
+
+    python -m tests.benchmarks.manifest_publish [--modules N] [--config-size BYTES]
+"""
+import argparse
+import hashlib
+import time
+from statistics import quantiles
+from typing import Optional
+
+import trio
+from local_console.clients.trio_mqtt import MQTTClient
+from local_console.core.camera.enums import MQTTTopics
+from local_console.core.schemas.schemas import Deployment
+from local_console.core.schemas.schemas import DeploymentManifest
+from local_console.core.schemas.schemas import InstanceSpec
+from local_console.core.schemas.schemas import Module
+from local_console.core.schemas.schemas import Topics
+
+from tests.benchmarks.mqtt_client import local_broker
+
+SEND_BUFFERS: dict[str, Optional[int]] = {
+    "2 KiB": 2048,
+    "OS default": None,
+}
+
+
+def multi_module_manifest(modules: int) -> DeploymentManifest:
+    names = [f"node-{i:02d}" for i in range(modules)]
+    return DeploymentManifest(
+        deployment=Deployment(
+            deploymentId=hashlib.sha256(b"benchmark").hexdigest(),
+            instanceSpecs={
+                name: InstanceSpec(
+                    moduleId=name,
+                    publish={"output": f"{name}-output"},
+                    subscribe={"input": f"{name}-input"},
+                )
+                for name in names
+            },
+            modules={
+                name: Module(
+                    entryPoint="main",
+                    moduleImpl="wasm",
+                    downloadUrl=f"http://192.168.1.10:8000/{name}.xtensa.aot.signed",
+                    hash=hashlib.sha256(name.encode()).hexdigest(),
+                )
+                for name in names
+            },
+            publishTopics={
+                f"{name}-output": Topics(type="telemetry", topic=f"{name}/out")
+                for name in names
+            },
+            subscribeTopics={
+                f"{name}-input": Topics(type="telemetry", topic=f"{name}/in")
+                for name in names
+            },
+        )
+    )
+
+
+async def publish_latencies(
+    host: str, port: int, send_buffer: Optional[int], payload: bytes, repeat: int
+) -> list[float]:
+    latencies = []
+    async with trio.open_nursery() as nursery:
+        client = MQTTClient("bench-manifest", nursery, send_buffer=send_buffer)
+        await client.connect(host, port)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await client.publish(MQTTTopics.ATTRIBUTES.value, payload, qos=1)
+            latencies.append(time.perf_counter() - start)
+        await client.disconnect()
+        nursery.cancel_scope.cancel()
+    return latencies
+
+
+async def main(
+    host: str, port: Optional[int], modules: int, config_size: int, repeat: int
+) -> None:
+    manifest = multi_module_manifest(modules)
+    payloads = {
+        f"EVP1 manifest, {modules} modules": manifest.render_for_evp1(),
+        f"EVP2 manifest, {modules} modules": manifest.render_for_evp2(),
+        "configuration blob": b"x" * config_size,
+    }
+
+    async with local_broker(port) as broker_port:
+        for label, payload in payloads.items():
+            print(f"{label} ({len(payload)} bytes), {repeat} publications:")
+            for buffer_label, send_buffer in SEND_BUFFERS.items():
+                latencies = await publish_latencies(
+                    host, broker_port, send_buffer, payload, repeat
+                )
+                cuts = quantiles(latencies, n=100, method="inclusive")
+                print(
+                    f"  {buffer_label:>12} send buffer: "
+                    f"p50 {cuts[49] * 1e3:.3f} ms, p95 {cuts[94] * 1e3:.3f} ms"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--modules", type=int, default=16)
+    parser.add_argument("--config-size", type=int, default=1024 * 1024)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+    trio.run(main, args.host, args.port, args.modules, args.config_size, args.repeat)
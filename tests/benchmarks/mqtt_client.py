@@ -0,0 +1,123 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Measures the message throughput and publish latency of the MQTT client
+against a local mosquitto broker, spawned on port 18830 unless --port
+points to a running one, or against the embedded broker with --embedded.
+Run it from the repository root with:
+
+    python -m tests.benchmarks.mqtt_client [--messages N] [--size BYTES] [--embedded]
+"""
+import argparse
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from statistics import quantiles
+from typing import Optional
+
+import trio
+from local_console.clients.trio_mqtt import MQTTClient
+from local_console.servers.broker import spawn_broker
+
+TOPIC = "benchmark/messages"
+BROKER_PORT = 18830
+
+
+@asynccontextmanager
+async def local_broker(port: Optional[int], embedded: bool) -> AsyncIterator[int]:
+    """
+    Provides the port of the broker to benchmark against,
+    spawning one unless `port` is given.
+    """
+    if port is not None:
+        yield port
+        return
+    async with trio.open_nursery() as nursery:
+        async with spawn_broker(BROKER_PORT, nursery, False, embedded):
+            yield BROKER_PORT
+        nursery.cancel_scope.cancel()
+
+
+def report(label: str, count: int, elapsed: float, latencies: list[float]) -> None:
+    cuts = quantiles(latencies, n=100, method="inclusive")
+    print(
+        f"{label:>12}: {count / elapsed:10.0f} msg/s | latency "
+        f"p50 {cuts[49] * 1e3:.3f} ms, p95 {cuts[94] * 1e3:.3f} ms, "
+        f"p99 {cuts[98] * 1e3:.3f} ms"
+    )
+
+
+async def run_round(
+    host: str, port: int, qos: int, messages: int, size: int
+) -> tuple[float, list[float]]:
+    """
+    Publishes `messages` payloads from one client and receives them on
+    another, returning the elapsed time until the last one arrives and the
+    publish-to-receive latency of each message.
+    """
+    padding = b"x" * max(size - 8, 0)
+    sent_at: list[float] = [0.0] * messages
+    latencies: list[float] = []
+
+    async with trio.open_nursery() as nursery:
+        subscriber = MQTTClient("bench-sub", nursery, max_buffer=messages)
+        publisher = MQTTClient("bench-pub", nursery)
+        await subscriber.connect(host, port)
+        await subscriber.subscribe(TOPIC, qos)
+        await publisher.connect(host, port)
+
+        async def receive() -> None:
+            async with subscriber.messages() as mgen:
+                async for msg in mgen:
+                    index = int.from_bytes(msg.payload[:8], "big")
+                    latencies.append(time.perf_counter() - sent_at[index])
+                    if len(latencies) == messages:
+                        return
+
+        start = time.perf_counter()
+        async with trio.open_nursery() as round_nursery:
+            round_nursery.start_soon(receive)
+            for i in range(messages):
+                sent_at[i] = time.perf_counter()
+                await publisher.publish(TOPIC, i.to_bytes(8, "big") + padding, qos=qos)
+        elapsed = time.perf_counter() - start
+
+        await publisher.disconnect()
+        await subscriber.disconnect()
+        nursery.cancel_scope.cancel()
+
+    return elapsed, latencies
+
+
+async def main(
+    host: str, port: Optional[int], messages: int, size: int, embedded: bool
+) -> None:
+    async with local_broker(port, embedded) as broker_port:
+        print(f"{messages} messages of {size} bytes through {host}:{broker_port}")
+        for qos in (0, 1):
+            elapsed, latencies = await run_round(host, broker_port, qos, messages, size)
+            report(f"QoS {qos}", messages, elapsed, latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--embedded", action="store_true")
+    args = parser.parse_args()
+    trio.run(main, args.host, args.port, args.messages, args.size, args.embedded)
@@ -0,0 +1,82 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Measures the throughput of the camera state when processing MQTT traffic,
+by replaying a capture into it as fast as possible. Without a capture made
+with `local-console traffic record`, one is synthesized after a device
+reporting its state, deployment status and logs. Run it from the
+repository root with:
+
+    python -m tests.benchmarks.state_replay [--capture FILE] [--messages N]
+"""
+import argparse
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Optional
+
+import trio
+from local_console.clients.mqtt_capture import TrafficRecorder
+from local_console.clients.mqtt_codec import Message
+from local_console.core.camera.state import CameraState
+from local_console.core.schemas.schemas import OnWireProtocol
+from local_console.utils.json_codec import json_encode
+
+from tests.benchmarks.json_codec import synthetic_payloads
+from tests.benchmarks.topic_router import message_stream
+
+
+def synthesize_capture(path: Path, count: int) -> None:
+    state_report, deploy_status, _ = synthetic_payloads()
+    with TrafficRecorder(path) as recorder:
+        for i, message in enumerate(message_stream(count, 512)):
+            if i % 50 == 0:
+                # Alternate between two states, so that they are all processed
+                payload = state_report if i % 100 else json_encode({"systemInfo": {}})
+                message = Message(message.topic, payload)
+            elif i % 50 == 25:
+                message = Message(message.topic, deploy_status)
+            recorder.record(message)
+
+
+async def replay(capture: Path) -> None:
+    send_channel, _ = trio.open_memory_channel(0)
+    camera = CameraState(send_channel, trio.lowlevel.current_trio_token())
+    camera._onwire_schema = OnWireProtocol.EVP2
+    stats = await camera.replay_traffic(capture, speed=None)
+    print(f"Replayed {stats.messages} messages in {stats.elapsed:.2f}s")
+    print(f"Throughput: {stats.throughput:.0f} messages/s")
+    print(
+        f"Processing time per message: p50 {stats.percentile(50) * 1e6:.1f} us, "
+        f"p95 {stats.percentile(95) * 1e6:.1f} us"
+    )
+
+
+def main(capture: Optional[Path], count: int) -> None:
+    if capture:
+        trio.run(replay, capture)
+        return
+    with TemporaryDirectory() as tempdir:
+        capture = Path(tempdir) / "traffic.mqtt"
+        synthesize_capture(capture, count)
+        trio.run(replay, capture)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--capture", type=Path, default=None)
+    parser.add_argument("--messages", type=int, default=50_000)
+    args = parser.parse_args()
+    main(args.capture, args.messages)
@@ -0,0 +1,88 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Measures signing AoT modules into SWAF files in memory, as a whole,
+against streaming them from file to file, and signing the modules of
+all targets one after the other against doing it concurrently. Run it
+from the repository root with:
+
+    python -m tests.benchmarks.swaf_signing [--size-mb N]
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable
+
+import trio
+from Crypto.PublicKey import ECC
+from local_console.core.commands.sign import sign_modules
+from local_console.core.commands.sign import signing_jobs
+from local_console.core.enums import Target
+from local_console.utils.signature import sign
+from local_console.utils.signature import sign_file
+
+
+def measure(label: str, fn: Callable[[], object]) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>24}: {elapsed * 1e3:8.2f} ms, peak {peak / 2**20:7.2f} MiB")
+
+
+def main(size_mb: int) -> None:
+    with TemporaryDirectory() as tmp_dir:
+        bin_dir = Path(tmp_dir)
+        key_file = bin_dir / "key.pem"
+        key_file.write_text(ECC.generate(curve="P-256").export_key(format="PEM"))
+        key = key_file.read_bytes()
+        for target in Target:
+            module = bin_dir / f"node.{target}.aot"
+            module.write_bytes(os.urandom(size_mb * 2**20))
+        source = bin_dir / f"node.{Target.XTENSA}.aot"
+        signed = bin_dir / f"node.{Target.XTENSA}.aot.signed"
+        print(f"Signing {size_mb} MiB modules")
+
+        measure(
+            "in memory",
+            lambda: signed.write_bytes(sign(source.read_bytes(), key)),
+        )
+        measure("streamed", lambda: sign_file(source, signed, key))
+
+        jobs = signing_jobs(bin_dir, Target)
+        measure(
+            "all targets, in turn",
+            lambda: [sign_file(job.source, job.signed, key) for job in jobs],
+        )
+        measure(
+            "all targets, at once",
+            lambda: trio.run(sign_modules, jobs, key_file, True),
+        )
+        measure(
+            "all targets, up to date", lambda: trio.run(sign_modules, jobs, key_file)
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=64)
+    args = parser.parse_args()
+    main(args.size_mb)
@@ -0,0 +1,95 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Measures the time the MQTT client takes to reconnect to the embedded broker
+without TLS, and with TLS for each key type, with full handshakes and with
+resumed sessions. It also times generating and loading the credentials.
+Run it from the repository root with:
+
+    python -m tests.benchmarks.tls_reconnect [--reconnects N]
+"""
+import argparse
+import ssl
+import time
+from pathlib import Path
+from statistics import median
+from tempfile import TemporaryDirectory
+from typing import Optional
+
+import trio
+from local_console.clients import trio_mqtt
+from local_console.clients.trio_mqtt import MQTTClient
+from local_console.core.schemas.schemas import TLSKeyType
+from local_console.servers.embedded_broker import EmbeddedBroker
+from local_console.utils.tls import client_ssl_context
+from local_console.utils.tls import ensure_broker_credentials
+from local_console.utils.tls import server_ssl_context
+
+
+async def reconnect_times(
+    reconnects: int,
+    server_context: Optional[ssl.SSLContext],
+    client_context: Optional[ssl.SSLContext],
+    resume: bool,
+) -> list[float]:
+    times: list[float] = []
+    async with trio.open_nursery() as nursery:
+        broker = EmbeddedBroker(0, "127.0.0.1", server_context)
+        await nursery.start(broker.run)
+        client = MQTTClient("bench-tls", nursery, ssl_context=client_context)
+        for _ in range(reconnects):
+            if not resume:
+                trio_mqtt._tls_sessions.clear()
+            start = time.perf_counter()
+            await client.connect("127.0.0.1", broker.port)
+            times.append(time.perf_counter() - start)
+            await client.disconnect()
+        broker.close()
+    return times
+
+
+def report(label: str, times: list[float]) -> None:
+    print(f"{label:>24}: median {median(times) * 1e3:7.2f} ms")
+
+
+async def main(reconnects: int) -> None:
+    print(f"Connecting {reconnects} times to the embedded broker")
+    report("no TLS", await reconnect_times(reconnects, None, None, False))
+    for key_type in TLSKeyType:
+        with TemporaryDirectory() as tmp_dir:
+            start = time.perf_counter()
+            credentials = ensure_broker_credentials(Path(tmp_dir), key_type)
+            generated = time.perf_counter() - start
+            start = time.perf_counter()
+            ensure_broker_credentials(Path(tmp_dir), key_type)
+            cached = time.perf_counter() - start
+            print(
+                f"{key_type:>24}: credentials generated in {generated * 1e3:.1f} ms, "
+                f"loaded from cache in {cached * 1e3:.1f} ms"
+            )
+            server = server_ssl_context(credentials)
+            client = client_ssl_context(credentials)
+            for resume in (False, True):
+                times = await reconnect_times(reconnects, server, client, resume)
+                handshake = "resumed" if resume else "full"
+                report(f"{key_type}, {handshake}", times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reconnects", type=int, default=50)
+    args = parser.parse_args()
+    trio.run(main, args.reconnects)
@@ -0,0 +1,98 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Measures the per-message cost of dispatching a telemetry-heavy stream of
+incoming messages, with the former regex match, unconditional JSON decoding
+and if-chain, and with the topic router. Run it from the repository root with:
+
+    python -m tests.benchmarks.topic_router [--messages N] [--telemetry-size BYTES]
+"""
+import argparse
+import json
+import re
+import time
+from typing import Any
+
+import trio
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_router import TopicRouter
+from local_console.core.camera.enums import MQTTTopics
+
+ATTRIBUTES_REQ = re.compile(r"^v1/devices/me/attributes/request/(\d+)$")
+KEYS = ("state/backdoor-EA_Main/placeholder", "systemInfo", "deploymentStatus")
+
+
+def message_stream(count: int, telemetry_size: int) -> list[Message]:
+    telemetry = json.dumps(
+        {"values": {"device/log": [{"app": "node", "log": "x" * telemetry_size}]}}
+    ).encode()
+    state = json.dumps({KEYS[0]: "e30="}).encode()
+    messages = []
+    for i in range(count):
+        if i % 50 == 0:
+            messages.append(Message(MQTTTopics.ATTRIBUTES.value, state))
+        elif i % 500 == 1:
+            messages.append(Message(f"v1/devices/me/attributes/request/{i}", b"{}"))
+        else:
+            messages.append(Message(MQTTTopics.TELEMETRY.value, telemetry))
+    return messages
+
+
+async def handler(topic: str, payload: Any) -> None:
+    pass
+
+
+async def chain_dispatch(messages: list[Message]) -> None:
+    for msg in messages:
+        if ATTRIBUTES_REQ.match(msg.topic):
+            await handler(msg.topic, msg.payload)
+        payload = json.loads(msg.payload)
+        if msg.topic == MQTTTopics.ATTRIBUTES.value:
+            for key in KEYS:
+                if key in payload:
+                    await handler(msg.topic, payload)
+        if msg.topic == MQTTTopics.TELEMETRY.value:
+            await handler(msg.topic, payload)
+
+
+async def router_dispatch(messages: list[Message]) -> None:
+    router = TopicRouter()
+    router.add_handler(MQTTTopics.ATTRIBUTES_REQ.value, handler, decode=False)
+    for key in KEYS:
+        router.add_handler(MQTTTopics.ATTRIBUTES.value, handler, key=key)
+    router.add_handler(MQTTTopics.TELEMETRY.value, handler, decode=False)
+    for msg in messages:
+        await router.dispatch(msg)
+
+
+async def main(count: int, telemetry_size: int) -> None:
+    messages = message_stream(count, telemetry_size)
+    for label, dispatch in (
+        ("regex + json + if-chain", chain_dispatch),
+        ("topic router", router_dispatch),
+    ):
+        start = time.perf_counter()
+        await dispatch(messages)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>24}: {elapsed / count * 1e6:.2f} us/message")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--telemetry-size", type=int, default=512)
+    args = parser.parse_args()
+    trio.run(main, args.messages, args.telemetry_size)
@@ -13,6 +13,7 @@
 # limitations under the License.
 #
 # SPDX-License-Identifier: Apache-2.0
+from unittest.mock import MagicMock
 
 
 class MockAsyncIterator:
@@ -33,3 +34,12 @@ class MockMQTTMessage:
     def __init__(self, topic, payload):
         self.topic = topic
         self.payload = payload
+
+
+def mock_lease(agent: MagicMock) -> MagicMock:
+    """
+    Mocks Agent.lease, so that it lends `agent`.
+    """
+    lease = MagicMock()
+    lease.return_value.__aenter__.return_value = agent
+    return lease
@@ -0,0 +1,284 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+"""
+Stand-in for the agent of a camera, speaking the EVP1 or EVP2 on-wire
+schema over a local broker. It requests its attributes until answered,
+applies the deployment manifests it receives by downloading the modules
+from their URLs and verifying their hashes, and reports its deployment
+status as it goes, so deployments can be exercised without a camera.
+It can also be run on its own, with:
+
+    python -m tests.mocks.simulated_device --port 1883 --schema EVP2-TB
+"""
+import argparse
+import hashlib
+import logging
+import urllib.request
+from dataclasses import dataclass
+from dataclasses import field
+from fnmatch import fnmatchcase
+from typing import Any
+from typing import Optional
+
+import trio
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.trio_mqtt import MQTTClient
+from local_console.core.camera.enums import MQTTTopics
+from local_console.core.schemas.schemas import OnWireProtocol
+from local_console.utils.json_codec import json_decode
+from local_console.utils.json_codec import json_encode
+from local_console.utils.json_codec import json_encode_str
+
+logger = logging.getLogger(__name__)
+
+ATTRIBUTES_REQUEST = "v1/devices/me/attributes/request/{}"
+ATTRIBUTES_RESPONSES = "v1/devices/me/attributes/response/+"
+DOWNLOAD_CHUNK = 64 * 1024
+
+
+@dataclass
+class DeviceBehavior:
+    """
+    Timing of the simulated device, and the failures to inject. Module
+    and instance names are matched against shell-style patterns, such
+    as "detection-*".
+    """
+
+    # Between status reports, and retries of the attributes request
+    report_interval: float = 1.0
+    # Before downloading each module, and before starting the instances
+    download_delay: float = 0.0
+    start_delay: float = 0.0
+    # Modules whose download fails, or whose download is corrupted
+    fail_downloads: list[str] = field(default_factory=list)
+    corrupt_downloads: list[str] = field(default_factory=list)
+    # Instances which fail to start
+    fail_instances: list[str] = field(default_factory=list)
+    # Number of manifests to ignore, as if they had been lost
+    drop_manifests: int = 0
+
+
+def matches_any(name: str, patterns: list[str]) -> bool:
+    return any(fnmatchcase(name, pattern) for pattern in patterns)
+
+
+class SimulatedDevice:
+    """
+    Connects to the broker at `host`:`port` once run() is started in a
+    nursery. `downloads` counts the modules downloaded, which are not
+    downloaded again by later deployments while their hash is the same.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        onwire_schema: OnWireProtocol,
+        behavior: Optional[DeviceBehavior] = None,
+        client_id: str = "simulated-device",
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.onwire_schema = onwire_schema
+        self.behavior = DeviceBehavior() if behavior is None else behavior
+        self.client_id = client_id
+
+        self.status: dict[str, Any] = {}
+        self.attributes_answered = trio.Event()
+        self.manifests_received = 0
+        self.downloads = 0
+        # Hashes of the modules in the device's cache, by module identifier
+        self.module_cache: dict[str, str] = {}
+        self._client: Optional[MQTTClient] = None
+        self._reconcile_scope = trio.CancelScope()
+
+    async def run(self, *, task_status: Any = trio.TASK_STATUS_IGNORED) -> None:
+        async with trio.open_nursery() as nursery:
+            self._client = MQTTClient(self.client_id, nursery)
+            await self._client.connect(self.host, self.port)
+            await self._client.subscribe(MQTTTopics.ATTRIBUTES.value)
+            await self._client.subscribe(ATTRIBUTES_RESPONSES)
+            nursery.start_soon(self._request_attributes)
+            nursery.start_soon(self._report_periodically)
+            task_status.started()
+
+            async with self._client.messages() as mgen:
+                async for msg in mgen:
+                    await self._handle(msg, nursery)
+            nursery.cancel_scope.cancel()
+
+    async def stop(self) -> None:
+        if self._client:
+            await self._client.disconnect()
+
+    async def _request_attributes(self) -> None:
+        assert self._client
+        request_id = 0
+        while not self.attributes_answered.is_set():
+            request_id += 1
+            await self._client.publish(ATTRIBUTES_REQUEST.format(request_id), "{}")
+            with trio.move_on_after(self.behavior.report_interval):
+                await self.attributes_answered.wait()
+
+    async def _report_periodically(self) -> None:
+        while True:
+            await self.report()
+            await trio.sleep(self.behavior.report_interval)
+
+    async def report(self) -> None:
+        assert self._client
+        status: Any = self.status
+        if self.onwire_schema == OnWireProtocol.EVP1:
+            status = json_encode_str(status)
+        await self._client.publish(
+            MQTTTopics.ATTRIBUTES.value, json_encode({"deploymentStatus": status})
+        )
+
+    async def _handle(self, msg: Message, nursery: trio.Nursery) -> None:
+        if msg.topic.startswith(ATTRIBUTES_RESPONSES[:-1]):
+            self.attributes_answered.set()
+            return
+
+        payload = json_decode(msg.payload)
+        if "deployment" not in payload:
+            # Such as the device's own status reports
+            return
+
+        self.manifests_received += 1
+        if self.manifests_received <= self.behavior.drop_manifests:
+            logger.debug("Dropping deployment manifest")
+            return
+
+        deployment = payload["deployment"]
+        if self.onwire_schema == OnWireProtocol.EVP1:
+            deployment = json_decode(deployment)
+        if deployment["deploymentId"] == self.status.get("deploymentId"):
+            await self.report()
+            return
+
+        # A newer manifest supersedes the one being applied
+        self._reconcile_scope.cancel()
+        self._reconcile_scope = trio.CancelScope()
+        nursery.start_soon(self._reconcile, deployment, self._reconcile_scope)
+
+    async def _reconcile(
+        self, deployment: dict[str, Any], scope: trio.CancelScope
+    ) -> None:
+        with scope:
+            modules = deployment["modules"]
+            instances = deployment["instanceSpecs"]
+            self.status = {
+                "deploymentId": deployment["deploymentId"],
+                "reconcileStatus": "applying",
+                "modules": {name: {"status": "downloading"} for name in modules},
+                "instances": {name: {"status": "unknown"} for name in instances},
+            }
+            await self.report()
+
+            for name, module in modules.items():
+                error = await self._fetch_module(name, module)
+                if error:
+                    self.status["modules"][name] = {
+                        "status": "error",
+                        "failureMessage": error,
+                    }
+                else:
+                    self.status["modules"][name] = {"status": "ok"}
+                await self.report()
+
+            if any(m["status"] == "error" for m in self.status["modules"].values()):
+                return
+
+            await trio.sleep(self.behavior.start_delay)
+            for name in instances:
+                if matches_any(name, self.behavior.fail_instances):
+                    self.status["instances"][name] = {
+                        "status": "error",
+                        "failureMessage": "Injected failure",
+                    }
+                else:
+                    self.status["instances"][name] = {"status": "ok"}
+            if all(i["status"] == "ok" for i in self.status["instances"].values()):
+                self.status["reconcileStatus"] = "ok"
+            await self.report()
+
+    async def _fetch_module(self, name: str, module: dict[str, Any]) -> Optional[str]:
+        """
+        Downloads a module unless cached, returning the reason of the
+        failure to do so, if any.
+        """
+        if self.module_cache.get(name) == module["hash"]:
+            return None
+
+        await trio.sleep(self.behavior.download_delay)
+        if matches_any(name, self.behavior.fail_downloads):
+            return "Injected failure"
+        try:
+            digest = await trio.to_thread.run_sync(
+                download_digest, module["downloadUrl"]
+            )
+        except OSError as e:
+            return f"Download failed: {e}"
+        self.downloads += 1
+        if matches_any(name, self.behavior.corrupt_downloads):
+            digest = hashlib.sha256(digest.encode()).hexdigest()
+        if digest != module["hash"]:
+            return "Hash mismatch"
+
+        self.module_cache[name] = digest
+        return None
+
+
+def download_digest(url: str) -> str:
+    """
+    Downloads the file at `url`, returning its SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    with urllib.request.urlopen(url, timeout=30) as response:
+        while chunk := response.read(DOWNLOAD_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def main(args: argparse.Namespace) -> None:
+    behavior = DeviceBehavior(
+        report_interval=args.report_interval,
+        download_delay=args.download_delay,
+        start_delay=args.start_delay,
+        fail_downloads=args.fail_download,
+        fail_instances=args.fail_instance,
+    )
+    device = SimulatedDevice(
+        args.host, args.port, OnWireProtocol(args.schema), behavior
+    )
+    await device.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument(
+        "--schema", choices=[s.value for s in OnWireProtocol], default="EVP2-TB"
+    )
+    parser.add_argument("--report-interval", type=float, default=1.0)
+    parser.add_argument("--download-delay", type=float, default=0.0)
+    parser.add_argument("--start-delay", type=float, default=0.0)
+    parser.add_argument("--fail-download", action="append", default=[])
+    parser.add_argument("--fail-instance", action="append", default=[])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    trio.run(main, args)
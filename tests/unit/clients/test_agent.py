@@ -14,20 +14,20 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 import base64
-import json
 from unittest.mock import ANY
 from unittest.mock import AsyncMock
-from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
+import trio
 from hypothesis import given
 from hypothesis import strategies as st
 from local_console.clients.agent import Agent
+from local_console.clients.agent import device_outbound_store
+from local_console.clients.mqtt_outbound import FileOutboundStore
 from local_console.core.camera.enums import MQTTTopics
 from local_console.core.schemas.schemas import OnWireProtocol
-from paho.mqtt.client import MQTT_ERR_ERRNO
-from paho.mqtt.client import MQTT_ERR_SUCCESS
+from local_console.utils.json_codec import json_encode
 
 from tests.strategies.configs import generate_text
 
@@ -50,15 +50,13 @@ async def test_configure_instance(
             "local_console.clients.agent.OnWireProtocol.from_iot_spec",
             return_value=onwire_schema,
         ),
-        patch("local_console.clients.agent.paho.Client"),
-        patch("local_console.clients.agent.AsyncClient"),
         patch("local_console.clients.agent.Agent.publish"),
     ):
         agent = Agent(ANY, ANY, ANY)
         async with agent.mqtt_scope([]):
             await agent.configure(instance_id, topic, config)
 
-        payload = json.dumps(
+        payload = json_encode(
             {
                 f"configuration/{instance_id}/{topic}": base64.b64encode(
                     config.encode("utf-8")
@@ -66,10 +64,55 @@ async def test_configure_instance(
             }
         )
         agent.publish.assert_called_once_with(
-            MQTTTopics.ATTRIBUTES.value, payload=payload
+            MQTTTopics.ATTRIBUTES.value, payload=payload, qos=0
         )
 
 
+@pytest.mark.trio
+async def test_configure_many_is_pipelined():
+    agent = Agent(ANY, ANY, OnWireProtocol.EVP2)
+    in_flight = 0
+    most_in_flight = 0
+
+    async def publish(topic: str, payload: str, qos: int) -> None:
+        nonlocal in_flight, most_in_flight
+        assert qos == 1
+        in_flight += 1
+        most_in_flight = max(most_in_flight, in_flight)
+        await trio.sleep(0.01)
+        in_flight -= 1
+
+    agent.publish = AsyncMock(side_effect=publish)
+    await agent.configure_many((f"instance-{i}", "t", "{}") for i in range(10))
+
+    assert agent.publish.await_count == 10
+    assert most_in_flight == 10
+
+
+def test_persisted_outbound_store(tmp_path):
+    with patch(
+        "local_console.clients.agent.outbound_store_path",
+        side_effect=lambda host, port: tmp_path / f"{port}.jsonl",
+    ):
+        owned = device_outbound_store("localhost", 1883)
+        # Held by the owner of the device's session
+        busy = device_outbound_store("localhost", 1883)
+        other = device_outbound_store("localhost", 1884)
+
+    assert isinstance(owned, FileOutboundStore)
+    assert not busy.persistent
+    assert isinstance(other, FileOutboundStore)
+    owner = Agent("localhost", 1883, OnWireProtocol.EVP2, outbound=owned)
+    # So that the broker resumes the session
+    assert owner.client_id == "cli-client-1883"
+    # Other agents do not take the owner's session over
+    borrower = Agent("localhost", 1883, OnWireProtocol.EVP2)
+    assert not borrower.outbound.persistent
+    assert borrower.client_id != owner.client_id
+    owned.close()
+    other.close()
+
+
 @given(generate_text(), st.sampled_from(OnWireProtocol))
 @pytest.mark.trio
 async def test_rpc(instance_id: str, onwire_schema: OnWireProtocol):
@@ -78,19 +121,15 @@ async def test_rpc(instance_id: str, onwire_schema: OnWireProtocol):
             "local_console.clients.agent.OnWireProtocol.from_iot_spec",
             return_value=onwire_schema,
         ),
-        patch("local_console.clients.agent.paho.Client"),
-        patch("local_console.clients.agent.AsyncClient"),
     ):
         method = "$agent/set"
         params = '{"log_enable": true}'
         agent = Agent(ANY, ANY, ANY)
         async with agent.mqtt_scope([]):
-            agent.client.publish_and_wait = AsyncMock(
-                return_value=(MQTT_ERR_SUCCESS, None)
-            )
+            agent.client.publish = AsyncMock()
             await agent.rpc(instance_id, method, params)
 
-        agent.client.publish_and_wait.assert_called_once()
+        agent.client.publish.assert_awaited_once()
 
 
 @given(generate_text(), st.sampled_from(OnWireProtocol))
@@ -101,29 +140,96 @@ async def test_rpc_error(instance_id: str, onwire_schema: OnWireProtocol):
             "local_console.clients.agent.OnWireProtocol.from_iot_spec",
             return_value=onwire_schema,
         ),
-        patch("local_console.clients.agent.paho.Client"),
-        patch("local_console.clients.agent.AsyncClient"),
     ):
         method = "$agent/set"
         params = '{"log_enable": true}'
         agent = Agent(ANY, ANY, ANY)
         async with agent.mqtt_scope([]):
-            agent.client.publish_and_wait = AsyncMock(
-                return_value=(MQTT_ERR_ERRNO, None)
-            )
+            agent.client.publish = AsyncMock(side_effect=ConnectionError)
             with pytest.raises(ConnectionError):
                 await agent.rpc(instance_id, method, params)
 
-        agent.client.publish_and_wait.assert_called_once()
+        agent.client.publish.assert_awaited_once()
 
 
 @pytest.mark.trio
 async def test_connection():
-    mock_client = MagicMock()
-    with patch("local_console.clients.agent.AsyncClient", return_value=mock_client):
+    mock_client = AsyncMock()
+    with patch("local_console.clients.agent.MQTTClient", return_value=mock_client):
         mock_client.connect.side_effect = OSError
         agent = Agent(ANY, ANY, ANY)
-        print(mock_client)
         with pytest.raises(SystemExit):
             async with agent.mqtt_scope([]):
                 pass
+
+
+@pytest.mark.trio
+async def test_lease_borrows_live_session():
+    owner = Agent("localhost", 1883, OnWireProtocol.EVP2)
+    async with owner.mqtt_scope([MQTTTopics.ATTRIBUTES.value], lend=True):
+        assert owner.client
+        owner.client.connected = True
+        async with Agent.lease(
+            "localhost",
+            1883,
+            OnWireProtocol.EVP2,
+            [MQTTTopics.ATTRIBUTES.value, MQTTTopics.RPC_RESPONSES.value],
+            handshake=True,
+        ) as agent:
+            assert agent is owner
+
+        # Only the topic that was not subscribed yet, and only once
+        assert [c.args for c in owner.client.subscribe.await_args_list] == [
+            (MQTTTopics.ATTRIBUTES.value,),
+            (MQTTTopics.RPC_RESPONSES.value,),
+        ]
+        owner.client.unsubscribe.assert_awaited_once_with(
+            MQTTTopics.RPC_RESPONSES.value
+        )
+        owner.client.connect.assert_awaited_once()
+
+
+@pytest.mark.trio
+async def test_lease_opens_own_session():
+    with patch.object(Agent, "initialize_handshake") as mock_handshake:
+        async with Agent.lease("localhost", 1883, OnWireProtocol.EVP2) as first:
+            # Nobody reads the messages of this session, so it is not lent
+            async with Agent.lease("localhost", 1883, OnWireProtocol.EVP2) as second:
+                assert second is not first
+            mock_handshake.assert_not_awaited()
+
+        async with Agent.lease(
+            "localhost", 1883, OnWireProtocol.EVP2, handshake=True
+        ) as third:
+            assert third is not first
+            mock_handshake.assert_awaited_once()
+
+
+@pytest.mark.trio
+async def test_owner_waits_for_borrowers(nursery):
+    owner = Agent("localhost", 1883, OnWireProtocol.EVP2)
+    borrowed = trio.Event()
+
+    async def borrow() -> None:
+        async with Agent.lease(
+            "localhost", 1883, OnWireProtocol.EVP2, [MQTTTopics.RPC_RESPONSES.value]
+        ) as agent:
+            assert agent is owner
+            borrowed.set()
+            # Meanwhile, the owner is leaving
+            await trio.sleep(0.1)
+            assert agent.client
+            agent.client.disconnect.assert_not_awaited()
+
+    with trio.CancelScope() as owner_scope:
+        async with owner.mqtt_scope([], lend=True):
+            client = owner.client
+            assert client
+            client.connected = True
+            nursery.start_soon(borrow)
+            await borrowed.wait()
+            owner_scope.cancel()
+            await trio.sleep_forever()
+
+    client.unsubscribe.assert_awaited_once_with(MQTTTopics.RPC_RESPONSES.value)
+    client.disconnect.assert_awaited_once()
@@ -0,0 +1,103 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+import trio
+from local_console.clients.mqtt_capture import CaptureError
+from local_console.clients.mqtt_capture import read_capture
+from local_console.clients.mqtt_capture import TrafficRecorder
+from local_console.clients.mqtt_capture import TrafficReplayer
+from local_console.clients.mqtt_codec import Message
+
+MESSAGES = [
+    Message("v1/devices/me/attributes", b'{"systemInfo": {}}', qos=1, retain=True),
+    Message("v1/devices/me/telemetry", b"\x00" * 1024),
+    Message("v1/devices/me/attributes/request/1", b"{}", qos=2),
+]
+
+
+def record(path: Path, offsets: list[float]) -> None:
+    with (
+        TrafficRecorder(path) as recorder,
+        patch("local_console.clients.mqtt_capture.time.monotonic") as monotonic,
+    ):
+        for offset, message in zip(offsets, MESSAGES):
+            monotonic.return_value = recorder._origin + offset
+            recorder.record(message)
+
+
+def test_roundtrip(tmp_path: Path):
+    path = tmp_path / "traffic.mqtt"
+    record(path, [0.0, 0.5, 2.0])
+
+    captured = list(read_capture(path))
+    assert [c.message for c in captured] == MESSAGES
+    assert [c.offset for c in captured] == [0.0, 0.5, 2.0]
+
+
+def test_appends_to_existing_capture(tmp_path: Path):
+    path = tmp_path / "traffic.mqtt"
+    record(path, [0.0])
+    with TrafficRecorder(path) as recorder:
+        recorder.record(MESSAGES[1])
+
+    captured = list(read_capture(path))
+    assert [c.message for c in captured] == MESSAGES[:2]
+    assert captured[1].offset >= 0
+
+
+def test_truncated_record_ends_capture(tmp_path: Path, caplog):
+    path = tmp_path / "traffic.mqtt"
+    record(path, [0.0, 0.5])
+    path.write_bytes(path.read_bytes()[:-10])
+
+    assert [c.message for c in read_capture(path)] == MESSAGES[:1]
+    assert "truncated record" in caplog.text
+
+
+def test_not_a_capture(tmp_path: Path):
+    path = tmp_path / "traffic.mqtt"
+    path.write_text("{}")
+    with pytest.raises(CaptureError):
+        list(read_capture(path))
+    with pytest.raises(CaptureError):
+        TrafficRecorder(path)
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("speed, duration", [(1.0, 2.0), (4.0, 0.5), (None, 0.0)])
+async def test_replay_timing(tmp_path: Path, autojump_clock, speed, duration):
+    path = tmp_path / "traffic.mqtt"
+    # The timing is relative to the first message
+    record(path, [10.0, 10.5, 12.0])
+    delivered = []
+
+    async def deliver(message: Message) -> None:
+        delivered.append((trio.current_time(), message))
+
+    stats = await TrafficReplayer(read_capture(path), deliver, speed).run()
+
+    assert [m for _, m in delivered] == MESSAGES
+    assert delivered[-1][0] - delivered[0][0] == pytest.approx(duration)
+    assert stats.messages == 3
+    assert stats.elapsed == pytest.approx(duration)
+
+
+def test_invalid_speed():
+    with pytest.raises(ValueError):
+        TrafficReplayer([], trio.lowlevel.checkpoint, 0)
@@ -0,0 +1,208 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+from local_console.clients.mqtt_codec import decode_ack
+from local_console.clients.mqtt_codec import decode_connack
+from local_console.clients.mqtt_codec import decode_connect
+from local_console.clients.mqtt_codec import decode_publish
+from local_console.clients.mqtt_codec import decode_suback
+from local_console.clients.mqtt_codec import decode_subscribe
+from local_console.clients.mqtt_codec import decode_varint
+from local_console.clients.mqtt_codec import encode_ack
+from local_console.clients.mqtt_codec import encode_connack
+from local_console.clients.mqtt_codec import encode_connect
+from local_console.clients.mqtt_codec import encode_publish
+from local_console.clients.mqtt_codec import encode_publish_header
+from local_console.clients.mqtt_codec import encode_suback
+from local_console.clients.mqtt_codec import encode_subscribe
+from local_console.clients.mqtt_codec import encode_varint
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_codec import MQTTProtocolError
+from local_console.clients.mqtt_codec import MQTTVersion
+from local_console.clients.mqtt_codec import Packet
+from local_console.clients.mqtt_codec import PacketReader
+from local_console.clients.mqtt_codec import PacketType
+
+topics = st.text(
+    alphabet=st.characters(blacklist_categories=("Cs",), blacklist_characters="\0"),
+    min_size=1,
+    max_size=50,
+)
+
+
+@given(st.integers(min_value=0, max_value=268_435_455))
+def test_varint_roundtrip(value: int):
+    encoded = encode_varint(value)
+    assert len(encoded) <= 4
+    assert decode_varint(encoded) == (value, len(encoded))
+
+
+def test_varint_out_of_range():
+    with pytest.raises(MQTTProtocolError):
+        encode_varint(268_435_456)
+
+
+def test_varint_incomplete():
+    with pytest.raises(IndexError):
+        decode_varint(b"\x80\x80")
+
+
+@given(
+    topics,
+    st.binary(max_size=1024),
+    st.sampled_from([0, 1, 2]),
+    st.booleans(),
+    st.integers(min_value=1, max_value=0xFFFF),
+    st.sampled_from(MQTTVersion),
+)
+def test_publish_roundtrip(
+    topic: str,
+    payload: bytes,
+    qos: int,
+    retain: bool,
+    packet_id: int,
+    version: MQTTVersion,
+):
+    message = Message(topic, payload, qos, retain, packet_id=packet_id if qos else 0)
+    packets = PacketReader().feed(encode_publish(message, version))
+
+    assert len(packets) == 1
+    assert packets[0].type == PacketType.PUBLISH
+    assert decode_publish(packets[0], version) == message
+
+
+@given(st.binary(max_size=70_000), st.sampled_from([0, 1]))
+def test_publish_header(payload: bytes, qos: int):
+    message = Message("a/b", payload, qos, packet_id=qos)
+    header = encode_publish_header(message, MQTTVersion.V5)
+
+    assert header + payload == encode_publish(message, MQTTVersion.V5)
+    # Fixed header, topic, packet identifier and properties only
+    assert len(header) <= 1 + 3 + 5 + 2 + 1
+
+
+@given(st.binary(min_size=1, max_size=4096), st.integers(min_value=1, max_value=64))
+def test_reader_reassembles_fragments(payload: bytes, chunk: int):
+    data = encode_publish(Message("a/b", payload)) + encode_ack(PacketType.PUBACK, 7)
+    reader = PacketReader()
+    packets = []
+    for i in range(0, len(data), chunk):
+        packets += reader.feed(data[i : i + chunk])
+
+    assert [p.type for p in packets] == [PacketType.PUBLISH, PacketType.PUBACK]
+    assert decode_publish(packets[0], MQTTVersion.V311).payload == payload
+    assert decode_ack(packets[1]) == (7, 0)
+
+
+def test_reader_rejects_oversized_packet():
+    reader = PacketReader(max_packet_size=10)
+    with pytest.raises(MQTTProtocolError):
+        reader.feed(encode_publish(Message("topic", b"x" * 32)))
+
+
+def test_reader_rejects_invalid_type():
+    with pytest.raises(MQTTProtocolError):
+        PacketReader().feed(b"\x00\x00")
+
+
+@pytest.mark.parametrize("version", list(MQTTVersion))
+def test_connect(version: MQTTVersion):
+    packet = PacketReader().feed(encode_connect("client", 30, version, True, "u"))[0]
+
+    assert packet.type == PacketType.CONNECT
+    assert packet.body[:6] == b"\x00\x04MQTT"
+    assert packet.body[6] == version
+    assert packet.body[7] == 0x82
+    assert packet.body[8:10] == b"\x00\x1e"
+    assert packet.body.endswith(b"\x00\x06client\x00\x01u")
+
+
+@pytest.mark.parametrize("version", list(MQTTVersion))
+def test_decode_connect(version: MQTTVersion):
+    data = encode_connect("client", 30, version, True, "user", "secret")
+    connect = decode_connect(PacketReader().feed(data)[0])
+
+    assert (connect.client_id, connect.version, connect.keepalive) == (
+        "client",
+        version,
+        30,
+    )
+    assert (connect.username, connect.password) == ("user", b"secret")
+    assert connect.will is None
+
+
+def test_decode_connect_unsupported_protocol():
+    packet = PacketReader().feed(encode_connect("client", 30))[0]
+    packet.body = packet.body[:6] + b"\x03" + packet.body[7:]
+    with pytest.raises(MQTTProtocolError):
+        decode_connect(packet)
+
+
+@pytest.mark.parametrize("version", list(MQTTVersion))
+def test_subscribe_roundtrip(version: MQTTVersion):
+    topics = [("a/+", 1), ("b/#", 0)]
+    packet = PacketReader().feed(encode_subscribe(7, topics, version))[0]
+    assert decode_subscribe(packet, version) == (7, topics)
+
+    suback = PacketReader().feed(encode_suback(7, [1, 0x80], version))[0]
+    assert decode_suback(suback, version) == (7, [1, 0x80])
+
+
+@pytest.mark.parametrize("version", list(MQTTVersion))
+def test_connack_roundtrip(version: MQTTVersion):
+    packet = PacketReader().feed(encode_connack(False, 0, version))[0]
+    assert decode_connack(packet, version) == (False, 0)
+
+
+def test_subscribe():
+    data = encode_subscribe(3, [("a/+", 1)], MQTTVersion.V5)
+    packet = PacketReader().feed(data)[0]
+
+    assert packet.type == PacketType.SUBSCRIBE
+    assert packet.flags == 0x02
+    assert packet.body == b"\x00\x03\x00\x00\x03a/+\x01"
+
+
+def test_pubrel_flags():
+    packet = PacketReader().feed(encode_ack(PacketType.PUBREL, 1))[0]
+    assert packet.flags == 0x02
+
+
+@pytest.mark.parametrize(
+    "version, body, expected",
+    [
+        (MQTTVersion.V311, b"\x00\x05\x00\x01", (5, [0, 1])),
+        (MQTTVersion.V5, b"\x00\x05\x00\x80", (5, [0x80])),
+        (MQTTVersion.V311, b"\x00\x05", (5, [])),
+    ],
+)
+def test_decode_suback(version: MQTTVersion, body: bytes, expected):
+    assert decode_suback(Packet(PacketType.SUBACK, 0, body), version) == expected
+
+
+def test_decode_connack():
+    packet = Packet(PacketType.CONNACK, 0, b"\x01\x05")
+    assert decode_connack(packet, MQTTVersion.V311) == (True, 5)
+
+    with pytest.raises(MQTTProtocolError):
+        decode_connack(Packet(PacketType.CONNACK, 0, b""), MQTTVersion.V311)
+
+
+def test_decode_publish_invalid_qos():
+    with pytest.raises(MQTTProtocolError):
+        decode_publish(Packet(PacketType.PUBLISH, 0x06, b"\x00\x01a"), MQTTVersion.V5)
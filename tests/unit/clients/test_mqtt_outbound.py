@@ -0,0 +1,83 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+from pathlib import Path
+
+import pytest
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_outbound import FileOutboundStore
+from local_console.clients.mqtt_outbound import OutboundStoreError
+
+
+def test_pending_messages_survive_restart(tmp_path: Path):
+    path = tmp_path / "outbound.log"
+    store = FileOutboundStore(path)
+    for packet_id in (1, 2, 3):
+        store.add(Message(f"t/{packet_id}", b"\x00\xff", 2, False, False, packet_id))
+    store.mark_sent(1)
+    store.mark_sent(2)
+    store.release(2)
+    store.remove(3)
+    store.close()
+
+    store = FileOutboundStore(path)
+    assert [m.packet_id for m in store] == [1, 2]
+    assert [m.dup for m in store] == [True, True]
+    assert store.is_released(2)
+    assert not store.is_released(1)
+    assert next(iter(store)).payload == b"\x00\xff"
+    store.close()
+
+    # Compacted on load
+    assert len(path.read_text().splitlines()) == 3
+
+
+def test_torn_record_is_skipped(tmp_path: Path, caplog):
+    path = tmp_path / "outbound.log"
+    store = FileOutboundStore(path)
+    store.add(Message("t", b"x", 1, False, False, 7))
+    store.close()
+    with path.open("a") as log:
+        log.write('{"op": "del", "i')
+
+    store = FileOutboundStore(path)
+    assert 7 in store
+    assert "Skipping corrupt record" in caplog.text
+    store.close()
+
+
+def test_log_is_compacted_while_in_use(tmp_path: Path):
+    path = tmp_path / "outbound.log"
+    store = FileOutboundStore(path, compact_records=10)
+    for packet_id in range(1, 100):
+        store.add(Message("t", b"x", 1, False, False, packet_id))
+        store.remove(packet_id)
+    store.add(Message("t", b"x", 1, False, False, 100))
+
+    assert len(path.read_text().splitlines()) <= 10
+    store.close()
+    store = FileOutboundStore(path)
+    assert [m.packet_id for m in store] == [100]
+    store.close()
+
+
+def test_store_is_locked_until_closed(tmp_path: Path):
+    path = tmp_path / "outbound.log"
+    store = FileOutboundStore(path)
+    with pytest.raises(OutboundStoreError):
+        FileOutboundStore(path)
+    store.close()
+
+    FileOutboundStore(path).close()
@@ -0,0 +1,149 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+
+import pytest
+import trio
+from local_console.clients.agent import attribute_keys
+from local_console.clients.agent import RECEIVE_QUEUES
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_queues import DropPolicy
+from local_console.clients.mqtt_queues import MessageQueues
+from local_console.clients.mqtt_queues import QueueSpec
+from local_console.clients.mqtt_queues import topic_matches
+
+
+def drain(queues: MessageQueues) -> list[bytes]:
+    payloads = []
+    while True:
+        try:
+            payloads.append(queues.receive_nowait().payload)
+        except (trio.WouldBlock, trio.EndOfChannel):
+            return payloads
+
+
+@pytest.mark.parametrize(
+    "topic_filter, topic, expected",
+    [
+        ("a/b", "a/b", True),
+        ("a/b", "a/c", False),
+        ("a/+", "a/b", True),
+        ("a/+", "a/b/c", False),
+        ("a/#", "a/b/c", True),
+        ("a/#", "a", True),
+        ("#", "x/y", True),
+        ("+/b", "a/b", True),
+        ("a/b/c", "a/b", False),
+    ],
+)
+def test_topic_matches(topic_filter: str, topic: str, expected: bool):
+    assert topic_matches(topic_filter, topic) == expected
+
+
+def test_drop_oldest():
+    queues = MessageQueues([QueueSpec("t", capacity=2)])
+    for i in range(4):
+        queues.put(Message("t", str(i).encode()))
+
+    assert drain(queues) == [b"2", b"3"]
+    assert queues.dropped == {"t": 2}
+
+
+def test_drop_newest():
+    queues = MessageQueues([QueueSpec("t", capacity=2, policy=DropPolicy.DROP_NEWEST)])
+    for i in range(4):
+        queues.put(Message("t", str(i).encode()))
+
+    assert drain(queues) == [b"0", b"1"]
+    assert queues.dropped == {"t": 2}
+
+
+def test_coalesce_by_key():
+    spec = QueueSpec(
+        "t/+",
+        capacity=2,
+        policy=DropPolicy.COALESCE,
+        coalesce_key=lambda m: m.topic,
+    )
+    queues = MessageQueues([spec])
+    queues.put(Message("t/a", b"a1"))
+    queues.put(Message("t/b", b"b1"))
+    queues.put(Message("t/a", b"a2"))
+    # No key to coalesce with: falls back to dropping the oldest
+    queues.put(Message("t/c", b"c1"))
+
+    assert drain(queues) == [b"a2", b"c1"]
+    assert queues.dropped == {"t/+": 2}
+
+
+def test_flood_does_not_evict_other_topics():
+    queues = MessageQueues(RECEIVE_QUEUES)
+    status = json.dumps({"deploymentStatus": {"reconcileStatus": "ok"}})
+    queues.put(Message("v1/devices/me/attributes", status.encode()))
+    for i in range(1000):
+        queues.put(Message("v1/devices/me/telemetry", str(i).encode()))
+    queues.put(Message("v1/devices/me/attributes/request/7", b"{}"))
+
+    received = [queues.receive_nowait() for _ in range(3)]
+    assert [m.topic for m in received] == [
+        "v1/devices/me/attributes/request/7",
+        "v1/devices/me/attributes",
+        "v1/devices/me/telemetry",
+    ]
+    assert received[2].payload == b"900"
+    assert queues.dropped == {"v1/devices/me/telemetry": 900}
+
+
+def test_equal_priority_keeps_arrival_order():
+    queues = MessageQueues([QueueSpec("a"), QueueSpec("b")])
+    for topic in ("b", "a", "b", "a"):
+        queues.put(Message(topic, topic.encode()))
+    queues.put(Message("other", b"other"))
+
+    assert drain(queues) == [b"b", b"a", b"b", b"a", b"other"]
+
+
+def test_attribute_keys():
+    report = Message("t", json.dumps({"a": 1, "b": 2}).encode())
+    assert attribute_keys(report) == frozenset({"a", "b"})
+    assert attribute_keys(Message("t", b"not json")) is None
+    assert attribute_keys(Message("t", b"[1]")) is None
+
+
+def test_invalid_capacity():
+    with pytest.raises(ValueError):
+        MessageQueues([QueueSpec("t", capacity=0)])
+
+
+@pytest.mark.trio
+async def test_receive_waits_and_ends_on_close():
+    queues = MessageQueues()
+    received = []
+
+    async def consume() -> None:
+        async for message in queues:
+            received.append(message.payload)
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(consume)
+        await trio.sleep(0.01)
+        queues.put(Message("t", b"1"))
+        queues.put(Message("t", b"2"))
+        queues.close()
+
+    assert received == [b"1", b"2"]
+    with pytest.raises(trio.ClosedResourceError):
+        queues.put(Message("t", b"3"))
@@ -0,0 +1,133 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+from unittest.mock import AsyncMock
+from unittest.mock import patch
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_queues import topic_matches
+from local_console.clients.mqtt_router import MAX_CACHED_TOPICS
+from local_console.clients.mqtt_router import TopicRouter
+
+levels = st.lists(st.sampled_from(["a", "b", "c"]), min_size=1, max_size=4)
+
+
+@given(
+    st.lists(st.sampled_from(["a", "b", "+", "#"]), min_size=1, max_size=4),
+    levels,
+)
+def test_matches_like_topic_matches(filter_levels: list[str], topic_levels: list[str]):
+    # '#' is only valid as the last level
+    if "#" in filter_levels:
+        filter_levels = filter_levels[: filter_levels.index("#") + 1]
+    topic_filter = "/".join(filter_levels)
+    topic = "/".join(topic_levels)
+    router = TopicRouter()
+    router.add_handler(topic_filter, AsyncMock())
+
+    assert bool(router.routes_for(topic)) == topic_matches(topic_filter, topic)
+
+
+def test_system_topics_skip_leading_wildcards():
+    router = TopicRouter()
+    router.add_handler("#", AsyncMock())
+    router.add_handler("+/broker/load", AsyncMock())
+    router.add_handler("$SYS/#", AsyncMock())
+
+    assert [r.topic_filter for r in router.routes_for("$SYS/broker/load")] == ["$SYS/#"]
+
+
+@pytest.mark.trio
+async def test_dispatch_in_registration_order():
+    calls = []
+
+    def recorder(name: str) -> AsyncMock:
+        return AsyncMock(side_effect=lambda topic, payload: calls.append(name))
+
+    router = TopicRouter()
+    router.add_handler("a/#", recorder("wildcard"))
+    router.add_handler("a/b", recorder("exact"))
+    router.add_handler("a/+", recorder("single"))
+
+    assert await router.dispatch(Message("a/b", b"{}")) == 3
+    assert calls == ["wildcard", "exact", "single"]
+
+
+@pytest.mark.trio
+async def test_dispatch_by_key():
+    state = AsyncMock()
+    status = AsyncMock()
+    router = TopicRouter()
+    router.add_handler("attrs", state, key="state")
+    router.add_handler("attrs", status, key="status")
+
+    assert await router.dispatch(Message("attrs", b'{"status": 1}')) == 1
+    state.assert_not_awaited()
+    status.assert_awaited_once_with("attrs", {"status": 1})
+
+    assert await router.dispatch(Message("attrs", b"[1, 2]")) == 0
+
+
+@pytest.mark.trio
+async def test_decodes_lazily_and_once():
+    raw = AsyncMock()
+    decoded = [AsyncMock(), AsyncMock()]
+    router = TopicRouter()
+    router.add_handler("raw", raw, decode=False)
+    for handler in decoded:
+        router.add_handler("json", handler)
+
+    with patch("local_console.clients.mqtt_router.json_decode") as mock_loads:
+        await router.dispatch(Message("raw", b"not json"))
+        await router.dispatch(Message("other", b"not json"))
+        mock_loads.assert_not_called()
+
+        await router.dispatch(Message("json", b"{}"))
+        mock_loads.assert_called_once_with(b"{}")
+
+    raw.assert_awaited_once_with("raw", b"not json")
+
+
+@pytest.mark.trio
+async def test_invalid_json_skips_decoding_routes(caplog):
+    raw = AsyncMock()
+    decoded = AsyncMock()
+    router = TopicRouter()
+    router.add_handler("t", decoded)
+    router.add_handler("t", raw, decode=False)
+
+    assert await router.dispatch(Message("t", b"{")) == 1
+    decoded.assert_not_awaited()
+    raw.assert_awaited_once()
+    assert "Discarding non-JSON payload on t" in caplog.text
+
+
+def test_key_requires_decoding():
+    with pytest.raises(ValueError):
+        TopicRouter().add_handler("t", AsyncMock(), key="k", decode=False)
+
+
+def test_route_table_is_bounded_and_refreshed():
+    router = TopicRouter()
+    router.add_handler("req/+", AsyncMock())
+    for i in range(MAX_CACHED_TOPICS + 1):
+        router.routes_for(f"req/{i}")
+    assert len(router._table) <= MAX_CACHED_TOPICS
+
+    router.add_handler("req/#", AsyncMock())
+    assert len(router.routes_for("req/1")) == 2
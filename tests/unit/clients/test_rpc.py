@@ -0,0 +1,142 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+import random
+from unittest.mock import ANY
+from unittest.mock import AsyncMock
+
+import pytest
+import trio
+from local_console.clients.agent import Agent
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_router import TopicRouter
+from local_console.clients.rpc import PendingRPCs
+from local_console.clients.rpc import RPCTimeoutError
+from local_console.core.camera.enums import MQTTTopics
+from local_console.core.schemas.schemas import OnWireProtocol
+from trio.testing import wait_all_tasks_blocked
+
+
+@pytest.mark.trio
+async def test_resolve_by_topic():
+    table = PendingRPCs()
+    call = table.register("12")
+    await table.resolve("v1/devices/me/rpc/response/12", {"status": "ok"})
+
+    assert await call == {"status": "ok"}
+    assert len(table) == 0
+
+
+@pytest.mark.trio
+async def test_resolve_by_evp2_body():
+    table = PendingRPCs()
+    call = table.register("12")
+    body = {"reqid": "12", "status": "ok", "response": "{}"}
+    await table.resolve(
+        "v1/devices/me/rpc/response/0", {"direct-command-response": body}
+    )
+
+    assert await call == body
+
+
+@pytest.mark.trio
+async def test_unknown_response_is_discarded():
+    table = PendingRPCs()
+    call = table.register("1")
+    await table.resolve("v1/devices/me/rpc/response/2", {})
+
+    assert not call.done
+    assert "1" in table
+
+
+@pytest.mark.trio
+async def test_timeout_cleans_up(autojump_clock):
+    table = PendingRPCs()
+    call = table.register("1", timeout=5)
+    with pytest.raises(RPCTimeoutError):
+        await call
+    assert trio.current_time() == pytest.approx(5)
+    assert len(table) == 0
+
+
+@pytest.mark.trio
+async def test_unawaited_requests_expire(autojump_clock):
+    table = PendingRPCs()
+    table.register("1", timeout=1)
+    table.register("2", timeout=10)
+    await trio.sleep(2)
+    table.register("3")
+
+    assert "1" not in table
+    assert "2" in table
+    with pytest.raises(ValueError):
+        table.register("2")
+
+
+@pytest.mark.trio
+async def test_late_responses_expire_their_request(autojump_clock):
+    table = PendingRPCs()
+    call = table.register("1", timeout=1)
+    table.register("2", timeout=1)
+    await trio.sleep(2)
+    await table.resolve("v1/devices/me/rpc/response/1", {"status": "ok"})
+
+    assert not call.done
+    assert len(table) == 0
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("onwire_schema", list(OnWireProtocol))
+async def test_concurrent_rpcs(onwire_schema: OnWireProtocol):
+    agent = Agent(ANY, ANY, onwire_schema)
+    router = TopicRouter()
+    router.add_handler(MQTTTopics.RPC_RESPONSES.value, agent.rpc_requests.resolve)
+    requests: list[str] = []
+    agent.publish = AsyncMock(side_effect=lambda topic, payload: requests.append(topic))
+    responses = {}
+
+    async def call(i: int) -> None:
+        pending = await agent.rpc(f"instance-{i}", "method", "{}")
+        responses[pending.reqid] = await pending
+
+    async with trio.open_nursery() as nursery:
+        for i in range(100):
+            nursery.start_soon(call, i)
+        await wait_all_tasks_blocked()
+        assert len(agent.rpc_requests) == 100
+
+        # The device answers in any order
+        random.shuffle(requests)
+        for topic in requests:
+            reqid = topic.rsplit("/", 1)[-1]
+            response = json.dumps({"reqid": reqid}).encode()
+            await router.dispatch(
+                Message(f"v1/devices/me/rpc/response/{reqid}", response)
+            )
+
+    assert len(responses) == 100
+    assert all(response["reqid"] == reqid for reqid, response in responses.items())
+    assert len(agent.rpc_requests) == 0
+
+
+@pytest.mark.trio
+async def test_failed_publish_is_not_pending():
+    agent = Agent(ANY, ANY, OnWireProtocol.EVP2)
+    agent.publish = AsyncMock(side_effect=ConnectionError)
+    with pytest.raises(ConnectionError):
+        await agent.rpc("instance", "method", "{}")
+
+    assert len(agent.rpc_requests) == 0
@@ -0,0 +1,392 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import socket
+import struct
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from contextlib import nullcontext
+from functools import partial
+from typing import Optional
+from unittest.mock import AsyncMock
+
+import pytest
+import trio
+from local_console.clients.mqtt_codec import decode_ack
+from local_console.clients.mqtt_codec import decode_publish
+from local_console.clients.mqtt_codec import encode_ack
+from local_console.clients.mqtt_codec import encode_publish
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_codec import MQTTProtocolError
+from local_console.clients.mqtt_codec import MQTTVersion
+from local_console.clients.mqtt_codec import Packet
+from local_console.clients.mqtt_codec import PacketReader
+from local_console.clients.mqtt_codec import PacketType
+from local_console.clients.mqtt_outbound import FileOutboundStore
+from local_console.clients.trio_mqtt import LARGE_PAYLOAD
+from local_console.clients.trio_mqtt import MQTTClient
+from local_console.clients.trio_mqtt import MQTTConnectionError
+
+
+class FakeBroker:
+    """
+    Answers a single client connection, echoing back every
+    message the client publishes.
+    """
+
+    def __init__(self, version: MQTTVersion, connack_code: int = 0) -> None:
+        self.version = version
+        self.connack_code = connack_code
+        self.answer_pings = True
+        self.received: list[Packet] = []
+        self.stream: Optional[trio.SocketStream] = None
+        self.send_lock = trio.Lock()
+        # Set once the client has closed its end of the connection
+        self.client_closed = trio.Event()
+
+    def received_types(self) -> list[PacketType]:
+        return [p.type for p in self.received]
+
+    async def send(self, data: bytes) -> None:
+        assert self.stream
+        async with self.send_lock:
+            await self.stream.send_all(data)
+
+    async def handle(self, stream: trio.SocketStream) -> None:
+        self.stream = stream
+        reader = PacketReader()
+        try:
+            async for data in stream:
+                for packet in reader.feed(data):
+                    self.received.append(packet)
+                    await self.answer(packet)
+        except trio.ClosedResourceError:
+            # Closed by answer()
+            pass
+        self.client_closed.set()
+
+    async def answer(self, packet: Packet) -> None:
+        body = packet.body
+        if packet.type == PacketType.CONNECT:
+            await self.send(bytes([0x20, 2, 0, self.connack_code]))
+        elif packet.type == PacketType.SUBSCRIBE:
+            packet_id = body[:2]
+            reason = b"\x00" if self.version == MQTTVersion.V5 else b""
+            await self.send(
+                bytes([0x90, 3 + len(reason)]) + packet_id + reason + b"\x01"
+            )
+        elif packet.type == PacketType.PUBLISH:
+            message = decode_publish(packet, self.version)
+            if message.qos == 1:
+                await self.send(encode_ack(PacketType.PUBACK, message.packet_id))
+            elif message.qos == 2:
+                await self.send(encode_ack(PacketType.PUBREC, message.packet_id))
+            await self.send(
+                encode_publish(Message(message.topic, message.payload), self.version)
+            )
+        elif packet.type == PacketType.PUBREL:
+            (packet_id,) = struct.unpack("!H", body)
+            await self.send(encode_ack(PacketType.PUBCOMP, packet_id))
+        elif packet.type == PacketType.PINGREQ and self.answer_pings:
+            await self.send(bytes([0xD0, 0]))
+        elif packet.type == PacketType.DISCONNECT:
+            await self.stream.aclose()
+
+
+async def serve(broker: FakeBroker, nursery: trio.Nursery) -> int:
+    listeners = await nursery.start(
+        partial(trio.serve_tcp, broker.handle, 0, host="127.0.0.1")
+    )
+    return listeners[0].socket.getsockname()[1]
+
+
+@asynccontextmanager
+async def connected_client(
+    broker: FakeBroker, **kwargs
+) -> AsyncIterator[tuple[MQTTClient, trio.Nursery]]:
+    async with trio.open_nursery() as nursery:
+        port = await serve(broker, nursery)
+        client = MQTTClient("test-client", nursery, broker.version, **kwargs)
+        await client.connect("127.0.0.1", port)
+        yield client, nursery
+        await client.disconnect()
+        nursery.cancel_scope.cancel()
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("version", list(MQTTVersion))
+async def test_publish_and_receive(version: MQTTVersion):
+    broker = FakeBroker(version)
+    async with connected_client(broker) as (client, _):
+        assert client.connected
+        assert await client.subscribe("a/#", qos=1) == 1
+
+        for qos in (0, 1, 2):
+            await client.publish(f"a/{qos}", f"payload {qos}", qos=qos)
+
+        async with client.messages() as mgen:
+            received = [await mgen.receive() for _ in range(3)]
+
+    assert [(m.topic, m.payload) for m in received] == [
+        ("a/0", b"payload 0"),
+        ("a/1", b"payload 1"),
+        ("a/2", b"payload 2"),
+    ]
+    assert broker.received_types() == [
+        PacketType.CONNECT,
+        PacketType.SUBSCRIBE,
+        PacketType.PUBLISH,
+        PacketType.PUBLISH,
+        PacketType.PUBLISH,
+        PacketType.PUBREL,
+        PacketType.DISCONNECT,
+    ]
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("size", [LARGE_PAYLOAD - 1, 4 * LARGE_PAYLOAD])
+async def test_publish_large_payload(size: int):
+    payload = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+    broker = FakeBroker(MQTTVersion.V5)
+    async with connected_client(broker) as (client, _):
+        await client.publish("a", payload, qos=1)
+        async with client.messages() as mgen:
+            message = await mgen.receive()
+
+    assert message.payload == payload
+
+
+@pytest.mark.trio
+async def test_send_buffer():
+    broker = FakeBroker(MQTTVersion.V311)
+    async with connected_client(broker, send_buffer=256 * 1024) as (client, _):
+        assert client._stream
+        size = client._stream.socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        # Linux doubles the requested size, for bookkeeping overhead
+        assert size >= 256 * 1024
+
+
+@pytest.mark.trio
+async def test_connection_refused():
+    broker = FakeBroker(MQTTVersion.V311, connack_code=5)
+    async with trio.open_nursery() as nursery:
+        port = await serve(broker, nursery)
+        client = MQTTClient("test-client", nursery)
+        with pytest.raises(MQTTConnectionError):
+            await client.connect("127.0.0.1", port)
+        assert not client.connected
+        nursery.cancel_scope.cancel()
+
+
+class UnresponsiveBroker(FakeBroker):
+    """
+    Answers CONNECT with a PINGRESP if `misbehave` is set,
+    or does not answer it at all otherwise.
+    """
+
+    def __init__(self, misbehave: bool) -> None:
+        super().__init__(MQTTVersion.V311)
+        self.misbehave = misbehave
+
+    async def answer(self, packet: Packet) -> None:
+        if packet.type == PacketType.CONNECT and self.misbehave:
+            await self.send(bytes([0xD0, 0]))
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("misbehave", [True, False], ids=["not_connack", "cancel"])
+async def test_failed_connect_closes_stream(misbehave: bool):
+    broker = UnresponsiveBroker(misbehave)
+    async with trio.open_nursery() as nursery:
+        port = await serve(broker, nursery)
+        client = MQTTClient("test-client", nursery)
+        with trio.move_on_after(0.5):
+            with pytest.raises(MQTTProtocolError) if misbehave else nullcontext():
+                await client.connect("127.0.0.1", port)
+        assert not client.connected
+
+        with trio.fail_after(1):
+            await broker.client_closed.wait()
+        nursery.cancel_scope.cancel()
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("persistent", [False, True])
+async def test_session_is_kept_with_persistent_outbound(persistent: bool, tmp_path):
+    broker = FakeBroker(MQTTVersion.V311)
+    outbound = FileOutboundStore(tmp_path / "outbound.jsonl") if persistent else None
+    async with connected_client(broker, outbound=outbound):
+        pass
+
+    connect = broker.received[0]
+    assert connect.type == PacketType.CONNECT
+    # Clean session flag of the connect flags, after the protocol name and level
+    clean_session = bool(connect.body[7] & 0x02)
+    assert clean_session != persistent
+
+
+@pytest.mark.trio
+async def test_incoming_qos1_is_acknowledged():
+    broker = FakeBroker(MQTTVersion.V311)
+    async with connected_client(broker) as (client, _):
+        await broker.send(encode_publish(Message("a", b"x", qos=1, packet_id=9)))
+        async with client.messages() as mgen:
+            message = await mgen.receive()
+        with trio.fail_after(1):
+            while PacketType.PUBACK not in broker.received_types():
+                await trio.sleep(0.01)
+
+    assert message.payload == b"x"
+    puback = broker.received[broker.received_types().index(PacketType.PUBACK)]
+    assert decode_ack(puback) == (9, 0)
+
+
+@pytest.mark.trio
+async def test_full_queue_counts_drops():
+    broker = FakeBroker(MQTTVersion.V311)
+    async with connected_client(broker, max_buffer=2) as (client, _):
+        for i in range(3):
+            await client.publish("a", str(i))
+        # Wait for the broker's echo of the last message
+        with trio.fail_after(1):
+            while not client.dropped:
+                await trio.sleep(0.01)
+
+        async with client.messages() as mgen:
+            payloads = [(await mgen.receive()).payload for _ in range(2)]
+
+    assert payloads == [b"1", b"2"]
+    assert client.dropped == {"#": 1}
+
+
+@pytest.mark.trio
+async def test_keepalive_pings(mock_clock):
+    mock_clock.rate = 20
+    broker = FakeBroker(MQTTVersion.V311)
+    async with connected_client(broker, keepalive=1) as (client, _):
+        await trio.sleep(3.5)
+        assert client.connected
+
+    assert broker.received_types().count(PacketType.PINGREQ) == 3
+
+
+@pytest.mark.trio
+async def test_keepalive_timeout(mock_clock):
+    mock_clock.rate = 20
+    broker = FakeBroker(MQTTVersion.V311)
+    broker.answer_pings = False
+    async with connected_client(broker, keepalive=1) as (client, _):
+        async with client.messages() as mgen:
+            with trio.fail_after(5):
+                async for _ in mgen:
+                    pass
+        assert not client.connected
+
+        with pytest.raises(MQTTConnectionError):
+            await client.publish("a", "b")
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("qos", [1, 2])
+async def test_connection_lost_retransmits_on_reconnect(qos: int):
+    broker = FakeBroker(MQTTVersion.V311)
+    answer = broker.answer
+
+    async def drop_first_publish(packet: Packet) -> None:
+        if packet.type == PacketType.PUBLISH:
+            broker.answer = answer  # type: ignore
+            await broker.stream.aclose()
+        else:
+            await answer(packet)
+
+    async with trio.open_nursery() as nursery:
+        port = await serve(broker, nursery)
+        client = MQTTClient("test-client", nursery, broker.version)
+        await client.connect("127.0.0.1", port)
+        broker.answer = drop_first_publish  # type: ignore
+
+        async def publish() -> None:
+            await client.publish("a", "b", qos=qos)
+
+        nursery.start_soon(publish)
+        while client.connected:
+            await trio.sleep(0.01)
+        assert len(client.outbound) == 1
+
+        with trio.fail_after(1):
+            await client.connect("127.0.0.1", port)
+            while client.outbound:
+                await trio.sleep(0.01)
+
+        publishes = [p for p in broker.received if p.type == PacketType.PUBLISH]
+        assert [decode_publish(p, broker.version).dup for p in publishes] == [
+            False,
+            True,
+        ]
+        await client.disconnect()
+        nursery.cancel_scope.cancel()
+
+
+@pytest.mark.trio
+async def test_disconnect_fails_pending_publish():
+    broker = FakeBroker(MQTTVersion.V311)
+    async with connected_client(broker) as (client, nursery):
+        broker.answer = AsyncMock()  # type: ignore
+
+        async def disconnect() -> None:
+            await trio.sleep(0.1)
+            await client.disconnect()
+
+        nursery.start_soon(disconnect)
+        with pytest.raises(MQTTConnectionError):
+            with trio.fail_after(1):
+                await client.publish("a", "b", qos=1)
+        assert not client.connected
+        # Kept, so that a persistent store can retransmit it
+        assert len(client.outbound) == 1
+
+        with pytest.raises(MQTTConnectionError):
+            await client.publish("a", "b", qos=1)
+
+
+@pytest.mark.trio
+async def test_inflight_window():
+    broker = FakeBroker(MQTTVersion.V5)
+    answer = broker.answer
+    held: list[Packet] = []
+
+    async def hold_acks(packet: Packet) -> None:
+        if packet.type == PacketType.PUBLISH:
+            held.append(packet)
+        else:
+            await answer(packet)
+
+    async with connected_client(broker, max_inflight=2) as (client, nursery):
+        broker.answer = hold_acks  # type: ignore
+        with trio.fail_after(5):
+            async with trio.open_nursery() as publishers:
+                for i in range(5):
+                    publishers.start_soon(partial(client.publish, f"t/{i}", "x", qos=1))
+                acknowledged = 0
+                while acknowledged < 5:
+                    await trio.sleep(0.05)
+                    # Never more than the window is awaiting its acknowledgement
+                    assert 0 < len(held) <= 2
+                    packet = held.pop(0)
+                    message = decode_publish(packet, broker.version)
+                    await broker.send(encode_ack(PacketType.PUBACK, message.packet_id))
+                    acknowledged += 1
+
+        assert not client.outbound
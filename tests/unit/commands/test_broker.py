@@ -35,7 +35,29 @@ def test_broker_command():
     ):
         result = runner.invoke(app, [])
         mock_spawn.assert_called_once_with(
-            config_obj.get_active_device_config().mqtt.port, ANY, False
+            config_obj.get_active_device_config().mqtt.port,
+            ANY,
+            False,
+            False,
+            None,
+            None,
+        )
+        assert result.exit_code == 0
+
+
+def test_broker_command_embedded():
+    with (
+        patch("local_console.commands.broker.spawn_broker") as mock_spawn,
+        patch("local_console.commands.broker.sleep_forever"),
+    ):
+        result = runner.invoke(app, ["--embedded"])
+        mock_spawn.assert_called_once_with(
+            config_obj.get_active_device_config().mqtt.port,
+            ANY,
+            False,
+            True,
+            None,
+            None,
         )
         assert result.exit_code == 0
 
@@ -49,7 +71,12 @@ def test_broker_command_error():
     ):
         result = runner.invoke(app, [])
         mock_spawn.assert_called_once_with(
-            config_obj.get_active_device_config().mqtt.port, ANY, False
+            config_obj.get_active_device_config().mqtt.port,
+            ANY,
+            False,
+            False,
+            None,
+            None,
         )
         assert result.exit_code == 1
 
@@ -95,6 +95,55 @@ def test_config_instance_command(instance_id: str, method: str, params: str):
         assert result.exit_code == 0
 
 
+def test_config_instances_command(tmp_path):
+    configs_file = tmp_path / "configs.json"
+    configs_file.write_text(
+        json.dumps({"node": {"threshold": "0.5", "labels": ["a"]}, "sink": {"x": "1"}})
+    )
+    with patch(
+        "local_console.commands.config.configure_instances_task"
+    ) as mock_configure:
+        result = runner.invoke(app, ["instances", str(configs_file)])
+        mock_configure.assert_called_once_with(
+            [
+                ("node", "threshold", "0.5"),
+                ("node", "labels", '["a"]'),
+                ("sink", "x", "1"),
+            ]
+        )
+        assert result.exit_code == 0
+
+    configs_file.write_text('{"node": "0.5"}')
+    with patch(
+        "local_console.commands.config.configure_instances_task"
+    ) as mock_configure:
+        result = runner.invoke(app, ["instances", str(configs_file)])
+        mock_configure.assert_not_called()
+        assert result.exit_code == 1
+
+
+def test_config_set_broker_option():
+    with patch.object(config_obj, "save_config"):
+        result = runner.invoke(
+            app, [GetCommands.SET.value, "broker.persist_outbound", "true"]
+        )
+        assert result.exit_code == 0
+        assert config_obj.get_config().broker.persist_outbound is True
+
+
+def test_config_tls_with_shared_broker_rejected():
+    with patch.object(config_obj, "save_config") as mock_save:
+        broker = config_obj.get_config().broker
+        result = runner.invoke(app, [GetCommands.SET.value, "broker.shared", "true"])
+        assert result.exit_code == 0
+        try:
+            result = runner.invoke(app, [GetCommands.SET.value, "broker.tls", "true"])
+            assert result.exit_code == 1
+            assert mock_save.call_count == 1
+        finally:
+            broker.__dict__.update(shared=False, tls=False)
+
+
 @given(
     generate_identifiers(max_size=5),
     generate_identifiers(max_size=5),
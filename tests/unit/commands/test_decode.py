@@ -0,0 +1,82 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from local_console.commands.decode import app
+from local_console.core.camera.flatbuffers import FlatbufferError
+from typer.testing import CliRunner
+
+from tests.unit.core.test_batch_decode import fake_batch_decode
+from tests.unit.core.test_batch_decode import write_inference
+
+runner = CliRunner()
+
+
+def test_decode(tmp_path):
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    for i in range(3):
+        write_inference(inputs, f"{i:04d}", b"x" * i)
+    labels = tmp_path / "labels.txt"
+    labels.write_text("zero\none")
+
+    with (
+        patch("local_console.commands.decode.conform_flatbuffer_schema"),
+        patch("local_console.commands.decode.ProcessPoolExecutor", ThreadPoolExecutor),
+        patch(
+            "local_console.core.camera.batch_decode.flatbuffer_binaries_to_json",
+            side_effect=fake_batch_decode,
+        ),
+    ):
+        result = runner.invoke(
+            app,
+            [
+                str(inputs),
+                "--schema",
+                str(tmp_path / "schema.fbs"),
+                "--labels",
+                str(labels),
+                "--output",
+                str(tmp_path / "out"),
+                "-j",
+                "2",
+            ],
+        )
+
+    assert result.exit_code == 0
+    assert "Decoded 3 files (0 failed, 0 already done)" in result.stdout
+    decoded = json.loads((tmp_path / "out" / "0001.json").read_text())
+    assert decoded["perception"]["classification_list"][0]["class_name"] == "one"
+
+
+def test_decode_invalid_schema(tmp_path):
+    with patch(
+        "local_console.commands.decode.conform_flatbuffer_schema",
+        side_effect=FlatbufferError("bad schema"),
+    ):
+        result = runner.invoke(
+            app, [str(tmp_path), "-s", "schema.fbs", "-o", str(tmp_path / "out")]
+        )
+    assert result.exit_code == 1
+
+
+def test_decode_not_a_directory(tmp_path):
+    result = runner.invoke(
+        app, [str(tmp_path / "missing"), "-s", "schema.fbs", "-o", str(tmp_path)]
+    )
+    assert result.exit_code == 1
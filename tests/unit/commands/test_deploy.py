@@ -14,6 +14,7 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 import json
+import os
 from contextlib import asynccontextmanager
 from datetime import timedelta
 from pathlib import Path
@@ -28,7 +29,7 @@ import trio
 from hypothesis import given
 from hypothesis import settings
 from local_console.clients.agent import Agent
-from local_console.clients.agent import check_attributes_request
+from local_console.clients.agent import answer_attributes_request
 from local_console.commands.deploy import app
 from local_console.commands.deploy import exec_deployment
 from local_console.commands.deploy import multiple_module_manifest_setup
@@ -48,6 +49,18 @@ from tests.strategies.deployment import deployment_manifest_strategy
 runner = CliRunner()
 
 
+@pytest.fixture(autouse=True, scope="module")
+def project_dir(tmp_path_factory):
+    """
+    Runs the commands from a scratch directory, as they store
+    the manifest they deploy in the current one.
+    """
+    cwd = Path.cwd()
+    os.chdir(tmp_path_factory.mktemp("project"))
+    yield
+    os.chdir(cwd)
+
+
 def test_get_empty_deployment():
     empty = get_empty_deployment()
     assert len(empty.deployment.modules) == 0
@@ -266,19 +279,16 @@ async def test_attributes_request_handling(
             "local_console.clients.agent.OnWireProtocol.from_iot_spec",
             return_value=onwire_schema,
         ),
-        patch("local_console.clients.agent.paho.Client"),
-        patch("local_console.clients.agent.AsyncClient"),
     ):
         request_topic = MQTTTopics.ATTRIBUTES_REQ.value.replace("+", str(mqtt_req_id))
 
         agent = Agent(ANY, ANY, ANY)
         agent.publish = AsyncMock()
         async with agent.mqtt_scope([MQTTTopics.ATTRIBUTES_REQ.value]):
-            check = await check_attributes_request(agent, request_topic, "{}")
+            await answer_attributes_request(agent, request_topic, b"{}")
 
         response_topic = request_topic.replace("request", "response")
         agent.publish.assert_called_once_with(response_topic, "{}")
-        assert check
 
 
 @given(deployment_manifest_strategy())
@@ -531,3 +541,82 @@ async def test_stimuli_proc(
     await stimulus_proc(topic, serialized, onwire_schema, mock_fsm)
 
     mock_fsm.update.assert_awaited_with(payload)
+
+
+@pytest.mark.parametrize("failed", [[], ["lab-2"]])
+def test_deploy_fleet_command(failed) -> None:
+    devices = [
+        DeviceConnection(
+            mqtt={"host": "localhost", "port": 1883 + i, "device_id": None},
+            webserver={"host": "localhost", "port": 8000},
+            name=f"lab-{i}",
+        )
+        for i in range(1, 4)
+    ]
+
+    async def execute(agent, fsm) -> bool:
+        return agent.port != 1884 or not failed
+
+    with (
+        patch.object(config_obj, "get_device_configs", return_value=devices),
+        patch("local_console.commands.deploy.SyncWebserver") as mock_webserver,
+        patch("local_console.commands.deploy.exec_deployment", execute),
+        patch(
+            "local_console.core.commands.fleet_deploy.Agent",
+            side_effect=lambda host, port, schema: Mock(port=port),
+        ),
+        patch("local_console.core.commands.fleet_deploy.DeployFSM") as mock_fsm,
+    ):
+        result = runner.invoke(app, ["-e", "-d", "lab-*", "--parallel", "2"])
+
+        assert mock_fsm.instantiate.call_count == 3
+        for call in mock_fsm.instantiate.call_args_list:
+            assert call.kwargs["webserver"] is mock_webserver.return_value
+        mock_webserver.return_value.__enter__.assert_called_once()
+        assert result.exit_code == (1 if failed else 0)
+
+
+def test_deploy_fleet_command_unknown_device() -> None:
+    with patch("local_console.commands.deploy.FleetDeployment") as mock_fleet:
+        result = runner.invoke(app, ["-e", "-d", "no-such-device"])
+        mock_fleet.assert_not_called()
+        assert result.exit_code == 1
+
+
+def test_multiple_module_setup_from_last_deployment(tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "detection.wasm").write_bytes(b"detection")
+    template = DeploymentManifest.model_validate(
+        {
+            "deployment": {
+                "deploymentId": "",
+                "instanceSpecs": {
+                    "detect": {"moduleId": "detection"},
+                },
+                "modules": {
+                    "detection": {
+                        "entryPoint": "main",
+                        "moduleImpl": "wasm",
+                        "downloadUrl": "",
+                        "hash": "",
+                    },
+                },
+                "publishTopics": {},
+                "subscribeTopics": {},
+            }
+        }
+    )
+    webserver = Mock()
+    webserver.port = 8888
+
+    with patch.object(config_obj, "get_deployment", return_value=template):
+        first = multiple_module_manifest_setup(bin_dir, webserver, None, False)
+    # deploy stores the manifest it built in place of the template
+    with patch.object(config_obj, "get_deployment", return_value=first):
+        webserver.port = 9999
+        again = multiple_module_manifest_setup(bin_dir, webserver, None, False)
+
+    assert again.deployment.deploymentId == first.deployment.deploymentId
+    assert list(again.deployment.modules) == list(first.deployment.modules)
+    assert "9999" in next(iter(again.deployment.modules.values())).downloadUrl
@@ -0,0 +1,137 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+from pathlib import Path
+from typing import Optional
+
+import pytest
+import trio
+from local_console.clients.agent import Agent
+from local_console.commands.deploy import exec_deployment
+from local_console.core.camera.enums import DeployStage
+from local_console.core.commands.deploy import DeployFSM
+from local_console.core.commands.deploy import single_module_manifest_setup
+from local_console.core.schemas.schemas import DeploymentManifest
+from local_console.core.schemas.schemas import OnWireProtocol
+from local_console.servers.embedded_broker import EmbeddedBroker
+from local_console.servers.webserver import SyncWebserver
+
+from tests.mocks.simulated_device import DeviceBehavior
+from tests.mocks.simulated_device import SimulatedDevice
+
+
+@pytest.fixture(autouse=True)
+def skip_connection():
+    """
+    Lets agents connect to the brokers of the simulated devices
+    """
+    yield
+
+
+@pytest.fixture
+def webserver(tmp_path: Path):
+    (tmp_path / "node.wasm").write_bytes(b"node module")
+    with SyncWebserver(tmp_path) as server:
+        yield server
+
+
+def manifest_for(webserver: SyncWebserver) -> DeploymentManifest:
+    return single_module_manifest_setup(
+        "node", webserver.dir / "node.wasm", webserver, host_override="127.0.0.1"
+    )
+
+
+async def deploy_to_simulated_device(
+    nursery: trio.Nursery,
+    onwire_schema: OnWireProtocol,
+    webserver: SyncWebserver,
+    behaviors: list[DeviceBehavior],
+) -> tuple[SimulatedDevice, list[bool], list[Optional[DeployStage]]]:
+    """
+    Deploys once per item of `behaviors`, which the device adopts
+    before each deployment.
+    """
+    broker = EmbeddedBroker(0, "127.0.0.1")
+    await nursery.start(broker.run)
+    device = SimulatedDevice("127.0.0.1", broker.port, onwire_schema, behaviors[0])
+    await nursery.start(device.run)
+
+    results = []
+    stages = []
+    for behavior in behaviors:
+        device.behavior = behavior
+        agent = Agent("127.0.0.1", broker.port, onwire_schema)
+        fsm = DeployFSM.instantiate(
+            onwire_schema, agent.deploy, timeout_secs=5, webserver=webserver
+        )
+        fsm.set_manifest(manifest_for(webserver))
+        results.append(await exec_deployment(agent, fsm, handshake_timeout=0.3))
+        stages.append(fsm.stage)
+
+    await device.stop()
+    broker.close()
+    return device, results, stages
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("onwire_schema", list(OnWireProtocol))
+async def test_deployment(onwire_schema, webserver, nursery):
+    behavior = DeviceBehavior(report_interval=0.05)
+    device, results, stages = await deploy_to_simulated_device(
+        nursery, onwire_schema, webserver, [behavior, behavior]
+    )
+
+    assert results == [True, True]
+    assert stages == [DeployStage.Done, DeployStage.Done]
+    assert device.attributes_answered.is_set()
+    assert device.status["reconcileStatus"] == "ok"
+    # The module was cached by the first deployment
+    assert device.downloads == 1
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize(
+    "behavior",
+    [
+        DeviceBehavior(report_interval=0.05, fail_downloads=["node-*"]),
+        DeviceBehavior(report_interval=0.05, corrupt_downloads=["node-*"]),
+        DeviceBehavior(report_interval=0.05, fail_instances=["node"]),
+    ],
+    ids=["download", "hash", "instance"],
+)
+async def test_injected_failures(behavior, webserver, nursery):
+    device, results, stages = await deploy_to_simulated_device(
+        nursery, OnWireProtocol.EVP2, webserver, [behavior]
+    )
+
+    assert results == [False]
+    assert stages == [DeployStage.Error]
+    assert device.status["reconcileStatus"] == "applying"
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("onwire_schema", list(OnWireProtocol))
+async def test_retry_after_failure(onwire_schema, webserver, nursery):
+    failing = DeviceBehavior(report_interval=0.05, fail_downloads=["node-*"])
+    healthy = DeviceBehavior(report_interval=0.05)
+    device, results, stages = await deploy_to_simulated_device(
+        nursery, onwire_schema, webserver, [failing, healthy]
+    )
+
+    # The same manifest is applied again, despite the former failure
+    assert results == [False, True]
+    assert stages == [DeployStage.Error, DeployStage.Done]
+    assert device.status["reconcileStatus"] == "ok"
+    assert device.downloads == 1
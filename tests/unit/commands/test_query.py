@@ -0,0 +1,65 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+
+from local_console.commands.query import app
+from local_console.core.camera.recording import InferenceRecorder
+from local_console.core.camera.recording import ResultRecord
+from local_console.core.camera.recording import ResultsFormat
+from local_console.core.config import config_obj
+from typer.testing import CliRunner
+
+runner = CliRunner()
+
+
+def populate(directory):
+    recorder = InferenceRecorder(directory, ResultsFormat.NDJSON)
+    recorder.append(
+        [
+            ResultRecord(1000, "dev", "model", "classification", 1, 0.9, "cat"),
+            ResultRecord(2000, "dev", "model", "classification", 2, 0.3),
+            ResultRecord(3000, "dev", "model", "classification", 1, 0.6, "cat"),
+        ]
+    )
+    recorder.close()
+
+
+def test_query_rows(tmp_path):
+    populate(tmp_path)
+    result = runner.invoke(app, [str(tmp_path), "--min-score", "0.5"])
+    assert result.exit_code == 0
+    rows = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [r["timestamp"] for r in rows] == [1000, 3000]
+
+
+def test_query_count(tmp_path):
+    populate(tmp_path)
+    result = runner.invoke(app, [str(tmp_path), "--count"])
+    assert result.exit_code == 0
+    assert result.stdout.splitlines() == ["1 (cat): 2", "2: 1"]
+
+
+def test_query_configured_directory(tmp_path):
+    populate(tmp_path)
+    config_obj.get_active_device_config().persist.results_dir_path = str(tmp_path)
+    result = runner.invoke(app, ["--limit", "1", "--class-id", "2"])
+    assert result.exit_code == 0
+    assert json.loads(result.stdout)["score"] == 0.3
+
+
+def test_query_no_directory():
+    result = runner.invoke(app, [])
+    assert result.exit_code == 1
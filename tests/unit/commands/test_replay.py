@@ -0,0 +1,77 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+from local_console.commands.replay import app
+from local_console.core.camera.recording import scan_results
+from typer.testing import CliRunner
+
+from tests.unit.core.test_replay import capture
+
+runner = CliRunner()
+
+
+def test_replay(tmp_path, caplog):
+    capture(
+        tmp_path / "capture" / "images",
+        ["20240326110151000", "20240326110152000"],
+    )
+    capture(
+        tmp_path / "capture" / "inferences",
+        ["20240326110151000", "20240326110152000"],
+        images=False,
+    )
+    output = tmp_path / "output"
+
+    result = runner.invoke(
+        app, [str(tmp_path / "capture"), "--max-speed", "-o", str(output)]
+    )
+
+    assert result.exit_code == 0
+    assert "Replayed 2 pairs" in result.stdout
+    assert "Throughput" in result.stdout
+    # Custom applications have nothing to draw
+    assert "Error while performing the drawing" not in caplog.text
+    assert sorted(p.name for p in (output / "images").iterdir()) == [
+        "0000.jpg",
+        "0001.jpg",
+    ]
+    assert sorted(p.name for p in (output / "inferences").iterdir()) == [
+        "0000.txt",
+        "0001.txt",
+    ]
+
+
+def test_replay_records_results(tmp_path):
+    capture(tmp_path, ["20240326110151000"])
+
+    result = runner.invoke(
+        app,
+        [str(tmp_path), "--speed", "10", "--results", str(tmp_path / "results")],
+    )
+
+    assert result.exit_code == 0
+    assert "Maximum lag" in result.stdout
+    # Undecoded payloads carry no results to record
+    assert list(scan_results(tmp_path / "results")) == []
+
+
+def test_replay_nothing_to_replay(tmp_path):
+    result = runner.invoke(app, [str(tmp_path)])
+    assert result.exit_code == 1
+
+
+def test_replay_invalid_speed(tmp_path):
+    result = runner.invoke(app, [str(tmp_path), "--speed", "0"])
+    assert result.exit_code == 1
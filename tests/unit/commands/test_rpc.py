@@ -13,9 +13,12 @@
 # limitations under the License.
 #
 # SPDX-License-Identifier: Apache-2.0
+from unittest.mock import AsyncMock
 from unittest.mock import patch
 
 from hypothesis import given
+from local_console.clients.rpc import DEFAULT_RPC_TIMEOUT
+from local_console.clients.rpc import RPCTimeoutError
 from local_console.commands.rpc import app
 from typer.testing import CliRunner
 
@@ -32,13 +35,28 @@ runner = CliRunner()
 def test_rpc_command(instance_id: str, method: str, params: str):
     with (
         patch("local_console.commands.rpc.Agent"),
-        patch("local_console.commands.rpc.rpc_task") as mock_rpc,
+        patch("local_console.commands.rpc.rpc_task", return_value=0) as mock_rpc,
     ):
         result = runner.invoke(app, [instance_id, method, params])
-        mock_rpc.assert_called_with(instance_id, method, params)
+        mock_rpc.assert_called_with(instance_id, method, params, DEFAULT_RPC_TIMEOUT)
         assert result.exit_code == 0
 
 
+def test_rpc_command_timeout():
+    async def unanswered() -> None:
+        raise RPCTimeoutError
+
+    with (
+        patch("local_console.commands.rpc.Agent") as mock_agent,
+        patch("local_console.commands.rpc.TopicRouter"),
+    ):
+        agent = mock_agent.return_value
+        agent.initialize_handshake = AsyncMock()
+        agent.rpc = AsyncMock(return_value=unanswered())
+        result = runner.invoke(app, ["node", "method", "{}", "--timeout", "0.1"])
+        assert result.exit_code == 1
+
+
 @given(
     generate_text(),
     generate_text(),
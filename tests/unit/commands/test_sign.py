@@ -0,0 +1,88 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import os
+from pathlib import Path
+
+import pytest
+from Crypto.PublicKey import ECC
+from local_console.commands.sign import app
+from local_console.core.enums import Target
+from local_console.utils.signature import sign
+from typer.testing import CliRunner
+
+runner = CliRunner()
+
+
+@pytest.fixture
+def project(tmp_path: Path, monkeypatch) -> Path:
+    monkeypatch.chdir(tmp_path)
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for target in Target:
+        (bin_dir / f"node.{target}.aot").write_bytes(f"{target} module".encode())
+    (bin_dir / "node.wasm").write_bytes(b"wasm module")
+    (tmp_path / "key.pem").write_text(
+        ECC.generate(curve="P-256").export_key(format="PEM")
+    )
+    return tmp_path
+
+
+def test_sign_all_targets(project: Path):
+    result = runner.invoke(app, ["-s", "key.pem"])
+    assert result.exit_code == 0
+
+    key = (project / "key.pem").read_bytes()
+    for target in Target:
+        source = project / "bin" / f"node.{target}.aot"
+        signed = project / "bin" / f"node.{target}.aot.signed"
+        assert signed.read_bytes() == sign(source.read_bytes(), key)
+    assert not (project / "bin" / "node.wasm.signed").exists()
+
+
+def test_sign_skips_up_to_date(project: Path):
+    runner.invoke(app, ["-s", "key.pem", "xtensa", "arm64"])
+    xtensa = project / "bin" / "node.xtensa.aot"
+    signed_mtime = (project / "bin" / "node.arm64.aot.signed").stat().st_mtime_ns
+    xtensa.write_bytes(b"xtensa module, rebuilt")
+    # Modified after having been signed
+    os.utime(xtensa, ns=(signed_mtime + 10**9, signed_mtime + 10**9))
+
+    result = runner.invoke(app, ["-s", "key.pem", "xtensa", "arm64"])
+    assert result.exit_code == 0
+
+    assert (project / "bin" / "node.arm64.aot.signed").stat().st_mtime_ns == (
+        signed_mtime
+    )
+    key = (project / "key.pem").read_bytes()
+    assert (project / "bin" / "node.xtensa.aot.signed").read_bytes() == sign(
+        xtensa.read_bytes(), key
+    )
+    assert not (project / "bin" / "node.amd64.aot.signed").exists()
+
+
+def test_sign_invalid_key(project: Path):
+    (project / "key.pem").write_text("not a key")
+    result = runner.invoke(app, ["-s", "key.pem"])
+    assert result.exit_code == 1
+    assert not list((project / "bin").glob("*.signed"))
+
+
+def test_sign_failed_module(project: Path):
+    (project / "bin" / "node.amd64.aot").write_bytes(b"")
+    result = runner.invoke(app, ["-s", "key.pem"])
+    assert result.exit_code == 1
+    assert not (project / "bin" / "node.amd64.aot.signed").exists()
+    assert (project / "bin" / "node.arm64.aot.signed").exists()
@@ -0,0 +1,101 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+from base64 import b64encode
+from unittest.mock import AsyncMock
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from hypothesis import given
+from local_console.clients.mqtt_capture import TrafficRecorder
+from local_console.clients.mqtt_codec import Message
+from local_console.commands.traffic import app
+from local_console.core.camera.enums import MQTTTopics
+from local_console.core.camera.mixin_mqtt import EA_STATE_TOPIC
+from local_console.core.schemas.edge_cloud_if_v1 import DeviceConfiguration
+from typer.testing import CliRunner
+
+from tests.strategies.configs import generate_valid_device_configuration
+
+runner = CliRunner()
+
+
+def test_replay_to_state(tmp_path):
+    capture = tmp_path / "traffic.mqtt"
+    with TrafficRecorder(capture) as recorder:
+        for _ in range(3):
+            report = {"systemInfo": {"protocolVersion": "EVP2-TB"}}
+            recorder.record(
+                Message(MQTTTopics.ATTRIBUTES.value, json.dumps(report).encode())
+            )
+
+    result = runner.invoke(app, ["replay", str(capture), "--max-speed"])
+
+    assert result.exit_code == 0
+    assert "Replayed 3 messages" in result.stdout
+    assert "Throughput" in result.stdout
+
+
+@given(generate_valid_device_configuration())
+def test_replay_state_report(tmp_path_factory, device_config: DeviceConfiguration):
+    capture = tmp_path_factory.mktemp("traffic") / "traffic.mqtt"
+    state = b64encode(device_config.model_dump_json().encode()).decode()
+    with TrafficRecorder(capture) as recorder:
+        recorder.record(
+            Message(
+                MQTTTopics.ATTRIBUTES.value,
+                json.dumps({EA_STATE_TOPIC: state}).encode(),
+            )
+        )
+
+    result = runner.invoke(app, ["replay", str(capture), "--max-speed"])
+
+    assert result.exit_code == 0
+    assert "Replayed 1 messages" in result.stdout
+
+
+def test_replay_not_a_capture(tmp_path):
+    capture = tmp_path / "traffic.mqtt"
+    capture.write_text("{}")
+
+    result = runner.invoke(app, ["replay", str(capture)])
+
+    assert result.exit_code == 1
+
+
+def test_record_connection_error(tmp_path):
+    with patch(
+        "local_console.commands.traffic.MQTTClient.connect", side_effect=OSError
+    ):
+        result = runner.invoke(app, ["record", str(tmp_path / "traffic.mqtt")])
+
+    assert result.exit_code == 1
+
+
+def test_record_over_tls(tmp_path):
+    context = MagicMock()
+    with (
+        patch("local_console.commands.traffic.broker_credentials"),
+        patch(
+            "local_console.commands.traffic.client_ssl_context", return_value=context
+        ),
+        patch("local_console.commands.traffic.MQTTClient") as mock_client,
+    ):
+        mock_client.return_value.connect = AsyncMock(side_effect=OSError)
+        result = runner.invoke(app, ["record", str(tmp_path / "traffic.mqtt")])
+
+    assert result.exit_code == 1
+    assert mock_client.call_args.kwargs["ssl_context"] is context
@@ -46,7 +46,8 @@ def skip_broker():
 def skip_connection():
     with (
         patch(
-            "local_console.clients.agent.AsyncClient",
+            "local_console.clients.agent.MQTTClient",
+            autospec=True,
         ),
     ):
         yield
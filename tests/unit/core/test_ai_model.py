@@ -23,6 +23,7 @@ from local_console.core.camera.ai_model import undeploy_step
 from local_console.core.commands.ota_deploy import get_package_hash
 
 from tests.fixtures.camera import cs_init
+from tests.mocks.mock_mqtt import mock_lease
 
 
 @pytest.fixture(params=["Done", "Failed"])
@@ -40,10 +41,9 @@ async def test_undeploy_step_rpc_sent(network_id: str, cs_init):
     camera_state = cs_init
 
     mock_agent = MagicMock()
-    mock_agent.mqtt_scope.return_value = AsyncMock()
     mock_agent.configure = AsyncMock()
     with (
-        patch("local_console.core.camera.ai_model.Agent", return_value=mock_agent),
+        patch("local_console.core.camera.ai_model.Agent.lease", mock_lease(mock_agent)),
         patch.object(camera_state, "device_config") as mock_config,
     ):
         mock_config.value.OTA.UpdateStatus = "Done"
@@ -60,10 +60,9 @@ async def test_undeploy_step_rpc_sent(network_id: str, cs_init):
 async def test_undeploy_step_not_deployed_model(update_status: str, cs_init):
     camera_state = cs_init
     mock_agent = MagicMock()
-    mock_agent.mqtt_scope.return_value = AsyncMock()
     mock_agent.configure = AsyncMock()
     with (
-        patch("local_console.core.camera.ai_model.Agent", return_value=mock_agent),
+        patch("local_console.core.camera.ai_model.Agent.lease", mock_lease(mock_agent)),
         patch.object(camera_state, "device_config") as mock_config,
         patch.object(camera_state, "ota_event") as mock_ota_event,
     ):
@@ -78,14 +77,13 @@ async def test_deploy_step(tmp_path, network_id, update_status: str, cs_init):
     filename = "dummy.bin"
     tmp_file = tmp_path / filename
     mock_agent = MagicMock()
-    mock_agent.mqtt_scope.return_value = AsyncMock()
     mock_agent.configure = AsyncMock()
 
     mock_server = AsyncMock()
     mock_server.__aenter__.return_value.port = 8000
 
     with (
-        patch("local_console.core.camera.ai_model.Agent", return_value=mock_agent),
+        patch("local_console.core.camera.ai_model.Agent.lease", mock_lease(mock_agent)),
         patch.object(camera_state, "device_config") as mock_config,
         patch.object(camera_state, "ota_event") as mock_ota_event,
         patch(
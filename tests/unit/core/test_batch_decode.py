@@ -0,0 +1,211 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+from local_console.core.camera.batch_decode import BatchDecoder
+from local_console.core.camera.batch_decode import decode_chunk
+from local_console.core.camera.batch_decode import DecodeFormat
+from local_console.core.camera.batch_decode import JOURNAL_NAME
+from local_console.core.camera.batch_decode import PART_PREFIX
+from local_console.core.camera.flatbuffers import FlatbufferError
+from local_console.core.camera.recording import scan_results
+
+
+def write_inference(directory, name: str, tensor: bytes) -> None:
+    (directory / f"{name}.txt").write_text(
+        json.dumps(
+            {
+                "DeviceID": "dev",
+                "ModelID": "model",
+                "Image": True,
+                "Inferences": [
+                    {"T": "20240326110151928", "O": b64encode(tensor).decode()}
+                ],
+            }
+        )
+    )
+
+
+def fake_decode(schema, tensor: bytes) -> dict:
+    if tensor == b"bad":
+        raise FlatbufferError("cannot decode")
+    return {
+        "perception": {"classification_list": [{"class_id": len(tensor), "score": 0.5}]}
+    }
+
+
+def fake_batch_decode(schema, tensors) -> list[dict]:
+    return [fake_decode(schema, tensor) for tensor in tensors]
+
+
+@pytest.fixture(autouse=True)
+def fake_flatc():
+    with (
+        patch(
+            "local_console.core.camera.batch_decode.flatbuffer_binaries_to_json",
+            side_effect=fake_batch_decode,
+        ) as mock_batch,
+        patch(
+            "local_console.core.camera.batch_decode.flatbuffer_binary_to_json",
+            side_effect=fake_decode,
+        ),
+    ):
+        yield mock_batch
+
+
+def test_decode_chunk(tmp_path, fake_flatc):
+    write_inference(tmp_path, "0001", b"x")
+    write_inference(tmp_path, "0002", b"xyz")
+    (tmp_path / "0003.txt").write_text("not json")
+
+    files = sorted(tmp_path.glob("*.txt"))
+    results = decode_chunk(files, tmp_path / "schema", {1: "one"}, flatten=True)
+
+    fake_flatc.assert_called_once()
+    assert [r.name for r in results] == ["0001.txt", "0002.txt", "0003.txt"]
+    # Flattened files only carry their records
+    assert all(r.decoded is None for r in results)
+    assert results[0].records[0].class_name == "one"
+    assert results[1].records[0].class_id == 3
+    assert results[1].records[0].class_name == "Unknown"
+    assert results[2].records == []
+    assert results[2].error.startswith("Invalid inference file")
+
+
+def test_decode_chunk_non_string_timestamp(tmp_path):
+    write_inference(tmp_path, "0001", b"x")
+    payload = json.loads((tmp_path / "0001.txt").read_text())
+    payload["Inferences"][0]["T"] = None
+    (tmp_path / "0002.txt").write_text(json.dumps(payload))
+
+    files = sorted(tmp_path.glob("*.txt"))
+    results = decode_chunk(files, tmp_path / "schema", None, flatten=True)
+
+    assert results[0].error is None
+    assert results[1].records == []
+    assert results[1].error.startswith("Could not extract results")
+
+
+def test_decode_chunk_isolates_undecodable(tmp_path):
+    write_inference(tmp_path, "0001", b"bad")
+    write_inference(tmp_path, "0002", b"ok")
+
+    files = sorted(tmp_path.glob("*.txt"))
+    results = decode_chunk(files, tmp_path / "schema", None, flatten=False)
+
+    assert results[0].error == "cannot decode"
+    assert results[1].error is None
+    assert results[1].decoded is not None
+    assert results[1].records == []
+
+
+def run_decoder(decoder: BatchDecoder) -> tuple:
+    progress = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        summary = decoder.run(executor, progress.append)
+    return summary, progress
+
+
+def test_batch_decoder_json(tmp_path):
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    for i in range(5):
+        write_inference(inputs, f"{i:04d}", b"x" * i)
+    write_inference(inputs, "0005", b"bad")
+    output = tmp_path / "out"
+
+    decoder = BatchDecoder(inputs, output, tmp_path / "schema", DecodeFormat.JSON)
+    decoder.chunk_size = 2
+    summary, progress = run_decoder(decoder)
+
+    assert (summary.total, summary.decoded, summary.failed) == (6, 5, 1)
+    assert sum(progress) == 6
+    assert sorted(p.name for p in output.glob("*.json")) == [
+        f"{i:04d}.json" for i in range(5)
+    ]
+    decoded = json.loads((output / "0003.json").read_text())
+    assert decoded["perception"]["classification_list"][0]["class_id"] == 3
+
+
+def test_batch_decoder_resumes(tmp_path):
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    for i in range(4):
+        write_inference(inputs, f"{i:04d}", b"x" * i)
+    output = tmp_path / "out"
+
+    decoder = BatchDecoder(
+        inputs, output, tmp_path / "schema", DecodeFormat.NDJSON, chunk_size=3
+    )
+    summary, _ = run_decoder(decoder)
+    assert summary.decoded == 4
+
+    # New captures land, and a run got killed while writing a part file
+    for i in range(4, 6):
+        write_inference(inputs, f"{i:04d}", b"x" * i)
+    orphan = output / f"{PART_PREFIX}999999.ndjson"
+    orphan.write_text("garbage")
+    with (output / JOURNAL_NAME).open("a") as journal:
+        journal.write('{"part": "results-deco')
+
+    summary, _ = run_decoder(decoder)
+    assert (summary.total, summary.skipped, summary.decoded) == (6, 4, 2)
+    assert not orphan.exists()
+    assert sorted(row["class_id"] for row in scan_results(output)) == list(range(6))
+
+    summary, _ = run_decoder(decoder)
+    assert (summary.skipped, summary.decoded) == (6, 0)
+
+
+def test_batch_decoder_retries_failed_files(tmp_path, fake_flatc):
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    write_inference(inputs, "0001", b"x")
+    write_inference(inputs, "0002", b"bad")
+    output = tmp_path / "out"
+
+    decoder = BatchDecoder(inputs, output, tmp_path / "schema", DecodeFormat.NDJSON)
+    summary, _ = run_decoder(decoder)
+    assert (summary.decoded, summary.failed) == (1, 1)
+
+    # The failing file gets fixed, such as after updating the schema
+    write_inference(inputs, "0002", b"xy")
+    pending = decoder.pending()
+    assert [f.name for f in pending[0]] == ["0002.txt"]
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        summary = decoder.run(executor, pending=pending)
+
+    assert (summary.total, summary.skipped, summary.decoded) == (2, 1, 1)
+    assert sorted(row["class_id"] for row in scan_results(output)) == [1, 2]
+
+
+def test_batch_decoder_reset(tmp_path):
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    write_inference(inputs, "0001", b"x")
+    output = tmp_path / "out"
+
+    decoder = BatchDecoder(inputs, output, tmp_path / "schema", DecodeFormat.NDJSON)
+    run_decoder(decoder)
+    decoder.reset()
+    summary, _ = run_decoder(decoder)
+
+    assert (summary.skipped, summary.decoded) == (0, 1)
+    assert len(list(scan_results(output))) == 1
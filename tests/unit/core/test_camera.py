@@ -25,6 +25,8 @@ import hypothesis.strategies as st
 import pytest
 import trio
 from hypothesis import given
+from local_console.clients.mqtt_capture import TrafficRecorder
+from local_console.clients.mqtt_codec import Message
 from local_console.core.camera.enums import DeploymentType
 from local_console.core.camera.enums import MQTTTopics
 from local_console.core.camera.enums import StreamStatus
@@ -276,12 +278,59 @@ async def test_process_state_topic_wrong(schema, caplog, cs_init) -> None:
     camera._onwire_schema = schema
     wrong_obj = {"a": "b"}
     backdoor_state = {
-        "state/backdoor-EA_Main/placeholder": b64encode(json.dumps(wrong_obj).encode())
+        "state/backdoor-EA_Main/placeholder": b64encode(
+            json.dumps(wrong_obj).encode()
+        ).decode()
     }
     await camera._process_state_topic(backdoor_state)
     assert "Error while validating device configuration" in caplog.text
 
 
+@pytest.mark.trio
+@given(generate_valid_device_configuration())
+async def test_unchanged_state_report_only_refreshes_reception(
+    device_config: DeviceConfiguration,
+) -> None:
+    async with (
+        trio.open_nursery() as nursery,
+        cs_init_context() as camera,
+    ):
+        camera._onwire_schema = OnWireProtocol.EVP2
+        camera.mqtt_client = AsyncMock()
+        observer = AsyncMock()
+        camera.device_config.subscribe_async(observer)
+
+        def report(config: DeviceConfiguration) -> Message:
+            state = b64encode(config.model_dump_json().encode()).decode()
+            payload = json.dumps({EA_STATE_TOPIC: state}).encode()
+            return Message(MQTTTopics.ATTRIBUTES.value, payload)
+
+        with patch("local_console.core.camera.mixin_mqtt.datetime") as mock_time:
+            mock_time.now.side_effect = [1, 2]
+            await camera.process_incoming(report(device_config))
+            with patch.object(DeviceConfiguration, "model_validate") as mock_validate:
+                await camera.process_incoming(report(device_config))
+                mock_validate.assert_not_called()
+
+        assert camera._last_reception == 2
+        observer.assert_awaited_once_with(device_config, None)
+
+        # A status set locally meanwhile is restored by the next report
+        camera.stream_status.value = StreamStatus.Transitioning
+        await camera.process_incoming(report(device_config))
+        assert camera.stream_status.value == StreamStatus.from_string(
+            device_config.Status.Sensor
+        )
+
+        changed = device_config.model_copy(deep=True)
+        changed.Status.Sensor = (
+            "Streaming" if changed.Status.Sensor != "Streaming" else "Standby"
+        )
+        await camera.process_incoming(report(changed))
+        observer.assert_awaited_with(changed, device_config)
+        nursery.cancel_scope.cancel()
+
+
 @pytest.mark.trio
 @given(proto_spec=st.sampled_from(OnWireProtocol))
 async def test_process_systeminfo(proto_spec: OnWireProtocol) -> None:
@@ -330,8 +379,10 @@ async def test_process_incoming_telemetry(cs_init) -> None:
         mock_now = Mock()
         mock_time.now.return_value = mock_now
 
-        dummy_telemetry = {"a": "b"}
-        await camera.process_incoming("v1/devices/me/telemetry", dummy_telemetry)
+        dummy_telemetry = json.dumps({"a": "b"}).encode()
+        await camera.process_incoming(
+            Message("v1/devices/me/telemetry", dummy_telemetry)
+        )
 
         assert camera._last_reception == mock_now
 
@@ -349,10 +400,59 @@ async def test_process_incoming(topic, function, cs_init) -> None:
     camera = cs_init
     with (patch.object(camera, function) as mock_proc,):
         payload = {topic: {"a": "b"}}
-        await camera.process_incoming(MQTTTopics.ATTRIBUTES.value, payload)
+        message = Message(MQTTTopics.ATTRIBUTES.value, json.dumps(payload).encode())
+        await camera.process_incoming(message)
         mock_proc.assert_awaited_once_with(payload)
 
 
+@pytest.mark.trio
+async def test_process_incoming_attributes_request(cs_init) -> None:
+    camera = cs_init
+    camera._onwire_schema = OnWireProtocol.EVP2
+    camera.mqtt_client = AsyncMock()
+    with patch.object(camera, "streaming_rpc_stop") as mock_stop:
+        for req_id in (1, 2):
+            request = Message(f"v1/devices/me/attributes/request/{req_id}", b"{}")
+            await camera.process_incoming(request)
+
+        assert camera.attributes_available.value
+        # Only stopped on the first request after connecting
+        mock_stop.assert_awaited_once()
+        camera.mqtt_client.publish.assert_awaited_with(
+            "v1/devices/me/attributes/response/2", "{}"
+        )
+
+
+@pytest.mark.trio
+async def test_process_incoming_unhandled(cs_init) -> None:
+    camera = cs_init
+    await camera.process_incoming(Message(MQTTTopics.ATTRIBUTES.value, b'{"a": 1}'))
+    await camera.process_incoming(Message("other/topic", b"not json"))
+
+    assert camera._last_reception is None
+
+
+@pytest.mark.trio
+async def test_replay_traffic(tmp_path, cs_init, autojump_clock) -> None:
+    camera = cs_init
+    camera._onwire_schema = OnWireProtocol.EVP2
+    capture = tmp_path / "traffic.mqtt"
+    with TrafficRecorder(capture) as recorder:
+        recorder.record(Message("v1/devices/me/attributes/request/1", b"{}"))
+        status = {DEPLOY_STATUS_TOPIC: {"reconcileStatus": "ok"}}
+        recorder.record(
+            Message(MQTTTopics.ATTRIBUTES.value, json.dumps(status).encode())
+        )
+
+    with patch.object(camera, "_process_attributes_request") as mock_request:
+        stats = await camera.replay_traffic(capture, speed=None)
+
+    # Without a client to answer it, the request is not replayed
+    mock_request.assert_not_awaited()
+    assert stats.messages == 1
+    assert camera.deploy_status.value == {"reconcileStatus": "ok"}
+
+
 @pytest.mark.trio
 async def test_process_deploy_fsm_(nursery, tmp_path, cs_init) -> None:
     camera = cs_init
@@ -632,3 +732,94 @@ async def test_process_camera_upload_inferences_missing_schema(
             image_file_saved,
             mock_get_output_from_inference_results.return_value,
         )
+
+
+@pytest.mark.trio
+async def test_process_camera_upload_records_results(tmp_path, cs_init) -> None:
+    from local_console.core.camera.recording import scan_results
+
+    images_dir = tmp_path / "images"
+    inferences_dir = tmp_path / "inferences"
+    results_dir = tmp_path / "results"
+
+    camera_state = cs_init
+    camera_state.image_dir_path.value = images_dir
+    camera_state.inference_dir_path.value = inferences_dir
+    camera_state.results_dir_path.value = results_dir
+    assert camera_state.results_recorder
+
+    decoded = {"perception": {"classification_list": [{"class_id": 4, "score": 0.5}]}}
+    raw = json.dumps(
+        {
+            "DeviceID": "dev",
+            "ModelID": "model",
+            "Inferences": [{"T": "20240326110151928", "O": "AAAA"}],
+        }
+    )
+    with (
+        patch.object(
+            camera_state, "_get_flatbuffers_inference_data", return_value=decoded
+        ),
+        patch.object(ClassificationDrawer, "process_frame"),
+    ):
+        camera_state.vapp_type.value = ApplicationType.CLASSIFICATION.value
+        camera_state.vapp_schema_file.value = "classification.fbs"
+
+        image_file = tmp_path / "a.jpg"
+        image_file.write_bytes(b"jpg")
+        inference_file = tmp_path / "a.txt"
+        inference_file.write_text(raw)
+
+        camera_state._process_camera_upload(image_file)
+        camera_state._process_camera_upload(inference_file)
+
+    # Closing the recorder flushes pending rows
+    camera_state.results_dir_path.value = None
+    assert camera_state.results_recorder is None
+
+    rows = list(scan_results(results_dir))
+    assert len(rows) == 1
+    assert rows[0]["device_id"] == "dev"
+    assert rows[0]["class_id"] == 4
+
+
+@pytest.mark.trio
+async def test_results_recording_unavailable(tmp_path, cs_init, caplog) -> None:
+    not_a_dir = tmp_path / "results"
+    not_a_dir.touch()
+
+    cs_init.results_dir_path.value = not_a_dir
+
+    assert cs_init.results_recorder is None
+    assert "Could not set up results recording" in caplog.text
+
+
+@pytest.mark.trio
+async def test_process_camera_upload_muxes_video(tmp_path, cs_init) -> None:
+    from local_console.core.camera.video import read_index
+
+    from tests.unit.core.test_video import make_frame
+
+    images_dir = tmp_path / "images"
+    camera_state = cs_init
+    camera_state.image_dir_path.value = images_dir
+    camera_state.inference_dir_path.value = tmp_path / "inferences"
+    camera_state.video_segment_seconds.value = "60"
+    assert camera_state.video_recorder
+
+    for stamp in ("20240326110151000", "20240326110152000"):
+        make_frame(tmp_path / f"{stamp}.jpg", 0)
+        (tmp_path / f"{stamp}.txt").write_text(
+            json.dumps({"Inferences": [{"T": stamp, "O": "AAAA"}]})
+        )
+        camera_state._process_camera_upload(tmp_path / f"{stamp}.jpg")
+        camera_state._process_camera_upload(tmp_path / f"{stamp}.txt")
+
+    # Only the frame on display is kept as a separate file
+    assert camera_state.stream_image.value == str(images_dir / f"{stamp}.jpg")
+    assert sorted(p.suffix for p in images_dir.iterdir()) == [".avi", ".idx", ".jpg"]
+
+    segment = camera_state.video_recorder.segment
+    camera_state.video_segment_seconds.value = ""
+    assert camera_state.video_recorder is None
+    assert read_index(segment) == [1711450911000, 1711450912000]
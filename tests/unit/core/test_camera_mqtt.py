@@ -13,6 +13,7 @@
 # limitations under the License.
 #
 # SPDX-License-Identifier: Apache-2.0
+from contextlib import asynccontextmanager
 from unittest.mock import ANY
 from unittest.mock import AsyncMock
 from unittest.mock import Mock
@@ -20,12 +21,14 @@ from unittest.mock import patch
 
 import pytest
 import trio
+from local_console.clients.mqtt_codec import Message
 from local_console.core.schemas.schemas import OnWireProtocol
 from local_console.gui.device_manager import DeviceManager
 from local_console.servers.broker import BrokerException
 
 from tests.fixtures.camera import cs_init
 from tests.fixtures.driver import mock_driver_with_agent
+from tests.mocks.mock_mqtt import MockAsyncIterator
 
 
 @pytest.mark.trio
@@ -36,8 +39,8 @@ async def test_process_incoming_telemetry(cs_init) -> None:
         mock_now = Mock()
         mock_time.now.return_value = mock_now
 
-        dummy_telemetry = {"a": "b"}
-        await camera.process_incoming("v1/devices/me/telemetry", dummy_telemetry)
+        dummy_telemetry = Message("v1/devices/me/telemetry", b'{"a": "b"}')
+        await camera.process_incoming(dummy_telemetry)
 
         assert camera._last_reception == mock_now
 
@@ -101,3 +104,29 @@ async def test_broker_port_already_open(cs_init) -> None:
                 ANY,
             )
         )
+
+
+@pytest.mark.trio
+async def test_messages_survive_broker_restart() -> None:
+    from local_console.core.camera.mixin_mqtt import MQTTMixin
+
+    rounds = iter([[Message("a", b"1")], [Message("a", b"2")], []])
+
+    @asynccontextmanager
+    async def messages():
+        yield MockAsyncIterator(next(rounds))
+
+    agent = Mock()
+    agent.client.messages = messages
+    supervisor = Mock()
+    supervisor.restarts = 0
+
+    async def restart(restarts: int) -> None:
+        supervisor.restarts = restarts + 1
+        # The broker did not come back the second time
+        agent.client.connected = restarts == 0
+
+    supervisor.wait_restart = restart
+
+    received = [msg async for msg in MQTTMixin._supervised_messages(agent, supervisor)]
+    assert [msg.payload for msg in received] == [b"1", b"2"]
@@ -27,6 +27,9 @@ import trio
 from hypothesis import given
 from local_console.core.camera.enums import DeployStage
 from local_console.core.commands.deploy import DeployFSM
+from local_console.core.commands.deploy import diff_manifests
+from local_console.core.commands.deploy import manifest_setup_epilog
+from local_console.core.commands.deploy import manifest_template
 from local_console.core.commands.deploy import single_module_manifest_setup
 from local_console.core.schemas.schemas import DeploymentManifest
 from local_console.core.schemas.schemas import OnWireProtocol
@@ -138,6 +141,70 @@ def test_deployment_setup(tmpdir):
         assert str(port) in dm.deployment.modules[computed_mod_name].downloadUrl
 
 
+def two_module_template(files_dir: Path) -> DeploymentManifest:
+    return DeploymentManifest.model_validate(
+        {
+            "deployment": {
+                "deploymentId": "",
+                "instanceSpecs": {
+                    name: {"moduleId": name, "subscribe": {}, "publish": {}}
+                    for name in ("detection", "tracking")
+                },
+                "modules": {
+                    name: {
+                        "entryPoint": "main",
+                        "moduleImpl": "wasm",
+                        "downloadUrl": str(files_dir / f"{name}.wasm"),
+                        "hash": "",
+                    }
+                    for name in ("detection", "tracking")
+                },
+                "publishTopics": {},
+                "subscribeTopics": {},
+            }
+        }
+    )
+
+
+def test_delta_deployment(tmp_path):
+    (tmp_path / "detection.wasm").write_bytes(b"detection v1")
+    (tmp_path / "tracking.wasm").write_bytes(b"tracking v1")
+    webserver = Mock()
+
+    webserver.port = 8888
+    first = manifest_setup_epilog(
+        tmp_path, two_module_template(tmp_path), webserver, host_override="1.2.3.4"
+    )
+    delta = diff_manifests(first, None)
+    assert not delta.unchanged
+    assert len(delta.changed) == 2
+
+    # The last deployment's manifest can be set up again,
+    # even from another port, resulting in the same deployment
+    template = manifest_template(first)
+    assert set(template.deployment.modules) == {"detection", "tracking"}
+    assert template.deployment.instanceSpecs["tracking"].moduleId == "tracking"
+    template.deployment.modules = two_module_template(tmp_path).deployment.modules
+    webserver.port = 9999
+    again = manifest_setup_epilog(
+        tmp_path, template, webserver, host_override="1.2.3.4"
+    )
+    assert again.deployment.deploymentId == first.deployment.deploymentId
+    delta = diff_manifests(again, first)
+    assert delta.identical
+    assert not delta.changed
+
+    (tmp_path / "tracking.wasm").write_bytes(b"tracking v2")
+    updated = manifest_setup_epilog(
+        tmp_path, two_module_template(tmp_path), webserver, host_override="1.2.3.4"
+    )
+    delta = diff_manifests(updated, first)
+    assert not delta.identical
+    assert [name.split("-")[0] for name in delta.unchanged] == ["detection"]
+    assert [name.split("-")[0] for name in delta.changed] == ["tracking"]
+    assert delta.changed[0] not in first.deployment.modules
+
+
 def template_deploy_status_for_manifest(manifest: DeploymentManifest) -> dict[str, Any]:
     deploy_id = manifest.deployment.deploymentId
     instances = list(manifest.deployment.instanceSpecs.keys())
@@ -33,6 +33,7 @@ from local_console.core.schemas.edge_cloud_if_v1 import Version
 
 from tests.fixtures.camera import cs_init
 from tests.fixtures.gui import driver_set
+from tests.mocks.mock_mqtt import mock_lease
 
 
 @pytest.fixture(params=["Application Firmware", "Sensor Firmware"])
@@ -294,7 +295,6 @@ async def test_update_firmware_task_valid(tmp_path, cs_init, ota_type) -> None:
     camera_state.device_config.value = device_config(100, "Done")
 
     mock_agent = MagicMock()
-    mock_agent.mqtt_scope.return_value = AsyncMock()
     mock_agent.configure = AsyncMock()
 
     mock_server = AsyncMock()
@@ -312,7 +312,7 @@ async def test_update_firmware_task_valid(tmp_path, cs_init, ota_type) -> None:
 
     with (
         patch.object(camera_state, "ota_event") as mock_ota_event,
-        patch("local_console.core.camera.firmware.Agent", return_value=mock_agent),
+        patch("local_console.core.camera.firmware.Agent.lease", mock_lease(mock_agent)),
         patch(
             "local_console.core.camera.firmware.AsyncWebserver",
             return_value=mock_server,
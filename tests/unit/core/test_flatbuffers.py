@@ -26,6 +26,7 @@ import pytest
 from hypothesis import given
 from local_console.core.camera.flatbuffers import add_class_names
 from local_console.core.camera.flatbuffers import conform_flatbuffer_schema
+from local_console.core.camera.flatbuffers import flatbuffer_binaries_to_json
 from local_console.core.camera.flatbuffers import flatbuffer_binary_to_json
 from local_console.core.camera.flatbuffers import FlatbufferError
 from local_console.core.camera.flatbuffers import get_flatc
@@ -217,3 +218,43 @@ def test_flatbuffer_binary_to_json_error(tmp_path):
     path_txt.write_text("{}")
     with pytest.raises(FlatbufferError):
         flatbuffer_binary_to_json(tmp_path / "myschema", b"payload")
+
+
+def test_flatbuffer_binaries_to_json(tmp_path):
+    def fake_flatc(cmd, **kwargs):
+        output_area = Path(cmd[cmd.index("-o") + 1])
+        inputs = cmd[cmd.index("--") + 1 :]
+        for input_file in inputs:
+            payload = Path(input_file).read_bytes().decode()
+            (output_area / f"{Path(input_file).stem}.json").write_text(
+                json.dumps({"payload": payload})
+            )
+
+    with (
+        patch("local_console.core.camera.flatbuffers.get_flatc"),
+        patch(
+            "local_console.core.camera.flatbuffers.subprocess.run",
+            side_effect=fake_flatc,
+        ) as mock_run,
+    ):
+        decoded = flatbuffer_binaries_to_json(tmp_path / "schema", [b"a", b"b", b"c"])
+        assert decoded == [{"payload": "a"}, {"payload": "b"}, {"payload": "c"}]
+        mock_run.assert_called_once()
+
+
+def test_flatbuffer_binaries_to_json_empty(tmp_path):
+    with patch("local_console.core.camera.flatbuffers.subprocess.run") as mock_run:
+        assert flatbuffer_binaries_to_json(tmp_path / "schema", []) == []
+        mock_run.assert_not_called()
+
+
+def test_flatbuffer_binaries_to_json_error(tmp_path):
+    with (
+        patch("local_console.core.camera.flatbuffers.get_flatc"),
+        patch(
+            "local_console.core.camera.flatbuffers.subprocess.run",
+            side_effect=subprocess.CalledProcessError(1, "flatc"),
+        ),
+        pytest.raises(FlatbufferError),
+    ):
+        flatbuffer_binaries_to_json(tmp_path / "schema", [b"a"])
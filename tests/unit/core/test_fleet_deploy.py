@@ -0,0 +1,130 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+from unittest.mock import AsyncMock
+from unittest.mock import Mock
+from unittest.mock import patch
+
+import pytest
+import trio
+from local_console.core.camera.enums import DeployStage
+from local_console.core.commands.deploy import DeployFSM
+from local_console.core.commands.deploy import get_empty_deployment
+from local_console.core.commands.fleet_deploy import FleetDeployment
+from local_console.core.commands.fleet_deploy import FleetProgress
+from local_console.core.commands.fleet_deploy import select_devices
+from local_console.core.config import ConfigError
+from local_console.core.schemas.schemas import DeviceConnection
+from local_console.core.schemas.schemas import MQTTParams
+from local_console.core.schemas.schemas import OnWireProtocol
+from local_console.core.schemas.schemas import WebserverParams
+
+
+def device(name: str, port: int) -> DeviceConnection:
+    return DeviceConnection(
+        mqtt=MQTTParams(host="localhost", port=port, device_id=None),
+        webserver=WebserverParams(host="localhost", port=8000),
+        name=name,
+    )
+
+
+DEVICES = [device("lab-1", 1883), device("lab-2", 1884), device("field-1", 1885)]
+
+
+def test_select_devices():
+    assert select_devices(DEVICES, "all") == DEVICES
+    assert [d.name for d in select_devices(DEVICES, "lab-*")] == ["lab-1", "lab-2"]
+    assert [d.name for d in select_devices(DEVICES, "field-1, lab-2")] == [
+        "lab-2",
+        "field-1",
+    ]
+    with pytest.raises(ConfigError, match="lab-3"):
+        select_devices(DEVICES, "lab-1,lab-3")
+    with pytest.raises(ConfigError):
+        select_devices(DEVICES, ",")
+
+
+@pytest.mark.trio
+async def test_fleet_deployment(autojump_clock):
+    running = 0
+    peak = 0
+
+    async def execute(agent, fsm) -> bool:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await fsm.stage_callback(DeployStage.WaitAppliedConfirmation)
+        await trio.sleep(1)
+        running -= 1
+        if agent.port == 1884:
+            # As raised by the agent when the broker is unreachable
+            raise SystemExit(1)
+        return agent.port == 1883
+
+    changes = []
+    progress = FleetProgress(
+        DEVICES, on_change=lambda p, outcome: changes.append(outcome.name)
+    )
+    with (
+        patch(
+            "local_console.core.commands.fleet_deploy.Agent",
+            side_effect=lambda host, port, schema: Mock(port=port),
+        ),
+        patch(
+            "local_console.core.commands.fleet_deploy.DeployFSM.instantiate",
+            side_effect=lambda schema, deploy_fn, stage_callback, **kwargs: Mock(
+                stage_callback=stage_callback
+            ),
+        ) as mock_instantiate,
+    ):
+        webserver = Mock()
+        deployment = FleetDeployment(
+            DEVICES,
+            OnWireProtocol.EVP2,
+            get_empty_deployment(),
+            webserver,
+            execute,
+            parallelism=2,
+            progress=progress,
+        )
+        await deployment.run()
+
+    assert peak == 2
+    for call in mock_instantiate.call_args_list:
+        assert call.kwargs["webserver"] is webserver
+    assert progress.complete
+    assert [o.name for o in progress.succeeded] == ["lab-1"]
+    assert [o.name for o in progress.failed] == ["lab-2", "field-1"]
+    assert progress.outcomes["lab-2"].error == "1"
+    assert progress.outcomes["field-1"].error == (
+        f"Stopped at stage {DeployStage.WaitAppliedConfirmation}"
+    )
+    assert progress.outcomes["field-1"].elapsed == pytest.approx(1)
+    # One stage change and the end of each deployment
+    assert sorted(changes) == sorted(2 * [d.name for d in DEVICES])
+    assert progress.summary() == (
+        "3/3 devices done: 1 succeeded, 2 failed, 0 in progress"
+    )
+
+
+@pytest.mark.trio
+async def test_shared_webserver_outlives_fsm():
+    webserver = Mock()
+    fsm = DeployFSM.instantiate(OnWireProtocol.EVP1, AsyncMock(), webserver=webserver)
+    fsm.stop()
+
+    webserver.start.assert_not_called()
+    webserver.stop.assert_not_called()
+    assert fsm.done.is_set()
@@ -0,0 +1,184 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+from unittest.mock import patch
+
+import pytest
+from local_console.core.camera.recording import columnar_available
+from local_console.core.camera.recording import get_inference_metadata
+from local_console.core.camera.recording import InferenceRecorder
+from local_console.core.camera.recording import parse_camera_timestamp
+from local_console.core.camera.recording import RecordingError
+from local_console.core.camera.recording import records_from_decoded
+from local_console.core.camera.recording import ResultsFilter
+from local_console.core.camera.recording import ResultsFormat
+from local_console.core.camera.recording import scan_results
+
+
+def payload(stamp: str = "20240326110151928", device: str = "dev-A") -> dict:
+    return {
+        "DeviceID": device,
+        "ModelID": "0300009999990100",
+        "Image": True,
+        "Inferences": [{"T": stamp, "O": "AAAA"}],
+    }
+
+
+DETECTION = {
+    "perception": {
+        "object_detection_list": [
+            {
+                "class_id": 0,
+                "bounding_box_type": "BoundingBox2d",
+                "bounding_box": {"left": 1, "top": 2, "right": 3, "bottom": 4},
+                "score": 0.75,
+            },
+            {
+                "class_id": 3,
+                "bounding_box_type": "BoundingBox2d",
+                "bounding_box": {"left": 5, "top": 6, "right": 7, "bottom": 8},
+                "score": 0.5,
+                "class_name": "dog",
+            },
+        ]
+    }
+}
+
+CLASSIFICATION = {
+    "perception": {
+        "classification_list": [
+            {"class_id": 2, "score": 0.875},
+            {"class_id": 1, "score": 0.125},
+        ]
+    }
+}
+
+
+def test_parse_camera_timestamp():
+    assert parse_camera_timestamp("19700101000001500") == 1500
+
+
+def test_inference_metadata():
+    device, model, stamp = get_inference_metadata(payload("19700101000002000"))
+    assert device == "dev-A"
+    assert model == "0300009999990100"
+    assert stamp == 2000
+
+
+@pytest.mark.parametrize(
+    "malformed",
+    [
+        {"Inferences": [{"T": None, "O": "AAAA"}]},
+        {"Inferences": [{"T": 20240326110151928, "O": "AAAA"}]},
+        {"Inferences": []},
+        [{"T": "20240326110151928"}],
+    ],
+)
+def test_inference_metadata_malformed(malformed):
+    with pytest.raises(RecordingError):
+        get_inference_metadata(malformed)
+
+
+def test_records_from_detection():
+    records = records_from_decoded(DETECTION, "dev", "model", 10)
+    assert len(records) == 2
+    assert records[0].task == "detection"
+    assert (records[0].left, records[0].top, records[0].right, records[0].bottom) == (
+        1,
+        2,
+        3,
+        4,
+    )
+    assert records[1].class_name == "dog"
+
+
+def test_records_from_classification():
+    records = records_from_decoded(CLASSIFICATION, "dev", "model", 10)
+    assert [r.class_id for r in records] == [2, 1]
+    assert all(r.task == "classification" and r.left is None for r in records)
+
+
+def test_records_from_unknown_task():
+    with pytest.raises(RecordingError):
+        records_from_decoded({"perception": {}}, "dev", "model", 10)
+
+
+@pytest.mark.parametrize(
+    "results_format",
+    [
+        ResultsFormat.NDJSON,
+        pytest.param(
+            ResultsFormat.ARROW,
+            marks=pytest.mark.skipif(not columnar_available(), reason="no pyarrow"),
+        ),
+        pytest.param(
+            ResultsFormat.PARQUET,
+            marks=pytest.mark.skipif(not columnar_available(), reason="no pyarrow"),
+        ),
+    ],
+)
+def test_record_and_scan(tmp_path, results_format):
+    recorder = InferenceRecorder(tmp_path, results_format, row_group_size=3)
+    assert recorder.path.suffix == f".{results_format.extension}"
+
+    assert recorder.record(payload("19700101000001000"), DETECTION) == 2
+    assert recorder.record(payload("19700101000002000"), CLASSIFICATION) == 2
+    recorder.record(payload("19700101000003000", device="dev-B"), DETECTION)
+    recorder.close()
+
+    rows = list(scan_results(tmp_path))
+    assert len(rows) == 6
+    assert rows[0]["timestamp"] == 1000
+    assert rows[0]["bottom"] == 4
+    assert rows[2]["task"] == "classification"
+    assert rows[2]["left"] is None
+
+    dev_b = list(scan_results(tmp_path, ResultsFilter(device_id="dev-B")))
+    assert len(dev_b) == 2
+
+    confident = list(scan_results(tmp_path, ResultsFilter(min_score=0.7)))
+    assert sorted(r["class_id"] for r in confident) == [0, 0, 2]
+
+    window = list(scan_results(tmp_path, ResultsFilter(since=2000, until=3000)))
+    assert [r["class_id"] for r in window] == [2, 1]
+
+
+def test_row_groups_are_flushed_on_size(tmp_path):
+    recorder = InferenceRecorder(tmp_path, ResultsFormat.NDJSON, row_group_size=4)
+    recorder.record(payload(), DETECTION)
+    assert recorder.path.read_text() == ""
+
+    recorder.record(payload(), CLASSIFICATION)
+    assert len(recorder.path.read_text().splitlines()) == 4
+    recorder.close()
+
+
+def test_row_groups_are_flushed_on_time(tmp_path):
+    with patch("local_console.core.camera.recording.time.monotonic") as clock:
+        clock.return_value = 100.0
+        recorder = InferenceRecorder(
+            tmp_path, ResultsFormat.NDJSON, row_group_size=100, flush_interval=5.0
+        )
+        recorder.record(payload(), DETECTION)
+        assert recorder.path.read_text() == ""
+
+        clock.return_value = 105.0
+        recorder.record(payload(), CLASSIFICATION)
+        assert len(recorder.path.read_text().splitlines()) == 4
+
+        recorder.record(payload(), CLASSIFICATION)
+        assert len(recorder.path.read_text().splitlines()) == 4
+        recorder.close()
+    assert len(recorder.path.read_text().splitlines()) == 6
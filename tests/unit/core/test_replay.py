@@ -0,0 +1,131 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+
+import pytest
+import trio
+from local_console.core.camera.recording import parse_camera_timestamp
+from local_console.core.camera.replay import captured_pairs
+from local_console.core.camera.replay import ReplayError
+from local_console.core.camera.replay import ReplaySource
+from local_console.core.camera.replay import ReplayStats
+from trio.testing import MockClock
+
+
+def capture(directory, stamps: list[str], images: bool = True) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    for index, stamp in enumerate(stamps):
+        name = f"{index:04d}"
+        (directory / f"{name}.txt").write_text(
+            json.dumps(
+                {
+                    "DeviceID": "dev",
+                    "ModelID": "model",
+                    "Image": True,
+                    "Inferences": [{"T": stamp, "O": "AAAA"}],
+                }
+            )
+        )
+        if images:
+            (directory / f"{name}.jpg").write_bytes(b"jpeg")
+
+
+def test_captured_pairs(tmp_path):
+    # Capture times are not in file name order
+    capture(tmp_path, ["20240326110152000", "20240326110151000"])
+    (tmp_path / "lonely.jpg").write_bytes(b"jpeg")
+
+    pairs = captured_pairs(tmp_path, tmp_path)
+
+    assert [p.image.name for p in pairs] == ["0001.jpg", "0000.jpg"]
+    assert pairs[1].timestamp - pairs[0].timestamp == 1000
+    assert pairs[0].inference == tmp_path / "0001.txt"
+
+
+@pytest.mark.parametrize(
+    "payload", ['{"Inferences":[{"T":null,"O":"AA=="}]}', '[{"T":"1"}]']
+)
+def test_captured_pairs_malformed_payload(tmp_path, payload):
+    (tmp_path / "20240326110151000.txt").write_text(payload)
+    (tmp_path / "20240326110151000.jpg").write_bytes(b"jpeg")
+
+    pairs = captured_pairs(tmp_path, tmp_path)
+
+    # Timed after the file name instead
+    assert pairs[0].timestamp == parse_camera_timestamp("20240326110151000")
+
+
+def test_captured_pairs_separate_directories(tmp_path):
+    capture(tmp_path / "inferences", ["20240326110151000"], images=False)
+    (tmp_path / "images").mkdir()
+    (tmp_path / "images" / "0000.jpg").write_bytes(b"jpeg")
+
+    pairs = captured_pairs(tmp_path / "images", tmp_path / "inferences")
+    assert len(pairs) == 1
+
+
+def replay_with(pairs, speed) -> tuple[ReplayStats, list[tuple[float, str]]]:
+    incoming = []
+
+    async def main() -> ReplayStats:
+        def on_incoming(path):
+            assert path.is_file()
+            incoming.append((trio.current_time(), path.name))
+
+        return await ReplaySource(pairs, on_incoming, speed).run()
+
+    stats = trio.run(main, clock=MockClock(autojump_threshold=0))
+    return stats, incoming
+
+
+@pytest.mark.parametrize("speed, span", [(1.0, 3.0), (4.0, 0.75)])
+def test_replay_timing(tmp_path, speed, span):
+    capture(tmp_path, ["20240326110151000", "20240326110152000", "20240326110154000"])
+    pairs = captured_pairs(tmp_path, tmp_path)
+
+    stats, incoming = replay_with(pairs, speed)
+
+    assert [name for _, name in incoming] == [
+        "0000.jpg",
+        "0000.txt",
+        "0001.jpg",
+        "0001.txt",
+        "0002.jpg",
+        "0002.txt",
+    ]
+    start = incoming[0][0]
+    assert incoming[2][0] - start == pytest.approx(span / 3)
+    assert incoming[4][0] - start == pytest.approx(span)
+    assert stats.pairs == 3
+    assert stats.elapsed == pytest.approx(span)
+    assert stats.throughput == pytest.approx(3 / span)
+
+
+def test_replay_max_speed(tmp_path):
+    capture(tmp_path, ["20240326110151000", "20240326120151000"])
+    pairs = captured_pairs(tmp_path, tmp_path)
+
+    stats, incoming = replay_with(pairs, None)
+
+    assert len(incoming) == 4
+    assert stats.elapsed == 0
+    assert len(stats.durations) == 2
+    assert stats.percentile(95) >= stats.percentile(50)
+
+
+def test_replay_invalid_speed():
+    with pytest.raises(ReplayError):
+        ReplaySource([], print, 0)
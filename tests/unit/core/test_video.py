@@ -0,0 +1,128 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import cv2
+import numpy as np
+import pytest
+from local_console.core.camera.video import find_frame
+from local_console.core.camera.video import index_path
+from local_console.core.camera.video import read_frame
+from local_console.core.camera.video import read_index
+from local_console.core.camera.video import SegmentRecorder
+from local_console.core.camera.video import VideoContainer
+from local_console.core.camera.video import VideoRecordingError
+from local_console.utils.fstools import StorageSizeWatcher
+
+
+def make_frame(path, shade: int, size: tuple[int, int] = (64, 48)):
+    width, height = size
+    cv2.imwrite(str(path), np.full((height, width, 3), shade, np.uint8))
+    return path
+
+
+@pytest.mark.parametrize("container", list(VideoContainer))
+def test_record_and_find_frames(tmp_path, container):
+    frames = tmp_path / "frames"
+    frames.mkdir()
+    recorder = SegmentRecorder(tmp_path / "video", 1.0, container)
+
+    locations = [
+        recorder.add_frame(make_frame(frames / f"{i}.jpg", i * 40), 1000 + i * 400)
+        for i in range(5)
+    ]
+    recorder.close()
+
+    # 1000, 1400, 1800 | 2200, 2600
+    assert [loc.offset for loc in locations] == [0, 1, 2, 0, 1]
+    assert locations[0].segment.name == f"segment-1000.{container}"
+    assert locations[3].segment.name == f"segment-2200.{container}"
+    assert read_index(locations[0].segment) == [1000, 1400, 1800]
+
+    found = find_frame(tmp_path / "video", 2500)
+    assert found == locations[3]
+    frame = read_frame(found)
+    assert frame.shape == (48, 64, 3)
+    assert abs(frame.mean() - 120) < 10
+
+    assert find_frame(tmp_path / "video", 999) is None
+
+
+def test_new_segment_on_frame_size_change(tmp_path):
+    recorder = SegmentRecorder(tmp_path, 60.0)
+    first = recorder.add_frame(make_frame(tmp_path / "a.jpg", 0), 1000)
+    second = recorder.add_frame(make_frame(tmp_path / "b.jpg", 0, (32, 32)), 1100)
+    recorder.close()
+
+    assert first.segment != second.segment
+    assert second.offset == 0
+
+
+def test_unreadable_frame(tmp_path):
+    (tmp_path / "a.jpg").write_bytes(b"not a jpeg")
+    recorder = SegmentRecorder(tmp_path)
+    with pytest.raises(VideoRecordingError):
+        recorder.add_frame(tmp_path / "a.jpg", 1000)
+
+
+def test_invalid_duration(tmp_path):
+    with pytest.raises(VideoRecordingError):
+        SegmentRecorder(tmp_path, 0)
+
+
+def test_prunes_whole_segments(tmp_path):
+    frames = tmp_path / "frames"
+    frames.mkdir()
+    video = tmp_path / "video"
+    video.mkdir()
+    storage = StorageSizeWatcher()
+    storage.set_path(video)
+
+    recorder = SegmentRecorder(video, 1.0, storage=storage)
+    for i in range(3):
+        recorder.add_frame(make_frame(frames / f"{i}.jpg", 0), 1000 + i * 1000)
+    sizes = {p.name: p.stat().st_size for p in video.iterdir()}
+
+    # Leave room for the newest two segments only
+    last_two = sorted(sizes)[-4:]
+    storage.set_storage_limit(sum(sizes[name] for name in last_two))
+    recorder.add_frame(make_frame(frames / "3.jpg", 0), 4000)
+    recorder.close()
+
+    remaining = sorted(p.name for p in video.iterdir())
+    assert "segment-1000.avi" not in remaining
+    assert "segment-1000.avi.idx" not in remaining
+    # Each remaining segment keeps its index
+    for name in remaining:
+        if name.endswith(".avi"):
+            assert index_path(video / name).exists()
+    assert storage.storage_usage == sum(
+        (video / name).stat().st_size for name in remaining
+    )
+
+
+def test_prune_segment_being_recorded(tmp_path):
+    storage = StorageSizeWatcher()
+    storage.set_path(tmp_path)
+    recorder = SegmentRecorder(tmp_path, 60.0, storage=storage)
+    recorder.add_frame(make_frame(tmp_path / "a.jpg", 0), 1000)
+    storage.remove_file(tmp_path / "a.jpg")
+
+    storage.set_storage_limit(0)
+    assert recorder.segment is None
+    assert list(tmp_path.iterdir()) == []
+
+    location = recorder.add_frame(make_frame(tmp_path / "b.jpg", 0), 2000)
+    assert location.offset == 0
+    recorder.close()
@@ -174,3 +174,13 @@ async def test_device_manager_add_invalid_port_same_name_retry_failure(nursery):
             assert len(config_obj.get_config().devices) == 2
             assert config_obj.get_config().devices[1].name == "test_device"
             assert config_obj.get_config().devices[1].mqtt.port == 4567
+
+
+@pytest.mark.trio
+async def test_devices_share_directory_monitor():
+    async with mock_persistency_update() as (mock_persistency, device_manager):
+        await device_manager.add_device(DeviceListItem(name="another", port=1234))
+
+        states = list(device_manager.state_factory.values())
+        assert len(states) == 2
+        assert all(s.dir_monitor is device_manager.dir_monitor for s in states)
@@ -25,6 +25,7 @@ import trio
 from hypothesis import given
 from hypothesis import settings
 from hypothesis import strategies as st
+from local_console.clients.rpc import PendingRPCs
 from local_console.core.camera.axis_mapping import SENSOR_SIZE
 from local_console.core.camera.enums import StreamStatus
 from local_console.core.schemas.edge_cloud_if_v1 import StartUploadInferenceData
@@ -37,8 +38,8 @@ from tests.fixtures.camera import cs_init
 from tests.fixtures.camera import cs_init_context
 from tests.fixtures.driver import mock_driver_with_agent
 from tests.fixtures.driver import mocked_driver_with_agent  # noqa
-from tests.mocks.mock_paho_mqtt import MockAsyncIterator
-from tests.mocks.mock_paho_mqtt import MockMQTTMessage
+from tests.mocks.mock_mqtt import MockAsyncIterator
+from tests.mocks.mock_mqtt import MockMQTTMessage
 
 
 def create_new(root: Path) -> Path:
@@ -95,7 +96,9 @@ async def test_streaming_rpc_start(mocked_driver_with_agent, cs_init) -> None:
     driver, mock_agent = mocked_driver_with_agent
 
     mock_agent.publish = AsyncMock()
-    mock_rpc = AsyncMock()
+    call = PendingRPCs().register("1")
+    call.set_response({"reqid": "1", "status": "ok"})
+    mock_rpc = AsyncMock(return_value=call)
     mock_agent.rpc = mock_rpc
 
     driver.camera_state = cs_init
@@ -124,6 +127,26 @@ async def test_streaming_rpc_start(mocked_driver_with_agent, cs_init) -> None:
                 CropVSize=v_size,
             ).model_dump_json(),
         )
+    assert driver.camera_state.stream_status.value == StreamStatus.Active
+
+
+@pytest.mark.trio
+async def test_streaming_rpc_start_timeout(
+    mocked_driver_with_agent, cs_init, autojump_clock
+) -> None:
+    driver, mock_agent = mocked_driver_with_agent
+    mock_agent.rpc = AsyncMock(return_value=PendingRPCs().register("1"))
+    driver.camera_state = cs_init
+    driver.camera_state.mqtt_client = mock_agent
+    driver.camera_state.upload_port = 1234
+    driver.camera_state.stream_status.value = StreamStatus.Transitioning
+
+    with patch(
+        "local_console.core.camera.mixin_streaming.get_webserver_ip",
+        return_value="localhost",
+    ):
+        await driver.camera_state.streaming_rpc_start()
+    assert driver.camera_state.stream_status.value == StreamStatus.Inactive
 
 
 @pytest.mark.trio
@@ -0,0 +1,97 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import logging
+from pathlib import Path
+
+import pytest
+from local_console.servers.broker_logs import BrokerEvent
+from local_console.servers.broker_logs import BrokerEventKind
+from local_console.servers.broker_logs import BrokerLogIngester
+from local_console.servers.broker_logs import RotatingLogFile
+
+LOGGER = "local_console.servers.broker_logs"
+
+SESSION = (
+    b"New connection from 127.0.0.1:50000 on port 1883.\n"
+    b"New client connected from 127.0.0.1:50000 as cam-1 (p2, c1, k60).\n"
+    b"Received SUBSCRIBE from cam-1\n"
+    b"\tv1/devices/me/attributes (QoS 1)\n"
+    b"\tv1/devices/me/rpc/request/+ (QoS 1)\n"
+    b"Sending SUBACK to cam-1\n"
+    b"Client cam-1 closed its connection.\n"
+)
+
+
+@pytest.mark.trio
+async def test_structured_events(caplog):
+    ingester = BrokerLogIngester("On port 1883")
+    with caplog.at_level(logging.DEBUG, logger=LOGGER):
+        # Lines split across chunks
+        ingester.feed(SESSION[:70])
+        ingester.feed(SESSION[70:])
+
+    events = [
+        record.broker_event
+        for record in caplog.records
+        if hasattr(record, "broker_event")
+    ]
+    assert events == [
+        BrokerEvent(BrokerEventKind.CONNECT, "cam-1", "127.0.0.1:50000"),
+        BrokerEvent(BrokerEventKind.SUBSCRIBE, "cam-1", "v1/devices/me/attributes"),
+        BrokerEvent(BrokerEventKind.SUBSCRIBE, "cam-1", "v1/devices/me/rpc/request/+"),
+        BrokerEvent(BrokerEventKind.DISCONNECT, "cam-1"),
+    ]
+    assert ingester.events[BrokerEventKind.SUBSCRIBE] == 2
+    assert not ingester.clients
+    assert "Sending SUBACK to cam-1" in caplog.messages
+
+
+@pytest.mark.trio
+async def test_no_decoding_above_debug(caplog):
+    ingester = BrokerLogIngester("On port 1883")
+    with caplog.at_level(logging.INFO, logger=LOGGER):
+        ingester.feed(SESSION)
+
+    assert not caplog.records
+    assert not ingester.events
+
+
+@pytest.mark.trio
+async def test_publish_lines_rate_limited(caplog, autojump_clock):
+    ingester = BrokerLogIngester("On port 1883", publish_rate=5, publish_sample=10)
+    line = b"Received PUBLISH from cam-1 (d0, q0, r0, m0, 'v1/devices/me/telemetry', ... (20 bytes))\n"
+    with caplog.at_level(logging.DEBUG, logger=LOGGER):
+        ingester.feed(line * 50)
+        ingester.feed(b"New client connected from 127.0.0.1:50001 as cam-2 (p2).\n")
+
+    publish_logs = [m for m in caplog.messages if "PUBLISH" in m]
+    # The first five, then one out of ten of the remaining 45
+    assert len(publish_logs) == 5 + 4
+    assert ingester.suppressed == 45
+    assert ingester.clients == {"cam-2"}
+
+
+def test_rotating_log_file(tmp_path: Path):
+    path = tmp_path / "mosquitto.log"
+    log = RotatingLogFile(path, max_bytes=10, backups=2)
+    for chunk in (b"aaaaaa", b"bbbbbb", b"cccccc", b"dddddd"):
+        log.write(chunk)
+    log.close()
+
+    assert path.read_bytes() == b"dddddd"
+    assert (tmp_path / "mosquitto.log.1").read_bytes() == b"cccccc"
+    assert (tmp_path / "mosquitto.log.2").read_bytes() == b"bbbbbb"
+    assert not (tmp_path / "mosquitto.log.3").exists()
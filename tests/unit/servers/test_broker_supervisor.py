@@ -0,0 +1,131 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import socket
+import sys
+from unittest.mock import AsyncMock
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+import trio
+from local_console.clients.agent import Agent
+from local_console.core.schemas.schemas import OnWireProtocol
+from local_console.servers.broker import BrokerException
+from local_console.servers.broker import BrokerSupervisor
+from local_console.servers.broker import INITIAL_BACKOFF
+from local_console.servers.broker import probe_broker
+from local_console.servers.broker import spawn_broker
+from local_console.servers.broker import start_mosquitto
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.trio
+async def test_probe_broker(nursery):
+    port = free_port()
+    assert not await probe_broker(port)
+    async with spawn_broker(port, nursery, False, embedded=True):
+        assert await probe_broker(port)
+
+
+@pytest.mark.trio
+async def test_restart_after_exit(nursery):
+    port = free_port()
+    async with spawn_broker(port, nursery, False, embedded=True) as supervisor:
+        reconnect = AsyncMock()
+        supervisor.on_ready(reconnect)
+        assert supervisor.running
+        assert supervisor.restarts == 0
+
+        for restarts in range(1, 3):
+            assert supervisor.embedded_broker
+            supervisor.embedded_broker.close()
+            with trio.fail_after(5):
+                await supervisor.wait_restart(restarts - 1)
+            assert supervisor.restarts == restarts
+            assert reconnect.await_count == restarts
+            assert await probe_broker(port)
+
+        # Backing off exponentially
+        assert supervisor.last_recovery
+        assert supervisor.last_recovery >= 2 * INITIAL_BACKOFF
+    assert not supervisor.running
+
+
+@pytest.mark.trio
+async def test_backoff_resets_once_stable(nursery, autojump_clock):
+    supervisor = BrokerSupervisor(1883, nursery)
+    exits: list[trio.Event] = []
+    sleeps: list[float] = []
+
+    async def start(config_file):
+        exits.append(trio.Event())
+        return exits[-1]
+
+    async def sleep(delay: float) -> None:
+        sleeps.append(delay)
+
+    with (
+        patch.object(supervisor, "_start", start),
+        patch("local_console.servers.broker.trio.sleep", sleep),
+    ):
+        await nursery.start(supervisor.run)
+        for uptime in (0, 0, 0, 40, 0):
+            await trio.testing.wait_all_tasks_blocked()
+            await trio.sleep_until(trio.current_time() + uptime)
+            exits[-1].set()
+        await trio.testing.wait_all_tasks_blocked()
+        supervisor.stop()
+
+    initial = supervisor.initial_backoff
+    assert sleeps == [initial, 2 * initial, 4 * initial, initial, 2 * initial]
+
+
+@pytest.mark.trio
+@pytest.mark.skipif(sys.platform == "win32", reason="Fake mosquitto is a shell script")
+async def test_mosquitto_port_held_by_another_broker(nursery, tmp_path):
+    port = free_port()
+    mosquitto = tmp_path / "mosquitto"
+    mosquitto.write_text("#!/bin/sh\necho 'Error: Address already in use'\nsleep 10\n")
+    mosquitto.chmod(0o755)
+    config_file = tmp_path / "broker.toml"
+    config_file.touch()
+
+    async with spawn_broker(port, nursery, False, embedded=True):
+        with (
+            patch("local_console.servers.broker.which", return_value=str(mosquitto)),
+            pytest.raises(BrokerException, match="Address already in use"),
+        ):
+            await start_mosquitto(config_file, nursery, f"On port {port}", port)
+
+
+@pytest.mark.trio
+async def test_agent_reconnect():
+    agent = Agent("localhost", 1883, OnWireProtocol.EVP2)
+    agent.client = MagicMock()
+    agent.client.connected = False
+    agent.client.connect = AsyncMock()
+    agent.client.subscribe = AsyncMock()
+    agent._subscriptions["v1/devices/me/attributes"] = 1
+
+    await agent.reconnect()
+
+    agent.client.connect.assert_awaited_once_with("localhost", 1883)
+    agent.client.subscribe.assert_awaited_once_with("v1/devices/me/attributes")
@@ -0,0 +1,195 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import pytest
+import trio
+from local_console.clients.mqtt_codec import encode_connect
+from local_console.clients.mqtt_codec import Message
+from local_console.clients.mqtt_codec import MQTTVersion
+from local_console.clients.mqtt_codec import PacketReader
+from local_console.clients.mqtt_codec import PacketType
+from local_console.clients.trio_mqtt import MQTTClient
+from local_console.clients.trio_mqtt import MQTTConnectionError
+from local_console.servers.broker import BrokerException
+from local_console.servers.broker import spawn_broker
+from local_console.servers.embedded_broker import EmbeddedBroker
+from local_console.servers.embedded_broker import filter_matches
+from local_console.servers.embedded_broker import valid_topic_filter
+
+
+@asynccontextmanager
+async def running_broker() -> AsyncIterator[tuple[EmbeddedBroker, trio.Nursery]]:
+    async with trio.open_nursery() as nursery:
+        broker = EmbeddedBroker(0, "127.0.0.1")
+        await nursery.start(broker.run)
+        yield broker, nursery
+        nursery.cancel_scope.cancel()
+
+
+async def connect(
+    broker: EmbeddedBroker,
+    nursery: trio.Nursery,
+    client_id: str,
+    version: MQTTVersion = MQTTVersion.V311,
+) -> MQTTClient:
+    client = MQTTClient(client_id, nursery, version)
+    await client.connect("127.0.0.1", broker.port)
+    return client
+
+
+async def receive(client: MQTTClient, count: int) -> list[Message]:
+    received = []
+    with trio.fail_after(5):
+        async with client.messages() as mgen:
+            async for msg in mgen:
+                received.append(msg)
+                if len(received) == count:
+                    break
+    return received
+
+
+@pytest.mark.parametrize(
+    "topic_filter, valid",
+    [
+        ("a/+/c", True),
+        ("#", True),
+        ("a/#", True),
+        ("a/#/c", False),
+        ("a/b+", False),
+        ("", False),
+    ],
+)
+def test_valid_topic_filter(topic_filter: str, valid: bool):
+    assert valid_topic_filter(topic_filter) == valid
+
+
+def test_system_topics_skip_leading_wildcards():
+    assert not filter_matches("#", "$SYS/broker/load")
+    assert filter_matches("$SYS/#", "$SYS/broker/load")
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("version", list(MQTTVersion))
+@pytest.mark.parametrize("qos", [0, 1, 2])
+async def test_publish_to_wildcard_subscription(version: MQTTVersion, qos: int):
+    async with running_broker() as (broker, nursery):
+        subscriber = await connect(broker, nursery, "sub", version)
+        assert await subscriber.subscribe("v1/devices/+/telemetry", qos) == min(qos, 1)
+        publisher = await connect(broker, nursery, "pub", version)
+        await publisher.publish("v1/devices/me/telemetry", b"1", qos=qos)
+        await publisher.publish("v1/devices/me/attributes", b"2", qos=qos)
+        await publisher.publish("v1/devices/you/telemetry", b"3", qos=qos)
+
+        received = await receive(subscriber, 2)
+        assert [msg.payload for msg in received] == [b"1", b"3"]
+        assert all(msg.qos == min(qos, 1) for msg in received)
+
+
+@pytest.mark.trio
+async def test_retained_messages():
+    async with running_broker() as (broker, nursery):
+        publisher = await connect(broker, nursery, "pub")
+        await publisher.publish("attributes/a", b"old", qos=1, retain=True)
+        await publisher.publish("attributes/a", b"new", qos=1, retain=True)
+        await publisher.publish("attributes/b", b"b", qos=1, retain=True)
+        await publisher.publish("attributes/b", b"", qos=1, retain=True)
+
+        subscriber = await connect(broker, nursery, "sub")
+        await subscriber.subscribe("attributes/#", 1)
+        (msg,) = await receive(subscriber, 1)
+        assert (msg.topic, msg.payload, msg.retain) == ("attributes/a", b"new", True)
+        assert list(broker.retained) == ["attributes/a"]
+
+
+@pytest.mark.trio
+async def test_unsubscribe_and_disconnect():
+    async with running_broker() as (broker, nursery):
+        client = await connect(broker, nursery, "client")
+        await client.subscribe("a", 1)
+        await client.subscribe("b", 1)
+        await client.unsubscribe("a")
+        await client.publish("a", b"", qos=1)
+        await client.publish("b", b"", qos=1)
+        (msg,) = await receive(client, 1)
+        assert msg.topic == "b"
+
+        assert broker.clients == ["client"]
+        await client.disconnect()
+        await trio.testing.wait_all_tasks_blocked()
+        assert broker.clients == []
+        assert broker._subscriptions == {}
+
+
+@pytest.mark.trio
+async def test_client_id_takeover():
+    async with running_broker() as (broker, nursery):
+        first = await connect(broker, nursery, "device")
+        await connect(broker, nursery, "device")
+        with trio.fail_after(5):
+            while first.connected:
+                await trio.sleep(0.01)
+        assert broker.clients == ["device"]
+
+
+@pytest.mark.trio
+async def test_will_on_connection_loss():
+    async with running_broker() as (broker, nursery):
+        observer = await connect(broker, nursery, "observer")
+        await observer.subscribe("status", 1)
+
+        stream = await trio.open_tcp_stream("127.0.0.1", broker.port)
+        data = encode_connect("device", 0)
+        # Sets the will flag, and appends the will topic and message
+        will = b"\x00\x06status\x00\x04gone"
+        data = (
+            data[:1]
+            + bytes([data[1] + len(will)])
+            + data[2:9]
+            + bytes([data[9] | 0x04])
+            + data[10:]
+            + will
+        )
+        await stream.send_all(data)
+        packets = PacketReader().feed(await stream.receive_some())
+        assert packets[0].type == PacketType.CONNACK
+        await stream.aclose()
+
+        (msg,) = await receive(observer, 1)
+        assert msg.payload == b"gone"
+
+
+@pytest.mark.trio
+async def test_invalid_publish_closes_connection():
+    async with running_broker() as (broker, nursery):
+        client = await connect(broker, nursery, "client")
+        await client.publish("a/#", b"")
+        with trio.fail_after(5):
+            while client.connected:
+                await trio.sleep(0.01)
+        with pytest.raises(MQTTConnectionError):
+            await client.subscribe("a")
+
+
+@pytest.mark.trio
+async def test_spawn_embedded_broker_port_in_use(nursery):
+    async with spawn_broker(0, nursery, False, embedded=True) as supervisor:
+        broker = supervisor.embedded_broker
+        assert isinstance(broker, EmbeddedBroker)
+        with pytest.raises(BrokerException):
+            async with spawn_broker(broker.port, nursery, False, embedded=True):
+                pass
@@ -0,0 +1,188 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+from pathlib import Path
+from unittest.mock import AsyncMock
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+import trio
+from local_console.clients.mqtt_codec import Message
+from local_console.core.camera.enums import MQTTTopics
+from local_console.core.schemas.schemas import OnWireProtocol
+from local_console.servers.broker import BrokerException
+from local_console.servers.broker import populate_shared_broker_conf
+from local_console.servers.shared_broker import DEVICE_BUFFER
+from local_console.servers.shared_broker import SharedBroker
+
+from tests.mocks.mock_mqtt import MockAsyncIterator
+
+
+def test_shared_broker_conf(tmp_path: Path):
+    config_file = tmp_path / "broker.toml"
+    populate_shared_broker_conf(
+        1882, {1884: "devices/1884/", 1883: "devices/1883/"}, config_file
+    )
+
+    lines = config_file.read_text().splitlines()
+    assert "listener 1882 127.0.0.1" in lines
+    listeners = [line for line in lines if line.startswith("listener 188")][1:]
+    assert listeners == ["listener 1883", "listener 1884"]
+    assert lines[lines.index("listener 1884") + 1] == "mount_point devices/1884/"
+
+
+class FakeMosquitto:
+    def __init__(self) -> None:
+        self.exited = trio.Event()
+
+    async def wait(self) -> None:
+        await self.exited.wait()
+
+    def kill(self) -> None:
+        self.exited.set()
+
+
+@pytest.fixture
+def mosquitto():
+    configs: list[str] = []
+    processes: list[FakeMosquitto] = []
+
+    async def start(config_file: Path, nursery, location, port, log_file=None):
+        configs.append(config_file.read_text())
+        if "listener 1999" in configs[-1]:
+            raise BrokerException("Error: Address already in use")
+        processes.append(FakeMosquitto())
+        return processes[-1]
+
+    client = MagicMock()
+    client.connected = True
+    client.connect = AsyncMock()
+    client.disconnect = AsyncMock()
+    client.subscribe = AsyncMock()
+    client.unsubscribe = AsyncMock()
+    client.publish = AsyncMock()
+    client.messages.return_value.__aenter__.return_value = MockAsyncIterator([])
+    with (
+        patch("local_console.servers.shared_broker.start_mosquitto", start),
+        patch("local_console.servers.shared_broker.MQTTClient", return_value=client),
+    ):
+        yield configs, client, processes
+
+
+@pytest.mark.trio
+async def test_attached_device_is_mounted(nursery, mosquitto):
+    configs, client, _ = mosquitto
+    broker = SharedBroker(1882, [1883])
+    await nursery.start(broker.run)
+
+    async with broker.attach("localhost", 1883, OnWireProtocol.EVP2) as (
+        agent,
+        messages,
+    ):
+        await agent.subscribe(MQTTTopics.ATTRIBUTES.value)
+        await agent.publish(MQTTTopics.ATTRIBUTES.value, "{}")
+        client.subscribe.assert_awaited_once_with(
+            "devices/1883/v1/devices/me/attributes"
+        )
+        client.publish.assert_awaited_once_with(
+            "devices/1883/v1/devices/me/attributes", payload="{}", qos=0
+        )
+
+        broker.route(Message("devices/1883/v1/devices/me/telemetry", b"{}"))
+        broker.route(Message("devices/1884/v1/devices/me/telemetry", b"{}"))
+        broker.route(Message("elsewhere", b"{}"))
+        assert messages.receive_nowait().topic == "v1/devices/me/telemetry"
+        with pytest.raises(trio.WouldBlock):
+            messages.receive_nowait()
+
+    client.unsubscribe.assert_awaited_once_with("devices/1883/v1/devices/me/attributes")
+    assert len(configs) == 1
+
+
+@pytest.mark.trio
+async def test_control_messages_survive_telemetry_flood(nursery, mosquitto):
+    configs, client, _ = mosquitto
+    broker = SharedBroker(1882, [1883])
+    await nursery.start(broker.run)
+
+    async with broker.attach("localhost", 1883, OnWireProtocol.EVP2) as (_, messages):
+        broker.route(
+            Message("devices/1883/v1/devices/me/attributes", b'{"deploymentStatus": 1}')
+        )
+        for _ in range(10 * DEVICE_BUFFER):
+            broker.route(Message("devices/1883/v1/devices/me/telemetry", b"{}"))
+
+        assert messages.receive_nowait().topic == MQTTTopics.ATTRIBUTES.value
+        assert messages.receive_nowait().topic == MQTTTopics.TELEMETRY.value
+        assert messages.dropped[MQTTTopics.TELEMETRY.value] > 0
+
+
+@pytest.mark.trio
+async def test_new_device_restarts_broker(nursery, mosquitto, autojump_clock):
+    configs, client, _ = mosquitto
+    broker = SharedBroker(1882, [1883])
+    await nursery.start(broker.run)
+
+    async with broker.attach("localhost", 1883, OnWireProtocol.EVP2) as (agent, _):
+        await agent.subscribe(MQTTTopics.ATTRIBUTES.value)
+        async with broker.attach("localhost", 1884, OnWireProtocol.EVP2):
+            assert len(configs) == 2
+            assert "listener 1884" in configs[1]
+            # The first device's agent kept its subscriptions
+            assert client.subscribe.await_count == 2
+
+        with pytest.raises(BrokerException):
+            async with broker.attach("localhost", 1883, OnWireProtocol.EVP2):
+                pass
+
+    broker.remove_device(1884)
+    await trio.sleep(1)
+    assert len(configs) == 3
+    assert "listener 1884" not in configs[2]
+
+
+@pytest.mark.trio
+async def test_broker_exit_restarts_broker(nursery, mosquitto, autojump_clock):
+    configs, client, processes = mosquitto
+    broker = SharedBroker(1882, [1883])
+    await nursery.start(broker.run)
+
+    processes[0].kill()
+    await trio.sleep(1)
+
+    assert len(configs) == 2
+    assert client.connect.await_count == 2
+    assert broker._serving == {1883}
+
+
+@pytest.mark.trio
+async def test_failed_restart_keeps_previous_ports(nursery, mosquitto, autojump_clock):
+    configs, client, _ = mosquitto
+    broker = SharedBroker(1882, [1883])
+    await nursery.start(broker.run)
+
+    broker.add_device(1999)
+    await trio.sleep(1)
+
+    assert len(configs) == 3
+    assert "listener 1999" in configs[1]
+    assert configs[2] == configs[0]
+    assert broker._serving == {1883}
+
+
+def test_console_port_is_reserved():
+    with pytest.raises(BrokerException):
+        SharedBroker(1882).add_device(1882)
@@ -18,10 +18,12 @@ import logging
 import os
 import random
 import threading
+import time
 from collections import OrderedDict
 from collections.abc import Iterator
 from itertools import cycle
 from pathlib import Path
+from typing import Callable
 from unittest.mock import MagicMock
 from unittest.mock import Mock
 from unittest.mock import patch
@@ -474,6 +476,99 @@ def test_directory_watcher(directory_monitor, tmp_path):
         directory_monitor.unwatch(dir1_to_watch)
 
 
+def test_directory_watcher_deduplicates_watches(directory_monitor, tmp_path):
+    """
+    Subscriptions on the same location share a single OS-level
+    watch, and deletion is notified to all of them.
+    """
+    notified = []
+    both_notified = threading.Event()
+
+    def make_cb(name: str) -> Callable[[Path], None]:
+        def on_delete_cb(path: Path) -> None:
+            notified.append(name)
+            if len(notified) == 2:
+                both_notified.set()
+
+        return on_delete_cb
+
+    dir_to_watch = tmp_path / "shared"
+    dir_to_watch.mkdir()
+
+    directory_monitor.watch(dir_to_watch, make_cb("a"))
+    directory_monitor.watch(dir_to_watch / ".." / "shared", make_cb("b"))
+    assert directory_monitor.num_watches == 1
+
+    dir_to_watch.rmdir()
+    assert both_notified.wait(5)
+    assert sorted(notified) == ["a", "b"]
+    assert directory_monitor.num_watches == 0
+
+
+def test_directory_watcher_unwatch_per_subscriber(directory_monitor, tmp_path):
+    fs_event = threading.Event()
+    unexpected = Mock()
+
+    def on_delete_cb(path: Path) -> None:
+        fs_event.set()
+
+    dir_to_watch = tmp_path / "shared"
+    dir_to_watch.mkdir()
+
+    directory_monitor.watch(dir_to_watch, on_delete_cb)
+    directory_monitor.watch(dir_to_watch, unexpected)
+
+    directory_monitor.unwatch(dir_to_watch, unexpected)
+    assert directory_monitor.num_watches == 1
+
+    dir_to_watch.rmdir()
+    assert fs_event.wait(5)
+    unexpected.assert_not_called()
+
+    directory_monitor.unwatch(dir_to_watch, on_delete_cb)
+    assert directory_monitor.num_watches == 0
+
+
+def test_directory_watcher_ignores_child_deletion(directory_monitor, tmp_path):
+    on_delete_cb = Mock()
+
+    dir_to_watch = tmp_path / "parent"
+    child = dir_to_watch / "child"
+    child.mkdir(parents=True)
+
+    directory_monitor.watch(dir_to_watch, on_delete_cb)
+    child.rmdir()
+
+    # Allow for the event to be dispatched
+    time.sleep(0.5)
+    on_delete_cb.assert_not_called()
+    assert directory_monitor.num_watches == 1
+
+
+def test_directory_watcher_reference_counted(directory_monitor, tmp_path):
+    monitor = directory_monitor
+    monitor.start()
+    first_observer = monitor._obs
+
+    monitor.stop()
+    assert first_observer.is_alive()
+
+    monitor.stop()
+    assert not first_observer.is_alive()
+
+    # Restarting after a full stop re-establishes existing watches
+    fs_event = threading.Event()
+    dir_to_watch = tmp_path / "dir"
+    dir_to_watch.mkdir()
+    monitor.watch(dir_to_watch, lambda path: fs_event.set())
+
+    monitor.start()
+    assert monitor._obs is not first_observer
+    dir_to_watch.rmdir()
+    assert fs_event.wait(5)
+    # The fixture releases this last start
+
+
 def test_regular_sequence_update_size(dir_layout, file_creator):
     dir_base, size = dir_layout
     w = StorageSizeWatcher(check_frequency=10)
@@ -491,3 +586,34 @@ def test_regular_sequence_update_size(dir_layout, file_creator):
     new_file.write_bytes(new_content)
     w.update_file_size(new_file)
     assert w.storage_usage == size + len(new_content)
+
+
+def test_prune_listeners(dir_layout, file_creator):
+    dir_base, size = dir_layout
+    w = StorageSizeWatcher(check_frequency=10)
+    w.set_path(dir_base)
+    pruned = []
+    w.add_prune_listener(pruned.append)
+
+    w.set_storage_limit(size - 1)
+    assert pruned == [dir_base / "fileA"]
+
+    w.remove_prune_listener(pruned.append)
+    w.set_storage_limit(size - 2)
+    assert pruned == [dir_base / "fileA"]
+
+
+def test_remove_file(dir_layout, file_creator):
+    dir_base, size = dir_layout
+    w = StorageSizeWatcher(check_frequency=10)
+    w.set_path(dir_base)
+
+    new_file = create_new(dir_base, file_creator)
+    w.incoming(new_file)
+    w.remove_file(new_file)
+
+    assert not new_file.exists()
+    assert w.storage_usage == size
+    assert new_file not in {e.path for e in w.content}
+    # Removing twice is harmless
+    w.remove_file(new_file)
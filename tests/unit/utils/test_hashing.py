@@ -0,0 +1,76 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import hashlib
+import os
+from base64 import b64encode
+from pathlib import Path
+
+import pytest
+from local_console.utils.hashing import CHUNK_SIZE
+from local_console.utils.hashing import FileHasher
+from local_console.utils.hashing import sha256_b64
+from local_console.utils.hashing import sha256_hex
+
+
+@pytest.fixture(params=[True, False], ids=["file_digest", "chunked"])
+def hasher(request, monkeypatch) -> FileHasher:
+    if not request.param:
+        monkeypatch.delattr(hashlib, "file_digest", raising=False)
+    return FileHasher()
+
+
+def test_digest(hasher: FileHasher, tmp_path: Path):
+    data = os.urandom(3 * CHUNK_SIZE + 123)
+    path = tmp_path / "module.wasm"
+    path.write_bytes(data)
+
+    assert hasher.digest(path) == hashlib.sha256(data).digest()
+
+
+def test_unchanged_file_is_not_read_again(hasher: FileHasher, tmp_path: Path):
+    path = tmp_path / "module.wasm"
+    path.write_bytes(b"first")
+    first = hasher.digest(path)
+    assert hasher.digest(path) == first
+    assert (hasher.hits, hasher.misses) == (1, 1)
+
+    # Same size, but a later modification time
+    path.write_bytes(b"again")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert hasher.digest(path) == hashlib.sha256(b"again").digest()
+    assert hasher.misses == 2
+
+
+def test_oldest_digests_are_evicted(tmp_path: Path):
+    hasher = FileHasher(max_entries=2)
+    paths = [tmp_path / f"{i}.bin" for i in range(3)]
+    for i, path in enumerate(paths):
+        path.write_bytes(bytes([i]))
+        hasher.digest(path)
+
+    hasher.digest(paths[2])
+    hasher.digest(paths[0])
+    assert (hasher.hits, hasher.misses) == (1, 4)
+
+
+def test_encodings(tmp_path: Path):
+    path = tmp_path / "firmware.bin"
+    path.write_bytes(b"firmware")
+    digest = hashlib.sha256(b"firmware").digest()
+
+    assert sha256_hex(path) == digest.hex()
+    assert sha256_b64(path) == b64encode(digest).decode()
@@ -0,0 +1,89 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import json
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+from local_console.utils import json_codec
+from local_console.utils.json_codec import json_decode
+from local_console.utils.json_codec import json_encode
+from local_console.utils.json_codec import json_encode_str
+
+documents = st.recursive(
+    st.none()
+    | st.booleans()
+    | st.integers(min_value=-(2**63), max_value=2**63 - 1)
+    | st.text(),
+    lambda children: st.lists(children) | st.dictionaries(st.text(), children),
+    max_leaves=10,
+)
+
+
+backends = pytest.mark.parametrize("backend", json_codec.available_backends())
+
+
+@contextmanager
+def using(backend: str) -> Iterator[None]:
+    previous = json_codec.backend_name()
+    json_codec.use_backend(backend)
+    try:
+        yield
+    finally:
+        json_codec.use_backend(previous)
+
+
+@pytest.fixture
+def backend_in_use(backend: str) -> Iterator[None]:
+    with using(backend):
+        yield
+
+
+@backends
+@given(document=documents)
+def test_roundtrip_matches_stdlib(backend: str, document):
+    with using(backend):
+        encoded = json_encode(document)
+        assert isinstance(encoded, bytes)
+        assert json.loads(encoded) == document
+        assert json_decode(encoded) == document
+        assert json_decode(memoryview(encoded)) == document
+        assert json_decode(json_encode_str(document)) == document
+
+
+@backends
+@pytest.mark.parametrize("invalid", [b"{", b"\xff", b""])
+def test_invalid_documents_raise_value_error(backend_in_use, invalid):
+    with pytest.raises(ValueError):
+        json_decode(invalid)
+
+
+@backends
+def test_stdlib_compatible_encoding(backend_in_use):
+    assert json_decode(json_encode({1: "a"})) == {"1": "a"}
+    assert json_decode(json_encode([2**70])) == [2**70]
+
+
+@backends
+def test_compact_encoding(backend_in_use):
+    assert json_encode({"a": [1, "ñ"]}) == '{"a":[1,"ñ"]}'.encode()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        json_codec.use_backend("yaml")
@@ -0,0 +1,80 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+import os
+from pathlib import Path
+
+import pytest
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import ECC
+from Crypto.Signature import DSS
+from local_console.utils.signature import sign
+from local_console.utils.signature import sign_file
+
+FOOTER_SIZE = 16
+DIGEST_SIZE = 32
+PADDED_SIGNATURE_SIZE = 80
+
+
+@pytest.fixture(scope="module")
+def private_key() -> ECC.EccKey:
+    return ECC.generate(curve="P-256")
+
+
+def test_swaf_layout(private_key):
+    aot = os.urandom(1000)
+    swaf = sign(aot, private_key.export_key(format="PEM").encode())
+
+    footer = swaf[-FOOTER_SIZE:]
+    assert footer[12:] == bytes((0x3A, 0x53, 0xF0, 0x07))
+    assert int.from_bytes(footer[4:8], "little") == len(aot)
+    sig_len = int.from_bytes(footer[8:10], "little")
+    assert footer[3] == PADDED_SIGNATURE_SIZE - sig_len
+
+    assert swaf[: len(aot)] == aot
+    signed_part = swaf[: len(aot) + PADDED_SIGNATURE_SIZE]
+    signature = signed_part[len(aot) : len(aot) + sig_len]
+    verifier = DSS.new(private_key.public_key(), "fips-186-3", encoding="der")
+    verifier.verify(SHA256.new(aot), signature)
+
+    digests = swaf[len(signed_part) : -FOOTER_SIZE]
+    assert digests[:DIGEST_SIZE] == SHA256.new(signed_part).digest()
+    public_key = private_key.public_key().export_key(format="DER")
+    assert digests[DIGEST_SIZE:] == SHA256.new(public_key).digest()
+
+
+def test_sign_file(private_key, tmp_path: Path):
+    key = private_key.export_key(format="PEM").encode()
+    # Spanning several chunks
+    aot = os.urandom(2 * 1024 * 1024 + 5)
+    source = tmp_path / "node.xtensa.aot"
+    source.write_bytes(aot)
+    signed = tmp_path / "node.xtensa.aot.signed"
+
+    sign_file(source, signed, key)
+
+    assert signed.read_bytes() == sign(aot, key)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [source.name, signed.name]
+
+
+def test_sign_empty_file(private_key, tmp_path: Path):
+    source = tmp_path / "node.xtensa.aot"
+    source.touch()
+    signed = tmp_path / "node.xtensa.aot.signed"
+
+    with pytest.raises(ValueError):
+        sign_file(source, signed, private_key.export_key(format="PEM").encode())
+    assert not signed.exists()
+    assert list(tmp_path.iterdir()) == [source]
@@ -0,0 +1,153 @@
+# Copyright 2024 Sony Semiconductor Solutions Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+import trio
+from cryptography import x509
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import rsa
+from local_console.clients.trio_mqtt import MQTTClient
+from local_console.clients.trio_mqtt import MQTTConnectionError
+from local_console.core.schemas.schemas import TLSKeyType
+from local_console.servers.broker import populate_broker_conf
+from local_console.servers.broker import probe_broker
+from local_console.servers.embedded_broker import EmbeddedBroker
+from local_console.utils.tls import client_ssl_context
+from local_console.utils.tls import ensure_broker_credentials
+from local_console.utils.tls import is_certificate_current
+from local_console.utils.tls import server_ssl_context
+
+
+def load_certificate(path: Path) -> x509.Certificate:
+    return x509.load_pem_x509_certificate(path.read_bytes())
+
+
+@pytest.mark.parametrize(
+    "key_type, key_class",
+    [
+        (TLSKeyType.ECDSA_P256, ec.EllipticCurvePublicKey),
+        (TLSKeyType.RSA_2048, rsa.RSAPublicKey),
+    ],
+)
+def test_broker_credentials_cached(tmp_path: Path, key_type, key_class):
+    credentials = ensure_broker_credentials(tmp_path, key_type)
+    server = load_certificate(credentials.server_certificate)
+    ca = load_certificate(credentials.ca_certificate)
+    assert isinstance(server.public_key(), key_class)
+    assert is_certificate_current(server, ca)
+    names = server.extensions.get_extension_for_class(x509.SubjectAlternativeName)
+    assert "localhost" in names.value.get_values_for_type(x509.DNSName)
+
+    with patch("local_console.utils.tls.generate_private_key") as generate:
+        assert ensure_broker_credentials(tmp_path, key_type) == credentials
+        generate.assert_not_called()
+    assert load_certificate(credentials.server_certificate) == server
+
+
+def test_expiring_certificate_renewed(tmp_path: Path):
+    credentials = ensure_broker_credentials(tmp_path)
+    client = load_certificate(credentials.client_certificate)
+
+    later = datetime.now() + timedelta(days=360)
+    with patch("local_console.utils.tls.datetime") as mock_datetime:
+        mock_datetime.now.return_value = later.astimezone()
+        mock_datetime.today.return_value = later
+        ensure_broker_credentials(tmp_path)
+
+    assert load_certificate(credentials.client_certificate) != client
+    # The CA itself is kept
+    assert load_certificate(credentials.ca_certificate).issuer == client.issuer
+
+
+def test_expiring_ca_renewed(tmp_path: Path):
+    credentials = ensure_broker_credentials(tmp_path)
+    ca = load_certificate(credentials.ca_certificate)
+    server = load_certificate(credentials.server_certificate)
+    context = client_ssl_context(credentials)
+
+    later = datetime.now() + timedelta(days=3645)
+    with patch("local_console.utils.tls.datetime") as mock_datetime:
+        mock_datetime.now.return_value = later.astimezone()
+        mock_datetime.today.return_value = later
+        assert ensure_broker_credentials(tmp_path) == credentials
+
+    renewed_ca = load_certificate(credentials.ca_certificate)
+    assert renewed_ca != ca
+    renewed_server = load_certificate(credentials.server_certificate)
+    assert renewed_server != server
+    with patch("local_console.utils.tls.datetime") as mock_datetime:
+        mock_datetime.now.return_value = later.astimezone()
+        assert is_certificate_current(renewed_server, renewed_ca)
+    # Not serving the previous certificates any longer
+    assert client_ssl_context(credentials) is not context
+
+
+def test_tls_broker_conf(tmp_path: Path):
+    credentials = ensure_broker_credentials(tmp_path)
+    config_file = tmp_path / "broker.toml"
+    populate_broker_conf(8883, config_file, credentials)
+
+    config = config_file.read_text()
+    assert "listener 8883" in config
+    assert "require_certificate true" in config
+    assert f"cafile {credentials.ca_certificate}" in config
+    assert f"keyfile {credentials.server_key}" in config
+
+
+@pytest.mark.trio
+async def test_tls_session_resumption(tmp_path: Path, nursery):
+    credentials = ensure_broker_credentials(tmp_path)
+    broker = EmbeddedBroker(0, "127.0.0.1", server_ssl_context(credentials))
+    await nursery.start(broker.run)
+    context = client_ssl_context(credentials)
+
+    assert await probe_broker(broker.port, ssl_context=context)
+    assert not await probe_broker(broker.port)
+
+    client = MQTTClient("tls-client", nursery, ssl_context=context)
+    await client.connect("127.0.0.1", broker.port)
+    assert not client.tls_resumed
+    await client.disconnect()
+
+    await client.connect("127.0.0.1", broker.port)
+    assert client.tls_resumed
+    await client.subscribe("a/b", 1)
+    await client.publish("a/b", b"over TLS", qos=1)
+    with trio.fail_after(5):
+        async with client.messages() as mgen:
+            async for msg in mgen:
+                assert msg.payload == b"over TLS"
+                break
+    await client.disconnect()
+    broker.close()
+
+
+@pytest.mark.trio
+async def test_tls_client_of_another_ca_refused(tmp_path: Path, nursery):
+    credentials = ensure_broker_credentials(tmp_path / "local")
+    broker = EmbeddedBroker(0, "127.0.0.1", server_ssl_context(credentials))
+    await nursery.start(broker.run)
+
+    other = ensure_broker_credentials(tmp_path / "other")
+    stranger = MQTTClient("stranger", nursery, ssl_context=client_ssl_context(other))
+    with pytest.raises(MQTTConnectionError):
+        await stranger.connect("127.0.0.1", broker.port)
+    assert not stranger.connected
+    broker.close()